@@ -629,30 +629,9 @@ GET_SIDE_TO_MOVE:
     RETN
 
 ; ==============================================================================
-; SET_SIDE_TO_MOVE - Set side to move
+; SET_SIDE_TO_MOVE and FLIP_SIDE (zero call sites) removed 2026-10-18 to make
+; room for UCI_POS_FEN below $6000 (BOARD); GET_PIECE_AT likewise below.
 ; ==============================================================================
-; Input: D = side (WHITE=0 or BLACK=8)
-; Uses: A
-; ==============================================================================
-SET_SIDE_TO_MOVE:
-    STXD                ; Save D
-    RLDI 10, GAME_STATE + STATE_SIDE_TO_MOVE
-    IRX
-    LDN 2
-    STR 10
-    RETN
-
-; ==============================================================================
-; FLIP_SIDE - Toggle side to move
-; ==============================================================================
-; Uses: A, D
-; ==============================================================================
-FLIP_SIDE:
-    RLDI 10, GAME_STATE + STATE_SIDE_TO_MOVE
-    LDN 10
-    XRI BLACK           ; Toggle between 0 and 8
-    STR 10
-    RETN
 
 ; ==============================================================================
 ; GET_CASTLING_RIGHTS - Get castling rights byte
@@ -684,32 +663,6 @@ CLEAR_CASTLING_RIGHT:
     SEX 2               ; Restore X to stack
     RETN
 
-; ==============================================================================
-; GET_PIECE_AT - Get piece at square
-; ==============================================================================
-; Input: D = square (0x88 format)
-; Output: D = piece code (0 if empty or invalid square)
-; Uses: A
-; ==============================================================================
-GET_PIECE_AT:
-    ; Save square in A.0
-    PLO 10
-
-    ; Check if valid square using original value
-    ANI $88
-    BNZ GET_PIECE_INVALID
-
-    ; Valid square - build address and get piece
-    LDI HIGH(BOARD)
-    PHI 10
-    ; A.0 already has square offset
-    LDN 10               ; Load piece at BOARD + square
-    RETN
-
-GET_PIECE_INVALID:
-    LDI 0               ; Return empty for invalid squares
-    RETN
-
 ; ==============================================================================
 ; INIT_MOVE_HISTORY - Initialize history pointer to start of history buffer
 ; ==============================================================================
@@ -138,8 +138,18 @@ cat negamax.asm >> "$OUTPUT"
 echo "  - uci.asm"
 cat uci.asm >> "$OUTPUT"
 
-echo "  - opening-book-lookup.asm"
-cat opening-book-lookup.asm >> "$OUTPUT"
+# The lookup must match the book's format (merge_books.py --trie writes a trie,
+# zobrist_book.py a hash-keyed table)
+if grep -q "^; Book format: trie" opening-book.asm; then
+    echo "  - opening-book-trie-lookup.asm (trie book)"
+    cat opening-book-trie-lookup.asm >> "$OUTPUT"
+elif grep -q "^; Book format: zobrist" opening-book.asm; then
+    echo "  - opening-book-hash-lookup.asm (Zobrist-keyed book)"
+    cat opening-book-hash-lookup.asm >> "$OUTPUT"
+else
+    echo "  - opening-book-lookup.asm"
+    cat opening-book-lookup.asm >> "$OUTPUT"
+fi
 
 echo "  - opening-book.asm (opening book data)"
 cat opening-book.asm >> "$OUTPUT"
@@ -206,9 +216,19 @@ elif command -v a18 &> /dev/null; then
         echo "  ✗ ERROR: Assembly failed - no hex file generated"
         exit 1
     fi
+elif command -v python3 &> /dev/null && [ -f tools/elph_asm.py ]; then
+    echo "Step 4: Assembling with tools/elph_asm.py (a18-compatible)..."
+    if python3 tools/elph_asm.py "$OUTPUT" -o "$HEXFILE" -l chess-engine.lst -b "$BINFILE"; then
+        echo "  ✓ SUCCESS: $HEXFILE created (24-byte records)"
+        echo "  Size: $(wc -c < "$HEXFILE") bytes"
+    else
+        echo "  ✗ ERROR: Assembly failed:"
+        grep "^[A-Z]" chess-engine.lst
+        exit 1
+    fi
 else
     echo "Step 4: SKIPPED - No 1802 assembler found"
-    echo "  Supported assemblers: asm1802, a18"
+    echo "  Supported assemblers: asm1802, a18, tools/elph_asm.py (python3)"
     echo "  You can manually assemble $OUTPUT with your assembler"
 fi
 
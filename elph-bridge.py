@@ -2,16 +2,24 @@
 """
 ELPH Chess Engine Bridge
 Bridges stdin/stdout to serial port for UCI GUI compatibility.
+
+Event-driven: one selectors loop waits on stdin and the serial fd together,
+and commands go to the board paced by the BIOS echo: a line's first byte
+waits for the board to read it, the rest go out a few bytes ahead of their
+echoes (see ECHO_WINDOW below).
 """
 import sys
 import os
-import select
+import selectors
 import signal
-import serial
 import time
 import re
 
-LOG_FILE = '/home/phiber/proj-chess/elph-debug.log'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tools'))
+from elph_squares import square_x88, x88_name
+from elph_sim import open_serial
+
+LOG_FILE = os.environ.get('ELPH_LOG', '/home/phiber/proj-chess/elph-debug.log')
 _log_start = None
 
 def log_write(log, msg):
@@ -25,15 +33,43 @@ def log_write(log, msg):
     seconds = elapsed - (minutes * 60)
     log.write(f"[{minutes:02d}:{seconds:06.3f}] {msg}")
     log.flush()
-SERIAL_PORT = '/dev/ttyUSB0'
+# ELPH_PORT overrides the port: a pty from `tools/elph_sim.py --pty`, or
+# sim:<image> to run the simulator in-process
+SERIAL_PORT = os.environ.get('ELPH_PORT', '/dev/ttyUSB0')
 BAUD_RATE = 19200
 
-# Timing - need enough delay to not overwhelm BIOS echo
-CHAR_DELAY = 0.003      # 3ms between characters
-LINE_DELAY = 0.030      # 30ms after line ending
-LONG_CMD_THRESHOLD = 80 # Commands longer than this get extra delay
-LONG_CMD_BASE_DELAY = 0.050   # 50ms base extra delay
-LONG_CMD_PER_MOVE = 0.025     # 25ms per move in position command (for MAKE_MOVE processing)
+# Pacing by the BIOS echo. The board only reads the UART while it sits in
+# UCI_READ_LINE; bytes that arrive while it processes a command (MAKE_MOVE per
+# move, TT_CLEAR, ...) are dropped. So a line's first byte goes out alone and
+# is resent until it echoes - then the board is known to be reading, and the
+# rest of the line may run up to ECHO_WINDOW bytes ahead of the echoes, at
+# least CHAR_GAP apart (the fixed per-byte delay the bridge used before), so
+# a USB-serial adapter's latency (FTDI: 16 ms each way by default) is paid
+# once per line, not once per byte. ELPH_ECHO_WINDOW=1 waits for every echo.
+# A resend inside a line rewinds to the unechoed byte and finishes the line
+# one byte at a time.
+ECHO_WINDOW = int(os.environ.get('ELPH_ECHO_WINDOW', 8))
+CHAR_GAP = 0.003        # minimum spacing of bytes sent ahead of their echoes
+ECHO_RESEND = 0.25      # no echo and a silent line this long: the byte was dropped, resend
+ECHO_GIVEUP = 10.0      # stop waiting for an echo after this long (board gone?)
+
+# Incremental position: when a GUI's "position startpos moves ..." extends the
+# game the board already holds, send only "position moves <new moves>" (the
+# uci.asm extension), so link and MAKE_MOVE time per turn stay constant
+# instead of growing with game length. Opt-in (ELPH_INCREMENTAL=1): firmware
+# older than listings/chess-engine-94a1d59.lst has no UCI_POS_MOVES_KW and
+# silently ignores "position moves", searching the old position.
+INCREMENTAL_POSITION = os.environ.get('ELPH_INCREMENTAL', '0') != '0'
+
+# Host-side opening book: a "go" in a book position is answered here from the
+# same compiled opening-book.asm the firmware carries, with no search on the
+# board; the position command still goes to the board. The answer waits in
+# the board queue until everything before it has echoed and the board has
+# answered its uci/isready, so the GUI sees replies in order. ELPH_BOOK=
+# (empty) sends every go to the board.
+BOOK_FILE = os.environ.get('ELPH_BOOK', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                      'opening-book.asm'))
+BOOK_PLY_LIMIT = 15     # board.asm: MOVE_HIST recording stops here, no book past it
 
 def filter_go_command(line):
     """Strip unsupported parameters from 'go' command."""
@@ -47,6 +83,116 @@ def filter_go_command(line):
         line = re.sub(r'\s+', ' ', line).strip()
     return line
 
+
+def load_book(path):
+    """Compiled opening-book.asm -> {((from, to), ...): (from, to)}.
+
+    Walks the DB byte stream after OPENING_BOOK: the way BL_ENTRY_LOOP does
+    (ply byte, $FF = end, 2*ply move bytes, 2 response bytes) and keeps only
+    what BOOK_LOOKUP can return: the first entry for a move sequence, and
+    nothing the ply-sorted early exit would stop before reaching. A trie
+    book is read node by node (first response per sequence, as the trie
+    holds it); a Zobrist-keyed book comes back as a HashBook, whose get()
+    hashes the sequence and searches the table as the firmware does."""
+    text = open(path).read()
+    if re.search(r'^; Book format: (trie|zobrist)', text, re.M):
+        if '; Book format: zobrist' in text:
+            from zobrist_book import HashBook
+            return HashBook(path)
+        from pgn_to_book import read_book
+        book = {}
+        for position, response, _ in read_book(path):
+            book.setdefault(tuple(position), response)
+        return book
+    m = re.search(r'^OPENING_BOOK:', text, re.M)
+    if m:
+        text = text[m.end():]
+    data = []
+    for line in text.splitlines():
+        code = line.split(';', 1)[0]
+        if 'DB' in code:
+            data.extend(int(hx, 16) for hx in re.findall(r'\$([0-9A-Fa-f]{2})', code))
+    book = {}
+    max_ply = 0
+    i = 0
+    while i < len(data) and data[i] != 0xFF:
+        ply = data[i]
+        entry = data[i + 1:i + 3 + 2 * ply]
+        i += 3 + 2 * ply
+        if len(entry) < 2 * ply + 2:
+            break
+        if ply >= max_ply:
+            key = tuple(zip(entry[0:2 * ply:2], entry[1:2 * ply:2]))
+            book.setdefault(key, (entry[-2], entry[-1]))
+        max_ply = max(max_ply, ply)
+    return book
+
+
+def book_move(book, moves):
+    """Book reply to a startpos move list (UCI strings), or None. Promotion
+    suffixes are ignored, as MOVE_HIST only records from/to squares."""
+    if len(moves) >= BOOK_PLY_LIMIT:
+        return None
+    try:
+        key = tuple((square_x88(mv[0:2]), square_x88(mv[2:4])) for mv in moves)
+    except (IndexError, TypeError):
+        return None
+    reply = book.get(key)
+    return x88_name(reply[0]) + x88_name(reply[1]) if reply else None
+
+
+def position_moves(line):
+    """Move list of a "position startpos [moves ...]" command; None for
+    anything else (FEN, malformed), which is always sent in full."""
+    tok = line.lower().split()
+    if tok[:2] != ['position', 'startpos']:
+        return None
+    if len(tok) == 2:
+        return []
+    if tok[2] != 'moves':
+        return None
+    return tok[3:]
+
+
+def window(echoed, narrow):
+    """Bytes of a line that may be in flight: one until the first has echoed
+    (the board may still be busy with the previous command) or after a
+    resend in the line, ECHO_WINDOW once the board is known to be reading."""
+    return 1 if echoed == 0 or narrow else max(1, ECHO_WINDOW)
+
+
+def echo_matches(sent, got):
+    """True if received byte `got` is the BIOS echo of sent byte `sent`.
+    Case-insensitive; a line ending echoes as CR and/or LF."""
+    if sent in (0x0D, 0x0A):
+        return got in (0x0D, 0x0A)
+    return bytes([got]).lower() == bytes([sent]).lower()
+
+
+def split_rx_lines(recv_buffer):
+    """Pop complete lines (CR, LF or CRLF terminated) off recv_buffer."""
+    lines = []
+    while b'\n' in recv_buffer or b'\r' in recv_buffer:
+        idx_n = recv_buffer.find(b'\n')
+        idx_r = recv_buffer.find(b'\r')
+
+        if idx_n == -1:
+            idx = idx_r
+        elif idx_r == -1:
+            idx = idx_n
+        else:
+            idx = min(idx_n, idx_r)
+
+        line = bytes(recv_buffer[:idx]).decode('latin-1', errors='replace')
+
+        end = idx + 1
+        if end < len(recv_buffer) and recv_buffer[end:end+1] in (b'\r', b'\n'):
+            end += 1
+        del recv_buffer[:end]
+        lines.append(line)
+    return lines
+
+
 def main():
     log = open(LOG_FILE, 'w')
     log.write(f"# Match started: {time.strftime('%Y-%m-%d %H:%M:%S %Z')}\n")
@@ -55,17 +201,7 @@ def main():
     signal.signal(signal.SIGPIPE, signal.SIG_IGN)
 
     try:
-        ser = serial.Serial(
-            port=SERIAL_PORT,
-            baudrate=BAUD_RATE,
-            bytesize=serial.EIGHTBITS,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            timeout=0.1,
-            xonxoff=False,
-            rtscts=False,
-            dsrdtr=False
-        )
+        ser = open_serial(SERIAL_PORT, BAUD_RATE)
         ser.reset_input_buffer()
         ser.reset_output_buffer()
         log_write(log, f"Serial: {ser.name} @ {ser.baudrate}\n")
@@ -79,137 +215,237 @@ def main():
     stdin_fd = sys.stdin.fileno()
     stdout_fd = sys.stdout.fileno()
 
+    sel = selectors.DefaultSelector()
+    sel.register(stdin_fd, selectors.EVENT_READ, 'stdin')
+    sel.register(ser.fileno(), selectors.EVENT_READ, 'serial')
+
     pending_echo_lines = []
     recv_buffer = bytearray()
     stdin_partial = ''  # Buffer for incomplete lines from stdin
 
+    tx_lines = []       # [line, bytes] queued for the board, oldest first;
+                        # a 'bestmove' line is a held book answer for the GUI
+    replies = []        # uciok/readyok the board owes, oldest first
+    tx_pos = 0          # bytes of tx_lines[0] echoed
+    tx_sent = 0         # bytes of tx_lines[0] sent (tx_sent - tx_pos in flight)
+    inflight = None     # oldest byte sent, echo not seen yet
+    narrow = False      # a byte of this line was resent: one in flight until it ends
+    sent_at = 0.0       # when the last byte was (re)sent
+    first_sent_at = 0.0 # when inflight was first sent
+    line_started = 0.0  # when the first byte of tx_lines[0] went out
+    last_rx = 0.0
+    searching = False   # 'go' sent, no bestmove yet: the board is not reading
+    board_moves = None  # startpos moves the board holds, None = unknown
+    gui_moves = None    # startpos moves of the GUI's last position command
+
+    book = {}
+    if BOOK_FILE:
+        try:
+            book = load_book(BOOK_FILE)
+            log_write(log, f"Book: {len(book)} positions from {BOOK_FILE}\n")
+        except OSError as e:
+            log_write(log, f"Book not loaded ({e}), every go goes to the board\n")
+
     log_write(log, "Entering main loop\n")
 
     try:
         while True:
-            # Check stdin
-            readable, _, _ = select.select([stdin_fd], [], [], 0.005)
-
-            if stdin_fd in readable:
-                data = os.read(stdin_fd, 8192)
-                if not data:
-                    log_write(log, "EOF on stdin\n")
-                    break
-
-                text = stdin_partial + data.decode('latin-1')
-                stdin_partial = ''
-                text = text.replace('\r\n', '\n').replace('\r', '\n')
-
-                # If text doesn't end with newline, last chunk is incomplete
-                if not text.endswith('\n'):
-                    last_nl = text.rfind('\n')
-                    if last_nl == -1:
-                        # No newline at all — buffer entire read
-                        stdin_partial = text
-                        text = ''
-                    else:
-                        stdin_partial = text[last_nl + 1:]
-                        text = text[:last_nl + 1]
-
-                input_lines = text.split('\n')
-
-                for line in input_lines:
-                    if not line:
-                        continue
-
-                    if line.strip().lower() == 'quit':
-                        log_write(log, "Quit command\n")
+            # Sleep until input, an echo, the resend deadline or the next
+            # byte of the window - no polling
+            timeout = None
+            if inflight is None and tx_lines and tx_lines[0][0].startswith('bestmove '):
+                timeout = max(0.0, max(sent_at, last_rx) + ECHO_GIVEUP - time.time())
+            if inflight is not None and not searching:
+                timeout = max(0.0, max(sent_at, last_rx) + ECHO_RESEND - time.time())
+                if tx_sent < len(tx_lines[0][1]) and tx_sent - tx_pos < window(tx_pos, narrow):
+                    timeout = min(timeout, max(0.0, sent_at + CHAR_GAP - time.time()))
+
+            for key, _ in sel.select(timeout):
+                if key.data == 'stdin':
+                    data = os.read(stdin_fd, 8192)
+                    if not data:
+                        log_write(log, "EOF on stdin\n")
                         return
 
-                    original_line = line
-                    line = filter_go_command(line)
-
-                    log_write(log, f"TX: {repr(line)}\n")
-
-                    pending_echo_lines.append(line.lower())
-
-                    # Send with delays, reading any incoming data between chars
-                    line_bytes = (line + '\n').encode('latin-1')
-                    for b in line_bytes:
-                        ser.write(bytes([b]))
-                        if b in (0x0D, 0x0A):
-                            time.sleep(LINE_DELAY)
+                    text = stdin_partial + data.decode('latin-1')
+                    stdin_partial = ''
+                    text = text.replace('\r\n', '\n').replace('\r', '\n')
+
+                    # If text doesn't end with newline, last chunk is incomplete
+                    if not text.endswith('\n'):
+                        last_nl = text.rfind('\n')
+                        if last_nl == -1:
+                            # No newline at all — buffer entire read
+                            stdin_partial = text
+                            text = ''
                         else:
-                            time.sleep(CHAR_DELAY)
-                        # Drain incoming while sending
-                        while ser.in_waiting:
-                            recv_buffer.extend(ser.read(ser.in_waiting))
-                    ser.flush()
-
-                    # Extra delay after long commands
-                    if len(line) > LONG_CMD_THRESHOLD:
-                        # Count moves in position command for scaled delay
-                        # Each "xxxx " or "xxxxx " move needs MAKE_MOVE processing time
-                        move_count = line.lower().count(' moves ')
-                        if move_count > 0:
-                            # Count individual moves after "moves" keyword
-                            moves_part = line.lower().split(' moves ', 1)
-                            if len(moves_part) > 1:
-                                move_count = len(moves_part[1].split())
-                            else:
-                                move_count = 0
-
-                        delay = LONG_CMD_BASE_DELAY + (move_count * LONG_CMD_PER_MOVE)
-                        time.sleep(delay)
-                        log_write(log, f"  (long cmd delay: {len(line)} chars, {move_count} moves, {delay*1000:.0f}ms)\n")
-
-            # Read from serial
-            while ser.in_waiting:
-                recv_buffer.extend(ser.read(ser.in_waiting))
-
-            # Process complete lines
-            while b'\n' in recv_buffer or b'\r' in recv_buffer:
-                idx_n = recv_buffer.find(b'\n')
-                idx_r = recv_buffer.find(b'\r')
-
-                if idx_n == -1:
-                    idx = idx_r
-                elif idx_r == -1:
-                    idx = idx_n
-                else:
-                    idx = min(idx_n, idx_r)
-
-                line = bytes(recv_buffer[:idx]).decode('latin-1', errors='replace')
-
-                end = idx + 1
-                if end < len(recv_buffer) and recv_buffer[end:end+1] in (b'\r', b'\n'):
-                    end += 1
-                del recv_buffer[:end]
-
-                line_stripped = line.strip()
-                if not line_stripped:
+                            stdin_partial = text[last_nl + 1:]
+                            text = text[:last_nl + 1]
+
+                    for line in text.split('\n'):
+                        if not line:
+                            continue
+
+                        if line.strip().lower() == 'quit':
+                            log_write(log, "Quit command\n")
+                            return
+
+                        line = filter_go_command(line)
+                        lower = line.lower()
+                        if lower.startswith('position'):
+                            gui_moves = position_moves(line)
+                        elif lower.startswith('go') and gui_moves is not None:
+                            reply = book_move(book, gui_moves)
+                            if reply:
+                                # The position still goes to the board (MOVE_HIST
+                                # stays in sync); only the search is skipped
+                                log_write(log, f"BOOK: {repr(line)} -> bestmove {reply} "
+                                               f"(ply {len(gui_moves)})\n")
+                                tx_lines.append([f"bestmove {reply}", None])
+                                continue
+                        log_write(log, f"TX: {repr(line)}\n")
+                        tx_lines.append([line, None])
                     continue
 
-                line_lower = line_stripped.lower()
-
-                # Check if this is an echo
-                is_echo = False
-                for i, expected in enumerate(pending_echo_lines):
-                    if line_lower == expected:
-                        log_write(log, f"ECHO: {repr(line_stripped)}\n")
-                        pending_echo_lines.pop(i)
-                        is_echo = True
-                        break
-                    # Check for partial match (corrupted echo)
-                    elif expected.endswith(line_lower) or line_lower.endswith(expected):
-                        log_write(log, f"PARTIAL_ECHO: {repr(line_stripped)} (expected {repr(expected)})\n")
-                        pending_echo_lines.pop(i)
-                        is_echo = True
-                        break
-
-                if not is_echo:
-                    output = (line_stripped + '\n').encode('latin-1')
-                    log_write(log, f"RX: {repr(line_stripped)}\n")
+                # Serial readable - walk it byte by byte so echoes and lines stay in order
+                data = ser.read(ser.in_waiting or 1)
+                if data:
+                    last_rx = time.time()
+                for b in data:
+                    if inflight is not None and not searching and echo_matches(inflight, b):
+                        # An echo continues the line being echoed: first byte at the
+                        # start of an RX line, later ones right after their predecessor
+                        line, line_bytes = tx_lines[0]
+                        if (not recv_buffer if tx_pos == 0 else
+                                recv_buffer and echo_matches(line_bytes[tx_pos - 1], recv_buffer[-1])):
+                            tx_pos += 1
+                            inflight = line_bytes[tx_pos] if tx_pos < tx_sent else None
+                            first_sent_at = last_rx
+                            if tx_pos == len(line_bytes):
+                                log_write(log, f"  (sent {len(line_bytes)} bytes in "
+                                               f"{(last_rx - line_started) * 1000:.0f}ms)\n")
+                                searching = line.lower().startswith('go')
+                                tx_lines.pop(0)
+                                tx_pos = tx_sent = 0
+                                narrow = False
+                    recv_buffer.append(b)
+                    if b not in (0x0D, 0x0A):
+                        continue
+
+                    for line in split_rx_lines(recv_buffer):
+                        line_stripped = line.strip()
+                        if not line_stripped:
+                            continue
+
+                        line_lower = line_stripped.lower()
+
+                        # Check if this is an echo
+                        is_echo = False
+                        for i, expected in enumerate(pending_echo_lines):
+                            if line_lower == expected:
+                                log_write(log, f"ECHO: {repr(line_stripped)}\n")
+                                pending_echo_lines.pop(i)
+                                is_echo = True
+                                break
+                            # Check for partial match (corrupted echo)
+                            elif expected.endswith(line_lower) or line_lower.endswith(expected):
+                                log_write(log, f"PARTIAL_ECHO: {repr(line_stripped)} (expected {repr(expected)})\n")
+                                pending_echo_lines.pop(i)
+                                if expected.startswith('position'):
+                                    board_moves = None  # board may not hold it: resend in full
+                                is_echo = True
+                                break
+
+                        if not is_echo:
+                            if line_lower.startswith('bestmove'):
+                                searching = False
+                            elif replies and line_lower.startswith(replies[0]):
+                                replies.pop(0)
+                            output = (line_stripped + '\n').encode('latin-1')
+                            log_write(log, f"RX: {repr(line_stripped)}\n")
+                            try:
+                                os.write(stdout_fd, output)
+                            except (BrokenPipeError, OSError) as e:
+                                log_write(log, f"Stdout write failed: {e}\n")
+                                return
+
+            now = time.time()
+            if inflight is not None and not searching and now - max(sent_at, last_rx) >= ECHO_RESEND:
+                # Nothing echoed for ECHO_RESEND: the board read none of the
+                # bytes in flight, so the line continues from the oldest
+                tx_sent = tx_pos + 1
+                narrow = narrow or tx_pos > 0
+                if now - first_sent_at >= ECHO_GIVEUP:
+                    log_write(log, f"  (no echo for {repr(chr(inflight))} in {ECHO_GIVEUP:.0f}s, moving on)\n")
+                    inflight = None
+                    tx_pos = tx_sent = tx_pos + 1
+                    if tx_pos == len(tx_lines[0][1]):
+                        tx_lines.pop(0)
+                        tx_pos = tx_sent = 0
+                        narrow = False
+                else:
+                    # Board was busy and dropped it
+                    log_write(log, f"  (resend {repr(chr(inflight))})\n")
+                    ser.write(bytes([inflight]))
+                    sent_at = now
+
+            # A line is put in wire form when it reaches the front of the
+            # queue, after everything before it has echoed
+            while inflight is None and tx_lines and tx_lines[0][1] is None:
+                line = tx_lines[0][0]
+                if line.startswith('bestmove '):
+                    # Held book answer: board output still owed goes first,
+                    # unless the board has been silent for ECHO_GIVEUP
+                    if pending_echo_lines or replies:
+                        if now - max(sent_at, last_rx) < ECHO_GIVEUP:
+                            break
+                        log_write(log, f"  (board silent {ECHO_GIVEUP:.0f}s, still owed "
+                                       f"{pending_echo_lines + replies}: dropped)\n")
+                        pending_echo_lines.clear()
+                        replies.clear()
                     try:
-                        os.write(stdout_fd, output)
+                        os.write(stdout_fd, f"{line}\n".encode('latin-1'))
                     except (BrokenPipeError, OSError) as e:
                         log_write(log, f"Stdout write failed: {e}\n")
                         return
+                    log_write(log, f"  (book answer out: {repr(line)})\n")
+                    tx_lines.pop(0)
+                    continue
+                if INCREMENTAL_POSITION and line.lower().startswith('position'):
+                    moves = position_moves(line)
+                    if (moves is not None and board_moves is not None
+                            and moves[:len(board_moves)] == board_moves):
+                        new = moves[len(board_moves):]
+                        if not new:
+                            log_write(log, "  (position unchanged, not sent)\n")
+                            tx_lines.pop(0)
+                            continue
+                        line = 'position moves ' + ' '.join(new)
+                        log_write(log, f"  (incremental: {repr(line)})\n")
+                    board_moves = moves
+                elif line.lower() == 'ucinewgame':
+                    board_moves = None
+                elif line.lower() in ('uci', 'isready'):
+                    replies.append('uciok' if line.lower() == 'uci' else 'readyok')
+                pending_echo_lines.append(line.lower())
+                tx_lines[0] = [line, (line + '\n').encode('latin-1')]
+
+            # Next byte: at once if nothing is in flight, else within the
+            # window and CHAR_GAP after the previous one
+            if tx_lines and tx_lines[0][1] is not None:
+                line_bytes = tx_lines[0][1]
+                while (tx_sent < len(line_bytes) and tx_sent - tx_pos < window(tx_pos, narrow)
+                       and (tx_sent == tx_pos or now - sent_at >= CHAR_GAP)):
+                    if tx_sent == tx_pos:
+                        inflight = line_bytes[tx_pos]
+                        first_sent_at = now
+                    if tx_sent == 0:
+                        line_started = now
+                    ser.write(line_bytes[tx_sent:tx_sent + 1])
+                    ser.flush()
+                    tx_sent += 1
+                    sent_at = now
+                    now = time.time()
 
     except Exception as e:
         log_write(log, f"Error: {e}\n")
@@ -0,0 +1,216 @@
+; ==============================================================================
+; Opening Book Lookup (Zobrist format) - Binary search on the position hash
+; ==============================================================================
+;
+; Book format (opening-book.asm built with tools/zobrist_book.py; header line
+; "; Book format: zobrist"):
+;   OPENING_BOOK:     DW n_entries
+;   BOOK_HASH_KEYS:   n_entries x DW hash, ascending (high byte first)
+;   BOOK_HASH_MOVES:  n_entries x [from] [piece_on_from] [to] [piece_on_to]
+;   Entry i of BOOK_HASH_MOVES answers hash i of BOOK_HASH_KEYS.
+;
+; Entries are keyed by HASH_HI/HASH_LO (HASH_INIT at "position startpos",
+; then MAKE_MOVE's incremental updates), so every move order that reaches a
+; book position finds it - not only the order recorded in MOVE_HIST. The
+; generator merges transpositions and resolves hash collisions at build
+; time. Before answering, the lookup checks that BOARD[from] and BOARD[to]
+; hold the stored pieces and that the piece to move belongs to the side to
+; move, so an unknown position sharing a book hash gets no book move.
+; build.sh assembles this file instead of opening-book-lookup.asm when
+; opening-book.asm carries the zobrist header.
+;
+; Uses: GAME_PLY - book only while GAME_PLY < BOOK_PLY_LIMIT (never in a
+;                  FEN game, which sets GAME_PLY = BOOK_PLY_LIMIT)
+;       HASH_HI/HASH_LO - current position hash
+;       BOOK_MOVE_FROM/TO - output for book response
+;
+; ==============================================================================
+
+; ==============================================================================
+; BOOK_LOOKUP - Search opening book for current position
+; ==============================================================================
+; Input:  HASH_HI/HASH_LO = position hash, GAME_PLY = number of moves played
+; Output: D = 1 if book hit, 0 if no match
+;         BOOK_MOVE_FROM/TO = response move (if hit)
+; Uses:   R7, R8, R9, R10, R11
+; ==============================================================================
+BOOK_LOOKUP:
+    ; Past the book depth (or a FEN game): not in book
+    RLDI 10, GAME_PLY
+    LDN 10
+    SMI BOOK_PLY_LIMIT
+    LBDF BH_NO_MATCH
+
+    ; R11 = position hash
+    RLDI 10, HASH_HI
+    LDA 10
+    PHI 11
+    LDN 10
+    PLO 11
+
+    ; Search range [R7, R8): lo = 0, hi = entry count
+    RLDI 7, 0
+    RLDI 10, OPENING_BOOK
+    LDA 10
+    PHI 8
+    LDN 10
+    PLO 8
+
+BH_SEARCH_LOOP:
+    ; R9 = hi - lo; empty range: not in book
+    GLO 7
+    STR 2
+    GLO 8
+    SM
+    PLO 9
+    GHI 7
+    STR 2
+    GHI 8
+    SMB
+    PHI 9
+    STR 2
+    GLO 9
+    OR
+    LBZ BH_NO_MATCH
+
+    ; R9 = mid = lo + (hi - lo) / 2
+    GHI 9
+    SHR
+    PHI 9
+    GLO 9
+    SHRC
+    PLO 9
+    GLO 7
+    STR 2
+    GLO 9
+    ADD
+    PLO 9
+    GHI 7
+    STR 2
+    GHI 9
+    ADC
+    PHI 9
+
+    ; R10 = BOOK_HASH_KEYS + mid * 2
+    GLO 9
+    SHL
+    PLO 10
+    GHI 9
+    SHLC
+    PHI 10
+    GLO 10
+    ADI LOW(BOOK_HASH_KEYS)
+    PLO 10
+    GHI 10
+    ADCI HIGH(BOOK_HASH_KEYS)
+    PHI 10
+
+    ; Compare the position hash with the key, high byte first
+    LDA 10              ; D = key high, R10 -> key low
+    STR 2
+    GHI 11
+    SM                  ; D = hash high - key high, DF = 1 if no borrow
+    LBNZ BH_HALVE
+    LDN 10              ; D = key low
+    STR 2
+    GLO 11
+    SM                  ; D = hash low - key low, DF = 1 if no borrow
+    LBZ BH_FOUND
+
+BH_HALVE:
+    ; DF still from the deciding SM (branches leave it alone)
+    LBDF BH_UPPER_HALF
+
+    ; hash < key: hi = mid
+    GHI 9
+    PHI 8
+    GLO 9
+    PLO 8
+    LBR BH_SEARCH_LOOP
+
+BH_UPPER_HALF:
+    ; hash > key: lo = mid + 1
+    INC 9
+    GHI 9
+    PHI 7
+    GLO 9
+    PLO 7
+    LBR BH_SEARCH_LOOP
+
+BH_FOUND:
+    ; R10 = BOOK_HASH_MOVES + mid * 4
+    GLO 9
+    SHL
+    PLO 10
+    GHI 9
+    SHLC
+    PHI 10
+    GLO 10
+    SHL
+    PLO 10
+    GHI 10
+    SHLC
+    PHI 10
+    GLO 10
+    ADI LOW(BOOK_HASH_MOVES)
+    PLO 10
+    GHI 10
+    ADCI HIGH(BOOK_HASH_MOVES)
+    PHI 10
+
+    ; R8.1 = board page (BOARD is page-aligned, 0x88 squares < $80)
+    LDI HIGH(BOARD)
+    PHI 8
+
+    ; BOARD[from] must hold the stored piece...
+    LDA 10              ; D = from, R10 -> piece on from
+    PLO 8
+    LDA 10              ; D = piece on from, R10 -> to
+    STR 2
+    LDN 8
+    XOR
+    LBNZ BH_NO_MATCH
+
+    ; ...of the side to move
+    RLDI 9, GAME_STATE + STATE_SIDE_TO_MOVE
+    LDN 8
+    ANI COLOR_MASK      ; D = 0 (white) or 8 (black)
+    STR 2
+    LDN 9               ; D = side to move (0 or 8)
+    XOR
+    LBNZ BH_NO_MATCH
+
+    ; BOARD[to] must hold the stored target (EMPTY or the captured piece)
+    LDA 10              ; D = to, R10 -> piece on to
+    PLO 8
+    LDN 10              ; D = piece on to
+    STR 2
+    LDN 8
+    XOR
+    LBNZ BH_NO_MATCH
+
+    ; Book hit: copy from (R10 - 3) and to (R10 - 1)
+    RLDI 9, BOOK_MOVE_FROM
+    DEC 10
+    DEC 10
+    DEC 10
+    LDN 10              ; Response from
+    STR 9
+    INC 9
+    INC 10
+    INC 10
+    LDN 10              ; Response to
+    STR 9
+
+    ; Return success
+    LDI 1
+    RETN
+
+BH_NO_MATCH:
+    ; No book match found
+    LDI 0
+    RETN
+
+; ==============================================================================
+; End of Opening Book Lookup (Zobrist format)
+; ==============================================================================
@@ -0,0 +1,126 @@
+; ==============================================================================
+; Opening Book Lookup (trie format) - Walk the book trie along MOVE_HIST
+; ==============================================================================
+;
+; Book format (opening-book.asm built with merge_books.py / pgn_to_book.py
+; --trie; header line "; Book format: trie"):
+;   node:  [response_from] [response_to] [n_children]
+;          n_children x ( [move_from] [move_to] DW child_node )
+;   response_from = $FF: no book move at this node (interior node only)
+;   DW child_node is big-endian (high byte first)
+;   OPENING_BOOK = root node (start position, ply 0)
+;
+; A move sequence shared by many book lines is stored once, as the path to
+; its node, so the lookup follows GAME_PLY edges and scans only the children
+; of each node on the way: O(ply) instead of the linear format's scan over
+; every same-ply entry (BL_ENTRY_LOOP in opening-book-lookup.asm).
+; build.sh assembles this file instead of opening-book-lookup.asm when
+; opening-book.asm carries the trie header.
+;
+; Uses: GAME_PLY - number of moves played since start
+;       MOVE_HIST - array of (from, to) pairs for game moves
+;       BOOK_MOVE_FROM/TO - output for book response
+;
+; ==============================================================================
+
+; ==============================================================================
+; BOOK_LOOKUP - Search opening book for current position
+; ==============================================================================
+; Input:  GAME_PLY = number of moves played
+;         MOVE_HIST = game move history (2 bytes per move)
+; Output: D = 1 if book hit, 0 if no match
+;         BOOK_MOVE_FROM/TO = response move (if hit)
+; Uses:   R7, R8, R9, R10
+; ==============================================================================
+BOOK_LOOKUP:
+    ; R8 = current trie node (root = start position)
+    RLDI 8, OPENING_BOOK
+
+    ; R9 = next game move to follow
+    RLDI 9, MOVE_HIST
+
+    ; R7.1 = game moves still to follow
+    RLDI 10, GAME_PLY
+    LDN 10
+    PHI 7
+
+BT_NODE_LOOP:
+    GHI 7
+    LBZ BT_AT_POSITION  ; Followed every game move: R8 = this position's node
+
+    ; Skip the node's response, read its child count
+    INC 8
+    INC 8
+    LDA 8               ; D = n_children, R8 -> first edge
+    LBZ BT_NO_MATCH     ; Leaf: the game has left the book
+    PLO 7               ; R7.0 = edges left to try
+
+BT_EDGE_LOOP:
+    ; Compare edge from with history from
+    LDA 8               ; D = edge from, R8 -> edge to
+    STR 2
+    LDN 9               ; D = history from
+    XOR
+    LBNZ BT_SKIP_TO     ; Mismatch: skip edge to + address
+
+    ; Compare edge to with history to
+    LDA 8               ; D = edge to, R8 -> child address
+    STR 2
+    INC 9
+    LDN 9               ; D = history to
+    DEC 9
+    XOR
+    LBNZ BT_SKIP_ADDR   ; Mismatch: skip address
+
+    ; Edge matches: R8 = child node (high byte first)
+    LDA 8
+    PHI 10
+    LDN 8
+    PLO 8
+    GHI 10
+    PHI 8
+
+    ; Next game move, one fewer to follow
+    INC 9
+    INC 9
+    GHI 7
+    SMI 1
+    PHI 7
+    LBR BT_NODE_LOOP
+
+BT_SKIP_TO:
+    INC 8               ; Past edge to -> R8 at child address
+BT_SKIP_ADDR:
+    INC 8
+    INC 8               ; Past child address -> R8 at next edge
+    DEC 7               ; R7.0 >= 1 here, so R7.1 is untouched
+    GLO 7
+    LBNZ BT_EDGE_LOOP
+    LBR BT_NO_MATCH     ; No child for the game move: out of book
+
+BT_AT_POSITION:
+    ; R8 = node of the current position; $FF = no book move here
+    ; Set up the output pointer first (RLDI clobbers D!)
+    RLDI 9, BOOK_MOVE_FROM
+    LDN 8               ; D = response from
+    XRI $FF
+    LBZ BT_NO_MATCH
+
+    LDA 8               ; Response from
+    STR 9
+    INC 9
+    LDN 8               ; Response to
+    STR 9
+
+    ; Return success
+    LDI 1
+    RETN
+
+BT_NO_MATCH:
+    ; No book match found
+    LDI 0
+    RETN
+
+; ==============================================================================
+; End of Opening Book Lookup (trie format)
+; ==============================================================================
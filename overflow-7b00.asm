@@ -145,3 +145,55 @@ BP_VECTOR:
     MARK                ; T & M(R2) <- (X,P)
     SEP 1               ; -> BIOS breakpoint handler: full register dump
     LBR $8003           ; monitor warm start (safety, if handler returns)
+
+; ==============================================================================
+; FEN field helpers for UCI_POS_FEN (uci.asm), LEAF
+; ==============================================================================
+; UCI_FEN_FIELD - Step R10 to the start of the next space-separated field
+; In:  R10 inside a field or on its separator
+; Out: D = first char of the next field (R10 at it), 0 at end of string
+; ------------------------------------------------------------------------------
+UCI_FEN_FIELD:
+    LDN 10
+    LBZ UCI_FEN_FIELD_RET
+    INC 10
+    XRI ' '
+    LBNZ UCI_FEN_FIELD
+    LDN 10
+UCI_FEN_FIELD_RET:
+    RETN
+
+; ------------------------------------------------------------------------------
+; UCI_FEN_PIECE_CODE - piece code of a placement letter (W_PAWN..B_KING)
+; UCI_FEN_CASTLE_BIT - CASTLE_* bit of a castling letter (KQkq)
+; In:  R13.0 = char
+; Out: D = 1-based position of the char in the table, 0 if absent. The '/'
+;      pads (never passed in: it ends a rank) make that position the value.
+; Uses: R7, R13.1
+; ------------------------------------------------------------------------------
+UCI_FEN_CASTLE_BIT:
+    RLDI 7, FEN_CASTLES
+    LBR UCI_FEN_LOOKUP
+UCI_FEN_PIECE_CODE:
+    RLDI 7, FEN_PIECES
+UCI_FEN_LOOKUP:
+    LDI 0
+    PHI 13
+UCI_FEN_LOOKUP_LOOP:
+    GHI 13
+    ADI 1
+    PHI 13              ; R13.1 = position of the next table char
+    LDA 7
+    LBZ UCI_FEN_LOOKUP_RET  ; End of table: D = 0
+    STR 2
+    GLO 13
+    XOR
+    LBNZ UCI_FEN_LOOKUP_LOOP
+    GHI 13
+UCI_FEN_LOOKUP_RET:
+    RETN
+
+FEN_PIECES:
+    DB "PNBRQK//pnbrqk", 0  ; W_PAWN..W_KING = 1-6, B_PAWN..B_KING = 9-14
+FEN_CASTLES:
+    DB "KQ/k///q", 0        ; CASTLE_WK = 1, WQ = 2, BK = 4, BQ = 8
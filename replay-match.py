@@ -26,16 +26,31 @@ reproduce the original match's per-search depth schedule), positions with no
 is treated as the CRASH/HANG signal: the script stops immediately and sends
 NOTHING further, leaving the engine untouched for ROM-monitor forensics
 (first dump: NODES_SEARCHED at $6412-$6415 = the dying node).
+
+Search cache (both modes, tools/elph_cache.py): a search that reaches its
+requested depth depends only on the build and the commands before it, so it
+is stored keyed on (engine build, commands since ucinewgame, go) and a replay
+only runs the searches it has never seen; cached ones print "[cached]". A
+search the clock cuts short is not stored, and the rest of its game runs
+uncached. Before the first uncached search the engine is caught up — a
+sim:<image> port resumes from the machine snapshot cached with the last hit,
+a board replays the skipped commands and checks each search against the
+cache. A board's build is the image at ELPH_BIN (default chess-engine.bin).
+ELPH_CACHE= (empty) turns the cache off.
 """
 import sys
 import os
 import time
-import serial
 import re
 
-SERIAL_PORT = '/dev/ttyUSB0'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tools'))
+from elph_sim import open_serial
+
+# ELPH_PORT overrides the port: a pty from `tools/elph_sim.py --pty`, or
+# sim:<image> to run the simulator in-process
+SERIAL_PORT = os.environ.get('ELPH_PORT', '/dev/ttyUSB0')
 BAUD_RATE = 19200
-LOG_FILE = '/home/phiber/proj-chess/replay-debug.log'
+LOG_FILE = os.environ.get('ELPH_LOG', '/home/phiber/proj-chess/replay-debug.log')
 
 # Timing borrowed from elph-bridge.py
 CHAR_DELAY = 0.003
@@ -148,7 +163,137 @@ def read_until_token(ser, log, token, timeout):
     return None
 
 
-def replay_uci_script(path, ser, log):
+def send_reset(ser, cmd, log):
+    """'uci' / 'ucinewgame': send, give the board time to clear, drain."""
+    send_line(ser, cmd, log)
+    time.sleep(1.5)
+    while ser.in_waiting:            # drain id/uciok/banner
+        log.write(f"RX: {ser.read(ser.in_waiting).decode('latin-1', errors='replace')}\n")
+    log.flush()
+
+
+def open_cache():
+    """(SearchCache, build hash) for the engine on SERIAL_PORT, or (None, None)
+    when caching is off (ELPH_CACHE empty) or the build is unknown. A sim: port
+    hashes its own image; a board is assumed to run ELPH_BIN (chess-engine.bin)."""
+    from elph_cache import SearchCache, image_hash, DEFAULT_DIR
+    if not os.environ.get('ELPH_CACHE', DEFAULT_DIR):
+        return None, None
+    if SERIAL_PORT.startswith('sim:'):
+        image = SERIAL_PORT[4:]
+    else:
+        image = os.environ.get('ELPH_BIN', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                        'chess-engine.bin'))
+    if not os.path.exists(image):
+        print(f"Search cache off: no image {image} to key it on (set ELPH_BIN)")
+        return None, None
+    return SearchCache(), image_hash(image)
+
+
+class CachedEngine:
+    """Sends a replay's commands to the engine, answering each search from the
+    search cache when (build, commands since ucinewgame, go) is already known.
+
+    Cached searches are not sent; they and everything before them are held
+    back until a search misses. Then the engine is brought to the state they
+    would have left it in (TT contents included) before that search runs: a
+    simulator port resumes from the snapshot stored with the last cached
+    search; a board replays the held-back commands, and every replayed search
+    is checked against its cached result. A replay whose searches are all
+    cached never touches the engine.
+
+    Only searches that reached their requested depth are cached; after one
+    that the clock cut short (elph_cache.reproducible), the rest of the game
+    runs uncached, since its TT contents depend on that search."""
+
+    def __init__(self, ser, log, cache=None, build=None):
+        self.ser, self.log = ser, log
+        self.cache, self.build = cache, build
+        self.history = []       # state-changing commands since ucinewgame
+        self.deferred = []      # (command, history before it) held back
+        self.snap = None        # (len(deferred) it covers, snapshot) from the cache
+        self.clean = True       # no clock-limited search since ucinewgame
+
+    def command(self, cmd):
+        """A state-changing command other than go (position, ucinewgame, ...)."""
+        if self.cache is None or (not self.clean and cmd != 'ucinewgame'):
+            if cmd == 'ucinewgame':
+                send_reset(self.ser, cmd, self.log)
+            else:
+                send_line(self.ser, cmd, self.log)
+            return
+        if cmd == 'ucinewgame':
+            # everything before it is wiped on the board too
+            self.history, self.deferred, self.snap = [], [], None
+            self.clean = True
+            self.deferred.append((cmd, []))
+        else:
+            self.deferred.append((cmd, list(self.history)))
+            self.history.append(cmd)
+
+    def go(self, cmd):
+        """Run (or look up) one search: (bestmove line or None, infos, cached)."""
+        if self.cache is None or not self.clean:
+            send_line(self.ser, cmd, self.log)
+            return read_until_bestmove(self.ser, self.log, BESTMOVE_TIMEOUT) + (False,)
+        key = self.cache.key(self.build, self.history, cmd)
+        hit = self.cache.get(key)
+        if hit:
+            self.deferred.append((cmd, list(self.history)))
+            self.history.append(cmd)
+            if hit['snapshot']:
+                self.snap = (len(self.deferred), hit['snapshot'])
+            self.log.write(f"TX: {cmd}  (cached: bestmove {hit['bestmove']})\n")
+            self.log.flush()
+            return f"bestmove {hit['bestmove']}", [tuple(i) for i in hit['info']], True
+        self.history.append(cmd)
+        if not self.catch_up():
+            return None, [], False
+        send_line(self.ser, cmd, self.log)
+        bestmove, infos = read_until_bestmove(self.ser, self.log, BESTMOVE_TIMEOUT)
+        if bestmove is not None:
+            self.store(key, cmd, bestmove, infos)
+        return bestmove, infos, False
+
+    def store(self, key, cmd, bestmove, infos):
+        from elph_cache import reproducible
+        if not (self.clean and reproducible(cmd, infos)):
+            self.clean = False
+            return
+        snap = self.ser.snapshot() if hasattr(self.ser, 'snapshot') else None
+        self.cache.put(key, self.build, cmd, bestmove.split()[1], [list(i) for i in infos], snap)
+
+    def catch_up(self):
+        """Put the engine where the held-back commands leave it. False if a
+        replayed search hangs."""
+        start = 0
+        if self.snap and hasattr(self.ser, 'restore'):
+            start = self.snap[0]
+            self.ser.restore(self.snap[1])
+            self.log.write(f"  (simulator resumed from cached snapshot, {start} commands skipped)\n")
+        for cmd, history in self.deferred[start:]:
+            if cmd == 'ucinewgame':
+                send_reset(self.ser, cmd, self.log)
+                continue
+            send_line(self.ser, cmd, self.log)
+            if not cmd.startswith('go'):
+                continue
+            bestmove, infos = read_until_bestmove(self.ser, self.log, BESTMOVE_TIMEOUT)
+            if bestmove is None:
+                print(f"  >>> NO BESTMOVE while replaying cached search '{cmd}' <<<")
+                return False
+            key = self.cache.key(self.build, history, cmd)
+            want = self.cache.get(key)
+            if want and want['bestmove'] != bestmove.split()[1]:
+                print(f"  !!! cache mismatch on '{cmd}': engine {bestmove}, cached {want['bestmove']}"
+                      f" (engine is not the build the cache was keyed on?)")
+                self.log.write(f"!!! cache mismatch: cached bestmove {want['bestmove']}\n")
+            self.store(key, cmd, bestmove, infos)
+        self.deferred, self.snap = [], None
+        return True
+
+
+def replay_uci_script(path, ser, log, engine):
     """Play a .uci command script verbatim. Each 'go' uses the depth written
     in the file; 'position' lines with no following 'go' are state-only (book
     moves). On bestmove timeout: STOP, send nothing more (monitor forensics)."""
@@ -172,28 +317,21 @@ def replay_uci_script(path, ser, log):
     i = 0
     while i < len(cmds):
         cmd = cmds[i]
-        if cmd in ('uci', 'ucinewgame'):
-            send_line(ser, cmd, log)
-            time.sleep(1.5)
-            while ser.in_waiting:            # drain id/uciok/banner
-                log.write(f"RX: {ser.read(ser.in_waiting).decode('latin-1', errors='replace')}\n")
-            log.flush()
+        if cmd == 'uci':
+            send_reset(ser, cmd, log)
         elif cmd == 'isready':
             send_line(ser, cmd, log)
             if read_until_token(ser, log, 'readyok', 10) is None:
                 print("  !!! no readyok — engine unresponsive, stopping (state preserved)")
                 log.write("!!! no readyok — stopped\n")
                 return False
-        elif cmd.startswith('position'):
-            send_line(ser, cmd, log)
         elif cmd.startswith('go'):
             search_no += 1
             elapsed_min = (time.time() - start_time) / 60.0
             print(f"[{elapsed_min:5.1f}min] search {search_no}/{n_go}: {cmd}", flush=True)
             log.write(f"\n=== Search {search_no}/{n_go}: {cmd} ===\n")
             log.flush()
-            send_line(ser, cmd, log)
-            bestmove, infos = read_until_bestmove(ser, log, BESTMOVE_TIMEOUT)
+            bestmove, infos, cached = engine.go(cmd)
             if bestmove is None:
                 print(f"  >>> NO BESTMOVE at search {search_no} — CRASH/HANG SIGNATURE <<<")
                 print(f"  >>> Engine untouched. Go to the ROM monitor and dump:")
@@ -202,9 +340,9 @@ def replay_uci_script(path, ser, log):
                 log.write(f">>> CRASH/HANG at search {search_no} — replay halted, bus quiet <<<\n")
                 return False
             last_info = infos[-1][1] if infos else ""
-            print(f"             {bestmove}  ({last_info})")
+            print(f"             {bestmove}  ({last_info}){'  [cached]' if cached else ''}")
         else:
-            send_line(ser, cmd, log)
+            engine.command(cmd)             # position, ucinewgame, setoption ...
         i += 1
 
     total_min = (time.time() - start_time) / 60.0
@@ -227,9 +365,7 @@ def main():
         log = open(LOG_FILE, 'w')
         log.write(f"# Replay started: {time.strftime('%Y-%m-%d %H:%M:%S %Z')}\n")
         try:
-            ser = serial.Serial(port=SERIAL_PORT, baudrate=BAUD_RATE,
-                                bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE,
-                                stopbits=serial.STOPBITS_ONE, timeout=0.1)
+            ser = open_serial(SERIAL_PORT, BAUD_RATE)
             ser.reset_input_buffer()
             ser.reset_output_buffer()
             print(f"Serial: {ser.name} @ {ser.baudrate}")
@@ -237,7 +373,8 @@ def main():
             print(f"ERROR: serial open failed: {e}")
             sys.exit(1)
         time.sleep(0.3)
-        clean = replay_uci_script(src_log, ser, log)
+        cache, build = open_cache()
+        clean = replay_uci_script(src_log, ser, log, CachedEngine(ser, log, cache, build))
         log.close()
         ser.close()
         sys.exit(0 if clean else 2)
@@ -267,14 +404,7 @@ def main():
     log.flush()
 
     try:
-        ser = serial.Serial(
-            port=SERIAL_PORT,
-            baudrate=BAUD_RATE,
-            bytesize=serial.EIGHTBITS,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            timeout=0.1,
-        )
+        ser = open_serial(SERIAL_PORT, BAUD_RATE)
         ser.reset_input_buffer()
         ser.reset_output_buffer()
         print(f"Serial: {ser.name} @ {ser.baudrate}")
@@ -292,10 +422,9 @@ def main():
 
     # SINGLE ucinewgame for the entire replay - this is critical.
     # All subsequent searches inherit accumulated TT state.
-    send_line(ser, 'ucinewgame', log)
-    time.sleep(1.5)
-    while ser.in_waiting:
-        ser.read(ser.in_waiting)
+    cache, build = open_cache()
+    engine = CachedEngine(ser, log, cache, build)
+    engine.command('ucinewgame')
 
     # Replay each prefix in sequence.
     # IMPORTANT: original match only fed even-count prefixes to the engine
@@ -328,10 +457,8 @@ def main():
         log.write(f"\n=== Search at move {mv} (after {i} plies): position ends with '{ends_with}' ===\n")
         log.flush()
 
-        send_line(ser, pos_cmd, log)
-        send_line(ser, f'go depth {depth}', log)
-
-        bestmove, infos = read_until_bestmove(ser, log, BESTMOVE_TIMEOUT)
+        engine.command(pos_cmd)
+        bestmove, infos, cached = engine.go(f'go depth {depth}')
 
         if bestmove is None:
             print(f"  !!! TIMEOUT waiting for bestmove at move {mv}")
@@ -341,7 +468,8 @@ def main():
         bm_parts = bestmove.split()
         engine_move = bm_parts[1] if len(bm_parts) >= 2 else "?"
         last_info = infos[-1][1] if infos else ""
-        print(f"             engine says: bestmove {engine_move}  ({last_info})")
+        print(f"             engine says: bestmove {engine_move}  ({last_info})"
+              f"{'  [cached]' if cached else ''}")
 
         # Heuristic illegal-move check: if next move in our list is white-to-move
         # and the engine output a bestmove that doesn't appear plausible. The
@@ -20,13 +20,17 @@ pre-A+B corpus baseline. Per game it answers:
 
 Usage: /tmp/chess_venv/bin/python tools/analyze_endgame_mechanism.py <log> [<log>...]
        add --csv to also dump per-game rows to stdout as CSV.
-Dedups by final movelist (identical games counted once).
+Needs only each search's last cp score, so --no-infos archives work; a game
+repeated across logs (same final movelist) is counted once.
 """
-import re, sys, statistics
+import os, sys, statistics
 
 sys.path.insert(0, "/tmp/chess_venv/lib/python3.12/site-packages")
 import chess
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from elph_corpus import Metric, measure_corpus, run_metrics
+
 PV = {chess.PAWN: 100, chess.KNIGHT: 320, chess.BISHOP: 330,
       chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 0}
 
@@ -37,56 +41,50 @@ LOSING_CP    = -500     # ~a rook or more down, matches the corpus "-5+" bucket
 AMP_CP       = -1750    # amp is -2000 on top of <= -250, so anything <= -1750
 
 
-def parse_searches(txt):
-    """yield (moves_before_search, deepest_eval_cp_or_None, bestmove) per ELPH search."""
-    pos, ev = None, None
-    for line in txt.splitlines():
-        if "TX: 'position startpos" in line:
-            m = re.search(r"position startpos(?: moves ([a-h1-8qrbnk ]+))?'", line)
-            if m:
-                pos = m.group(1).split() if m.group(1) else []
-                ev = None
-            continue
-        if "RX: 'info" in line:
-            m = re.search(r"score cp (-?\d+)", line)
-            if m:
-                ev = int(m.group(1))          # keep the deepest (last) info line
-            continue
-        if "RX: 'bestmove" in line and pos is not None:
-            m = re.search(r"bestmove (\S+?)'", line)
-            if m:
-                yield list(pos), ev, m.group(1)
-            pos = None
-
-
 def material_white(board):
     w = sum(PV[p.piece_type] for p in board.piece_map().values() if p.color)
     b = sum(PV[p.piece_type] for p in board.piece_map().values() if not p.color)
     return w - b
 
 
-def analyze_game(path):
-    txt = open(path, errors="replace").read()
-    searches = list(parse_searches(txt))
+class EndgameMetric(Metric):
+    """Per-game mechanism row (see analyze_game) from the shared replay."""
+    name = "endgame"
+
+    def begin(self, game):
+        super().begin(game)
+        # last position + last bestmove is the final state
+        self.final_plies = len(game.final_moves())
+        self.final = None
+
+    def position(self, step):
+        if step.ply == self.final_plies:
+            self.final = (material_white(step.board), step.board.is_checkmate())
+
+    def end(self, ok):
+        return game_row(self.game, self.final)
+
+
+def analyze_game(game):
+    return run_metrics(game, [EndgameMetric()])["endgame"]
+
+
+def game_row(game, final):
+    """`final` = (white material, checkmate) of the final position, or None
+    if it could not be replayed."""
+    # (moves_before_search, deepest_eval_cp_or_None, bestmove) per ELPH search
+    searches = [(s.moves, s.eval, s.bestmove) for s in game.searches]
     if not searches:
         return None
 
     # ELPH is the side to move at its own searches
     elph_white = len(searches[0][0]) % 2 == 0
 
-    # replay the full game: last position + last bestmove is the final state
-    final_moves = searches[-1][0] + [searches[-1][2]]
-    board = chess.Board()
-    replay_ok = True
-    for mv in final_moves:
-        try:
-            board.push_uci(mv)
-        except Exception:
-            replay_ok = False
-            break
+    final_moves = game.final_moves()
+    replay_ok = final is not None
 
     plies = len(final_moves)
-    mat_w = material_white(board) if replay_ok else None
+    mat_w = final[0] if replay_ok else None
     mat_elph = None if mat_w is None else (mat_w if elph_white else -mat_w)
 
     # ELPH's reported eval series (its own POV; skip book moves with no info)
@@ -118,12 +116,12 @@ def analyze_game(path):
             phantom = statistics.mean(honest) - mat_elph
 
     return {
-        "path": path,
+        "path": game.path,
         "key": " ".join(final_moves),
         "elph": "W" if elph_white else "B",
         "plies": plies,
         "mat_elph": mat_elph,
-        "mate": replay_ok and board.is_checkmate(),
+        "mate": replay_ok and final[1],
         "n_evals": len(ev_series),
         "ev_min": min(ev_series) if ev_series else None,
         "ev_last": ev_series[-1] if ev_series else None,
@@ -160,19 +158,8 @@ def resign_bucket(g):
 
 
 def main(paths, csv=False):
-    games, seen = [], set()
-    for p in paths:
-        try:
-            g = analyze_game(p)
-        except Exception as e:
-            print(f"{p}: ERR {e}", file=sys.stderr)
-            continue
-        if g is None:
-            continue
-        if g["key"] in seen:
-            continue
-        seen.add(g["key"])
-        games.append(g)
+    games = [r["endgame"] for _, r in measure_corpus(paths, [EndgameMetric], infos=False)
+             if r["endgame"] is not None]
 
     if not games:
         print("no parseable games")
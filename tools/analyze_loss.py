@@ -4,10 +4,14 @@ python-chess and compare the engine's reported d5 eval to the ACTUAL material on
 the board. Separates shuffle/loss root causes by grounding eval against reality.
 
 Run with the venv python: /tmp/chess_venv/bin/python tools/analyze_loss.py <log>...
+Only searches with a depth-5 info line count, so --no-infos archives give
+no rows; book moves and |eval| > 1800 (amp/mate) are skipped.
 """
-import re, sys
+import os, sys
 sys.path.insert(0, "/tmp/chess_venv/lib/python3*/site-packages")
 import chess
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from elph_corpus import Metric, measure_corpus, run_metrics
 
 PV = {chess.PAWN:100, chess.KNIGHT:320, chess.BISHOP:330,
       chess.ROOK:500, chess.QUEEN:900, chess.KING:0}
@@ -19,34 +23,30 @@ def material_stm(board):
     bal = w - b
     return bal if board.turn == chess.WHITE else -bal
 
-def replay(moves):
-    bd = chess.Board()
-    for m in moves:
-        try: bd.push_uci(m)
-        except Exception: return None
-    return bd
+class GroundedEvals(Metric):
+    """(ply, d5 eval, actual material stm POV, bestmove) per usable search."""
+    name = "grounded"
 
-def searches(txt):
-    """yield (moves_list, d5_eval_or_None, bestmove) per engine search."""
-    pos, ev = None, None
-    for line in txt.splitlines():
-        m = re.search(r"position startpos moves ([a-h1-8qrbn ]+)", line)
-        if m: pos = m.group(1).split(); ev = None; continue
-        m = re.search(r"info depth 5 score cp (-?\d+)", line)
-        if m: ev = int(m.group(1)); continue
-        m = re.search(r"bestmove (\S+)", line)
-        if m and pos is not None:
-            yield pos, ev, m.group(1).strip().strip("'")
+    def begin(self, game):
+        super().begin(game)
+        self.rows = []
 
-def analyze(path):
-    txt = open(path).read()
-    rows = []
-    for moves, ev, bm in searches(txt):
+    def position(self, step):
+        # ply 0 is a bare "position startpos": never counted (as before the store)
+        if step.search is None or step.ply == 0: return
+        ev = step.search.eval_at_depth(5)
         if ev is None or abs(ev) > 1800:   # skip book + hopeless-amp/mate
-            continue
-        bd = replay(moves)
-        if bd is None: continue
-        rows.append((len(moves), ev, material_stm(bd)))
+            return
+        self.rows.append((step.ply, ev, material_stm(step.board), step.bestmove))
+
+    def end(self, ok):
+        return self.rows
+
+def analyze(game):
+    report(game.path, run_metrics(game, [GroundedEvals()])["grounded"])
+
+def report(path, rows):
+    rows = [r[:3] for r in rows]
     if not rows:
         print(f"{path.split('/')[-1][:46]:46s}  (no usable searches)"); return
     elph = "W" if rows[0][0] % 2 == 0 else "B"   # ELPH to move at its searches
@@ -73,21 +73,11 @@ def analyze(path):
           f"mat[1st6]={early_mat:+5.0f} mat_min={min(mats):+5d} "
           f"eval-mat_avg={avg_opt:+5.0f}  -> {cls}")
 
-if __name__ == "__main__":
-    for p in sys.argv[1:]:
-        try: analyze(p)
-        except Exception as e: print(f"{p}: ERR {e}")
-
-def trace(path):
-    txt = open(path).read()
+def trace(game):
+    path = game.path
     prev = None
     print(f"--- {path.split('/')[-1]} : per-move (eval / actual material, stm POV); * = sharp swing ---")
-    seq=[]
-    for moves, ev, bm in searches(txt):
-        if ev is None or abs(ev) > 1800: continue
-        bd = replay(moves)
-        if bd is None: continue
-        seq.append((len(moves)//1, ev, material_stm(bd), bm))
+    seq = run_metrics(game, [GroundedEvals()])["grounded"]
     for i,(ply,ev,mat,bm) in enumerate(seq):
         swing = ""
         if i>0:
@@ -98,3 +88,7 @@ def trace(path):
         if i>=2 and seq[i-2][2]-mat >= 250:
             seq_disp += f"   *** material dropped {seq[i-2][2]-mat} vs 2-ply-ago ***"
         print(seq_disp)
+
+if __name__ == "__main__":
+    for path, r in measure_corpus(sys.argv[1:], [GroundedEvals]):
+        report(path, r["grounded"])
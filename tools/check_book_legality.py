@@ -5,15 +5,21 @@ Opening-book legality sweep for the RCA 1806 chess engine.
 Parses the COMPILED book (opening-book.asm), walks it exactly as the engine's
 BL_ENTRY_LOOP does (read ply byte; $FF = end; then 2*ply move bytes + 2 response
 bytes), replays each entry from the start position with python-chess, and flags
-any entry whose move sequence OR recommended response is illegal.
+any entry whose move sequence OR recommended response is illegal. A trie-format
+book (merge_books.py --trie) is walked node by node instead, each node with a
+response being one entry; a Zobrist-keyed book (zobrist_book.py) is checked
+along the move order recorded with each hash entry.
 
 An illegal book move is an instant forfeit, so this must come back 100% clean.
 
 Run:  /tmp/chess_venv/bin/python3 tools/check_book_legality.py [opening-book.asm]
 """
-import re, sys
+import os, re, sys
 import chess
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from pgn_to_book import TRIE_MARKER, ZOBRIST_MARKER, read_book
+
 def x88_to_sq(b):
     """0x88 byte -> python-chess square (or None if off-board)."""
     file = b & 0x0F
@@ -38,23 +44,34 @@ def load_book_bytes(path):
             bytes_out.append(int(hx, 16))
     return bytes_out
 
-def main():
-    path = sys.argv[1] if len(sys.argv) > 1 else 'opening-book.asm'
-    data = load_book_bytes(path)
+def flat_entries(data):
+    """(ply, move bytes, response bytes) per linear-format entry; a truncated
+    last entry comes back with moves None."""
     i = 0
-    entries = 0
-    bad = []
     while i < len(data):
         ply = data[i]
         if ply == 0xFF:           # end-of-book terminator
             break
         need = 1 + 2 * ply + 2
         if i + need > len(data):
-            bad.append((entries, ply, "TRUNCATED entry (runs past end of data)", None))
+            yield ply, None, None
             break
-        moves = data[i+1 : i+1+2*ply]
-        resp  = data[i+1+2*ply : i+3+2*ply]
+        yield ply, data[i+1 : i+1+2*ply], data[i+1+2*ply : i+3+2*ply]
         i += need
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'opening-book.asm'
+    text = open(path).read()
+    if TRIE_MARKER in text or ZOBRIST_MARKER in text:
+        book = [(len(pos), [b for m in pos for b in m], resp) for pos, resp, _ in read_book(path)]
+    else:
+        book = flat_entries(load_book_bytes(path))
+    entries = 0
+    bad = []
+    for ply, moves, resp in book:
+        if moves is None:
+            bad.append((entries, ply, "TRUNCATED entry (runs past end of data)", None))
+            break
         entries += 1
 
         board = chess.Board()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Compact binary archive of match games (.elpharc), memory-mapped for reading.
+
+An elph-debug log repeats the whole movelist in every position line, so it
+grows with the square of the game length. An archive stores each game's
+moves once, 2 bytes a move in the engine's own 0x88 encoding (what MOVE_HIST
+holds), plus fixed-size records per search and per info line. Every table
+is a flat array at a known offset, so opening an archive is an mmap and a
+header read: a game is decoded only when it is asked for.
+
+Layout (little-endian):
+    header   magic 'ELPHARC1', then u32: version, games, moves, searches,
+             infos, and the byte offsets of the five sections below
+    games    per game  <IIIIHHH2x  first move, first search, path offset,
+                                   path length, moves, searches, game_no
+    moves    per move  <H   from | to << 8 as 0x88 squares. Bit 7 of the
+             `to` byte flags a promotion; the piece (q r b n = 0..3) sits in
+             the two 0x88 off-board bits: bit 3 of `from` (low) and bit 3
+             of `to` (high) — never set on a real square.
+    searches per search <HhHbBBxHHIIII  ply, eval cp, bestmove, mate,
+             depth, flags (1 = book), info lines in the log, info records
+             kept, nodes, position time ms, bestmove time ms, first info
+    infos    per info  <BBhII  depth, flags (1 = cp, 2 = mate), score,
+             nodes, time ms
+    paths    UTF-8 log paths the games came from
+
+Absent values: eval -32768, mate 0, depth 0, nodes / times 0xFFFFFFFF.
+Times are the log timestamps, in ms.
+
+Games come back as the same Game / Search objects tools/elph_corpus.py
+builds, so replay(), run_metrics() and every corpus tool work on them.
+measure_corpus() takes .elpharc paths next to logs.
+
+    from elph_archive import Archive
+    arc = Archive('corpus.elpharc')
+    len(arc), arc[0].moves, arc[0].searches[3].eval
+    arc.moves_array          # memoryview of every move (u16), all games
+
+Usage:
+    python3 tools/elph_archive.py OUT.elpharc [logs...]    # convert (default ./elph-debug*.log)
+    python3 tools/elph_archive.py --info ARCHIVE            # sizes, load time
+    options: --no-infos (drop per-info-line records)
+"""
+import glob
+import mmap
+import os
+import struct
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from elph_corpus import Game, Search, log_games
+from elph_squares import square_x88, x88_name
+
+MAGIC = b'ELPHARC1'
+VERSION = 1
+HEADER = struct.Struct('<8s10I')
+GAME = struct.Struct('<IIIIHHH2x')
+SEARCH = struct.Struct('<HhHbBBxHHIIII')
+INFO = struct.Struct('<BBhII')
+NO_EVAL = -32768
+NONE32 = 0xFFFFFFFF
+PROMO = 'qrbn'
+
+
+def encode_move(uci):
+    """'e7e8q' -> u16 (see the layout above)."""
+    frm, to = square_x88(uci[0:2]), square_x88(uci[2:4])
+    if len(uci) > 4:
+        p = PROMO.index(uci[4].lower())
+        frm |= (p & 1) << 3
+        to |= 0x80 | (p >> 1) << 3
+    return frm | to << 8
+
+
+def decode_move(code):
+    frm, to = code & 0xFF, code >> 8
+    uci = x88_name(frm) + x88_name(to)
+    if to & 0x80:
+        uci += PROMO[(frm >> 3 & 1) | (to >> 3 & 1) << 1]
+    return uci
+
+
+def _ms(t):
+    return NONE32 if t is None else int(round(t * 1000))
+
+
+def _secs(ms):
+    return None if ms == NONE32 else ms / 1000
+
+
+def write_archive(path, games, infos=True):
+    """Write Game objects (elph_corpus) to `path`; returns the game count."""
+    game_recs, moves, searches, info_recs, paths = [], [], [], [], bytearray()
+    for g in games:
+        name = g.path.encode('utf-8')
+        game_recs.append((len(moves), len(searches), len(paths), len(name),
+                          len(g.moves), len(g.searches), g.game_no))
+        paths += name
+        moves.extend(encode_move(m) for m in g.moves)
+        for s in g.searches:
+            first = len(info_recs)
+            for depth, cp, mate, nodes, t in (s.infos or ()) if infos else ():
+                flags, score = (1, cp) if cp is not None else ((2, mate) if mate is not None else (0, 0))
+                info_recs.append((depth or 0, flags, score, NONE32 if nodes is None else nodes, _ms(t)))
+            searches.append((s.ply, NO_EVAL if s.eval is None else s.eval,
+                             encode_move(s.bestmove) if s.bestmove and len(s.bestmove) >= 4 else 0,
+                             s.mate or 0, s.depth or 0, 1 if s.book else 0,
+                             s.n_info or 0, len(info_recs) - first,
+                             NONE32 if s.nodes is None else s.nodes,
+                             _ms(s.t_position), _ms(s.t_bestmove), first))
+    off_games = HEADER.size
+    off_moves = off_games + GAME.size * len(game_recs)
+    off_searches = off_moves + 2 * len(moves)
+    off_infos = off_searches + SEARCH.size * len(searches)
+    off_paths = off_infos + INFO.size * len(info_recs)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(game_recs), len(moves), len(searches),
+                            len(info_recs), off_games, off_moves, off_searches, off_infos,
+                            off_paths))
+        for r in game_recs:
+            f.write(GAME.pack(*r))
+        f.write(struct.pack(f'<{len(moves)}H', *moves))
+        for r in searches:
+            f.write(SEARCH.pack(*r))
+        for r in info_recs:
+            f.write(INFO.pack(*r))
+        f.write(paths)
+    return len(game_recs)
+
+
+class Archive:
+    """Read-only, memory-mapped .elpharc. Indexing decodes one game."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.n_games, self.n_moves, self.n_searches, self.n_infos,
+         self.off_games, self.off_moves, self.off_searches, self.off_infos,
+         self.off_paths) = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not an ELPH archive (version {VERSION})")
+        self.moves_array = memoryview(self.mm)[self.off_moves:self.off_moves + 2 * self.n_moves].cast('H')
+
+    def __len__(self):
+        return self.n_games
+
+    def game_record(self, i):
+        """(first move, first search, path offset, path length, moves,
+        searches, game_no) of game i, undecoded."""
+        if not 0 <= i < self.n_games:
+            raise IndexError(i)
+        return GAME.unpack_from(self.mm, self.off_games + GAME.size * i)
+
+    def moves(self, i):
+        """Game i's movelist (UCI strings)."""
+        m0, _, _, _, nm, _, _ = self.game_record(i)
+        return [decode_move(c) for c in self.moves_array[m0:m0 + nm]]
+
+    def final_key(self, i):
+        """Game i's final movelist as a string (the dedup key)."""
+        m0, s0, _, _, nm, ns, _ = self.game_record(i)
+        moves = self.moves(i)
+        if not ns:
+            return ' '.join(moves)
+        ply, _, best = SEARCH.unpack_from(self.mm, self.off_searches + SEARCH.size * (s0 + ns - 1))[:3]
+        return ' '.join(moves[:ply] + [decode_move(best)])
+
+    def __getitem__(self, i):
+        m0, s0, p0, plen, nm, ns, game_no = self.game_record(i)
+        path = bytes(self.mm[self.off_paths + p0:self.off_paths + p0 + plen]).decode('utf-8')
+        moves = [decode_move(c) for c in self.moves_array[m0:m0 + nm]]
+        searches = []
+        for k in range(s0, s0 + ns):
+            (ply, ev, best, mate, depth, flags, n_info, kept, nodes, t_pos, t_best,
+             i0) = SEARCH.unpack_from(self.mm, self.off_searches + SEARCH.size * k)
+            infos = []
+            for j in range(i0, i0 + kept):
+                d, iflags, score, inodes, t = INFO.unpack_from(self.mm, self.off_infos + INFO.size * j)
+                infos.append((d or None, score if iflags & 1 else None, score if iflags & 2 else None,
+                              None if inodes == NONE32 else inodes, _secs(t)))
+            searches.append(Search(
+                ply=ply, moves=moves[:ply], bestmove=decode_move(best) if best else None,
+                eval=None if ev == NO_EVAL else ev, mate=mate or None, depth=depth or None,
+                nodes=None if nodes == NONE32 else nodes, n_info=n_info,
+                t_position=_secs(t_pos), t_bestmove=_secs(t_best), book=bool(flags & 1),
+                infos=infos))
+        return Game(path, game_no, moves, searches)
+
+    def games(self):
+        for i in range(self.n_games):
+            yield self[i]
+
+    def close(self):
+        self.moves_array.release()
+        self.mm.close()
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Convert elph-debug logs to a binary archive")
+    ap.add_argument('archive', nargs='?', help="output .elpharc")
+    ap.add_argument('logs', nargs='*', help="logs (default: ./elph-debug*.log)")
+    ap.add_argument('--info', metavar='ARCHIVE', help="describe an archive")
+    ap.add_argument('--no-infos', action='store_true', help="leave out per-info-line records")
+    args = ap.parse_args()
+
+    if args.info:
+        t0 = time.perf_counter()
+        arc = Archive(args.info)
+        games = list(arc.games())
+        dt = time.perf_counter() - t0
+        print(f"{args.info}: {os.path.getsize(args.info)} bytes, {arc.n_games} games, "
+              f"{arc.n_moves} moves, {arc.n_searches} searches, {arc.n_infos} info lines; "
+              f"all games decoded in {dt * 1000:.0f} ms")
+        del games
+        arc.close()
+        return 0
+    if not args.archive:
+        ap.error("give an output archive or --info")
+    logs = args.logs or sorted(glob.glob('elph-debug*.log'))
+    games = [g for path in logs for g in log_games(path)]
+    n = write_archive(args.archive, games, infos=not args.no_infos)
+    size = os.path.getsize(args.archive)
+    text = sum(os.path.getsize(p) for p in logs)
+    print(f"{len(logs)} logs ({text} bytes) -> {n} games, {size} bytes ({args.archive})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
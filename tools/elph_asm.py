@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+a18-compatible assembler for the engine build (CDP1802 + the 1805/1806
+extensions it uses), for hosts without a18 or asm1802.
+
+Assembles build.sh's concatenated chess-engine.asm into an Intel HEX file and
+an a18-format listing, byte- and symbol-identical to a18's: the baseline
+source rebuilds listings/chess-engine-702cdaf.lst exactly, so a listing
+written here serves tools/elph_sim.py, elph_prof.py, uci_regress.py and the
+crash-forensics archive like a flashed build's.
+
+Covers what the engine source uses: labels (with or without ':'), EQU, ORG,
+DB/BYTE (numbers, 'c' and "strings"), DW/WORD, DS/BLK, CPU/END; $hex, nnH,
+%bin, decimal and 'c' operands; + - * / % & | ^ << >> ~, unary < > (low /
+high byte), HIGH()/LOW() and $ for the location counter. CALL is the BIOS
+SCRT call (D4 hi lo) and RETN its return (D5), as in the listings.
+
+Errors (undefined symbol, short branch off its page, unknown opcode) are
+listed a18-style with a capital letter in column 0, so build.sh's
+`grep "^[A-Z]" chess-engine.lst` catches them; the exit code is 1.
+
+Usage:
+    python3 tools/elph_asm.py chess-engine.asm -o chess-engine.hex -l chess-engine.lst
+    python3 tools/elph_asm.py chess-engine.asm -l build.lst -b chess-engine.bin
+"""
+import argparse
+import re
+import sys
+
+# Opcode tables: one-byte, immediate, register-in-low-nibble, short and long
+# branches, and the $68-prefixed 1805 forms
+INHERENT = {
+    'IDL': 0x00, 'IRX': 0x60, 'RET': 0x70, 'DIS': 0x71, 'LDXA': 0x72, 'STXD': 0x73,
+    'ADC': 0x74, 'SDB': 0x75, 'SHRC': 0x76, 'RSHR': 0x76, 'SMB': 0x77, 'SAV': 0x78,
+    'MARK': 0x79, 'REQ': 0x7A, 'SEQ': 0x7B, 'SHLC': 0x7E, 'RSHL': 0x7E,
+    'NOP': 0xC4, 'LSNQ': 0xC5, 'LSNZ': 0xC6, 'LSNF': 0xC7, 'LSKP': 0xC8, 'NLBR': 0xC8,
+    'LSIE': 0xCC, 'LSQ': 0xCD, 'LSZ': 0xCE, 'LSDF': 0xCF, 'SKP': 0x38, 'NBR': 0x38,
+    'LDX': 0xF0, 'OR': 0xF1, 'AND': 0xF2, 'XOR': 0xF3, 'ADD': 0xF4, 'SD': 0xF5,
+    'SHR': 0xF6, 'SM': 0xF7, 'SHL': 0xFE, 'RETN': 0xD5,
+}
+IMMEDIATE = {'ADCI': 0x7C, 'SDBI': 0x7D, 'SMBI': 0x7F, 'LDI': 0xF8, 'ORI': 0xF9,
+             'ANI': 0xFA, 'XRI': 0xFB, 'ADI': 0xFC, 'SDI': 0xFD, 'SMI': 0xFF}
+REGISTER = {'LDN': 0x00, 'INC': 0x10, 'DEC': 0x20, 'LDA': 0x40, 'STR': 0x50,
+            'GLO': 0x80, 'GHI': 0x90, 'PLO': 0xA0, 'PHI': 0xB0, 'SEP': 0xD0, 'SEX': 0xE0}
+SHORT_BRANCH = {'BR': 0x30, 'BQ': 0x31, 'BZ': 0x32, 'BDF': 0x33, 'BPZ': 0x33, 'BGE': 0x33,
+                'B1': 0x34, 'B2': 0x35, 'B3': 0x36, 'B4': 0x37, 'BNQ': 0x39, 'BNZ': 0x3A,
+                'BNF': 0x3B, 'BM': 0x3B, 'BL': 0x3B, 'BN1': 0x3C, 'BN2': 0x3D, 'BN3': 0x3E,
+                'BN4': 0x3F}
+LONG_BRANCH = {'LBR': 0xC0, 'LBQ': 0xC1, 'LBZ': 0xC2, 'LBDF': 0xC3, 'LBNQ': 0xC9,
+               'LBNZ': 0xCA, 'LBNF': 0xCB, 'CALL': 0xD4}
+EXT_INHERENT = {'STPC': 0x00, 'DTC': 0x01, 'SPM2': 0x02, 'SCM2': 0x03, 'SPM1': 0x04,
+                'SCM1': 0x05, 'LDC': 0x06, 'STM': 0x07, 'GEC': 0x08, 'ETQ': 0x09,
+                'XIE': 0x0A, 'XID': 0x0B, 'CIE': 0x0C, 'CID': 0x0D, 'DADC': 0x74,
+                'DSAV': 0x76, 'DSMB': 0x77, 'DADD': 0xF4, 'DSM': 0xF7}
+EXT_IMMEDIATE = {'DACI': 0x7C, 'DSBI': 0x7F, 'DADI': 0xFC, 'DSMI': 0xFF}
+EXT_REGISTER = {'RLXA': 0x60, 'SRET': 0x90, 'RSXD': 0xA0, 'RNX': 0xB0}
+EXT_SHORT_BRANCH = {'BCI': 0x3E, 'BXI': 0x3F}
+EXT_REG_WORD = {'DBNZ': 0x20, 'SCAL': 0x80, 'RLDI': 0xC0}
+IGNORED = {'CPU', 'END', 'PAGE', 'TITLE'}
+
+TOKEN = re.compile(r"\s*(?:(\$[0-9A-Fa-f]+|[0-9][0-9A-Fa-f]*[Hh]\b|%[01]+|[0-9]+)"
+                   r"|('(?:[^']|'')')|([A-Za-z_][\w.]*)|(\$)|(<<|>>|[-+*/&|^~()<>!%]))")
+BINARY = {'|': (1, lambda a, b: a | b), '^': (1, lambda a, b: a ^ b),
+          '&': (2, lambda a, b: a & b),
+          '<<': (3, lambda a, b: a << b), '>>': (3, lambda a, b: a >> b),
+          '+': (4, lambda a, b: a + b), '-': (4, lambda a, b: a - b),
+          '*': (5, lambda a, b: a * b), '/': (5, lambda a, b: a // b if b else 0),
+          '%': (5, lambda a, b: a % b if b else 0)}
+
+
+class AsmError(Exception):
+    pass
+
+
+def strip_comment(text):
+    """Source line without its ';' comment (a ';' inside quotes is data)."""
+    quote = None
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif ch == ';':
+            return text[:i]
+    return text
+
+
+def split_operands(text):
+    """'a, "b,c", (d, e)' -> ['a', '"b,c"', '(d, e)']."""
+    args, cur, quote, depth = [], '', None, 0
+    for ch in text:
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            args.append(cur.strip())
+            cur = ''
+            continue
+        cur += ch
+    if cur.strip() or args:
+        args.append(cur.strip())
+    return args
+
+
+class Expression:
+    """Precedence-climbing evaluator over 16-bit values. An undefined symbol
+    evaluates to 0 and sets .undefined (forward references in early passes)."""
+
+    def __init__(self, text, symbols, pc):
+        self.symbols = symbols
+        self.undefined = False
+        self.tokens = []
+        pos, text = 0, text.strip()
+        while pos < len(text):
+            m = TOKEN.match(text, pos)
+            if not m or m.end() == pos:
+                raise AsmError(f"bad expression '{text}'")
+            pos = m.end()
+            num, char, name, here, op = m.groups()
+            if num:
+                if num[0] == '$':
+                    self.tokens.append(('n', int(num[1:], 16)))
+                elif num[-1] in 'Hh':
+                    self.tokens.append(('n', int(num[:-1], 16)))
+                elif num[0] == '%':
+                    self.tokens.append(('n', int(num[1:], 2)))
+                else:
+                    self.tokens.append(('n', int(num)))
+            elif char:
+                self.tokens.append(('n', ord(char[1])))
+            elif name:
+                self.tokens.append(('s', name.upper()))
+            elif here:
+                self.tokens.append(('n', pc))
+            else:
+                self.tokens.append(('o', op))
+        self.i = 0
+
+    def value(self):
+        v = self._binary(0)
+        if self.i != len(self.tokens):
+            raise AsmError('junk after expression')
+        return v & 0xFFFF
+
+    def _peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else (None, None)
+
+    def _take(self):
+        tok = self._peek()
+        self.i += 1
+        return tok
+
+    def _binary(self, min_prec):
+        left = self._unary()
+        while True:
+            kind, op = self._peek()
+            if kind != 'o' or op not in BINARY or BINARY[op][0] <= min_prec:
+                return left
+            self._take()
+            prec, fn = BINARY[op]
+            left = fn(left, self._binary(prec)) & 0xFFFF
+
+    def _unary(self):
+        kind, v = self._take()
+        if kind == 'o':
+            if v == '-':
+                return -self._unary() & 0xFFFF
+            if v == '+':
+                return self._unary()
+            if v in '~!':
+                return ~self._unary() & 0xFFFF
+            if v == '<':
+                return self._unary() & 0xFF
+            if v == '>':
+                return self._unary() >> 8
+            if v == '(':
+                inner = self._binary(0)
+                if self._take() != ('o', ')'):
+                    raise AsmError("missing ')'")
+                return inner
+        elif kind == 'n':
+            return v
+        elif kind == 's':
+            if v in ('HIGH', 'LOW') and self._peek() == ('o', '('):
+                arg = self._unary()
+                return (arg >> 8) & 0xFF if v == 'HIGH' else arg & 0xFF
+            if v not in self.symbols:
+                self.undefined = True
+                return 0
+            return self.symbols[v]
+        raise AsmError('missing operand')
+
+
+class Line:
+    """One source line and what it assembled to."""
+
+    def __init__(self, text):
+        self.text = text.rstrip('\n')
+        self.addr = None        # location (or EQU value) shown in the listing
+        self.data = b''
+        self.error = None
+
+
+def assemble_line(line, symbols, pc, final):
+    """Assemble one line at `pc`; returns the next pc. Undefined symbols are
+    errors only in the final pass."""
+    body = strip_comment(line.text)
+    if not body.strip():
+        return pc
+    m = re.match(r"^([A-Za-z_.][\w.]*)?:?\s*(.*)$", body) if not body[0].isspace() \
+        else re.match(r"^()\s*(.*)$", body)
+    label, rest = m.group(1), m.group(2).strip()
+    op, operands = (rest.split(None, 1) + [''])[:2] if rest else (None, '')
+    op = op.upper() if op else None
+
+    def ev(text):
+        e = Expression(text, symbols, pc)
+        v = e.value()
+        if final and e.undefined:
+            raise AsmError(f"undefined symbol in '{text}'")
+        return v
+
+    def reg(text):
+        r = ev(text)
+        if r > 15:
+            raise AsmError(f"bad register '{text}'")
+        return r
+
+    if op == 'EQU':
+        if not label:
+            raise AsmError('EQU without a label')
+        symbols[label.upper()] = line.addr = ev(operands)
+        return pc
+    if label:
+        symbols[label.upper()] = line.addr = pc
+    if op is None or op in IGNORED:
+        return pc
+    if op == 'ORG':
+        line.addr = ev(operands)
+        return line.addr
+
+    out = bytearray()
+    if op in ('DB', 'BYTE'):
+        for arg in split_operands(operands):
+            if arg[:1] == '"' or (arg[:1] == "'" and len(arg) > 3):
+                out += arg[1:-1].encode('latin-1')
+            else:
+                out.append(ev(arg) & 0xFF)
+    elif op in ('DW', 'WORD'):
+        for arg in split_operands(operands):
+            v = ev(arg)
+            out += bytes([v >> 8, v & 0xFF])
+    elif op in ('DS', 'BLK'):
+        line.addr = pc
+        return pc + ev(operands)
+    elif op in INHERENT:
+        out.append(INHERENT[op])
+    elif op in IMMEDIATE:
+        out += bytes([IMMEDIATE[op], ev(operands) & 0xFF])
+    elif op in REGISTER:
+        r = reg(operands)
+        if op == 'LDN' and r == 0:
+            raise AsmError('LDN 0 is IDL')
+        out.append(REGISTER[op] | r)
+    elif op == 'OUT':
+        out.append(0x60 | reg(operands))
+    elif op == 'INP':
+        out.append(0x68 | reg(operands))
+    elif op in SHORT_BRANCH or op in EXT_SHORT_BRANCH:
+        target = ev(operands)
+        prefix = bytes([0x68, EXT_SHORT_BRANCH[op]]) if op in EXT_SHORT_BRANCH \
+            else bytes([SHORT_BRANCH[op]])
+        if final and (target >> 8) != ((pc + len(prefix)) >> 8):
+            raise AsmError(f"short branch to {target:04x} leaves page {pc >> 8:02x}")
+        out += prefix + bytes([target & 0xFF])
+    elif op in LONG_BRANCH:
+        target = ev(operands)
+        out += bytes([LONG_BRANCH[op], target >> 8, target & 0xFF])
+    elif op in EXT_INHERENT:
+        out += bytes([0x68, EXT_INHERENT[op]])
+    elif op in EXT_IMMEDIATE:
+        out += bytes([0x68, EXT_IMMEDIATE[op], ev(operands) & 0xFF])
+    elif op in EXT_REGISTER:
+        out += bytes([0x68, EXT_REGISTER[op] | reg(operands)])
+    elif op in EXT_REG_WORD:
+        args = split_operands(operands)
+        if len(args) != 2:
+            raise AsmError(f'{op} takes a register and a word')
+        v = ev(args[1])
+        out += bytes([0x68, EXT_REG_WORD[op] | reg(args[0]), v >> 8, v & 0xFF])
+    else:
+        raise AsmError(f'unknown opcode {op}')
+    line.addr = pc
+    line.data = bytes(out)
+    return pc + len(out)
+
+
+def assemble(source_lines, passes=3):
+    """Source lines -> ([Line], {symbol: value}). Every instruction's size is
+    fixed by its opcode, so three passes settle all forward references."""
+    symbols = {}
+    for n in range(passes):
+        lines, pc = [], 0
+        for text in source_lines:
+            line = Line(text)
+            lines.append(line)
+            try:
+                pc = assemble_line(line, symbols, pc, n == passes - 1)
+            except AsmError as e:
+                line.error = str(e)
+    return lines, symbols
+
+
+def image(lines):
+    """{addr: byte} of everything assembled."""
+    mem = {}
+    for line in lines:
+        for i, b in enumerate(line.data):
+            mem[(line.addr + i) & 0xFFFF] = b
+    return mem
+
+
+def write_listing(path, lines, symbols):
+    """a18 layout: address/value in columns 3-6, up to four bytes from column
+    10 (continuation lines for longer data), source from column 24; then the
+    sorted symbol table, four per row."""
+    out = []
+    for line in lines:
+        if line.error:
+            out.append('E' + ' ' * 23 + line.text)
+            out.append(f'    {line.error}')
+        elif line.addr is None:
+            out.append(' ' * 24 + line.text)
+        elif not line.data:
+            out.append(f'   {line.addr:04x}                 {line.text}')
+        else:
+            for i in range(0, len(line.data), 4):
+                chunk = ' '.join(f'{b:02x}' for b in line.data[i:i + 4])
+                out.append(f'   {line.addr + i:04x}   {chunk:<12}  '
+                           + (line.text if i == 0 else ''))
+    out.append(' ' * 24)
+    out.append('*' + ' ' * 23 + '\tEND')
+    rows, row = [], ''
+    for i, (name, value) in enumerate(sorted(symbols.items())):
+        row += f'{value:04x}  {name:<10}'
+        if i % 4 == 3:
+            rows.append(row)
+            row = ''
+        else:
+            row += '    '
+    if row:
+        rows.append(row)
+    with open(path, 'w') as f:
+        f.write('\n'.join(out) + '\n\f' + '\n'.join(rows) + '\n\f')
+
+
+def write_hex(path, mem, record=24):
+    """Intel HEX, one data record per run of up to `record` contiguous bytes
+    (24, as build.sh's srec_cat pass: fits 64-char monitor input)."""
+    recs, addrs = [], sorted(mem)
+    i = 0
+    while i < len(addrs):
+        start, chunk = addrs[i], []
+        while i < len(addrs) and addrs[i] == start + len(chunk) and len(chunk) < record:
+            chunk.append(mem[addrs[i]])
+            i += 1
+        raw = bytes([len(chunk), start >> 8, start & 0xFF, 0]) + bytes(chunk)
+        recs.append(':' + raw.hex().upper() + f'{-sum(raw) & 0xFF:02X}')
+    recs.append(':00000001FF')
+    with open(path, 'w') as f:
+        f.write('\n'.join(recs) + '\n')
+
+
+def write_bin(path, mem):
+    """Raw image from $0000 to the highest assembled byte (gaps = $00)."""
+    top = max(mem) + 1 if mem else 0
+    with open(path, 'wb') as f:
+        f.write(bytes(mem.get(a, 0) for a in range(top)))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('source', help='concatenated source (build.sh: chess-engine.asm)')
+    ap.add_argument('-o', '--hex', help='Intel HEX output')
+    ap.add_argument('-l', '--listing', help='a18-format listing output')
+    ap.add_argument('-b', '--bin', help='raw binary output')
+    args = ap.parse_args()
+
+    with open(args.source, errors='replace') as f:
+        lines, symbols = assemble(f.readlines())
+    mem = image(lines)
+    if args.listing:
+        write_listing(args.listing, lines, symbols)
+    if args.hex:
+        write_hex(args.hex, mem)
+    if args.bin:
+        write_bin(args.bin, mem)
+
+    errors = [ln for ln in lines if ln.error]
+    for ln in errors[:20]:
+        print(f'  {ln.error}: {ln.text.strip()}', file=sys.stderr)
+    low = [a for a in mem if a < 0x7000]
+    print(f'{len(mem)} bytes, main segment ends at ${max(low):04X}, '
+          f'{len(symbols)} symbols, {len(errors)} error(s)', file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
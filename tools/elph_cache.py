@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Persistent search-result cache for deterministic engine replays.
+
+A search that runs to the depth it was given depends only on the build and
+the commands since the last ucinewgame (TT contents included), so its result
+can be keyed by
+
+    (hash of the engine image, commands since ucinewgame, the go command)
+
+and never needs to be recomputed. A search the RTC budget cuts short is not
+reproducible: where the whole-second boundaries fall depends on wall time on
+a board, and in the simulator on every cycle spent since boot (uci, isready,
+earlier games) - none of which is in the key. reproducible() tells the two
+apart: only searches that reached their `go depth N` are stored, and once a
+game has had a clock-limited search, nothing after it in that game is looked
+up or stored (its TT contents are no longer known). Entries hold the bestmove and the info
+lines (with their times), plus — when the engine was a simulator — a machine
+snapshot (tools/elph_sim.py) taken right after the search, so a replay can
+resume a simulator there instead of re-running everything before it.
+
+A rebuilt binary has a different hash, so its entries simply stop matching
+(automatic invalidation); they age out under the LRU limits. Storage is one
+SQLite file; least-recently-used entries are evicted past ELPH_CACHE_MB
+megabytes or ELPH_CACHE_ENTRIES entries.
+
+Environment:
+    ELPH_CACHE          cache directory (default ~/.cache/elph); empty = off
+    ELPH_CACHE_MB       size limit, default 512
+    ELPH_CACHE_ENTRIES  entry limit, default 100000
+    ELPH_BIN            image a real board runs (default chess-engine.bin
+                        next to replay-match.py); sim:<image> ports hash
+                        their own image
+
+Usage:
+    python3 tools/elph_cache.py                 # stats per build
+    python3 tools/elph_cache.py --clear         # drop everything
+    python3 tools/elph_cache.py --keep IMAGE    # drop entries of other builds
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import zlib
+
+DEFAULT_DIR = os.path.expanduser('~/.cache/elph')
+DEFAULT_MB = 512
+DEFAULT_ENTRIES = 100_000
+STATE_FREE = ('uci', 'isready', 'stop')     # commands that leave the engine state alone
+
+
+def image_hash(path):
+    """Short hash of an engine image's bytes (.bin, .hex or .lst alike: the
+    same build hashes the same whichever form it is loaded from)."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from elph_sim import load_image
+    image = load_image(path)
+    mem = bytearray(max(image) + 1 if image else 0)
+    for a, b in image.items():
+        mem[a] = b
+    return hashlib.sha256(bytes(mem)).hexdigest()[:16]
+
+
+def normalize(cmd):
+    return ' '.join(cmd.split())
+
+
+def reproducible(go, infos):
+    """Did this search finish the depth `go` asked for? ([secs, info line]
+    pairs as read.) A go without a depth, or one whose last info line is
+    shallower, was ended by the clock and may differ on a fresh run. A book
+    answer (no info lines at all) never looks at the clock."""
+    if not infos:
+        return True
+    m = re.search(r"\bdepth (\d+)", go)
+    depths = [int(d) for _, line in infos for d in re.findall(r"\bdepth (\d+)", line)]
+    return m is not None and max(depths, default=0) >= int(m.group(1))
+
+
+class SearchCache:
+    """On-disk (build, command history, go) -> search result map with LRU
+    eviction. `history` is every state-changing command sent since the last
+    ucinewgame (or boot), earlier go commands included — they fill the TT."""
+
+    def __init__(self, path=None, max_mb=None, max_entries=None):
+        path = path if path is not None else os.environ.get('ELPH_CACHE', DEFAULT_DIR)
+        os.makedirs(path, exist_ok=True)
+        self.max_bytes = int(float(max_mb if max_mb is not None else
+                                   os.environ.get('ELPH_CACHE_MB', DEFAULT_MB)) * 1024 * 1024)
+        self.max_entries = int(max_entries if max_entries is not None else
+                               os.environ.get('ELPH_CACHE_ENTRIES', DEFAULT_ENTRIES))
+        self.db = sqlite3.connect(os.path.join(path, 'search-cache.sqlite'))
+        self.db.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, build TEXT, go TEXT, bestmove TEXT, info TEXT,
+            snapshot BLOB, size INTEGER, last_used REAL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+        self.db.commit()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def key(build, history, go):
+        blob = json.dumps([build, [normalize(c) for c in history], normalize(go)])
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def get(self, key):
+        """Cached result {'bestmove', 'info': [[secs, line], ...], 'snapshot'}
+        or None. A hit becomes most recently used."""
+        row = self.db.execute("SELECT bestmove, info, snapshot FROM entries WHERE key = ?",
+                              (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        return {'bestmove': row[0], 'info': json.loads(row[1]),
+                'snapshot': zlib.decompress(row[2]) if row[2] else None}
+
+    def put(self, key, build, go, bestmove, info, snapshot=None):
+        info = json.dumps(info)
+        snap = zlib.compress(snapshot, 6) if snapshot else None
+        size = len(info) + len(bestmove or '') + (len(snap) if snap else 0) + 200
+        self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (key, build, normalize(go), bestmove, info, snap, size, time.time()))
+        self.evict()
+
+    def evict(self):
+        """Drop least-recently-used entries until both limits hold."""
+        count, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            drop = []
+            for key, size in self.db.execute("SELECT key, size FROM entries ORDER BY last_used"):
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                drop.append((key,))
+                count -= 1
+                total -= size
+            self.db.executemany("DELETE FROM entries WHERE key = ?", drop)
+        self.db.commit()
+
+    def stats(self):
+        """[(build, entries, bytes, with snapshot)] by build, biggest first."""
+        return self.db.execute("""SELECT build, COUNT(*), SUM(size), COUNT(snapshot) FROM entries
+                                  GROUP BY build ORDER BY SUM(size) DESC""").fetchall()
+
+    def drop(self, keep_build=None):
+        """Delete all entries, or all but those of `keep_build`."""
+        if keep_build is None:
+            self.db.execute("DELETE FROM entries")
+        else:
+            self.db.execute("DELETE FROM entries WHERE build != ?", (keep_build,))
+        self.db.commit()
+        self.db.execute("VACUUM")
+
+    def close(self):
+        self.db.close()
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Inspect or prune the search-result cache")
+    ap.add_argument('--clear', action='store_true', help="delete every entry")
+    ap.add_argument('--keep', metavar='IMAGE', help="delete entries of every build but IMAGE's")
+    args = ap.parse_args()
+
+    if not os.environ.get('ELPH_CACHE', DEFAULT_DIR):
+        print("cache disabled (ELPH_CACHE is empty)")
+        return 0
+    cache = SearchCache()
+    if args.clear:
+        cache.drop()
+    elif args.keep:
+        cache.drop(keep_build=image_hash(args.keep))
+    rows = cache.stats()
+    print(f"{os.environ.get('ELPH_CACHE', DEFAULT_DIR)}: limits {cache.max_bytes // (1024 * 1024)} MB, "
+          f"{cache.max_entries} entries")
+    for build, n, size, snaps in rows:
+        print(f"  build {build}: {n:6d} searches ({snaps} with snapshot) {size / 1e6:8.1f} MB")
+    if not rows:
+        print("  empty")
+    cache.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
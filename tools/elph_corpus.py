@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+"""
+Indexed store of the elph-debug*.log corpus, shared by the analysis tools.
+
+Each log is parsed ONCE into SQLite (one parser for every tool, instead of
+each tool's own regexes over the raw text) and re-parsed only when it
+changes: a file whose size and mtime match its stored row is skipped; one
+that differs is hashed, and only a different SHA-1 is parsed again.
+
+What is stored, per log:
+    games     a log splits into games at ucinewgame and where a position
+              line stops extending the previous one (a log normally holds
+              one game). The game's longest position movelist is stored once.
+    searches  every ELPH search in order: plies played before it (its
+              position is the game's movelist up to there), bestmove, the
+              last reported cp score (and mate score), deepest depth, last
+              node count, info-line count, log timestamps of the position and
+              the bestmove, and whether it was a book move (bridge BOOK: line
+              or no info lines).
+    infos     every info line's depth / score cp / score mate / nodes / time,
+              for per-depth questions (analyze_loss.py's depth-5 evals).
+
+The database is ELPH_CORPUS (default ~/.cache/elph/corpus.sqlite); paths are
+stored absolute, so it holds logs from any directory at once.
+
+    from elph_corpus import Corpus
+    corpus = Corpus()
+    corpus.ingest(paths)
+    for game in corpus.games(paths):
+        game.path, game.moves, game.final_moves()
+        for s in game.searches:
+            s.ply, s.moves, s.bestmove, s.eval, s.depth, s.book, s.t_position, ...
+
+Board replay: replay(game) walks a game ONCE from the start position,
+yielding a Step per ply (board advanced incrementally, plus ELPH's search
+there: eval, bestmove, timing). Analyzers subclass Metric and hand a list of
+them to run_metrics(game, metrics), so every metric comes out of one pass.
+
+Corpus-wide: measure_corpus(paths, [MetricClass, ...]) deduplicates games by
+final movelist and fans them out over a process pool (ELPH_JOBS, default one
+per core) in chunks; results come back in corpus order, so a run's output
+does not depend on scheduling.
+
+Usage:
+    python3 tools/elph_corpus.py [logs...]        # ingest (default ./elph-debug*.log), stats
+    python3 tools/elph_corpus.py --prune          # also forget logs gone from disk
+    python3 tools/elph_corpus.py --sql 'SELECT ...'
+"""
+import glob
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+
+DEFAULT_DB = os.path.join(os.path.expanduser('~/.cache/elph'), 'corpus.sqlite')
+ARCHIVE_SUFFIX = '.elpharc'
+PARSER_VERSION = 2      # bump when parse_log changes: every log is re-parsed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, mtime REAL,
+    sha1 TEXT, parser INTEGER);
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY, file_id INTEGER, game_no INTEGER, moves TEXT);
+CREATE TABLE IF NOT EXISTS searches (
+    id INTEGER PRIMARY KEY, game_id INTEGER, idx INTEGER, ply INTEGER,
+    bestmove TEXT, eval INTEGER, mate INTEGER, depth INTEGER, nodes INTEGER,
+    n_info INTEGER, t_position REAL, t_bestmove REAL, book INTEGER);
+CREATE TABLE IF NOT EXISTS infos (
+    search_id INTEGER, depth INTEGER, cp INTEGER, mate INTEGER, nodes INTEGER, t REAL);
+CREATE INDEX IF NOT EXISTS games_file ON games (file_id);
+CREATE INDEX IF NOT EXISTS searches_game ON searches (game_id);
+CREATE INDEX IF NOT EXISTS infos_search ON infos (search_id);
+"""
+
+# Two log formats: elph-bridge.py quotes every line and stamps it with the
+# session clock ("[12:34.567] RX: 'info ...'"); replay-match.py writes lines
+# bare and stamps only RX lines, relative to the go ("[t+  1.23s] RX: info
+# ..."), so there a search's position is at t = 0.
+TIMESTAMP = re.compile(r"^\[(?:(\d+):(\d+\.\d+)|t\+\s*(\d+\.\d+)s)\]")
+TX_NEWGAME = re.compile(r"TX: '?ucinewgame\b")
+TX_ANY_POSITION = re.compile(r"TX: '?position ")
+TX_POSITION = re.compile(r"TX: '?position startpos(?: moves ([a-h1-8qrbnk ]+))?'?\s*$")
+RX_INFO = re.compile(r"RX: '?info ")
+RX_BESTMOVE = re.compile(r"RX: '?bestmove ([^\s']+)")
+BOOK_LINE = re.compile(r"BOOK: '.*' -> bestmove (\S+)")
+INFO_FIELDS = re.compile(r"\b(depth|nodes) (\d+)|\bscore (cp|mate) (-?\d+)")
+
+
+class Search:
+    """One ELPH search. `moves` is the position it searched (a list)."""
+    __slots__ = ('ply', 'moves', 'bestmove', 'eval', 'mate', 'depth', 'nodes', 'n_info',
+                 't_position', 't_bestmove', 'book', 'infos')
+
+    def __init__(self, **kw):
+        for k in self.__slots__:
+            setattr(self, k, kw.get(k))
+
+    def eval_at_depth(self, depth):
+        """Score cp of the last info line at `depth`, or None."""
+        ev = None
+        for d, cp, _mate, _nodes, _t in self.infos or ():
+            if d == depth and cp is not None:
+                ev = cp
+        return ev
+
+
+class Game:
+    def __init__(self, path, game_no, moves, searches):
+        self.path, self.game_no, self.moves, self.searches = path, game_no, moves, searches
+
+    def final_moves(self):
+        """The last search's position plus its bestmove — the game as far as
+        ELPH's last move (what analyze_endgame_mechanism.py calls final)."""
+        if not self.searches:
+            return list(self.moves)
+        last = self.searches[-1]
+        return last.moves + [last.bestmove]
+
+
+def _timestamp(line):
+    m = TIMESTAMP.match(line)
+    if not m:
+        return None
+    if m.group(3):
+        return float(m.group(3))
+    return int(m.group(1)) * 60 + float(m.group(2))
+
+
+def parse_log(text):
+    """[(game movelist, [search dicts])] from an elph-bridge or replay-match
+    log's text."""
+    games = []
+    moves = None            # current game's longest position line
+    pos = None              # position awaiting its bestmove
+    cur = None
+    for line in text.splitlines():
+        if TX_NEWGAME.search(line):
+            moves = pos = cur = None
+            continue
+        if TX_ANY_POSITION.search(line):
+            m = TX_POSITION.search(line)
+            if not m:
+                continue
+            new = m.group(1).split() if m.group(1) else []
+            if moves is None or new[:len(moves)] != moves:
+                moves = new
+                games.append((moves, []))
+            else:
+                moves[:] = new
+            pos = len(new)
+            t = _timestamp(line)
+            cur = {'ply': pos, 'infos': [], 't_position': 0.0 if t is None else t}
+            continue
+        if pos is None:
+            continue
+        if RX_INFO.search(line):
+            depth = nodes = cp = mate = None
+            for f in INFO_FIELDS.finditer(line):
+                if f.group(1) == 'depth':
+                    depth = int(f.group(2))
+                elif f.group(1) == 'nodes':
+                    nodes = int(f.group(2))
+                elif f.group(3) == 'cp':
+                    cp = int(f.group(4))
+                else:
+                    mate = int(f.group(4))
+            cur['infos'].append((depth, cp, mate, nodes, _timestamp(line)))
+            continue
+        m = RX_BESTMOVE.search(line)
+        book = False
+        if not m:
+            m = BOOK_LINE.search(line)
+            book = True
+            if not m:
+                continue
+        infos = cur['infos']
+        cps = [i[1] for i in infos if i[1] is not None]
+        mates = [i[2] for i in infos if i[2] is not None]
+        depths = [i[0] for i in infos if i[0] is not None]
+        nodes = [i[3] for i in infos if i[3] is not None]
+        cur.update(bestmove=m.group(1), eval=cps[-1] if cps else None,
+                   mate=mates[-1] if mates else None, depth=max(depths) if depths else None,
+                   nodes=nodes[-1] if nodes else None, n_info=len(infos),
+                   t_bestmove=_timestamp(line), book=book or not infos)
+        games[-1][1].append(cur)
+        pos = cur = None
+    return games
+
+
+def log_games(path):
+    """The games of one log parsed straight from its text, bypassing the
+    store (converters, one-off reads)."""
+    with open(path, 'rb') as f:
+        text = f.read().decode('latin-1')
+    return [Game(os.path.abspath(path), game_no, list(moves),
+                 [Search(moves=moves[:s['ply']], **s) for s in searches])
+            for game_no, (moves, searches) in enumerate(parse_log(text))]
+
+
+class Corpus:
+    def __init__(self, db=None):
+        db = db or os.environ.get('ELPH_CORPUS', DEFAULT_DB)
+        os.makedirs(os.path.dirname(os.path.abspath(db)), exist_ok=True)
+        self.db = sqlite3.connect(db)
+        self.db.executescript(SCHEMA)
+
+    def ingest(self, paths):
+        """Bring the store up to date for `paths`; (parsed, unchanged) counts."""
+        parsed = unchanged = 0
+        for path in paths:
+            path = os.path.abspath(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            row = self.db.execute("SELECT id, size, mtime, sha1, parser FROM files WHERE path = ?",
+                                  (path,)).fetchone()
+            if row and row[1:3] == (st.st_size, st.st_mtime) and row[4] == PARSER_VERSION:
+                unchanged += 1
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            sha1 = hashlib.sha1(data).hexdigest()
+            if row and row[3] == sha1 and row[4] == PARSER_VERSION:
+                self.db.execute("UPDATE files SET size = ?, mtime = ? WHERE id = ?",
+                                (st.st_size, st.st_mtime, row[0]))
+                unchanged += 1
+                continue
+            if row:
+                self._forget(row[0])
+            cur = self.db.execute("INSERT INTO files (path, size, mtime, sha1, parser) "
+                                  "VALUES (?, ?, ?, ?, ?)",
+                                  (path, st.st_size, st.st_mtime, sha1, PARSER_VERSION))
+            self._store(cur.lastrowid, parse_log(data.decode('latin-1')))
+            parsed += 1
+        self.db.commit()
+        return parsed, unchanged
+
+    def _store(self, file_id, games):
+        for game_no, (moves, searches) in enumerate(games):
+            gid = self.db.execute("INSERT INTO games (file_id, game_no, moves) VALUES (?, ?, ?)",
+                                  (file_id, game_no, ' '.join(moves))).lastrowid
+            for idx, s in enumerate(searches):
+                sid = self.db.execute(
+                    "INSERT INTO searches (game_id, idx, ply, bestmove, eval, mate, depth, nodes, "
+                    "n_info, t_position, t_bestmove, book) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (gid, idx, s['ply'], s['bestmove'], s['eval'], s['mate'], s['depth'],
+                     s['nodes'], s['n_info'], s['t_position'], s['t_bestmove'],
+                     int(s['book']))).lastrowid
+                self.db.executemany("INSERT INTO infos VALUES (?, ?, ?, ?, ?, ?)",
+                                    [(sid,) + i for i in s['infos']])
+
+    def _forget(self, file_id):
+        self.db.execute("DELETE FROM infos WHERE search_id IN (SELECT s.id FROM searches s "
+                        "JOIN games g ON s.game_id = g.id WHERE g.file_id = ?)", (file_id,))
+        self.db.execute("DELETE FROM searches WHERE game_id IN "
+                        "(SELECT id FROM games WHERE file_id = ?)", (file_id,))
+        self.db.execute("DELETE FROM games WHERE file_id = ?", (file_id,))
+        self.db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def prune(self):
+        """Forget logs that no longer exist; returns how many."""
+        gone = [(fid, p) for fid, p in self.db.execute("SELECT id, path FROM files")
+                if not os.path.exists(p)]
+        for fid, _ in gone:
+            self._forget(fid)
+        self.db.commit()
+        return len(gone)
+
+    def game_keys(self, path):
+        """[(id, final movelist as a string)] of one ingested log's games."""
+        return [(gid, moves if ply is None else ' '.join(moves.split()[:ply] + [bestmove]))
+                for gid, moves, ply, bestmove in self.db.execute(
+                    "SELECT g.id, g.moves, s.ply, s.bestmove FROM games g "
+                    "JOIN files f ON g.file_id = f.id "
+                    "LEFT JOIN searches s ON s.game_id = g.id AND s.idx = "
+                    "(SELECT MAX(idx) FROM searches WHERE game_id = g.id) "
+                    "WHERE f.path = ? ORDER BY g.game_no", (os.path.abspath(path),)).fetchall()]
+
+    def game_ids(self, paths, dedup=False):
+        """Ids of the games of `paths` (ingested), in path order then log
+        order. dedup: only the first game with each final movelist."""
+        ids, seen = [], set()
+        for path in paths:
+            for gid, key in self.game_keys(path):
+                if dedup:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                ids.append(gid)
+        return ids
+
+    def game(self, gid, infos=True):
+        path, game_no, moves = self.db.execute(
+            "SELECT f.path, g.game_no, g.moves FROM games g JOIN files f ON g.file_id = f.id "
+            "WHERE g.id = ?", (gid,)).fetchone()
+        moves = moves.split()
+        searches = []
+        for row in self.db.execute(
+                "SELECT id, ply, bestmove, eval, mate, depth, nodes, n_info, t_position, "
+                "t_bestmove, book FROM searches WHERE game_id = ? ORDER BY idx", (gid,)).fetchall():
+            s = Search(ply=row[1], moves=moves[:row[1]], bestmove=row[2], eval=row[3],
+                       mate=row[4], depth=row[5], nodes=row[6], n_info=row[7],
+                       t_position=row[8], t_bestmove=row[9], book=bool(row[10]))
+            if infos:
+                s.infos = self.db.execute(
+                    "SELECT depth, cp, mate, nodes, t FROM infos WHERE search_id = ? "
+                    "ORDER BY rowid", (row[0],)).fetchall()
+            searches.append(s)
+        return Game(path, game_no, moves, searches)
+
+    def games(self, paths, infos=True, dedup=False):
+        """Games of `paths` (ingested), in path order then log order."""
+        for gid in self.game_ids(paths, dedup):
+            yield self.game(gid, infos)
+
+    def close(self):
+        self.db.close()
+
+
+class Step:
+    """One position of a replay: `board` after `ply` plies (the replay's own
+    board, advanced in place — copy it to keep it), ELPH's `search` there if
+    it searched this position (with its eval, bestmove and timing), and the
+    `move` played from it next (None at the end of the line)."""
+    __slots__ = ('ply', 'board', 'search', 'move')
+
+    def __init__(self, ply, board, search, move):
+        self.ply, self.board, self.search, self.move = ply, board, search, move
+
+    @property
+    def eval(self):
+        return self.search.eval if self.search else None
+
+    @property
+    def bestmove(self):
+        return self.search.bestmove if self.search else None
+
+    @property
+    def timing(self):
+        """Seconds from the position to the bestmove, or None."""
+        s = self.search
+        if s is None or s.t_position is None or s.t_bestmove is None:
+            return None
+        return s.t_bestmove - s.t_position
+
+
+def replay_line(game):
+    """The movelist a replay walks: the longest position line, extended by
+    ELPH's last bestmove when that came after it (the game's final move)."""
+    final = game.final_moves()
+    if len(final) > len(game.moves) and final[:len(game.moves)] == game.moves:
+        return final
+    return game.moves
+
+
+def replay(game):
+    """Walk a game once from the start position, yielding a Step per
+    position (ply 0 .. the line's end). An illegal move ends the walk early;
+    the generator's return value is True if the whole line replayed."""
+    import chess
+    by_ply = {s.ply: s for s in game.searches}
+    board = chess.Board()
+    line = replay_line(game)
+    for ply, uci in enumerate(line):
+        try:
+            move = chess.Move.from_uci(uci)
+        except ValueError:
+            move = None
+        if move is None or not board.is_legal(move):
+            yield Step(ply, board, by_ply.get(ply), None)
+            return False
+        yield Step(ply, board, by_ply.get(ply), move)
+        board.push(move)
+    yield Step(len(line), board, by_ply.get(len(line)), None)
+    return True
+
+
+class Metric:
+    """A per-game measurement fed by one shared replay pass (run_metrics).
+
+    position(step) sees every position, before step.move is played; end(ok)
+    returns the metric's result (ok False if an illegal move cut the replay
+    short). `game` is set before the first position."""
+    name = None
+
+    def begin(self, game):
+        self.game = game
+
+    def position(self, step):
+        pass
+
+    def end(self, ok):
+        return None
+
+
+def run_metrics(game, metrics):
+    """One replay of `game` driving every metric; {metric name: result}."""
+    for m in metrics:
+        m.begin(game)
+    walk = replay(game)
+    ok = True
+    while True:
+        try:
+            step = next(walk)
+        except StopIteration as stop:
+            ok = stop.value
+            break
+        for m in metrics:
+            m.position(step)
+    return {m.name or type(m).__name__: m.end(ok) for m in metrics}
+
+
+_worker_corpus = None
+_worker_archives = {}
+
+
+def _worker_game(db, unit, infos):
+    """A work unit's Game: a corpus game id, or (archive path, index)."""
+    global _worker_corpus
+    if isinstance(unit, tuple):
+        from elph_archive import Archive
+        path, i = unit
+        if path not in _worker_archives:
+            _worker_archives[path] = Archive(path)
+        return _worker_archives[path][i]
+    if _worker_corpus is None:
+        _worker_corpus = Corpus(db)
+    return _worker_corpus.game(unit, infos)
+
+
+def _measure_chunk(db, units, metrics, infos):
+    """Pool job: [(unit, path, {name: result} or 'ERR ...')] for a chunk."""
+    out = []
+    for unit in units:
+        game = _worker_game(db, unit, infos)
+        try:
+            out.append((unit, game.path, run_metrics(game, [m() for m in metrics])))
+        except Exception as e:
+            out.append((unit, game.path, f"ERR {e}"))
+    return out
+
+
+def measure_corpus(paths, metrics, jobs=None, dedup=True, infos=True, db=None, chunk=None):
+    """Run Metric classes over every game of `paths` in a process pool.
+
+    This is how the log analysis tools read the corpus: logs go through the
+    store, so only new or changed logs are parsed; games are measured in a
+    process pool of ELPH_JOBS workers (default one per core); identical
+    games (same final movelist) are counted once.
+
+    Games are deduplicated by final movelist (first occurrence kept, as
+    analyze_endgame_mechanism.py always did), sent to the workers in chunks,
+    and returned in corpus order whatever order the chunks finish in:
+    [(path, {metric name: result})]. A game whose metrics raised is reported
+    on stderr and left out. jobs defaults to ELPH_JOBS or one per core.
+    Paths ending in .elpharc are read from the archive (elph_archive.py)
+    instead of the store, and deduplicated together with the logs."""
+    from concurrent.futures import ProcessPoolExecutor
+    db = os.path.abspath(db or os.environ.get('ELPH_CORPUS', DEFAULT_DB))
+    logs = [p for p in paths if not p.endswith(ARCHIVE_SUFFIX)]
+    corpus = open_corpus(logs, db) if logs else None
+    units, seen = [], set()
+    for path in paths:
+        if path.endswith(ARCHIVE_SUFFIX):
+            from elph_archive import Archive
+            arc = Archive(path)
+            keyed = [((os.path.abspath(path), i), arc.final_key(i)) for i in range(len(arc))]
+            arc.close()
+        else:
+            keyed = corpus.game_keys(path)
+            if not keyed:
+                print(f"{path}: no games (not an elph-bridge or replay-match log?)",
+                      file=sys.stderr)
+        for unit, key in keyed:
+            if dedup:
+                if key in seen:
+                    continue
+                seen.add(key)
+            units.append(unit)
+    if corpus:
+        corpus.close()
+    jobs = jobs or int(os.environ.get('ELPH_JOBS', 0)) or os.cpu_count() or 1
+    chunk = chunk or max(1, min(32, len(units) // (4 * jobs)))
+    chunks = [units[i:i + chunk] for i in range(0, len(units), chunk)]
+    results = {}
+    if jobs == 1:
+        done = (_measure_chunk(db, c, metrics, infos) for c in chunks)
+    else:
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        done = pool.map(_measure_chunk, [db] * len(chunks), chunks,
+                        [metrics] * len(chunks), [infos] * len(chunks))
+    for part in done:
+        for unit, path, res in part:
+            results[unit] = (path, res)
+    if jobs != 1:
+        pool.shutdown()
+    out = []
+    for unit in units:
+        path, res = results[unit]
+        if isinstance(res, str):
+            print(f"{path}: {res}", file=sys.stderr)
+            continue
+        out.append((path, res))
+    return out
+
+
+def open_corpus(paths, db=None):
+    """Corpus with `paths` ingested — what the analysis tools start with."""
+    corpus = Corpus(db)
+    parsed, unchanged = corpus.ingest(paths)
+    if parsed:
+        print(f"(corpus: parsed {parsed} new/changed logs, {unchanged} unchanged)", file=sys.stderr)
+    return corpus
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Ingest elph-debug logs into the corpus store")
+    ap.add_argument('logs', nargs='*', help="logs (default: ./elph-debug*.log)")
+    ap.add_argument('--db', help="database (default ELPH_CORPUS or ~/.cache/elph/corpus.sqlite)")
+    ap.add_argument('--prune', action='store_true', help="forget logs that no longer exist")
+    ap.add_argument('--sql', help="run a query and print the rows")
+    args = ap.parse_args()
+
+    corpus = Corpus(args.db)
+    logs = args.logs or sorted(glob.glob('elph-debug*.log'))
+    parsed, unchanged = corpus.ingest(logs)
+    print(f"{len(logs)} logs: {parsed} parsed, {unchanged} unchanged")
+    if args.prune:
+        print(f"pruned {corpus.prune()} missing logs")
+    if args.sql:
+        for row in corpus.db.execute(args.sql):
+            print('\t'.join('' if v is None else str(v) for v in row))
+    else:
+        f, g, s, i = (corpus.db.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                      for t in ('files', 'games', 'searches', 'infos'))
+        print(f"store: {f} logs, {g} games, {s} searches, {i} info lines")
+    corpus.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
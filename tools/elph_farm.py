@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Tournament farm: plays games between ELPH and a UCI opponent on several
+engine endpoints at once.
+
+Each endpoint is a port as elph-bridge.py takes it (ELPH_PORT): a serial
+device, a pty from `tools/elph_sim.py --pty`, or sim:<image> for an
+in-process simulator. One worker thread per endpoint takes the next game off
+the schedule and plays it the way CuteChess would: ELPH is an elph-bridge.py
+process on that endpoint (so the echo-paced serial handling, incremental
+positions and host book are the bridge's own), the opponent is any UCI
+command line, and the farm keeps the board, the adjudication and the clock.
+An endpoint plays one game at a time; N endpoints play N games at once.
+
+Output in --out (default farm-<date>-<time>/):
+    games.pgn                  every finished game, in finishing order
+    elph-debug-gNNN.log        the bridge's log for game NNN — the same
+                               TX/RX format as elph-debug.log, so
+                               tools/analyze_endgame_mechanism.py and
+                               analyze_loss.py run on them directly
+
+Games end on checkmate, stalemate, threefold repetition, the 50-move rule or
+insufficient material (python-chess), on an illegal move or a search with no
+bestmove inside --timeout (a forfeit), or by adjudication like CuteChess's
+-resign / -draw: a side whose own score stays <= -RESIGN_SCORE for
+RESIGN_MOVES consecutive searches loses (one-sided, as in the match setup);
+from move DRAW_MOVENUMBER on, both scores within DRAW_SCORE for DRAW_MOVES
+consecutive moves is a draw. Colours alternate by game number.
+
+Usage:
+    python3 tools/elph_farm.py -e sim:chess-engine.bin -j 8 -n 200 \\
+        --opponent stockfish --opponent-option 'Skill Level=3' \\
+        --opponent-go 'go movetime 200'
+    python3 tools/elph_farm.py -e /dev/ttyUSB0 -e /dev/ttyUSB1 -n 20
+    python3 tools/elph_farm.py \\
+        -e sim:listings/chess-engine-702cdaf.lst -j 4 -n 8 --go 'go depth 3' \\
+        --opponent 'python3 elph-bridge.py' \\
+        --opponent-env ELPH_PORT=sim:listings/chess-engine-702cdaf.lst
+    options: --go CMD (ELPH's go, default 'go depth 4')  --maxplies N
+             --timeout S  --resign-score/--resign-moves  --draw-score/
+             --draw-moves/--draw-movenumber (0 = off)  --out DIR
+
+Needs python-chess (as the analysis tools do).
+"""
+import os
+import queue
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+import chess
+import chess.pgn
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BRIDGE = os.path.join(os.path.dirname(HERE), 'elph-bridge.py')
+
+MATE_CP = 30000         # 'score mate N' counts as this for adjudication
+HANDSHAKE_TIMEOUT = 60  # uci/isready, including a simulator boot
+
+
+def search_result(lines):
+    """(bestmove, last reported score in cp or None) from a search's output
+    lines; bestmove None if there is no bestmove line."""
+    best = score = None
+    for line in lines:
+        words = line.split()
+        if words[:1] == ['bestmove']:
+            best = words[1] if len(words) > 1 else '(none)'
+        elif words[:1] == ['info'] and 'score' in words:
+            i = words.index('score')
+            try:
+                kind, n = words[i + 1], int(words[i + 2])
+            except (IndexError, ValueError):
+                continue
+            score = n if kind == 'cp' else (MATE_CP if n > 0 else -MATE_CP)
+    return best, score
+
+
+class UciEngine:
+    """A UCI engine subprocess, read line by line on a thread."""
+
+    def __init__(self, name, argv, env=None):
+        self.name = name
+        self.proc = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, text=True, bufsize=1, env=env)
+        self.lines = queue.Queue()
+        threading.Thread(target=self._reader, daemon=True).start()
+
+    def _reader(self):
+        for line in self.proc.stdout:
+            self.lines.put(line.strip())
+        self.lines.put(None)                # EOF
+
+    def send(self, line):
+        try:
+            self.proc.stdin.write(line + '\n')
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            pass
+
+    def expect(self, token, timeout):
+        """Lines up to and including the first starting with `token`, or
+        None if it did not come in time (or the engine exited)."""
+        deadline = time.time() + timeout
+        seen = []
+        while True:
+            try:
+                line = self.lines.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                return None
+            if line is None:
+                return None
+            seen.append(line)
+            if line.startswith(token):
+                return seen
+
+    def start(self, options=()):
+        """uci, setoptions, isready. False if the engine never answered."""
+        self.send('uci')
+        if self.expect('uciok', HANDSHAKE_TIMEOUT) is None:
+            return False
+        for opt in options:
+            name, _, value = opt.partition('=')
+            self.send(f"setoption name {name.strip()} value {value.strip()}")
+        self.send('isready')
+        return self.expect('readyok', HANDSHAKE_TIMEOUT) is not None
+
+    def search(self, moves, go, timeout):
+        """(bestmove, score in cp from the mover's side or None); bestmove
+        None on timeout."""
+        self.send('position startpos' + (' moves ' + ' '.join(moves) if moves else ''))
+        self.send(go)
+        seen = self.expect('bestmove', timeout)
+        if seen is None:
+            return None, None
+        return search_result(seen)
+
+    def quit(self):
+        self.send('quit')
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+
+class Adjudicator:
+    """CuteChess-style resign and draw adjudication on reported scores."""
+
+    def __init__(self, args):
+        self.args = args
+        self.resign_run = [0, 0]    # per colour: consecutive own scores <= -RESIGN_SCORE
+        self.draw_run = 0           # consecutive plies with |score| <= DRAW_SCORE
+
+    def update(self, board, mover, score):
+        """Record `mover`'s score for its search; a (result, reason) or None."""
+        a = self.args
+        if a.resign_moves and score is not None:
+            self.resign_run[mover] = self.resign_run[mover] + 1 if score <= -a.resign_score else 0
+            if self.resign_run[mover] >= a.resign_moves:
+                return ('0-1' if mover == chess.WHITE else '1-0'), 'adjudication: resign'
+        if a.draw_moves:
+            if (board.fullmove_number >= a.draw_movenumber and score is not None
+                    and abs(score) <= a.draw_score):
+                self.draw_run += 1
+            else:
+                self.draw_run = 0
+            if self.draw_run >= 2 * a.draw_moves:
+                return '1/2-1/2', 'adjudication: draw'
+        return None
+
+
+class Farm:
+    def __init__(self, args):
+        self.args = args
+        self.schedule = queue.Queue()
+        for n in range(1, args.games + 1):
+            self.schedule.put(n)
+        self.lock = threading.Lock()
+        self.score = {'W': 0, 'D': 0, 'L': 0}
+        self.done = 0
+        self.t0 = time.time()
+        os.makedirs(args.out, exist_ok=True)
+        self.pgn_path = os.path.join(args.out, 'games.pgn')
+
+    def engines(self, n, endpoint):
+        a = self.args
+        env = dict(os.environ, ELPH_PORT=endpoint,
+                   ELPH_LOG=os.path.join(a.out, f'elph-debug-g{n:03d}.log'))
+        elph = UciEngine('ELPH', [sys.executable, BRIDGE], env)
+        opp_env = dict(os.environ)
+        opp_env.pop('ELPH_LOG', None)
+        for kv in a.opponent_env:
+            k, _, v = kv.partition('=')
+            opp_env[k] = v
+        opp_env.setdefault('ELPH_LOG', os.devnull)
+        argv = shlex.split(a.opponent)
+        opp = UciEngine(a.opponent_name or os.path.basename(argv[-1]), argv, opp_env)
+        return elph, opp
+
+    def play(self, n, endpoint):
+        """One game on `endpoint`: (pgn game, ELPH's result 'W'/'D'/'L')."""
+        a = self.args
+        elph_color = chess.WHITE if n % 2 == 1 else chess.BLACK
+        elph, opp = self.engines(n, endpoint)
+        board = chess.Board()
+        result, reason = None, None
+        try:
+            for eng in (elph, opp):
+                if not eng.start(a.opponent_option if eng is opp else ()):
+                    result = '*'
+                    reason = f"{eng.name} did not start"
+                eng.send('ucinewgame')
+            adj = Adjudicator(a)
+            moves = []
+            while result is None:
+                mover = board.turn
+                eng, go = (elph, a.go) if mover == elph_color else (opp, a.opponent_go)
+                best, score = eng.search(moves, go, a.timeout)
+                loser = '0-1' if mover == chess.WHITE else '1-0'
+                if best is None:
+                    result, reason = loser, f"{eng.name} forfeits: no bestmove in {a.timeout}s"
+                    break
+                try:
+                    move = chess.Move.from_uci(best)
+                except ValueError:
+                    move = None
+                if move is None or move not in board.legal_moves:
+                    result, reason = loser, f"{eng.name} forfeits: illegal move {best}"
+                    break
+                board.push(move)
+                moves.append(best)
+                outcome = board.outcome(claim_draw=True)
+                if outcome is not None:
+                    result, reason = outcome.result(), outcome.termination.name.lower().replace('_', ' ')
+                    break
+                adjudged = adj.update(board, mover, score)
+                if adjudged:
+                    result, reason = adjudged
+                elif a.maxplies and len(moves) >= a.maxplies:
+                    result, reason = '1/2-1/2', f"adjudication: {a.maxplies} plies"
+        finally:
+            elph.quit()
+            opp.quit()
+
+        game = chess.pgn.Game.from_board(board)
+        names = {elph_color: 'ELPH', not elph_color: opp.name}
+        game.headers.update({
+            'Event': a.event, 'Site': endpoint, 'Date': time.strftime('%Y.%m.%d'),
+            'Round': str(n), 'White': names[chess.WHITE], 'Black': names[chess.BLACK],
+            'Result': result, 'Termination': reason, 'PlyCount': str(len(board.move_stack)),
+        })
+        if result == '*':
+            outcome = None
+        elif result == '1/2-1/2':
+            outcome = 'D'
+        else:
+            outcome = 'W' if (result == '1-0') == (elph_color == chess.WHITE) else 'L'
+        return game, outcome
+
+    def worker(self, endpoint):
+        while True:
+            try:
+                n = self.schedule.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                game, outcome = self.play(n, endpoint)
+            except Exception as e:
+                print(f"game {n} on {endpoint}: {e}", file=sys.stderr, flush=True)
+                continue
+            with self.lock:
+                with open(self.pgn_path, 'a') as f:
+                    print(game, file=f, end='\n\n')
+                self.done += 1
+                if outcome:
+                    self.score[outcome] += 1
+                h = game.headers
+                mins = (time.time() - self.t0) / 60
+                print(f"[{mins:6.1f}min] game {n:3d} ({self.done}/{self.args.games}) {endpoint}: "
+                      f"{h['White']} - {h['Black']} {h['Result']} ({h['Termination']}, "
+                      f"{h['PlyCount']} plies)  ELPH +{self.score['W']} ={self.score['D']} "
+                      f"-{self.score['L']}", flush=True)
+
+    def run(self):
+        threads = [threading.Thread(target=self.worker, args=(ep,), daemon=True)
+                   for ep in self.args.endpoints]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        w, d, l = self.score['W'], self.score['D'], self.score['L']
+        games = w + d + l
+        print(f"\n{games} games in {(time.time() - self.t0) / 60:.1f} min: "
+              f"ELPH +{w} ={d} -{l}{elo_text(w, d, l)}")
+        print(f"PGN: {self.pgn_path}")
+
+
+def elo_text(w, d, l):
+    """', score 56.0%, Elo +42' (nothing if the score is 0% / 100%)."""
+    games = w + d + l
+    if not games:
+        return ''
+    s = (w + d / 2) / games
+    text = f", score {100 * s:.1f}%"
+    if 0 < s < 1:
+        import math
+        text += f", Elo {-400 * math.log10(1 / s - 1):+.0f}"
+    return text
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Play ELPH vs a UCI opponent on several endpoints at once")
+    ap.add_argument('-e', '--endpoint', action='append', required=True,
+                    help="ELPH_PORT of an engine (serial device, pty, sim:<image>); repeat per board")
+    ap.add_argument('-j', '--jobs', type=int, default=1,
+                    help="sim: endpoints only: run this many copies of each")
+    ap.add_argument('-n', '--games', type=int, default=2)
+    ap.add_argument('--go', default='go depth 4', help="ELPH's go command")
+    ap.add_argument('--opponent', default='stockfish', help="opponent UCI command line")
+    ap.add_argument('--opponent-name', help="PGN name (default: the command's last word)")
+    ap.add_argument('--opponent-option', action='append', default=[], metavar='NAME=VALUE',
+                    help="setoption for the opponent (repeatable)")
+    ap.add_argument('--opponent-env', action='append', default=[], metavar='VAR=VALUE',
+                    help="environment for the opponent process (repeatable)")
+    ap.add_argument('--opponent-go', default='go movetime 200', help="opponent's go command")
+    ap.add_argument('--timeout', type=float, default=200, help="seconds per search before a forfeit")
+    ap.add_argument('--maxplies', type=int, default=400, help="draw after this many plies (0 = off)")
+    ap.add_argument('--resign-score', type=int, default=1500)
+    ap.add_argument('--resign-moves', type=int, default=10, help="0 = no resign adjudication")
+    ap.add_argument('--draw-score', type=int, default=10)
+    ap.add_argument('--draw-moves', type=int, default=8, help="0 = no draw adjudication")
+    ap.add_argument('--draw-movenumber', type=int, default=40)
+    ap.add_argument('--event', default='ELPH farm')
+    ap.add_argument('--out', default=time.strftime('farm-%Y%m%d-%H%M%S'))
+    args = ap.parse_args()
+    args.out = os.path.abspath(args.out)
+
+    args.endpoints = []
+    for ep in args.endpoint:
+        args.endpoints += [ep] * (args.jobs if ep.startswith('sim:') else 1)
+    print(f"{args.games} games on {len(args.endpoints)} endpoints "
+          f"({', '.join(sorted(set(args.endpoints)))}), output {args.out}/")
+    Farm(args).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
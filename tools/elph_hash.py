@@ -0,0 +1,814 @@
+#!/usr/bin/env python3
+"""
+Bit-exact model of the engine's 16-bit Zobrist hash (HASH_HI/HASH_LO).
+
+Keys come from zobrist-keys.asm itself (the DW tables under ZOBRIST_PIECE_SQ,
+ZOBRIST_SIDE, ZOBRIST_CASTLE and ZOBRIST_EP, 781 words in assembly order), so
+whatever the engine assembles is what gets hashed. Position mirrors the
+engine's state and routines on a 0x88 board of engine piece codes:
+
+    HASH_INIT        piece-square keys of every occupied square, the side key
+                     if black is to move, one castle key per right held
+                     (WK, WQ, BK, BQ) and the EP file key when an EP square
+                     is set (capturable or not)
+    MAKE_MOVE        board, castling, EP square, halfmove clock and king
+                     squares as makemove.asm updates them; hash XORs
+                     [mover, from], [captured, capture square], [piece now on
+                     to, to] and the side key, plus both rook squares when
+                     castling. Castling and EP keys are NEVER updated
+                     incrementally: they stay as HASH_INIT left them.
+    UNMAKE_MOVE      the exact reverse, from the undo tuple make_move returned
+    NULL_MAKE_MOVE   clear EP, flip side, XOR the side key (and back)
+
+Piece-square offsets use the routines' 8-bit arithmetic (index = (p & 7) - 1,
++6 for black, times 128, plus sq64 * 2), so even a corrupt board code lands on
+the word the engine would read; one outside the key tables raises ValueError.
+"position startpos|fen ... moves ..." is modelled by Position.startpos /
+Position.from_fen and uci_hashes(), which returns what the engine leaves in
+HASH_HIST: the HASH_INIT hash, then one hash per move.
+
+Verification:
+    --sim IMAGE    plays each game (logs, .elpharc archives, or tools/*.uci
+                   position lines) through tools/elph_sim.py and compares
+                   every HASH_HIST entry, BOARD and GAME_STATE with the model;
+                   --go 'go depth 2' also checks the hash is back after a
+                   search (UNMAKE_MOVE symmetry)
+    --dump FILE    checks a monitor RAM dump ('6000>  04 02 ...' lines, as
+                   compare_codedump.py reads them): is HASH_HI/LO what
+                   HASH_INIT gives for the dumped board, and if not, which
+                   castling/EP keys from the game's HASH_INIT explain it? A
+                   hash no combination explains is corrupt. The key tables
+                   are compared too when the dump covers them (--listing).
+
+Batch mode: games are replayed ONCE, in parallel (ELPH_JOBS / -j), into a
+flat delta stream - the key word indices each HASH_INIT / MAKE_MOVE XORs,
+with a marker per position - plus a fingerprint per position (board + side,
+all the game hash depends on). stream_hashes() turns the stream into every
+position's hash for ANY key set in one tight pass over an array, which is
+what TT and key-quality studies need to repeat cheaply.
+
+    from elph_hash import Position, load_keys
+    pos = Position.startpos()
+    undo = pos.make_uci('e2e4'); pos.hash; pos.unmake_move(undo)
+
+Usage:
+    python3 tools/elph_hash.py [moves...]                  # hash after startpos moves
+    python3 tools/elph_hash.py --fen 'FEN' [moves...]
+    python3 tools/elph_hash.py --sim LISTING [inputs...] [--games N] [--go 'go depth 2']
+    python3 tools/elph_hash.py --dump DUMP [--listing LISTING]
+    python3 tools/elph_hash.py --batch [inputs...] [-j JOBS]
+        inputs: elph-debug logs (default ./elph-debug*.log), .elpharc
+                archives, .pgn / .zip databases, tools/*.uci scripts
+    options: --keys zobrist-keys.asm
+"""
+
+import argparse
+import glob
+import hashlib
+import os
+import re
+import sys
+import time
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from elph_squares import NO_EP, square_x88, x88_name
+
+ROOT = os.path.dirname(HERE)
+DEFAULT_KEYS = os.path.join(ROOT, 'zobrist-keys.asm')
+
+KEY_TABLES = (('ZOBRIST_PIECE_SQ', 768), ('ZOBRIST_SIDE', 1),
+              ('ZOBRIST_CASTLE', 4), ('ZOBRIST_EP', 8))
+SIDE_WORD, CASTLE_WORD, EP_WORD, N_WORDS = 768, 769, 773, 781
+
+EMPTY, WHITE, BLACK = 0, 0, 8
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 1, 2, 3, 4, 5, 6
+CASTLE_WK, CASTLE_WQ, CASTLE_BK, CASTLE_BQ = 1, 2, 4, 8
+ROOK_HOME = {0x00: CASTLE_WQ, 0x07: CASTLE_WK, 0x70: CASTLE_BQ, 0x77: CASTLE_BK}
+PROMO_TYPE = {'q': QUEEN, 'r': ROOK, 'b': BISHOP, 'n': KNIGHT}
+FEN_PIECES = {c: i + 1 for i, c in enumerate('PNBRQK')}
+FEN_PIECES.update({c.lower(): v | BLACK for c, v in FEN_PIECES.items()})
+START_RANK = [ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK]
+
+# GAME_STATE layout (board.asm STATE_* offsets)
+STATE_SIDE, STATE_CASTLING, STATE_EP, STATE_HALFMOVE = 0, 1, 2, 3
+STATE_W_KING, STATE_B_KING = 6, 7
+
+# Delta stream markers (word indices are < N_WORDS)
+EMIT = 0xFFFE               # a position is complete: its hash is the running XOR
+RESET = 0xFFFF              # a new game: running XOR = 0
+
+DUMP_LINE = re.compile(r"\s*([0-9A-Fa-f]{4})\s*>\s*(.*)")
+EQU_LINE = re.compile(r"^(\w+)\s+EQU\s+\$([0-9A-Fa-f]+)")
+DW_WORD = re.compile(r"\$([0-9A-Fa-f]{4})")
+
+
+def load_keys(path=DEFAULT_KEYS):
+    """The 781 key words of zobrist-keys.asm in assembly order (piece-square
+    768, side 1, castle 4, EP 8). ValueError if a table is missing, short,
+    out of order, or not contiguous."""
+    tables = {}
+    label = None
+    for line in open(path):
+        code = line.split(';', 1)[0]
+        m = re.match(r"^(\w+):", code)
+        if m:
+            label = m.group(1)
+            tables.setdefault(label, [])
+            code = code[m.end():]
+        if label is not None and re.match(r"\s*DW\b", code, re.I):
+            tables[label] += [int(hx, 16) for hx in DW_WORD.findall(code)]
+    labels = [name for name, _ in KEY_TABLES]
+    if [name for name in tables if name in labels] != labels:
+        raise ValueError(f"{path}: expected labels {', '.join(labels)} in that order")
+    words = []
+    for name, count in KEY_TABLES:
+        if len(tables[name]) != count:
+            raise ValueError(f"{path}: {name} has {len(tables[name])} words, expected {count}")
+        words += tables[name]
+    return words
+
+
+def piece_word(code, sq):
+    """Key word index HASH_INIT / HASH_XOR_PIECE_SQ read for board code `code`
+    on 0x88 square `sq`, with their 8-bit arithmetic."""
+    idx = ((code & 7) - 1) & 0xFF
+    if code & BLACK:
+        idx = (idx + 6) & 0xFF
+    return idx * 64 + ((sq & 0x70) >> 1) + (sq & 7)
+
+
+class Keys:
+    """A key set plus the [code << 7 | sq] -> word index table MAKE_MOVE's
+    hash updates go through (None where the engine would read past the key
+    tables)."""
+
+    def __init__(self, words):
+        if len(words) != N_WORDS:
+            raise ValueError(f"{len(words)} key words, expected {N_WORDS}")
+        self.words = list(words)
+        self.square = [None] * (16 << 7)
+        for code in range(1, 16):
+            for sq in range(128):
+                w = piece_word(code, sq)
+                if w < N_WORDS:
+                    self.square[code << 7 | sq] = w
+
+    @classmethod
+    def load(cls, path=DEFAULT_KEYS):
+        return cls(load_keys(path))
+
+
+_default_keys = None
+
+
+def default_keys():
+    global _default_keys
+    if _default_keys is None:
+        _default_keys = Keys.load()
+    return _default_keys
+
+
+class Position:
+    """BOARD, GAME_STATE and HASH_HI/LO as the engine holds them. `trace`,
+    when a list, collects the key word indices every hash update XORs."""
+    __slots__ = ('keys', 'board', 'side', 'castling', 'ep', 'halfmove', 'kings',
+                 'hash', 'trace')
+
+    def __init__(self, keys=None):
+        self.keys = keys or default_keys()
+        self.board = bytearray(128)
+        self.side = WHITE
+        self.castling = CASTLE_WK | CASTLE_WQ | CASTLE_BK | CASTLE_BQ
+        self.ep = NO_EP
+        self.halfmove = 0
+        self.kings = [0x04, 0x74]
+        self.hash = 0
+        self.trace = None
+
+    @classmethod
+    def startpos(cls, keys=None, trace=None):
+        """INIT_BOARD + HASH_INIT ("position startpos")."""
+        pos = cls(keys)
+        for f in range(8):
+            pos.board[f] = START_RANK[f]
+            pos.board[0x10 + f] = PAWN
+            pos.board[0x60 + f] = PAWN | BLACK
+            pos.board[0x70 + f] = START_RANK[f] | BLACK
+        pos.trace = trace
+        pos.hash_init()
+        return pos
+
+    @classmethod
+    def from_fen(cls, fen, keys=None, trace=None):
+        """UCI_POS_FEN + HASH_INIT ("position fen ..."): fields not given keep
+        INIT_BOARD's defaults, unknown placement characters are ignored."""
+        pos = cls(keys)
+        fields = fen.split()
+        sq = 0x70
+        for ch in fields[0] if fields else '':
+            if ch == '/':
+                sq = (((sq - 1) & 0x70) - 0x10) & 0xFF
+            elif '1' <= ch <= '8':
+                sq = (sq + int(ch)) & 0xFF
+            elif ch in FEN_PIECES:
+                if not sq & 0x88:
+                    pos.board[sq] = FEN_PIECES[ch]
+                    if FEN_PIECES[ch] & 7 == KING:
+                        pos.kings[FEN_PIECES[ch] >> 3] = sq
+                sq = (sq + 1) & 0xFF
+        if len(fields) > 1:
+            pos.side = BLACK if fields[1] == 'b' else WHITE
+        if len(fields) > 2:
+            pos.castling = 0
+            for ch in fields[2]:
+                pos.castling |= {'K': CASTLE_WK, 'Q': CASTLE_WQ,
+                                 'k': CASTLE_BK, 'q': CASTLE_BQ}.get(ch, 0)
+        if len(fields) > 3 and fields[3] != '-':
+            pos.ep = square_x88(fields[3])
+        if len(fields) > 4 and fields[4].isdigit():
+            pos.halfmove = int(fields[4]) & 0xFF
+        pos.trace = trace
+        pos.hash_init()
+        return pos
+
+    def word(self, code, sq):
+        w = self.keys.square[code << 7 | sq]
+        if w is None:
+            raise ValueError(f"piece code ${code:02X} on ${sq:02X} reads past the key tables")
+        return w
+
+    def hash_init(self):
+        """HASH_INIT: the full hash of the current board and state."""
+        x = [self.word(p, sq) for sq, p in enumerate(self.board) if p and not sq & 0x88]
+        if self.side:
+            x.append(SIDE_WORD)
+        x += [CASTLE_WORD + bit for bit in range(4) if self.castling >> bit & 1]
+        if self.ep != NO_EP:
+            x.append(EP_WORD + (self.ep & 7))
+        self.hash = 0
+        self._xor(x)
+        return self.hash
+
+    def _xor(self, x):
+        if None in x:
+            raise ValueError("piece code reads past the key tables")
+        w = self.keys.words
+        h = self.hash
+        for i in x:
+            h ^= w[i]
+        self.hash = h
+        if self.trace is not None:
+            self.trace.extend(x)
+
+    def make_move(self, frm, to, promo=0):
+        """MAKE_MOVE with MOVE_FROM/MOVE_TO = frm/to and UNDO_PROMOTION =
+        promo (piece type 2-5, or 0). Returns the undo tuple."""
+        b = self.board
+        sqw = self.keys.square
+        undo_state = (self.castling, self.ep, self.halfmove)
+        moving = b[frm]
+        captured = b[to]
+        cap_sq = to
+        b[to] = moving
+        if not captured and moving & 7 == PAWN and self.ep != NO_EP and to == self.ep:
+            cap_sq = (frm & 0x70) | (to & 7)
+            captured = b[cap_sq]
+            b[cap_sq] = EMPTY
+        if promo:
+            b[to] = (moving & BLACK) + promo
+        x = []
+        if moving & 7 == KING:
+            self.kings[moving >> 3 & 1] = to
+            self.castling &= ~(CASTLE_BK | CASTLE_BQ if moving & BLACK else CASTLE_WK | CASTLE_WQ)
+            d = (to - frm) & 0xFF
+            rook_sqs = (to + 1, to - 1) if d == 2 else (to - 2, to + 1) if d == 0xFE else None
+            if rook_sqs:
+                old, new = rook_sqs
+                rook = b[old]
+                b[old] = EMPTY
+                b[new] = rook
+                if rook:
+                    x += (sqw[rook << 7 | old], sqw[rook << 7 | new])
+        b[frm] = EMPTY
+        self.side ^= BLACK
+        self.ep = NO_EP
+        if moving & 7 == PAWN:
+            rank_diff = ((frm & 0x70) - (to & 0x70)) & 0xFF
+            if rank_diff == 0xE0:
+                self.ep = (to + 0xF0) & 0xFF
+            elif rank_diff == 0x20:
+                self.ep = to + 0x10
+        self.halfmove = 0 if captured or moving & 7 == PAWN else (self.halfmove + 1) & 0xFF
+        self.castling &= ~(ROOK_HOME.get(frm, 0) | ROOK_HOME.get(to, 0))
+        p = b[to]
+        mover = (p & BLACK) | PAWN if promo else p
+        if mover:
+            x.append(sqw[mover << 7 | frm])
+        if captured:
+            x.append(sqw[captured << 7 | cap_sq])
+        if p:
+            x.append(sqw[p << 7 | to])
+        x.append(SIDE_WORD)
+        self._xor(x)
+        return (frm, to, promo, captured, cap_sq) + undo_state
+
+    def unmake_move(self, undo):
+        """UNMAKE_MOVE from make_move's undo tuple."""
+        frm, to, promo, captured, cap_sq, castling, ep, halfmove = undo
+        b = self.board
+        sqw = self.keys.square
+        p = b[to]
+        b[cap_sq] = captured
+        if cap_sq != to:
+            b[to] = EMPTY
+        if p and promo:
+            p = (p & BLACK) | PAWN
+        b[frm] = p
+        x = []
+        if p & 7 == KING:
+            self.kings[p >> 3 & 1] = frm
+            d = (to - frm) & 0xFF
+            rook_sqs = (to - 1, to + 1) if d == 2 else (to + 1, to - 2) if d == 0xFE else None
+            if rook_sqs:
+                old, new = rook_sqs
+                rook = b[old]
+                b[old] = EMPTY
+                b[new] = rook
+                if rook:
+                    x += (sqw[rook << 7 | old], sqw[rook << 7 | new])
+        self.castling, self.ep, self.halfmove = castling, ep, halfmove
+        self.side ^= BLACK
+        p = b[frm]
+        mover = (p & BLACK) + promo if promo else p
+        if mover:
+            x.append(sqw[mover << 7 | to])
+        if captured:
+            x.append(sqw[captured << 7 | cap_sq])
+        if p:
+            x.append(sqw[p << 7 | frm])
+        x.append(SIDE_WORD)
+        self._xor(x)
+
+    def null_move(self):
+        """NULL_MAKE_MOVE. Returns the saved EP square for null_unmake."""
+        saved = self.ep
+        self.ep = NO_EP
+        self.side ^= BLACK
+        self._xor([SIDE_WORD])
+        return saved
+
+    def null_unmake(self, saved_ep):
+        self.side ^= BLACK
+        self.ep = saved_ep
+        self._xor([SIDE_WORD])
+
+    def make_uci(self, move):
+        """Parse a UCI move as UCI_POS_MOVE_LOOP does and make it."""
+        frm, to = square_x88(move[0:2]), square_x88(move[2:4])
+        if frm == NO_EP or to == NO_EP:
+            raise ValueError(f"bad move {move!r}")
+        return self.make_move(frm, to, PROMO_TYPE.get(move[4:5].lower(), 0))
+
+    def fingerprint(self):
+        return fingerprint(self.board, self.side)
+
+
+def fingerprint(board, side):
+    """64-bit digest of a 128-byte BOARD and the side to move: all a startpos
+    game's hash depends on, so it tells positions apart where the hash can't."""
+    return int.from_bytes(hashlib.blake2b(bytes(board) + bytes((side,)),
+                                          digest_size=8).digest(), 'little')
+
+
+def uci_hashes(moves, fen=None, keys=None):
+    """HASH_HIST after "position startpos|fen ... moves <moves>" (without the
+    engine's 255-entry cap): HASH_INIT's hash, then one per move."""
+    pos = Position.from_fen(fen, keys) if fen else Position.startpos(keys)
+    hashes = [pos.hash]
+    for mv in moves:
+        pos.make_uci(mv)
+        hashes.append(pos.hash)
+    return pos, hashes
+
+
+def parse_position(line):
+    """'position startpos|fen ... [moves ...]' -> (fen or None, moves), or None."""
+    m = re.match(r"\s*position\s+(startpos|fen\s+(.*?))(?:\s+moves\s+(.*))?\s*$", line)
+    if not m:
+        return None
+    return m.group(2), (m.group(3) or '').split()
+
+
+# ------------------------------------------------------------------------------
+# Inputs: (fen, moves) cases from logs, archives, PGNs and UCI scripts
+# ------------------------------------------------------------------------------
+
+def iter_cases(paths):
+    """Yield (fen or None, UCI movelist) per game / position line."""
+    for path in paths:
+        low = path.lower()
+        if low.endswith('.elpharc'):
+            from elph_archive import Archive
+            arc = Archive(path)
+            for i in range(len(arc)):
+                yield None, arc.moves(i)
+            arc.close()
+        elif low.endswith('.uci'):
+            from elph_sim import load_uci_script
+            for cmd in load_uci_script(path):
+                case = parse_position(cmd)
+                if case:
+                    yield case
+        elif low.endswith(('.pgn', '.zip')):
+            for moves in pgn_movelists(path):
+                yield None, moves
+        else:
+            from elph_corpus import log_games
+            for game in log_games(path):
+                yield None, game.final_moves()
+
+
+def san_to_uci(movetext):
+    """PGN movetext -> UCI moves (pgn_to_book's SAN resolver); stops at the
+    first move it cannot resolve."""
+    from pgn_to_book import apply_move, init_board, move_to_squares, parse_moves, promotion_of
+    state = init_board()
+    moves = []
+    for san in parse_moves(movetext):
+        squares = move_to_squares(san, state)
+        if squares is None:
+            break
+        promo = promotion_of(san)
+        moves.append(x88_name(squares[0]) + x88_name(squares[1]) + (promo or '').lower())
+        apply_move(state, squares[0], squares[1], promo)
+    return moves
+
+
+def pgn_movelists(path):
+    from pgn_to_book import iter_movetexts
+    for movetext in iter_movetexts(path):
+        moves = san_to_uci(movetext)
+        if moves:
+            yield moves
+
+
+# ------------------------------------------------------------------------------
+# Batch mode: delta streams
+# ------------------------------------------------------------------------------
+
+def game_stream(fen, moves, keys, deltas, fingerprints):
+    """Append one game to a delta stream (RESET, HASH_INIT's words, EMIT,
+    then each move's words and EMIT) and its positions' fingerprints."""
+    trace = []
+    deltas.append(RESET)
+    pos = Position.from_fen(fen, keys, trace) if fen else Position.startpos(keys, trace)
+    deltas.extend(trace)
+    deltas.append(EMIT)
+    fingerprints.append(pos.fingerprint())
+    for mv in moves:
+        del trace[:]
+        pos.make_uci(mv)
+        deltas.extend(trace)
+        deltas.append(EMIT)
+        fingerprints.append(pos.fingerprint())
+    return pos
+
+
+def _stream_chunk(keys_path, cases, movetexts=()):
+    """Worker: (deltas, fingerprints, games, bad games) for a chunk."""
+    keys = Keys.load(keys_path)
+    deltas, fingerprints = array('H'), array('Q')
+    games = bad = 0
+    for fen, moves in list(cases) + [(None, san_to_uci(t)) for t in movetexts]:
+        mark = (len(deltas), len(fingerprints))
+        try:
+            game_stream(fen, moves, keys, deltas, fingerprints)
+            games += 1
+        except (ValueError, IndexError):
+            del deltas[mark[0]:]
+            del fingerprints[mark[1]:]
+            bad += 1
+    return deltas, fingerprints, games, bad
+
+
+def _chunks(paths, size):
+    """Work units: ('cases', [...]) from logs/archives/scripts, ('pgn', [...])
+    movetexts (SAN is resolved in the workers)."""
+    from pgn_to_book import iter_movetexts
+    cases = []
+    for path in paths:
+        if path.lower().endswith(('.pgn', '.zip')):
+            texts = []
+            for text in iter_movetexts(path):
+                texts.append(text)
+                if len(texts) == size:
+                    yield [], texts
+                    texts = []
+            if texts:
+                yield [], texts
+        else:
+            for case in iter_cases([path]):
+                cases.append(case)
+                if len(cases) == size:
+                    yield cases, []
+                    cases = []
+    if cases:
+        yield cases, []
+
+
+def build_stream(paths, keys_path=DEFAULT_KEYS, jobs=None, chunk=500):
+    """Replay every game of `paths` into one delta stream. Returns (deltas,
+    fingerprints, games, bad games); chunks keep input order."""
+    jobs = jobs or int(os.environ.get('ELPH_JOBS', 0)) or os.cpu_count() or 1
+    deltas, fingerprints = array('H'), array('Q')
+    games = bad = 0
+    parts = []
+    if jobs == 1:
+        parts = (_stream_chunk(keys_path, c, t) for c, t in _chunks(paths, chunk))
+    else:
+        pool = ProcessPoolExecutor(jobs)
+        parts = pool.map(_stream_chunk, *zip(*((keys_path, c, t) for c, t in _chunks(paths, chunk))))
+    for d, f, g, b in parts:
+        deltas.extend(d)
+        fingerprints.extend(f)
+        games += g
+        bad += b
+    if jobs != 1:
+        pool.shutdown()
+    return deltas, fingerprints, games, bad
+
+
+def stream_hashes(deltas, words):
+    """Every EMITted position's hash under key set `words`, in stream order."""
+    w = list(words) + [0, 0]        # EMIT / RESET index past the keys: XOR 0
+    out = array('H')
+    h = 0
+    for i in deltas:
+        if i < N_WORDS:
+            h ^= w[i]
+        elif i == EMIT:
+            out.append(h)
+        else:
+            h = 0
+    return out
+
+
+def first_occurrences(fingerprints):
+    """Stream indices of each distinct position's first occurrence."""
+    seen = set()
+    first = array('I')
+    for i, fp in enumerate(fingerprints):
+        if fp not in seen:
+            seen.add(fp)
+            first.append(i)
+    return first
+
+
+def collision_stats(hashes, first):
+    """(distinct positions, distinct hashes among them, colliding pairs -
+    pairs of distinct positions with one hash -, and the pairs ideal random
+    16-bit keys would give: C(n, 2) / 65536)."""
+    per_hash = Counter(hashes[i] for i in first)
+    n = len(first)
+    pairs = sum(c * (c - 1) // 2 for c in per_hash.values())
+    return n, len(per_hash), pairs, n * (n - 1) / 2 / 65536
+
+
+# ------------------------------------------------------------------------------
+# Verification: simulator and hardware dumps
+# ------------------------------------------------------------------------------
+
+def engine_symbols(listing=None):
+    """{name: address}: the listing's symbol table, else board.asm's EQUs."""
+    if listing:
+        from elph_sim import load_symbols
+        return load_symbols(listing)
+    symbols = {}
+    for line in open(os.path.join(ROOT, 'board.asm')):
+        m = EQU_LINE.match(line)
+        if m:
+            symbols[m.group(1)] = int(m.group(2), 16)
+    return symbols
+
+
+def state_diffs(mem, sym, pos):
+    """Differences between engine RAM (anything indexable by address) and
+    the model's board / state."""
+    diffs = []
+    board, state = sym['BOARD'], sym['GAME_STATE']
+    for sq in range(128):
+        if not sq & 0x88 and mem[board + sq] != pos.board[sq]:
+            diffs.append(f"BOARD[{x88_name(sq)}] engine ${mem[board + sq]:02X} model ${pos.board[sq]:02X}")
+    for name, off, value in (('side', STATE_SIDE, pos.side), ('castling', STATE_CASTLING, pos.castling),
+                             ('ep', STATE_EP, pos.ep), ('halfmove', STATE_HALFMOVE, pos.halfmove),
+                             ('white king', STATE_W_KING, pos.kings[0]),
+                             ('black king', STATE_B_KING, pos.kings[1])):
+        if mem[state + off] != value:
+            diffs.append(f"{name} engine ${mem[state + off]:02X} model ${value:02X}")
+    return diffs
+
+
+def verify_sim(image, cases, go=None, limit=None, keys=None):
+    """Play each (fen, moves) case in the simulator; compare HASH_HIST, BOARD
+    and GAME_STATE (and the hash after `go`) with the model. Returns
+    (cases checked, hashes compared, [mismatch lines])."""
+    from elph_sim import ElphSim
+    sym = engine_symbols(image if image.lower().endswith('.lst') else None)
+    sim = ElphSim.from_file(image, translate=True)
+    sim.boot()
+    sim.command('uci')
+    checked = compared = 0
+    bad = []
+    for fen, moves in cases:
+        if limit is not None and checked >= limit:
+            break
+        moves = moves[:254]             # HASH_HIST holds HASH_INIT + 254 moves
+        checked += 1
+        pos, hashes = uci_hashes(moves, fen, keys)
+        desc = f"fen {fen}" if fen else "startpos"
+        sim.command(f"position {desc}" + (" moves " + ' '.join(moves) if moves else ''))
+        mem = sim.mem
+        count = mem[sym['HASH_HIST_COUNT']]
+        engine = [mem[sym['HASH_HIST'] + 2 * i] << 8 | mem[sym['HASH_HIST'] + 2 * i + 1]
+                  for i in range(count)]
+        compared += len(engine)
+        if engine != hashes:
+            ply = next((i for i, (e, m) in enumerate(zip(engine, hashes)) if e != m),
+                       min(len(engine), len(hashes)))
+            bad.append(f"{desc} {' '.join(moves[:ply])}: HASH_HIST[{ply}] "
+                       f"engine {engine[ply:ply + 1]} model {hashes[ply:ply + 1]} "
+                       f"({len(engine)} vs {len(hashes)} entries)")
+            continue
+        diffs = state_diffs(mem, sym, pos)
+        if diffs:
+            bad.append(f"{desc} {' '.join(moves)}: " + '; '.join(diffs))
+            continue
+        if go:
+            sim.command(go)
+            h = mem[sym['HASH_HI']] << 8 | mem[sym['HASH_LO']]
+            compared += 1
+            if h != pos.hash:
+                bad.append(f"{desc} {' '.join(moves)}: after '{go}' hash ${h:04X}, "
+                           f"before ${pos.hash:04X}")
+    return checked, compared, bad
+
+
+def read_dump(path):
+    """Monitor dump -> {address: byte}."""
+    mem = {}
+    for line in open(path):
+        m = DUMP_LINE.match(line)
+        if not m:
+            continue
+        addr = int(m.group(1), 16)
+        for i, b in enumerate(re.findall(r"[0-9A-Fa-f]{2}", m.group(2))):
+            mem[addr + i] = int(b, 16)
+    return mem
+
+
+def explain_hash(pos, h):
+    """The (castling bits, EP square) HASH_INIT states that give hash `h` for
+    this board and side. A game's hash keeps the castling/EP keys of its
+    HASH_INIT (startpos: all four rights, no EP), whatever the rights now."""
+    found = []
+    saved = (pos.castling, pos.ep, pos.trace)
+    pos.trace = None
+    for castling in range(16):
+        for ep in [NO_EP] + list(range(8)):
+            pos.castling, pos.ep = castling, ep
+            if pos.hash_init() == h:
+                found.append((castling, ep))
+    pos.castling, pos.ep, pos.trace = saved
+    pos.hash_init()
+    return found
+
+
+def castling_name(bits):
+    return ''.join(c for c, b in zip('KQkq', (CASTLE_WK, CASTLE_WQ, CASTLE_BK, CASTLE_BQ))
+                   if bits & b) or '-'
+
+
+def check_dump(path, listing=None, keys=None):
+    """Report lines for a RAM dump: hash vs board, key tables vs keys."""
+    keys = keys or default_keys()
+    mem = read_dump(path)
+    sym = engine_symbols(listing)
+    lines = []
+    need = [sym['BOARD'] + sq for sq in range(128) if not sq & 0x88] + \
+           [sym['GAME_STATE'] + off for off in range(8)] + [sym['HASH_HI'], sym['HASH_LO']]
+    missing = [a for a in need if a not in mem]
+    if missing:
+        return [f"dump lacks {len(missing)} needed bytes (first ${missing[0]:04X}): "
+                f"dump BOARD ${sym['BOARD']:04X}-${sym['BOARD'] + 0x8F:04X} and "
+                f"HASH_HI/LO ${sym['HASH_HI']:04X}"]
+    pos = Position(keys)
+    for sq in range(128):
+        if not sq & 0x88:
+            pos.board[sq] = mem[sym['BOARD'] + sq]
+    state = sym['GAME_STATE']
+    pos.side, pos.castling, pos.ep = (mem[state + STATE_SIDE], mem[state + STATE_CASTLING],
+                                      mem[state + STATE_EP])
+    h = mem[sym['HASH_HI']] << 8 | mem[sym['HASH_LO']]
+    try:
+        init = pos.hash_init()
+    except ValueError as e:
+        return [f"board holds a piece code outside the key tables: {e}"]
+    lines.append(f"HASH_HI/LO ${h:04X}; HASH_INIT of the dumped board and state ${init:04X}")
+    if h == init:
+        lines.append("  hash matches the board and its current castling/EP state")
+    else:
+        found = explain_hash(pos, h)
+        if found:
+            for castling, ep in found:
+                lines.append(f"  hash matches the board with HASH_INIT castling {castling_name(castling)}, "
+                             f"EP {'-' if ep == NO_EP else 'file ' + 'abcdefgh'[ep]}"
+                             + (" (a startpos game)" if castling == 15 and ep == NO_EP else ''))
+        else:
+            lines.append("  *** no castling/EP state explains the hash: hash or board corrupt "
+                         "(or dumped mid-search / mid-MAKE_MOVE) ***")
+    hist, count = sym.get('HASH_HIST'), sym.get('HASH_HIST_COUNT')
+    if hist is not None and count in mem and mem[count]:
+        last = hist + 2 * (mem[count] - 1)
+        if last in mem and last + 1 in mem:
+            top = mem[last] << 8 | mem[last + 1]
+            lines.append(f"HASH_HIST[{mem[count] - 1}] ${top:04X}"
+                         + (" = HASH_HI/LO" if top == h else " != HASH_HI/LO (searching, or corrupt)"))
+    base = sym.get('ZOBRIST_PIECE_SQ')
+    if base is not None:
+        got = [mem.get(base + 2 * i) for i in range(N_WORDS)]
+        covered = [i for i in range(N_WORDS) if got[i] is not None and mem.get(base + 2 * i + 1) is not None]
+        bad = [i for i in covered if (got[i] << 8 | mem[base + 2 * i + 1]) != keys.words[i]]
+        if covered:
+            lines.append(f"key tables: {len(covered)}/{N_WORDS} words in the dump, "
+                         + (f"*** {len(bad)} differ (first word {bad[0]} at ${base + 2 * bad[0]:04X}) ***"
+                            if bad else "all match"))
+    return lines
+
+
+def default_inputs():
+    return sorted(glob.glob('elph-debug*.log'))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    ap.add_argument('args', nargs='*', help="moves, or inputs with --sim / --batch")
+    ap.add_argument('--fen', help="hash 'position fen FEN moves ...' instead of startpos")
+    ap.add_argument('--sim', metavar='IMAGE', help="verify against the simulator")
+    ap.add_argument('--games', type=int, help="with --sim: at most this many games")
+    ap.add_argument('--go', help="with --sim: also search (e.g. 'go depth 2') and check the hash")
+    ap.add_argument('--dump', metavar='FILE', help="check a monitor RAM dump")
+    ap.add_argument('--listing', help="with --dump: symbol addresses from this listing")
+    ap.add_argument('--batch', action='store_true', help="hash every corpus position")
+    ap.add_argument('-j', '--jobs', type=int)
+    ap.add_argument('--keys', default=DEFAULT_KEYS)
+    args = ap.parse_args()
+    keys = Keys.load(args.keys)
+
+    if args.dump:
+        for line in check_dump(args.dump, args.listing, keys):
+            print(line)
+        return 0
+
+    if args.sim:
+        t0 = time.time()
+        checked, compared, bad = verify_sim(args.sim, iter_cases(args.args or default_inputs()),
+                                            args.go, args.games, keys)
+        print(f"{checked} positions, {compared} engine hashes compared against the model "
+              f"in {time.time() - t0:.1f}s")
+        for line in bad[:20]:
+            print(f"  MISMATCH {line}")
+        if len(bad) > 20:
+            print(f"  ... +{len(bad) - 20} more")
+        print("  all match" if not bad else f"  *** {len(bad)} mismatching positions ***")
+        return 1 if bad else 0
+
+    if args.batch:
+        paths = args.args or default_inputs()
+        t0 = time.time()
+        deltas, fingerprints, games, bad = build_stream(paths, args.keys, args.jobs)
+        t1 = time.time()
+        hashes = stream_hashes(deltas, keys.words)
+        t2 = time.time()
+        first = first_occurrences(fingerprints)
+        n, distinct, pairs, expected = collision_stats(hashes, first)
+        print(f"{games} games ({bad} unplayable), {len(hashes)} positions, "
+              f"{len(deltas)} stream words")
+        print(f"  replay {t1 - t0:.1f}s, hashing {t2 - t1:.2f}s "
+              f"({len(hashes) / max(t2 - t1, 1e-9) / 1e6:.1f}M positions/s)")
+        print(f"  {n} distinct positions (board + side) on {distinct} distinct hashes; "
+              f"{pairs} colliding pairs (ideal random keys: {expected:.0f}, "
+              f"ratio {pairs / max(expected, 1e-9):.3f})")
+        return 0
+
+    pos, hashes = uci_hashes(args.args, args.fen, keys)
+    for i, h in enumerate(hashes):
+        print(f"{i:3d}  ${h:04X}  {args.args[i - 1] if i else ('fen' if args.fen else 'startpos')}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
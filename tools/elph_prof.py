@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Label-level cycle profiler for the chess engine, on the CDP1806 simulator.
+
+Runs a UCI command script (tools/*.uci format) against an archived listing
+and, for every `go`, reports where the machine cycles went:
+
+  - call graph: one row per SCRT call target (NEGAMAX, EVALUATE,
+    GENERATE_MOVES, IS_IN_CHECK, TT_PROBE, MAKE_MOVE, ...) with call count,
+    inclusive and exclusive cycles and cycles per search node. Calls are seen
+    at SEP 4 / SEP 5, so the CALL/RETN overhead inside the BIOS SCRT routines
+    is charged to the callee. Inclusive cycles count only the outermost
+    activation of a recursive function (NEGAMAX, QUIESCENCE_SEARCH), gprof
+    style; --callers adds the caller/callee breakdown under each function.
+  - flat profile: every executed instruction charged to the nearest
+    preceding label in the listing, so hot loops inside a routine
+    (e.g. the slider rays in GENERATE_MOVES) show up on their own.
+
+Cycles per node divide by NODES_SEARCHED as the engine leaves it after the
+search. The RTC runs on simulator virtual time, so timed searches end where
+they would on the board.
+
+--diff runs the same script on a second build and prints per-go totals plus
+per-function and per-label deltas (summed over all searches), so each
+optimization is measured rather than guessed:
+
+Usage:
+    python3 tools/elph_prof.py [--listing LST] [--top N] [--callers] script.uci
+    python3 tools/elph_prof.py --listing listings/chess-engine-8c7208d.lst \\
+        --diff listings/chess-engine-702cdaf.lst tools/probe_loss19_castle.uci
+
+A script of '-' reads commands from stdin.
+"""
+import bisect
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from elph_sim import (ElphSim, Rtc, Uart, CLOCK_HZ, CLOCKS_PER_CYCLE, STOP_INPUT,
+                      instr_cycles, load_labels, load_symbols, load_uci_script)
+
+DEFAULT_LST = 'listings/chess-engine-94a1d59.lst'
+ROOT = '(uci)'                  # code running when the go line arrives
+
+
+class GoProfile:
+    """Everything measured for one `go` command."""
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.bestmove = None
+        self.info = ''
+        self.cycles = 0
+        self.nodes = 0
+        self.funcs = {}         # name -> [calls, incl, excl]
+        self.edges = {}         # (caller, callee) -> [calls, incl]
+        self.flat = {}          # label -> [instructions, cycles]
+
+    def per_node(self, cycles):
+        return cycles / self.nodes if self.nodes else 0.0
+
+
+class CallProfiler:
+    """Shadow call stack driven by the simulator's SEP 4 / SEP 5 hook.
+
+    A frame is [name, caller sp, entry cycle]. The sp recorded at the call
+    (R2 before SCRT pushes the linkage) is what R2 + 2 reads at the matching
+    SEP 5, which lets a return find its frame even if the engine unwound some
+    frames without RETN; frames whose sp is at or below a new call's sp are
+    dead and are closed first."""
+
+    def __init__(self, sim, names):
+        self.sim = sim
+        self.names = names      # addr -> label
+        self.prof = None
+
+    def start(self, prof):
+        self.prof = prof
+        self.stack = [[ROOT, 0x10000, self.sim.cycles]]
+        self.active = {ROOT: 1}
+        self.edge_active = {}
+        self.last = self.sim.cycles
+        self.sim.pc_counts = [0] * 0x10000
+        self.sim.sep_hook = self._sep
+
+    def stop(self):
+        cyc = self.sim.cycles
+        self._charge(cyc)
+        while len(self.stack) > 1:
+            self._close(cyc)
+        counts = self.sim.pc_counts
+        self.sim.pc_counts = None
+        self.sim.sep_hook = None
+        self._flat(counts)
+
+    def _charge(self, cyc):
+        f = self.prof.funcs.get(self.stack[-1][0])
+        if f is None:
+            f = self.prof.funcs[self.stack[-1][0]] = [0, 0, 0]
+        f[2] += cyc - self.last
+        self.last = cyc
+
+    def _close(self, cyc):
+        name, _, entry = self.stack.pop()
+        caller = self.stack[-1][0]
+        self.active[name] -= 1
+        if not self.active[name]:
+            self.prof.funcs[name][1] += cyc - entry
+        key = (caller, name)
+        self.edge_active[key] -= 1
+        if not self.edge_active[key]:
+            self.prof.edges[key][1] += cyc - entry
+
+    def _sep(self, n, cyc):
+        self._charge(cyc)
+        R = self.sim.r
+        if n == 4:
+            M = self.sim.mem
+            pc = R[3]                           # -> DW target after SEP 4
+            target = (M[pc] << 8) | M[(pc + 1) & 0xFFFF]
+            name = self.names.get(target) or f"${target:04X}"
+            sp = R[2]
+            while len(self.stack) > 1 and self.stack[-1][1] <= sp:
+                self._close(cyc)
+            caller = self.stack[-1][0]
+            self.stack.append([name, sp, cyc])
+            f = self.prof.funcs.get(name)
+            if f is None:
+                f = self.prof.funcs[name] = [0, 0, 0]
+            f[0] += 1
+            self.active[name] = self.active.get(name, 0) + 1
+            key = (caller, name)
+            e = self.prof.edges.get(key)
+            if e is None:
+                e = self.prof.edges[key] = [0, 0]
+            e[0] += 1
+            self.edge_active[key] = self.edge_active.get(key, 0) + 1
+        else:
+            sp = (R[2] + 2) & 0xFFFF
+            for i in range(len(self.stack) - 1, 0, -1):
+                if self.stack[i][1] == sp:
+                    while len(self.stack) > i:
+                        self._close(cyc)
+                    break
+            else:
+                if len(self.stack) > 1:
+                    self._close(cyc)
+
+    def _flat(self, counts):
+        addrs = sorted(self.names)
+        mem = self.sim.mem
+        flat = self.prof.flat
+        for pc, n in enumerate(counts):
+            if not n:
+                continue
+            i = bisect.bisect_right(addrs, pc) - 1
+            label = self.names[addrs[i]] if i >= 0 else '(none)'
+            f = flat.get(label)
+            if f is None:
+                f = flat[label] = [0, 0]
+            f[0] += n
+            f[1] += n * (instr_cycles(mem, pc) or 0)
+
+
+def profile_build(lst, cmds, clock_hz=CLOCK_HZ, log=None):
+    """Boot `lst` in the simulator, play `cmds`, profile every go.
+    Returns a list of GoProfile."""
+    labels = load_labels(lst)
+    symbols = load_symbols(lst)
+    nodes_addr = symbols.get('NODES_SEARCHED', 0x6412)
+    sim = ElphSim.from_file(lst, uart=Uart(clock_hz=clock_hz),
+                            rtc=Rtc(clock_hz=clock_hz), clock_hz=clock_hz)
+    names = {}
+    for name, addr in list(labels.items()) + list(sim.bios.items()):
+        names.setdefault(addr, name)
+    cp = CallProfiler(sim, names)
+
+    sim.boot()
+    if sim.run_until_input() != STOP_INPUT:
+        raise RuntimeError(f"{lst}: engine stopped during boot: {sim.registers()}")
+    sim.output_lines()
+
+    profiles = []
+    for cmd in cmds:
+        if cmd == 'quit':
+            break
+        if not cmd.startswith('go'):
+            sim.command(cmd)
+            if sim.stop_reason != STOP_INPUT:
+                raise RuntimeError(f"{lst}: sim stopped ({sim.stop_reason}) "
+                                   f"after '{cmd}': {sim.registers()}")
+            continue
+        prof = GoProfile(cmd)
+        c0 = sim.cycles
+        cp.start(prof)
+        out = sim.command(cmd)
+        cp.stop()
+        prof.cycles = sim.cycles - c0
+        prof.nodes = int.from_bytes(sim.mem[nodes_addr:nodes_addr + 4], 'little')
+        for ln in out:
+            if ln.startswith('bestmove'):
+                prof.bestmove = ln.split()[1] if len(ln.split()) > 1 else '?'
+            elif ln.startswith('info depth'):
+                prof.info = ln
+        if sim.stop_reason != STOP_INPUT:
+            prof.bestmove = f"SIM STOP {sim.stop_reason}"
+        profiles.append(prof)
+        if log:
+            log(f"  {os.path.basename(lst)}: {cmd} -> {prof.bestmove} "
+                f"({prof.cycles:,} cycles, {prof.nodes} nodes)")
+        if sim.stop_reason != STOP_INPUT:
+            break
+    return profiles
+
+
+def merge(profiles):
+    """Sum a list of GoProfile into one."""
+    total = GoProfile('(all searches)')
+    for p in profiles:
+        total.cycles += p.cycles
+        total.nodes += p.nodes
+        for src, dst in ((p.funcs, total.funcs), (p.edges, total.edges), (p.flat, total.flat)):
+            for k, v in src.items():
+                d = dst.setdefault(k, [0] * len(v))
+                for i, x in enumerate(v):
+                    d[i] += x
+    return total
+
+
+def seconds(cycles, clock_hz):
+    return cycles * CLOCKS_PER_CYCLE / clock_hz
+
+
+def report(prof, top, callers, clock_hz):
+    tot = prof.cycles or 1
+    print(f"=== {prof.cmd}" + (f"  ->  bestmove {prof.bestmove}" if prof.bestmove else '') + " ===")
+    if prof.info:
+        print(f"    {prof.info}")
+    print(f"    {prof.cycles:,} cycles = {seconds(prof.cycles, clock_hz):.2f} s "
+          f"@ {clock_hz / 1e6:g} MHz, {prof.nodes:,} nodes, "
+          f"{prof.per_node(prof.cycles):,.0f} cycles/node")
+    print()
+    print("  Call graph (SCRT targets; incl = outermost activation only)")
+    print(f"  {'incl%':>6} {'incl':>13} {'excl%':>6} {'excl':>13} {'calls':>9} "
+          f"{'excl/call':>9} {'incl/node':>10}  function")
+    rows = sorted(prof.funcs.items(), key=lambda kv: -kv[1][2])[:top]
+    for name, (calls, incl, excl) in sorted(rows, key=lambda kv: -kv[1][1]):
+        print(f"  {100 * incl / tot:6.2f} {incl:13,} {100 * excl / tot:6.2f} {excl:13,} "
+              f"{calls:9,} {excl / calls if calls else 0:9.1f} "
+              f"{prof.per_node(incl):10.1f}  {name}")
+        if callers:
+            for (a, b), (n, inc) in sorted(prof.edges.items(), key=lambda kv: -kv[1][1]):
+                if b == name:
+                    print(f"  {'':>6} {inc:13,} {'':>6} {'':>13} {n:9,}  {'':>20}  <- {a}")
+            for (a, b), (n, inc) in sorted(prof.edges.items(), key=lambda kv: -kv[1][1]):
+                if a == name:
+                    print(f"  {'':>6} {inc:13,} {'':>6} {'':>13} {n:9,}  {'':>20}  -> {b}")
+    print()
+    print("  Flat profile (cycles charged to the nearest preceding label)")
+    print(f"  {'%':>6} {'cycles':>13} {'instrs':>12} {'cyc/node':>9}  label")
+    for label, (n, cyc) in sorted(prof.flat.items(), key=lambda kv: -kv[1][1])[:top]:
+        print(f"  {100 * cyc / tot:6.2f} {cyc:13,} {n:12,} {prof.per_node(cyc):9.1f}  {label}")
+    print()
+
+
+def _delta_rows(a, b, na, nb, top, title):
+    """A/B table sorted by absolute change; the per-node columns separate a
+    cheaper routine from a search that simply visited fewer nodes."""
+    keys = set(a) | set(b)
+    rows = [(k, a.get(k, 0), b.get(k, 0)) for k in keys]
+    rows.sort(key=lambda r: -abs(r[2] - r[1]))
+    print(f"  {title}")
+    print(f"  {'A':>13} {'B':>13} {'B-A':>13} {'%':>8} {'A/node':>9} {'B/node':>9}  name")
+    for k, x, y in rows[:top]:
+        pct = f"{100 * (y - x) / x:+7.1f}%" if x else '    new'
+        print(f"  {x:13,} {y:13,} {y - x:+13,} {pct:>8} "
+              f"{x / na if na else 0:9.1f} {y / nb if nb else 0:9.1f}  {k}")
+    print()
+
+
+def report_diff(lst_a, pa, lst_b, pb, top, clock_hz):
+    print(f"A = {lst_a}")
+    print(f"B = {lst_b}")
+    print()
+    print(f"  {'A cycles':>13} {'B cycles':>13} {'B-A %':>7} {'A nodes':>8} {'B nodes':>8} "
+          f"{'A cyc/n':>8} {'B cyc/n':>8}  A/B bestmove  command")
+    for x, y in zip(pa, pb):
+        pct = 100 * (y.cycles - x.cycles) / x.cycles if x.cycles else 0
+        same = '' if x.bestmove == y.bestmove else '  (DIFFERENT)'
+        print(f"  {x.cycles:13,} {y.cycles:13,} {pct:+6.1f}% {x.nodes:8,} {y.nodes:8,} "
+              f"{x.per_node(x.cycles):8.0f} {y.per_node(y.cycles):8.0f}  "
+              f"{x.bestmove}/{y.bestmove}  {x.cmd}{same}")
+    if len(pa) != len(pb):
+        print(f"  !! search counts differ: A {len(pa)}, B {len(pb)}")
+    ta, tb = merge(pa), merge(pb)
+    pct = 100 * (tb.cycles - ta.cycles) / ta.cycles if ta.cycles else 0
+    print(f"  {ta.cycles:13,} {tb.cycles:13,} {pct:+6.1f}% {ta.nodes:8,} {tb.nodes:8,} "
+          f"{ta.per_node(ta.cycles):8.0f} {tb.per_node(tb.cycles):8.0f}  total "
+          f"({seconds(ta.cycles, clock_hz):.1f} s -> {seconds(tb.cycles, clock_hz):.1f} s)")
+    print()
+    _delta_rows({k: v[2] for k, v in ta.funcs.items()}, {k: v[2] for k, v in tb.funcs.items()},
+                ta.nodes, tb.nodes, top, "Exclusive cycles per function")
+    _delta_rows({k: v[0] for k, v in ta.funcs.items()}, {k: v[0] for k, v in tb.funcs.items()},
+                ta.nodes, tb.nodes, top, "Calls per function")
+    _delta_rows({k: v[1] for k, v in ta.flat.items()}, {k: v[1] for k, v in tb.flat.items()},
+                ta.nodes, tb.nodes, top, "Flat cycles per label")
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Label-level cycle profiler (per go command)")
+    ap.add_argument('script', help="UCI command script (tools/*.uci), or - for stdin")
+    ap.add_argument('--listing', default=DEFAULT_LST,
+                    help=f"a18 listing of the build to profile (default {DEFAULT_LST})")
+    ap.add_argument('--diff', metavar='LST', help="second build: print A/B deltas instead")
+    ap.add_argument('--top', type=int, default=25, help="rows per table (default 25)")
+    ap.add_argument('--callers', action='store_true',
+                    help="list callers/callees under each call-graph row")
+    ap.add_argument('--total', action='store_true',
+                    help="one merged report for all searches instead of one per go")
+    ap.add_argument('--clock-hz', type=int, default=CLOCK_HZ,
+                    help=f"nominal CPU clock (default {CLOCK_HZ})")
+    args = ap.parse_args()
+
+    if args.script == '-':
+        cmds = [ln.strip() for ln in sys.stdin if ln.strip() and not ln.startswith('#')]
+    else:
+        cmds = load_uci_script(args.script)
+    log = lambda s: print(s, file=sys.stderr, flush=True)
+
+    pa = profile_build(args.listing, cmds, args.clock_hz, log)
+    if args.diff:
+        pb = profile_build(args.diff, cmds, args.clock_hz, log)
+        report_diff(args.listing, pa, args.diff, pb, args.top, args.clock_hz)
+        return 0
+    if args.total and len(pa) > 1:
+        pa = [merge(pa)]
+    for prof in pa:
+        report(prof, args.top, args.callers, args.clock_hz)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
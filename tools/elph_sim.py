@@ -0,0 +1,1779 @@
+#!/usr/bin/env python3
+"""
+ELPH / CDP1806 instruction-set simulator for the RCA 1806 chess engine.
+
+Loads chess-engine.bin, chess-engine.hex, or an archived a18 listing
+(listings/chess-engine-<hash>.lst carries every assembled byte), and runs the
+engine with no hardware in the loop:
+
+  - 1802 core + the 1806 extended set (RLDI, DBNZ, RLXA, RSXD, RNX, SCAL/SRET,
+    DSAV, BCD ops, counter/timer and interrupt-control opcodes), with per-
+    instruction machine-cycle counts from the CDP1805/1806 datasheet
+  - the UART that serial-io-uart.asm talks to (port 1 = data, INP 2 = status,
+    bit 0 RX ready, bit 1 TX empty)
+  - the DS12887 RTC as NEGAMAX reads it (OUT 2 = register select with bit 7
+    set, INP 3 = data, binary mode). By default the RTC runs on VIRTUAL time:
+    its clock is derived from executed machine cycles at the nominal clock
+    rate (--clock-hz, default 12 MHz), so the 180 s budget, RTC_DELTA_POS and
+    the per-iteration time prediction behave exactly as on the board while the
+    host runs as fast as it can. --rtc wall reads the host clock instead.
+  - a stand-in BIOS ROM at $8000-$FFFF: SCRT call/ret on R4/R5 (R6 linkage,
+    high byte pushed first, D saved in RE.0 — same as Mark's BIOS) and
+    F_TYPE / F_READ / F_MSG / F_UINTOUT written in real 1802 code against
+    the UART, so their cycles are counted like everything else. The BIOS
+    breakpoint handler (R1, reached by MARK / SEP 1) and the $8003 warm start
+    are IDL traps: the run stops and the registers are left for inspection.
+
+Two execution modes with identical cycle and instruction counts: the
+opcode-at-a-time interpreter (reference, and the only mode the profiler
+hooks see), and --translate, which compiles straight-line basic blocks to
+cached Python functions keyed by (address, P, X) and drops them when a store
+lands on their bytes. --bench compares the two on fixed tools/*.uci positions.
+Both modes honour `pc_hooks` ({address: fn(sim)}, called before the
+instruction at that address runs), which tools/elph_tt.py uses to record
+transposition-table traffic.
+
+Usage:
+    python3 tools/elph_sim.py [chess-engine.bin|.hex|.lst]
+
+With no further arguments the simulator is a UCI engine on stdin/stdout (the
+BIOS echo is stripped, as elph-bridge.py does), so CuteChess or a script can
+drive it directly. --script plays a tools/*.uci file instead.
+
+elph-bridge.py and replay-match.py reach the simulator through ELPH_PORT
+(ELPH_LOG moves their log), either as a pseudo-terminal or in-process:
+
+    python3 tools/elph_sim.py build.lst --translate --pty /tmp/elph0 &
+    ELPH_PORT=/tmp/elph0 python3 elph-bridge.py
+    ELPH_PORT=sim:build.lst python3 replay-match.py tools/stress_qs_0717.uci
+
+Library use:
+
+    sim = ElphSim.from_file('chess-engine.bin')
+    sim.boot()
+    lines = sim.command('isready')          # -> ['readyok']
+
+Snapshots hold the whole machine (CPU, RAM, UART, RTC) tagged with the UCI
+command index, and load in well under a millisecond — record a long replay
+once, then resume right before the search that matters, or fork variants:
+
+    python3 tools/elph_sim.py build.lst --script game.uci --save-snapshots snaps/
+    python3 tools/elph_sim.py --snapshot snaps/cmd0083.snap --script game.uci
+
+    base = sim.snapshot()
+    for mv in candidates:
+        sim.restore(base)
+        sim.command(f'position ... {mv}')
+"""
+import json
+import os
+import re
+import sys
+import time
+
+CLOCK_HZ = 12_000_000           # ELPH crystal
+RTC_EPOCH = 1767225600          # virtual RTC time at cycle 0: 2026-01-01 00:00:00
+CLOCKS_PER_CYCLE = 8            # one 1802 machine cycle = 8 clock pulses
+RAM_TOP = 0x8000                # 32KB RAM; $8000-$FFFF is ROM (writes ignored)
+STACK_TOP = 0x7FFF              # R2 as the monitor hands it to a loaded program
+
+UART_DATA = 1                   # serial-io-uart.asm port assignments
+UART_STATUS = 2
+UART_RX_RDY = 0x01
+UART_TX_RDY = 0x02
+RTC_SELECT = 2                  # OUT 2 = DS12887 register select
+RTC_DATA = 3                    # INP 3 / OUT 3 = DS12887 data
+
+# Stop reasons returned by ElphSim.run()
+STOP_INPUT = 'input'            # engine is polling the UART with RX empty
+STOP_IDLE = 'idle'              # IDL executed (crash trap / BIOS breakpoint)
+STOP_CYCLES = 'cycles'          # cycle limit reached
+STOP_ILLEGAL = 'illegal'        # undefined 68-prefixed opcode
+
+SNAP_MAGIC = b'ELPHSNP1'        # snapshot file: magic, u32 header length,
+                                # JSON header, then RAM $0000-$7FFF raw
+
+
+# ------------------------------------------------------------------------------
+# Image loaders
+# ------------------------------------------------------------------------------
+
+def load_bin(path, base=0):
+    """Raw binary -> {addr: byte}, loaded at `base`."""
+    data = open(path, 'rb').read()
+    return {base + i: b for i, b in enumerate(data)}
+
+
+def load_hex(path):
+    """Intel HEX (as written by a18 / srec_cat) -> {addr: byte}."""
+    image = {}
+    upper = 0
+    for raw in open(path):
+        line = raw.strip()
+        if not line.startswith(':'):
+            continue
+        rec = bytes.fromhex(line[1:])
+        count, addr, rtype = rec[0], (rec[1] << 8) | rec[2], rec[3]
+        if rtype == 0x00:
+            for i in range(count):
+                image[(upper + addr + i) & 0xFFFF] = rec[4 + i]
+        elif rtype == 0x01:
+            break
+        elif rtype in (0x02, 0x04):
+            upper = ((rec[4] << 8) | rec[5]) << (4 if rtype == 0x02 else 16)
+    return image
+
+
+LST_LINE = re.compile(r"^   ([0-9a-f]{4})   ((?:[0-9a-f]{2} ?)+)")
+
+
+def load_listing(path):
+    """a18 listing -> {addr: byte}. Byte columns sit at 10..22 of each line;
+    continuation lines (long DB/DW) carry the address and bytes only."""
+    image = {}
+    for line in open(path, errors='replace'):
+        m = LST_LINE.match(line[:22])
+        if not m:
+            continue
+        addr = int(m.group(1), 16)
+        for i, hx in enumerate(m.group(2).split()):
+            image[(addr + i) & 0xFFFF] = int(hx, 16)
+    return image
+
+
+LST_LABEL = re.compile(r"^   ([0-9a-f]{4})   (?:[0-9a-f]{2} ?)*\s*(\w+):")
+LST_SYMBOL = re.compile(r"([0-9a-f]{4})  +(\w+)")
+
+
+def load_labels(path):
+    """a18 listing -> {name: addr} for code labels (`NAME:` in the source
+    column). EQUs are excluded; see load_symbols for the whole table."""
+    labels = {}
+    for line in open(path, errors='replace'):
+        m = LST_LABEL.match(line)
+        if m:
+            labels[m.group(2)] = int(m.group(1), 16)
+    return labels
+
+
+def load_symbols(path):
+    """a18 listing -> {name: value} from the symbol table at the end of the
+    file (labels and EQUs alike: `hhhh  NAME` pairs, several per line)."""
+    symbols = {}
+    for line in open(path, errors='replace'):
+        if line[:4].strip() and re.match(r"[0-9a-f]{4}  ", line):
+            for val, name in LST_SYMBOL.findall(line):
+                symbols[name] = int(val, 16)
+    return symbols
+
+
+def load_uci_script(path):
+    """tools/*.uci -> list of commands (blank lines and # comments dropped),
+    as replay-match.py reads them."""
+    cmds = []
+    for raw in open(path):
+        line = raw.strip()
+        if line and not line.startswith('#'):
+            cmds.append(line)
+    return cmds
+
+
+def load_image(path):
+    """Pick the loader by extension (.hex / .lst / anything else = raw bin)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.hex':
+        return load_hex(path)
+    if ext == '.lst':
+        return load_listing(path)
+    return load_bin(path)
+
+
+# ------------------------------------------------------------------------------
+# Stand-in BIOS ROM
+# ------------------------------------------------------------------------------
+
+class _RomBuilder:
+    """Tiny label-resolving emitter for the hand-assembled BIOS routines."""
+
+    def __init__(self, base):
+        self.base = base
+        self.code = bytearray()
+        self.labels = {}
+        self.fixups = []        # (offset, label, kind): short/long/high/low
+
+    @property
+    def pc(self):
+        return self.base + len(self.code)
+
+    def label(self, name):
+        self.labels[name] = self.pc
+
+    def emit(self, *bs):
+        self.code.extend(bs)
+
+    def br(self, op, name):
+        """Short branch: target must be on the immediate byte's page."""
+        self.code.append(op)
+        self.fixups.append((len(self.code), name, 'short'))
+        self.code.append(0)
+
+    def lbr(self, op, name):
+        self.code.append(op)
+        self.fixups.append((len(self.code), name, 'long'))
+        self.code.extend(b'\0\0')
+
+    def imm(self, op, name, part):
+        """Immediate-operand instruction whose operand is HIGH/LOW(label)."""
+        self.code.append(op)
+        self.fixups.append((len(self.code), name, part))
+        self.code.append(0)
+
+    def finish(self):
+        for off, name, kind in self.fixups:
+            target = self.labels[name]
+            if kind == 'high':
+                self.code[off] = target >> 8
+            elif kind == 'low':
+                self.code[off] = target & 0xFF
+            elif kind == 'short':
+                if (self.base + off) >> 8 != target >> 8:
+                    raise ValueError(f"BIOS short branch to {name} leaves page")
+                self.code[off] = target & 0xFF
+            else:
+                self.code[off] = target >> 8
+                self.code[off + 1] = target & 0xFF
+        return bytes(self.code)
+
+
+def _tx_wait(rb, name):
+    """Poll the UART until the transmitter is empty (INP 2 / ANI 2 / BZ)."""
+    rb.label(name)
+    rb.emit(0x6A, 0xFA, UART_TX_RDY)    # INP 2 ; ANI TX_RDY
+    rb.br(0x32, name)                   # BZ wait
+
+
+def build_bios():
+    """Return (rom_bytes_by_addr, entry_points) for the stand-in BIOS.
+
+    Register contract mirrors the ELPH BIOS the engine was written against:
+    SCRT clobbers RE.0 only; F_TYPE/F_READ clobber RE.0; F_MSG advances R15;
+    F_UINTOUT consumes R13 and leaves R15 one past the last digit. All routines
+    use M(R2) (the free stack slot) as I/O scratch, as INP/OUT require."""
+    rom = {}
+    rb = _RomBuilder(0xFE00)
+
+    # --- SCRT call (entered via SEP 4; R4 rests on SCRT_CALL) ---
+    rb.label('CALL_EXIT')
+    rb.emit(0xD3)                       # SEP 3
+    rb.label('SCRT_CALL')
+    rb.emit(0xAE, 0xE2)                 # PLO RE ; SEX 2
+    rb.emit(0x96, 0x73, 0x86, 0x73)     # push R6 (high byte first)
+    rb.emit(0x93, 0xB6, 0x83, 0xA6)     # R6 = R3 (points at inline address)
+    rb.emit(0x46, 0xB3, 0x46, 0xA3)     # R3 = inline address, R6 past it
+    rb.emit(0x8E)                       # GLO RE
+    rb.br(0x30, 'CALL_EXIT')
+
+    # --- SCRT return (entered via SEP 5; R5 rests on SCRT_RET) ---
+    rb.label('RET_EXIT')
+    rb.emit(0xD3)                       # SEP 3
+    rb.label('SCRT_RET')
+    rb.emit(0xAE, 0xE2)                 # PLO RE ; SEX 2
+    rb.emit(0x96, 0xB3, 0x86, 0xA3)     # R3 = R6
+    rb.emit(0x60, 0x72, 0xA6, 0xF0, 0xB6)   # IRX ; pop R6.0 ; pop R6.1
+    rb.emit(0x8E)                       # GLO RE
+    rb.br(0x30, 'RET_EXIT')
+
+    # --- F_READ: wait for RX, fall into F_TYPE to echo ---
+    rb.label('F_READ')
+    rb.emit(0x6A, 0xFA, UART_RX_RDY)    # INP 2 ; ANI RX_RDY
+    rb.br(0x32, 'F_READ')
+    rb.emit(0x69)                       # INP 1 -> D
+
+    # --- F_TYPE: D = character; returns with D intact ---
+    rb.label('F_TYPE')
+    rb.emit(0xAE)                       # PLO RE
+    _tx_wait(rb, 'TYPE_WAIT')
+    rb.emit(0x8E, 0x52, 0x61, 0x22)     # GLO RE ; STR 2 ; OUT 1 ; DEC 2
+    rb.emit(0x8E, 0xD5)                 # GLO RE ; SEP 5
+
+    # --- F_MSG: R15 -> null-terminated string ---
+    rb.label('F_MSG')
+    rb.emit(0x4F)                       # LDA 15
+    rb.br(0x32, 'MSG_DONE')
+    rb.emit(0xAE)                       # PLO RE
+    _tx_wait(rb, 'MSG_WAIT')
+    rb.emit(0x8E, 0x52, 0x61, 0x22)     # GLO RE ; STR 2 ; OUT 1 ; DEC 2
+    rb.br(0x30, 'F_MSG')
+    rb.label('MSG_DONE')
+    rb.emit(0xD5)
+
+    # --- F_UINTOUT: R13 (unsigned) -> ASCII decimal at R15 ---
+    # R7 = divisor table pointer, R8.0 = digit char, R8.1 = "digit emitted"
+    rb.label('F_UINTOUT')
+    rb.emit(0x97, 0x73, 0x87, 0x73, 0x98, 0x73, 0x88, 0x73)  # push R7, R8
+    rb.imm(0xF8, 'UO_TABLE', 'high')
+    rb.emit(0xB7)                       # PHI 7
+    rb.imm(0xF8, 'UO_TABLE', 'low')
+    rb.emit(0xA7)                       # PLO 7
+    rb.emit(0xF8, 0x00, 0xB8)           # R8.1 = 0
+    rb.label('UO_DIGIT')
+    rb.emit(0xF8, ord('0'), 0xA8)       # R8.0 = '0'
+    rb.label('UO_SUB')
+    rb.emit(0xE7, 0x17)                 # SEX 7 ; INC 7 (-> divisor low)
+    rb.emit(0x8D, 0xF7, 0xAE)           # GLO 13 ; SM ; PLO RE
+    rb.emit(0x27, 0x9D, 0x77, 0xE2)     # DEC 7 ; GHI 13 ; SMB ; SEX 2
+    rb.br(0x3B, 'UO_EMIT')              # BNF: R13 < divisor
+    rb.emit(0xBD, 0x8E, 0xAD, 0x18)     # PHI 13 ; GLO RE ; PLO 13 ; INC 8
+    rb.br(0x30, 'UO_SUB')
+    rb.label('UO_EMIT')
+    rb.emit(0x88, 0xFB, ord('0'))       # GLO 8 ; XRI '0'
+    rb.br(0x3A, 'UO_PUT')
+    rb.emit(0x98)                       # GHI 8
+    rb.br(0x3A, 'UO_PUT')
+    rb.emit(0x87)                       # GLO 7
+    rb.imm(0xFB, 'UO_ONES', 'low')      # XRI LOW(UO_ONES)
+    rb.br(0x3A, 'UO_NEXT')              # leading zero: suppress
+    rb.label('UO_PUT')
+    rb.emit(0x88, 0x5F, 0x1F)           # GLO 8 ; STR 15 ; INC 15
+    rb.emit(0xF8, 0x01, 0xB8)           # R8.1 = 1
+    rb.label('UO_NEXT')
+    rb.emit(0x17, 0x17, 0x87)           # INC 7 x2 ; GLO 7
+    rb.imm(0xFB, 'UO_END', 'low')       # XRI LOW(UO_END)
+    rb.br(0x3A, 'UO_DIGIT')
+    rb.emit(0x60, 0x72, 0xA8, 0x72, 0xB8, 0x72, 0xA7, 0xF0, 0xB7)  # pop R8, R7
+    rb.emit(0xD5)
+    rb.label('UO_TABLE')
+    for div in (10000, 1000, 100, 10):
+        rb.emit(div >> 8, div & 0xFF)
+    rb.label('UO_ONES')
+    rb.emit(0x00, 0x01)
+    rb.label('UO_END')
+
+    # --- BIOS breakpoint handler (R1) and monitor warm start: IDL traps ---
+    rb.label('BREAK')
+    rb.emit(0x00)
+
+    for i, b in enumerate(rb.finish()):
+        rom[rb.base + i] = b
+
+    # Fixed BIOS vectors ($FF03.. jump table, $8003 warm start)
+    def vector(addr, target):
+        rom[addr], rom[addr + 1], rom[addr + 2] = 0xC0, target >> 8, target & 0xFF
+
+    vector(0xFF03, rb.labels['F_TYPE'])
+    vector(0xFF06, rb.labels['F_READ'])
+    vector(0xFF09, rb.labels['F_MSG'])
+    vector(0xFF60, rb.labels['F_UINTOUT'])
+    for a in range(0x8000, 0x8006):
+        rom[a] = 0x00
+    return rom, dict(rb.labels)
+
+
+# ------------------------------------------------------------------------------
+# Peripherals
+# ------------------------------------------------------------------------------
+
+class Uart:
+    """Host side of the engine's serial port. `rx` holds bytes waiting for the
+    engine, `tx` collects what the engine sent. With `baud` set, TX_RDY drops
+    for one character time after each OUT (10 bits at the baud rate, in
+    machine cycles), so output costs the same cycles it does on the wire."""
+
+    def __init__(self, baud=None, clock_hz=CLOCK_HZ):
+        self.rx = bytearray()
+        self.tx = bytearray()
+        self.baud = baud
+        self.char_cycles = 0 if not baud else (clock_hz // CLOCKS_PER_CYCLE) * 10 // baud
+        self.tx_busy_until = 0
+
+    def feed(self, data):
+        self.rx.extend(data)
+
+    def drain(self):
+        out = bytes(self.tx)
+        self.tx.clear()
+        return out
+
+    def status(self, cycles):
+        st = UART_RX_RDY if self.rx else 0
+        if cycles >= self.tx_busy_until:
+            st |= UART_TX_RDY
+        return st
+
+    def read(self):
+        if not self.rx:
+            return 0
+        b = self.rx[0]
+        del self.rx[0]
+        return b
+
+    def write(self, b, cycles):
+        self.tx.append(b)
+        self.tx_busy_until = cycles + self.char_cycles
+
+
+class Rtc:
+    """DS12887 as the engine uses it: binary mode, 24h. Registers 0-9 are the
+    clock, $0A-$0D control, $0E-$7F NVRAM.
+
+    mode='virtual' (default): time = `epoch` + executed cycles at `clock_hz`.
+    Only machine work advances the clock — a search sees exactly the seconds
+    the board would, and the fixed epoch keeps second-boundary phase (and so
+    every RTC-gated decision) identical from run to run.
+    mode='wall': the host's local time, as a real DS12887 would read."""
+
+    def __init__(self, mode='virtual', clock_hz=CLOCK_HZ, epoch=RTC_EPOCH):
+        if mode not in ('virtual', 'wall'):
+            raise ValueError(f"RTC mode must be 'virtual' or 'wall', not {mode!r}")
+        self.mode = mode
+        self.clock_hz = clock_hz
+        self.epoch = epoch
+        self.select = 0
+        self.nvram = bytearray(128)
+        self.nvram[0x0B] = 0x06         # DM=1 (binary), 24/12=1
+        self.nvram[0x0D] = 0x80         # VRT: battery good
+
+    def now(self, cycles):
+        """Seconds since the Unix epoch as the RTC currently reads."""
+        if self.mode == 'wall':
+            return time.time()
+        return self.epoch + cycles * CLOCKS_PER_CYCLE // self.clock_hz
+
+    def clock_regs(self, cycles):
+        if self.mode == 'wall':
+            t = time.localtime()
+        else:
+            t = time.gmtime(self.now(cycles))
+        return {0: t.tm_sec, 2: t.tm_min, 4: t.tm_hour, 6: (t.tm_wday + 1) % 7 + 1,
+                7: t.tm_mday, 8: t.tm_mon, 9: t.tm_year % 100}
+
+    def write_select(self, value):
+        self.select = value & 0x7F
+
+    def read(self, cycles):
+        reg = self.select
+        if reg <= 9:
+            return self.clock_regs(cycles).get(reg, self.nvram[reg])
+        return self.nvram[reg]
+
+    def write(self, value):
+        if self.select > 9:
+            self.nvram[self.select] = value
+
+
+# ------------------------------------------------------------------------------
+# CPU
+# ------------------------------------------------------------------------------
+
+# CDP1805/1806 machine cycles for 68-prefixed opcodes (datasheet table);
+# anything not listed is undefined on the 1806.
+EXT_CYCLES = {0x00: 3, 0x01: 3, 0x02: 3, 0x03: 3, 0x04: 3, 0x05: 3, 0x06: 3,
+              0x07: 3, 0x08: 3, 0x09: 3, 0x0A: 3, 0x0B: 3, 0x0C: 3, 0x0D: 3,
+              0x3E: 3, 0x3F: 3, 0x74: 4, 0x76: 6, 0x77: 4, 0x7C: 4, 0x7F: 4,
+              0xF4: 4, 0xF7: 4, 0xFC: 4, 0xFF: 4}
+for _n in range(16):
+    EXT_CYCLES[0x20 | _n] = 5       # DBNZ
+    EXT_CYCLES[0x60 | _n] = 5       # RLXA
+    EXT_CYCLES[0x80 | _n] = 10      # SCAL
+    EXT_CYCLES[0x90 | _n] = 8       # SRET
+    EXT_CYCLES[0xA0 | _n] = 5       # RSXD
+    EXT_CYCLES[0xB0 | _n] = 4       # RNX
+    EXT_CYCLES[0xC0 | _n] = 5       # RLDI
+
+
+def instr_cycles(mem, pc):
+    """Machine cycles of the instruction at `pc` (None for an undefined 68xx)."""
+    op = mem[pc]
+    if op == 0x68:
+        return EXT_CYCLES.get(mem[(pc + 1) & 0xFFFF])
+    return 3 if op >> 4 == 0xC else 2
+
+
+def _bcd_add(a, b, carry):
+    lo = (a & 0x0F) + (b & 0x0F) + carry
+    hi = (a >> 4) + (b >> 4)
+    if lo > 9:
+        lo -= 10
+        hi += 1
+    c = 0
+    if hi > 9:
+        hi -= 10
+        c = 1
+    return ((hi << 4) | lo) & 0xFF, c
+
+
+def _bcd_sub(a, b, no_borrow):
+    """a - b - (not no_borrow) in BCD; returns (result, DF=no borrow)."""
+    lo = (a & 0x0F) - (b & 0x0F) - (0 if no_borrow else 1)
+    hi = (a >> 4) - (b >> 4)
+    if lo < 0:
+        lo += 10
+        hi -= 1
+    df = 1
+    if hi < 0:
+        hi += 10
+        df = 0
+    return ((hi << 4) | lo) & 0xFF, df
+
+
+# ------------------------------------------------------------------------------
+# Basic-block translator (ElphSim.translate = True)
+# ------------------------------------------------------------------------------
+#
+# A block is the straight-line run of instructions from one address up to and
+# including the first branch / skip / SEP / DBNZ / SCAL / SRET, compiled to one
+# Python function with P, X, every immediate and every branch target folded in
+# as constants. Blocks are keyed by (address, P, X) and are pure register/
+# memory code; anything with side effects outside R/M/D/DF (I/O, IDL, RET,
+# MARK, counter and BCD ops) or that uses R[P] as data is left to the
+# interpreter one instruction at a time. Machine cycles per block are summed
+# at translation, so totals match the interpreter exactly.
+
+BLOCK_MAX = 128                 # instructions per block
+_BLOCK_CODE = {}                # source -> code object, shared by all simulators
+
+_X_OPS = {0x60, 0x72, 0x73, 0x74, 0x75, 0x77,
+          0xF0, 0xF1, 0xF2, 0xF3, 0xF4, 0xF5, 0xF7}     # read or write R[X]
+_ALU = {0: 'd = {m}', 1: 'd |= {m}', 2: 'd &= {m}', 3: 'd ^= {m}',
+        4: 'v = d + {m}; df = v >> 8; d = v & 0xFF',
+        5: 'v = {m} - d; df = 1 if v >= 0 else 0; d = v & 0xFF',
+        7: 'v = d - {m}; df = 1 if v >= 0 else 0; d = v & 0xFF'}
+_ALU_C = {4: 'v = d + {m} + df; df = v >> 8; d = v & 0xFF',
+          5: 'v = {m} - d - (1 - df); df = 1 if v >= 0 else 0; d = v & 0xFF',
+          7: 'v = d - {m} - (1 - df); df = 1 if v >= 0 else 0; d = v & 0xFF'}
+_COND = {1: 'S.q', 2: 'd == 0', 3: 'df'}
+
+
+def _store(addr, val):
+    """Source lines for a RAM write that invalidates translated code."""
+    return [f'a = {addr}', 'if a < 0x8000:', f'    M[a] = {val}',
+            '    if CP[a >> 8]: S._smc(a)']
+
+
+def translate_block(M, pc, P, X):
+    """Translate the block at `pc` for the given P and X.
+
+    Returns (source, cycles, instructions, end) where `end` is one past the
+    last byte read, or None if the first instruction must be interpreted.
+    The function is `blk(R, M, d, df)` and returns (d, df, X, P) on exit."""
+    body = []
+    cycles = ninstr = 0
+    a0 = pc
+    exit_ = None
+    while ninstr < BLOCK_MAX:
+        op = M[a0]
+        hi, n = op >> 4, op & 0x0F
+        nxt = (a0 + 1) & 0xFFFF
+        cyc = 2
+        code = None
+        if op == 0x68:
+            op2 = M[nxt]
+            ext = EXT_CYCLES.get(op2)
+            h2, n2 = op2 >> 4, op2 & 0x0F
+            if ext is None or h2 not in (0x2, 0x6, 0x8, 0x9, 0xA, 0xB, 0xC) or n2 == P \
+                    or (h2 != 0x2 and h2 != 0xC and X == P):
+                break
+            cyc = ext
+            q = (a0 + 2) & 0xFFFF
+            if h2 == 0xC:                                       # RLDI
+                code = [f'R[{n2}] = {(M[q] << 8) | M[(q + 1) & 0xFFFF]}']
+                nxt = (q + 2) & 0xFFFF
+            elif h2 == 0x6:                                     # RLXA
+                code = [f'a = R[{X}]', f'R[{n2}] = (M[a] << 8) | M[(a + 1) & 0xFFFF]',
+                        f'R[{X}] = (a + 2) & 0xFFFF']
+                nxt = q
+            elif h2 == 0xA:                                     # RSXD
+                code = [f'v = R[{n2}]'] + _store(f'R[{X}]', 'v & 0xFF') + \
+                    _store('(a - 1) & 0xFFFF', 'v >> 8') + [f'R[{X}] = (a - 1) & 0xFFFF']
+                nxt = q
+            elif h2 == 0xB:                                     # RNX
+                code = [f'R[{X}] = R[{n2}]']
+                nxt = q
+            elif h2 == 0x2:                                     # DBNZ
+                t = (M[q] << 8) | M[(q + 1) & 0xFFFF]
+                code = [f'v = (R[{n2}] - 1) & 0xFFFF', f'R[{n2}] = v',
+                        f'R[{P}] = {t} if v else {(q + 2) & 0xFFFF}']
+                exit_ = (X, P)
+            elif h2 == 0x8:                                     # SCAL
+                t = (M[q] << 8) | M[(q + 1) & 0xFFFF]
+                code = [f'v = R[{n2}]'] + _store(f'R[{X}]', 'v & 0xFF') + \
+                    _store('(a - 1) & 0xFFFF', 'v >> 8') + \
+                    [f'R[{X}] = (a - 1) & 0xFFFF', f'R[{n2}] = {(q + 2) & 0xFFFF}',
+                     f'R[{P}] = {t}']
+                exit_ = (X, P)
+            else:                                               # SRET
+                code = [f'R[{P}] = R[{n2}]', f'a = (R[{X}] + 1) & 0xFFFF',
+                        f'R[{n2}] = (M[a] << 8) | M[(a + 1) & 0xFFFF]',
+                        f'R[{X}] = (a + 1) & 0xFFFF']
+                exit_ = (X, P)
+        elif op in _X_OPS and X == P:
+            break
+        elif hi == 0xF:
+            k = n & 7
+            if n == 0x6:
+                code = ['df = d & 1', 'd >>= 1']
+            elif n == 0xE:
+                code = ['df = d >> 7', 'd = (d << 1) & 0xFF']
+            elif n & 8:
+                code = [_ALU[k].format(m=M[nxt])]
+                nxt = (nxt + 1) & 0xFFFF
+            else:
+                code = [_ALU[k].format(m=f'M[R[{X}]]')]
+        elif hi == 0x8:
+            code = [f'd = R[{n}] & 0xFF'] if n != P else None
+        elif hi == 0x9:
+            code = [f'd = R[{n}] >> 8'] if n != P else None
+        elif hi == 0xA:
+            code = [f'R[{n}] = (R[{n}] & 0xFF00) | d'] if n != P else None
+        elif hi == 0xB:
+            code = [f'R[{n}] = (R[{n}] & 0x00FF) | (d << 8)'] if n != P else None
+        elif hi == 0x0:
+            code = [f'd = M[R[{n}]]'] if n and n != P else None
+        elif hi == 0x1:
+            code = [f'R[{n}] = (R[{n}] + 1) & 0xFFFF'] if n != P else None
+        elif hi == 0x2:
+            code = [f'R[{n}] = (R[{n}] - 1) & 0xFFFF'] if n != P else None
+        elif hi == 0x4:
+            code = [f'a = R[{n}]', 'd = M[a]', f'R[{n}] = (a + 1) & 0xFFFF'] if n != P else None
+        elif hi == 0x5:
+            code = _store(f'R[{n}]', 'd') if n != P else None
+        elif hi == 0xE:
+            code = []
+            X = n
+        elif hi == 0x7:
+            if n == 2:                                          # LDXA
+                code = [f'a = R[{X}]', 'd = M[a]', f'R[{X}] = (a + 1) & 0xFFFF']
+            elif n == 3:                                        # STXD
+                code = _store(f'R[{X}]', 'd') + [f'R[{X}] = (a - 1) & 0xFFFF']
+            elif n in (4, 5, 7):                                # ADC / SDB / SMB
+                code = [_ALU_C[n].format(m=f'M[R[{X}]]')]
+            elif n in (0xC, 0xD, 0xF):                          # ADCI / SDBI / SMBI
+                code = [_ALU_C[n & 7].format(m=M[nxt])]
+                nxt = (nxt + 1) & 0xFFFF
+            elif n == 6:                                        # SHRC
+                code = ['v = d & 1', 'd = (d >> 1) | (df << 7)', 'df = v']
+            elif n == 0xE:                                      # SHLC
+                code = ['v = d >> 7', 'd = ((d << 1) & 0xFF) | df', 'df = v']
+            elif n == 0xA:
+                code = ['S.q = 0']                              # REQ
+            elif n == 0xB:
+                code = ['S.q = 1']                              # SEQ
+            # RET / DIS / SAV / MARK: interpreter
+        elif hi == 0x6:
+            if n == 0 and X != P:
+                code = [f'R[{X}] = (R[{X}] + 1) & 0xFFFF']      # IRX
+            # OUT / INP: interpreter
+        elif hi == 0x3:                                         # short branches
+            t = (nxt & 0xFF00) | M[nxt]
+            f = (nxt + 1) & 0xFFFF
+            if n == 0:
+                code = [f'R[{P}] = {t}']
+            elif n == 8:                                        # SKP
+                code = [f'R[{P}] = {f}']
+            else:
+                k = n & 7
+                c = _COND.get(k) or f'S.ef[{k - 4}]'
+                if n & 8:
+                    c = f'not ({c})'
+                code = [f'R[{P}] = {t} if {c} else {f}']
+            exit_ = (X, P)
+        elif hi == 0xC:                                         # long branch / skip
+            cyc = 3
+            if n == 4:
+                code = []                                       # NOP
+            else:
+                k = n & 3
+                c = {0: 'S.ie', 1: 'S.q', 2: 'd == 0', 3: 'df'}[k] if n & 4 else \
+                    {0: 'True', 1: 'S.q', 2: 'd == 0', 3: 'df'}[k]
+                if n & 4:
+                    if n < 8:
+                        c = f'not ({c})'
+                    t, f = (nxt + 2) & 0xFFFF, nxt
+                else:
+                    if n & 8:
+                        c = f'not ({c})'
+                    t, f = (M[nxt] << 8) | M[(nxt + 1) & 0xFFFF], (nxt + 2) & 0xFFFF
+                nxt = (nxt + 2) & 0xFFFF
+                code = [f'R[{P}] = {t} if {c} else {f}']
+                exit_ = (X, P)
+        elif hi == 0xD:                                         # SEP
+            code = [f'R[{P}] = {nxt}']
+            exit_ = (X, n)
+        if code is None:
+            break
+        body += code
+        cycles += cyc
+        ninstr += 1
+        a0 = nxt
+        if exit_:
+            break
+    if not ninstr:
+        return None
+    if exit_ is None:
+        body.append(f'R[{P}] = {a0}')
+        exit_ = (X, P)
+    src = 'def blk(R, M, d, df):\n' + ''.join(f'    {ln}\n' for ln in body) + \
+        f'    return d, df, {exit_[0]}, {exit_[1]}\n'
+    return src, cycles, ninstr, a0
+
+
+class ElphSim:
+    """CDP1806 core + ELPH memory map, UART, RTC and stand-in BIOS."""
+
+    def __init__(self, image=None, uart=None, rtc=None, clock_hz=CLOCK_HZ, translate=False):
+        self.clock_hz = clock_hz
+        self.mem = bytearray(0x10000)
+        self.r = [0] * 16
+        self.p = 0
+        self.x = 0
+        self.d = 0
+        self.df = 0
+        self.t = 0
+        self.q = 0
+        self.ie = 1
+        self.ef = [0, 0, 0, 0]          # EF1-EF4 flags (1 = line asserted)
+        self.counter = 0
+        self.timer_run = False
+        self.timer_base = 0             # cycle count when the timer last loaded
+        self.ci = 0                     # counter-interrupt latch (BCI)
+        self.xi = 0                     # external-interrupt latch (BXI)
+        self.cie = 1
+        self.xie = 1
+        self.cycles = 0
+        self.instructions = 0
+        self.stop_reason = None
+        self._poll_pc = None
+        self.history = []               # UCI lines sent since boot (snapshot tag)
+        # profiling hooks (tools/elph_prof.py): per-address execution counts
+        # and a callback on SEP 4 / SEP 5 (SCRT call / return), fn(n, cycles)
+        self.pc_counts = None
+        self.sep_hook = None
+        # {addr: fn(sim)} called before the instruction at addr runs (both
+        # modes; translated blocks only start at a hooked address when it is
+        # a call or branch target, which subroutine entries always are)
+        self.pc_hooks = None
+        # translated blocks: (pc | P << 16 | X << 20) -> (fn, cycles, instrs)
+        # or False (interpret); per-page {key: (start, end)}; CP[page] = 1
+        # while a block covers the page, so stores there invalidate
+        self.translate = translate
+        self._blocks = {}
+        self._page_blocks = {}
+        self._code_pages = bytearray(256)
+        self.uart = uart or Uart(clock_hz=clock_hz)
+        self.rtc = rtc or Rtc(clock_hz=clock_hz)
+        self.bios_rom, self.bios = build_bios()
+        for a, b in self.bios_rom.items():
+            self.mem[a] = b
+        if image:
+            self.load(image)
+
+    @classmethod
+    def from_file(cls, path, **kw):
+        return cls(load_image(path), **kw)
+
+    def load(self, image):
+        """Copy {addr: byte} into memory (ROM addresses included)."""
+        for a, b in image.items():
+            self.mem[a & 0xFFFF] = b
+        self.flush_blocks()
+
+    def boot(self, entry=0x0000):
+        """Machine state as the monitor leaves it when it runs a program:
+        P = 3 at `entry`, X = 2, R2 = stack top, SCRT armed, IE = 1."""
+        self.r = [0] * 16
+        self.r[1] = self.bios['BREAK']
+        self.r[2] = STACK_TOP
+        self.r[3] = entry
+        self.r[4] = self.bios['SCRT_CALL']
+        self.r[5] = self.bios['SCRT_RET']
+        self.p, self.x = 3, 2
+        self.d = self.df = self.t = self.q = 0
+        self.ie = 1
+        self.stop_reason = None
+        self.history = []
+
+    # --- snapshots ---
+
+    def snapshot(self, tag=None):
+        """Complete machine state as bytes: CPU, counter/timer, interrupt
+        latches, RAM, UART queues and RTC. Tagged with the number of UCI lines
+        sent so far (`cmd_index`) and the lines themselves, so a replay knows
+        where to resume. The BIOS ROM is not stored — it is rebuilt."""
+        u, c = self.uart, self.rtc
+        hdr = {
+            'tag': tag,
+            'cmd_index': len(self.history),
+            'history': self.history,
+            'clock_hz': self.clock_hz,
+            'cpu': {'r': self.r, 'p': self.p, 'x': self.x, 'd': self.d, 'df': self.df,
+                    't': self.t, 'q': self.q, 'ie': self.ie, 'ef': self.ef},
+            'timer': {'counter': self.counter, 'timer_run': self.timer_run,
+                      'timer_base': self.timer_base, 'ci': self.ci, 'xi': self.xi,
+                      'cie': self.cie, 'xie': self.xie},
+            'cycles': self.cycles,
+            'instructions': self.instructions,
+            'poll_pc': self._poll_pc,
+            'uart': {'rx': u.rx.hex(), 'tx': u.tx.hex(), 'baud': u.baud,
+                     'char_cycles': u.char_cycles, 'tx_busy_until': u.tx_busy_until},
+            'rtc': {'mode': c.mode, 'clock_hz': c.clock_hz, 'epoch': c.epoch,
+                    'select': c.select, 'nvram': c.nvram.hex()},
+        }
+        h = json.dumps(hdr, separators=(',', ':')).encode()
+        return SNAP_MAGIC + len(h).to_bytes(4, 'little') + h + bytes(self.mem[:RAM_TOP])
+
+    def restore(self, data):
+        """Load a snapshot() blob into this simulator. Returns its header."""
+        hdr = snapshot_header(data)
+        off = 12 + int.from_bytes(data[8:12], 'little')
+        self.mem[:RAM_TOP] = data[off:off + RAM_TOP]
+        cpu, tm = hdr['cpu'], hdr['timer']
+        self.r = list(cpu['r'])
+        self.p, self.x, self.d, self.df = cpu['p'], cpu['x'], cpu['d'], cpu['df']
+        self.t, self.q, self.ie, self.ef = cpu['t'], cpu['q'], cpu['ie'], list(cpu['ef'])
+        self.counter, self.timer_run, self.timer_base = tm['counter'], tm['timer_run'], tm['timer_base']
+        self.ci, self.xi, self.cie, self.xie = tm['ci'], tm['xi'], tm['cie'], tm['xie']
+        self.clock_hz = hdr['clock_hz']
+        self.cycles = hdr['cycles']
+        self.instructions = hdr['instructions']
+        self._poll_pc = hdr['poll_pc']
+        self.history = list(hdr['history'])
+        self.stop_reason = None
+        u, c = hdr['uart'], hdr['rtc']
+        self.uart.rx[:] = bytes.fromhex(u['rx'])
+        self.uart.tx[:] = bytes.fromhex(u['tx'])
+        self.uart.baud, self.uart.char_cycles = u['baud'], u['char_cycles']
+        self.uart.tx_busy_until = u['tx_busy_until']
+        self.rtc.mode, self.rtc.clock_hz, self.rtc.epoch = c['mode'], c['clock_hz'], c['epoch']
+        self.rtc.select = c['select']
+        self.rtc.nvram[:] = bytes.fromhex(c['nvram'])
+        self.flush_blocks()
+        return hdr
+
+    def save_snapshot(self, path, tag=None):
+        with open(path, 'wb') as f:
+            f.write(self.snapshot(tag))
+
+    @classmethod
+    def from_snapshot(cls, path, **kw):
+        """New simulator resumed from a snapshot file."""
+        sim = cls(**kw)
+        with open(path, 'rb') as f:
+            sim.restore(f.read())
+        return sim
+
+    # --- bus devices ---
+
+    def _out(self, port, value):
+        if port == UART_DATA:
+            self._poll_pc = None
+            self.uart.write(value, self.cycles)
+        elif port == RTC_SELECT:
+            self.rtc.write_select(value)
+        elif port == RTC_DATA:
+            self.rtc.write(value)
+
+    def _inp(self, port, pc):
+        if port == UART_STATUS:
+            st = self.uart.status(self.cycles)
+            # A receive wait is the same status poll coming round again with
+            # nothing sent or received in between; TX-empty polls in F_TYPE /
+            # F_MSG always have an OUT between them, so they never match.
+            if st == UART_TX_RDY:
+                if self._poll_pc == pc:
+                    self.stop_reason = STOP_INPUT
+                self._poll_pc = pc
+            return st
+        if port == UART_DATA:
+            self._poll_pc = None
+            return self.uart.read()
+        if port == RTC_DATA:
+            return self.rtc.read(self.cycles)
+        return 0
+
+    def _gec(self):
+        if self.timer_run:
+            ticks = (self.cycles - self.timer_base) // 32
+            return (self.counter - ticks) & 0xFF
+        return self.counter
+
+    def interrupt(self):
+        """Assert /INT once (the crash-catcher probe). Taken only with IE=1."""
+        if not self.ie:
+            return False
+        self.t = (self.x << 4) | self.p
+        self.p, self.x, self.ie = 1, 2, 0
+        self.xi = 1
+        return True
+
+    # --- execution ---
+
+    def run(self, max_cycles=None, stop_on_input=True):
+        """Execute until the engine blocks on UART input, idles, hits an
+        undefined opcode, or `max_cycles` more machine cycles have elapsed.
+        Returns the stop reason.
+
+        With `translate` set (and no profiling hook installed) this runs
+        translated blocks; the cycle limit is then checked between blocks, so
+        a STOP_CYCLES run may overshoot it by one block."""
+        if self.translate and self.pc_counts is None and self.sep_hook is None:
+            return self._run_blocks(max_cycles, stop_on_input)
+        if self._blocks:
+            self.flush_blocks()
+        return self._interpret(max_cycles, stop_on_input)
+
+    # --- translated blocks ---
+
+    def flush_blocks(self):
+        """Drop every translated block (after host-side memory changes)."""
+        self._blocks.clear()
+        self._page_blocks.clear()
+        self._code_pages[:] = bytes(256)
+
+    def _block(self, pc, p, x):
+        key = pc | (p << 16) | (x << 20)
+        t = translate_block(self.mem, pc, p, x)
+        if t is None:
+            blk, end = False, pc + 1
+        else:
+            src, cycles, ninstr, end = t
+            code = _BLOCK_CODE.get(src)
+            if code is None:
+                code = _BLOCK_CODE[src] = compile(src, f'<block {pc:04X}>', 'exec')
+            ns = {'S': self, 'CP': self._code_pages}
+            exec(code, ns)
+            blk = (ns['blk'], cycles, ninstr)
+        if end <= pc:
+            end = 0x10000
+        self._blocks[key] = blk
+        for page in range(pc >> 8, ((end - 1) >> 8) + 1):
+            self._page_blocks.setdefault(page, {})[key] = (pc, end)
+            self._code_pages[page] = 1
+        return blk
+
+    def _smc(self, a):
+        """A store hit a page holding translated code: drop the blocks that
+        cover `a` (self-modifying code, or data sharing a page with code)."""
+        blocks = self._page_blocks.get(a >> 8, {})
+        for key, (start, end) in list(blocks.items()):
+            if start <= a < end:
+                self._blocks.pop(key, None)
+                for page in range(start >> 8, ((end - 1) >> 8) + 1):
+                    pb = self._page_blocks[page]
+                    pb.pop(key, None)
+                    if not pb:
+                        self._code_pages[page] = 0
+        if not blocks:
+            self._code_pages[a >> 8] = 0
+
+    def _run_blocks(self, max_cycles, stop_on_input):
+        M = self.mem
+        R = self.r
+        CP = self._code_pages
+        cache = self._blocks
+        hooks = self.pc_hooks
+        p, x, d, df = self.p, self.x, self.d, self.df
+        cyc = self.cycles
+        limit = cyc + max_cycles if max_cycles is not None else 1 << 62
+        ninstr = 0
+        reason = None
+        self.stop_reason = None
+        while cyc < limit:
+            pc = R[p]
+            blk = cache.get(pc | (p << 16) | (x << 20))
+            if blk is None:
+                blk = self._block(pc, p, x)
+            if blk:
+                if hooks is not None and pc in hooks:
+                    self.p, self.x, self.d, self.df = p, x, d, df
+                    self.cycles = cyc
+                    hooks[pc](self)
+                fn, c, n = blk
+                d, df, x, p = fn(R, M, d, df)
+                cyc += c
+                ninstr += n
+                continue
+            # I/O, IDL, RET/MARK/SAV, counter and BCD ops: one interpreted step
+            self.p, self.x, self.d, self.df = p, x, d, df
+            self.cycles = cyc
+            reason = self._interpret(1, stop_on_input)
+            p, x, d, df = self.p, self.x, self.d, self.df
+            cyc = self.cycles
+            for base in (R[x], R[2]):               # INP / SAV / MARK / DSAV stores
+                for a in range(base - 3, base + 3):
+                    if 0 <= a < RAM_TOP and CP[a >> 8]:
+                        self._smc(a)
+            if reason != STOP_CYCLES:
+                break
+            reason = None
+        self.p, self.x, self.d, self.df = p, x, d, df
+        self.cycles = cyc
+        self.instructions += ninstr
+        if reason is None:
+            reason = STOP_CYCLES
+        self.stop_reason = reason
+        return reason
+
+    # --- interpreter ---
+
+    def _interpret(self, max_cycles=None, stop_on_input=True):
+        M = self.mem
+        R = self.r
+        p, x, d, df = self.p, self.x, self.d, self.df
+        cyc = self.cycles
+        limit = cyc + max_cycles if max_cycles is not None else 1 << 62
+        counts = self.pc_counts
+        sep_hook = self.sep_hook
+        hooks = self.pc_hooks
+        ninstr = 0
+        reason = None
+        self.stop_reason = None
+        while cyc < limit:
+            pc = R[p]
+            if hooks is not None and pc in hooks:
+                self.p, self.x, self.d, self.df = p, x, d, df
+                self.cycles = cyc
+                hooks[pc](self)
+            op = M[pc]
+            if counts is not None:
+                counts[pc] += 1
+            R[p] = pc = (pc + 1) & 0xFFFF
+            ninstr += 1
+            hi = op >> 4
+            n = op & 0x0F
+            cyc += 2
+            if hi == 0xF:                                 # ALU / immediates
+                if n & 8:
+                    if n == 0xE:                            # SHL
+                        df = d >> 7
+                        d = (d << 1) & 0xFF
+                        continue
+                    m = M[pc]
+                    R[p] = (pc + 1) & 0xFFFF
+                    n &= 7
+                else:
+                    if n == 6:                              # SHR
+                        df = d & 1
+                        d >>= 1
+                        continue
+                    m = M[R[x]]
+                if n == 0:
+                    d = m                                   # LDX / LDI
+                elif n == 1:
+                    d |= m
+                elif n == 2:
+                    d &= m
+                elif n == 3:
+                    d ^= m
+                elif n == 4:
+                    v = d + m
+                    df = v >> 8
+                    d = v & 0xFF
+                elif n == 5:                                # SD / SDI: M - D
+                    v = m - d
+                    df = 1 if v >= 0 else 0
+                    d = v & 0xFF
+                else:                                       # SM / SMI: D - M
+                    v = d - m
+                    df = 1 if v >= 0 else 0
+                    d = v & 0xFF
+            elif hi == 0x8:
+                d = R[n] & 0xFF                             # GLO
+            elif hi == 0xC:                                 # long branch / skip
+                cyc += 1
+                if n & 4:                                   # skips + NOP
+                    if n == 4:
+                        continue
+                    k = n & 3
+                    if k == 0:                              # LSIE
+                        c = self.ie
+                    elif k == 1:
+                        c = self.q
+                    elif k == 2:
+                        c = d == 0
+                    else:
+                        c = df
+                    if n < 8:                               # LSNQ/LSNZ/LSNF
+                        c = not c
+                    if c:
+                        R[p] = (pc + 2) & 0xFFFF
+                else:
+                    k = n & 3
+                    if k == 0:
+                        c = True
+                    elif k == 1:
+                        c = self.q
+                    elif k == 2:
+                        c = d == 0
+                    else:
+                        c = df
+                    if n & 8:
+                        c = not c
+                    if c:
+                        R[p] = (M[pc] << 8) | M[(pc + 1) & 0xFFFF]
+                    else:
+                        R[p] = (pc + 2) & 0xFFFF
+            elif hi == 0xA:
+                R[n] = (R[n] & 0xFF00) | d                  # PLO
+            elif hi == 0x0:
+                if n:
+                    d = M[R[n]]                             # LDN
+                else:                                       # IDL
+                    reason = STOP_IDLE
+                    break
+            elif hi == 0xB:
+                R[n] = (R[n] & 0x00FF) | (d << 8)           # PHI
+            elif hi == 0x5:                                 # STR
+                a = R[n]
+                if a < RAM_TOP:
+                    M[a] = d
+            elif hi == 0x9:
+                d = R[n] >> 8                               # GHI
+            elif hi == 0x7:
+                if n == 2:                                  # LDXA
+                    a = R[x]
+                    d = M[a]
+                    R[x] = (a + 1) & 0xFFFF
+                elif n == 3:                                # STXD
+                    a = R[x]
+                    if a < RAM_TOP:
+                        M[a] = d
+                    R[x] = (a - 1) & 0xFFFF
+                elif n == 4 or n == 0xC:                    # ADC / ADCI
+                    if n == 4:
+                        m = M[R[x]]
+                    else:
+                        m = M[pc]
+                        R[p] = (pc + 1) & 0xFFFF
+                    v = d + m + df
+                    df = v >> 8
+                    d = v & 0xFF
+                elif n == 5 or n == 0xD:                    # SDB / SDBI
+                    if n == 5:
+                        m = M[R[x]]
+                    else:
+                        m = M[pc]
+                        R[p] = (pc + 1) & 0xFFFF
+                    v = m - d - (1 - df)
+                    df = 1 if v >= 0 else 0
+                    d = v & 0xFF
+                elif n == 7 or n == 0xF:                    # SMB / SMBI
+                    if n == 7:
+                        m = M[R[x]]
+                    else:
+                        m = M[pc]
+                        R[p] = (pc + 1) & 0xFFFF
+                    v = d - m - (1 - df)
+                    df = 1 if v >= 0 else 0
+                    d = v & 0xFF
+                elif n == 6:                                # SHRC
+                    v = d & 1
+                    d = (d >> 1) | (df << 7)
+                    df = v
+                elif n == 0xE:                              # SHLC
+                    v = d >> 7
+                    d = ((d << 1) & 0xFF) | df
+                    df = v
+                elif n <= 1:                                # RET / DIS
+                    a = R[x]
+                    v = M[a]
+                    R[x] = (a + 1) & 0xFFFF
+                    x, p = v >> 4, v & 0x0F
+                    self.ie = 1 - n
+                elif n == 8:                                # SAV
+                    a = R[x]
+                    if a < RAM_TOP:
+                        M[a] = self.t
+                elif n == 9:                                # MARK
+                    self.t = (x << 4) | p
+                    a = R[2]
+                    if a < RAM_TOP:
+                        M[a] = self.t
+                    x = p
+                    R[2] = (a - 1) & 0xFFFF
+                elif n == 0xA:
+                    self.q = 0                              # REQ
+                else:
+                    self.q = 1                              # SEQ
+            elif hi == 0x6:
+                if n == 0:
+                    R[x] = (R[x] + 1) & 0xFFFF              # IRX
+                elif n < 8:                                 # OUT n
+                    a = R[x]
+                    R[x] = (a + 1) & 0xFFFF
+                    self.cycles = cyc
+                    self._out(n, M[a])
+                elif n > 8:                                 # INP n-8
+                    self.cycles = cyc
+                    d = self._inp(n - 8, pc)
+                    a = R[x]
+                    if a < RAM_TOP:
+                        M[a] = d
+                    if self.stop_reason is not None:
+                        if stop_on_input:
+                            reason = self.stop_reason
+                            break
+                        self.stop_reason = None
+                else:                                       # 68 prefix
+                    op2 = M[pc]
+                    R[p] = pc = (pc + 1) & 0xFFFF
+                    ext = EXT_CYCLES.get(op2)
+                    if ext is None:
+                        reason = STOP_ILLEGAL
+                        R[p] = (pc - 2) & 0xFFFF
+                        break
+                    cyc += ext - 2
+                    h2, n2 = op2 >> 4, op2 & 0x0F
+                    if h2 == 0xC:                           # RLDI
+                        R[n2] = (M[pc] << 8) | M[(pc + 1) & 0xFFFF]
+                        R[p] = (pc + 2) & 0xFFFF
+                    elif h2 == 0x2:                         # DBNZ
+                        v = (R[n2] - 1) & 0xFFFF
+                        R[n2] = v
+                        pc = R[p]
+                        if v:
+                            R[p] = (M[pc] << 8) | M[(pc + 1) & 0xFFFF]
+                        else:
+                            R[p] = (pc + 2) & 0xFFFF
+                    elif h2 == 0x6:                         # RLXA
+                        a = R[x]
+                        R[n2] = (M[a] << 8) | M[(a + 1) & 0xFFFF]
+                        R[x] = (a + 2) & 0xFFFF
+                    elif h2 == 0xA:                         # RSXD
+                        a = R[x]
+                        v = R[n2]
+                        if a < RAM_TOP:
+                            M[a] = v & 0xFF
+                        a = (a - 1) & 0xFFFF
+                        if a < RAM_TOP:
+                            M[a] = v >> 8
+                        R[x] = (a - 1) & 0xFFFF
+                    elif h2 == 0xB:                         # RNX
+                        R[x] = R[n2]
+                    elif h2 == 0x8:                         # SCAL
+                        a = R[x]
+                        v = R[n2]
+                        if a < RAM_TOP:
+                            M[a] = v & 0xFF
+                        a = (a - 1) & 0xFFFF
+                        if a < RAM_TOP:
+                            M[a] = v >> 8
+                        R[x] = (a - 1) & 0xFFFF
+                        pc = R[p]
+                        R[n2] = (pc + 2) & 0xFFFF
+                        R[p] = (M[pc] << 8) | M[(pc + 1) & 0xFFFF]
+                    elif h2 == 0x9:                         # SRET
+                        R[p] = R[n2]
+                        a = (R[x] + 1) & 0xFFFF
+                        R[n2] = (M[a] << 8) | M[(a + 1) & 0xFFFF]
+                        R[x] = (a + 1) & 0xFFFF
+                    else:
+                        self.cycles = cyc
+                        d, df = self._ext_misc(op2, p, x, d, df)
+            elif hi == 0xD:
+                p = n                                       # SEP
+                if sep_hook is not None and (n == 4 or n == 5):
+                    self.p, self.x = p, x
+                    sep_hook(n, cyc)
+            elif hi == 0x1:
+                R[n] = (R[n] + 1) & 0xFFFF                  # INC
+            elif hi == 0x4:                                 # LDA
+                a = R[n]
+                d = M[a]
+                R[n] = (a + 1) & 0xFFFF
+            elif hi == 0xE:
+                x = n                                       # SEX
+            elif hi == 0x3:                                 # short branches
+                if n == 0:
+                    c = True
+                elif n == 8:                                # SKP
+                    R[p] = (pc + 1) & 0xFFFF
+                    continue
+                else:
+                    k = n & 7
+                    if k == 1:
+                        c = self.q
+                    elif k == 2:
+                        c = d == 0
+                    elif k == 3:
+                        c = df
+                    else:
+                        c = self.ef[k - 4]
+                    if n & 8:
+                        c = not c
+                if c:
+                    R[p] = (pc & 0xFF00) | M[pc]
+                else:
+                    R[p] = (pc + 1) & 0xFFFF
+            elif hi == 0x2:
+                R[n] = (R[n] - 1) & 0xFFFF                  # DEC
+            else:
+                raise AssertionError(op)
+        self.p, self.x, self.d, self.df = p, x, d, df
+        self.cycles = cyc
+        self.instructions += ninstr
+        if reason is None:
+            reason = STOP_CYCLES
+        self.stop_reason = reason
+        return reason
+
+    def _ext_misc(self, op2, p, x, d, df):
+        """Counter/timer, interrupt control, DSAV, BCD and BCI/BXI."""
+        M, R = self.mem, self.r
+        if op2 <= 0x0D:
+            if op2 == 0x00:                                 # STPC
+                self.counter = self._gec()
+                self.timer_run = False
+            elif op2 == 0x01:                               # DTC
+                self.counter = (self._gec() - 1) & 0xFF
+                self.timer_base = self.cycles
+            elif op2 == 0x06:                               # LDC
+                self.counter = d
+                self.timer_base = self.cycles
+            elif op2 == 0x07:                               # STM
+                self.counter = self._gec()
+                self.timer_base = self.cycles
+                self.timer_run = True
+            elif op2 == 0x08:                               # GEC
+                d = self._gec()
+            elif op2 == 0x0A:
+                self.xie = 1
+            elif op2 == 0x0B:
+                self.xie = 0
+            elif op2 == 0x0C:
+                self.cie = 1
+            elif op2 == 0x0D:
+                self.cie = 0
+            # SPM2/SCM2/SPM1/SCM1/ETQ: EF-driven modes, no EF activity here
+            return d, df
+        if op2 in (0x3E, 0x3F):                             # BCI / BXI
+            pc = R[p]
+            if op2 == 0x3E:
+                c, self.ci = self.ci, 0
+            else:
+                c = self.xi
+            R[p] = (pc & 0xFF00) | M[pc] if c else (pc + 1) & 0xFFFF
+            return d, df
+        if op2 == 0x76:                                     # DSAV
+            a = (R[x] - 1) & 0xFFFF
+            if a < RAM_TOP:
+                M[a] = self.t
+            a = (a - 1) & 0xFFFF
+            if a < RAM_TOP:
+                M[a] = d
+            a = (a - 1) & 0xFFFF
+            if a < RAM_TOP:
+                M[a] = (d >> 1) | (df << 7)
+            R[x] = a
+            return (d >> 1) | (df << 7), d & 1
+        # BCD: DADD/DADI/DADC/DACI, DSM/DSMI/DSMB/DSBI
+        if op2 in (0xFC, 0x7C, 0xFF, 0x7F):
+            pc = R[p]
+            m = M[pc]
+            R[p] = (pc + 1) & 0xFFFF
+        else:
+            m = M[R[x]]
+        if op2 in (0xF4, 0xFC):
+            return _bcd_add(d, m, 0)
+        if op2 in (0x74, 0x7C):
+            return _bcd_add(d, m, df)
+        if op2 in (0xF7, 0xFF):
+            return _bcd_sub(d, m, 1)
+        return _bcd_sub(d, m, df)
+
+    # --- host conveniences ---
+
+    def send(self, line):
+        """Queue a UCI line (newline-terminated) for the engine."""
+        self.history.append(line)
+        self.uart.feed((line + '\n').encode('latin-1'))
+
+    def run_until_input(self, max_cycles=None):
+        """Run until the engine is back in UCI_READ_LINE with nothing left to
+        read (or stops for any other reason). Returns the stop reason."""
+        while True:
+            reason = self.run(max_cycles)
+            if reason != STOP_INPUT or not self.uart.rx:
+                return reason
+
+    def output_lines(self):
+        """Drain UART output and split it into stripped, non-empty lines."""
+        text = self.uart.drain().decode('latin-1', errors='replace')
+        return [ln.strip() for ln in re.split(r'[\r\n]+', text) if ln.strip()]
+
+    def command(self, line, max_cycles=None, echo=False):
+        """Send one UCI line, run to the next input wait, return the engine's
+        response lines (BIOS echo removed unless `echo`)."""
+        self.send(line)
+        self.run_until_input(max_cycles)
+        lines = self.output_lines()
+        if not echo:
+            lines = strip_echo(lines, [line])
+        return lines
+
+    def registers(self):
+        """One-line register dump in the BIOS breakpoint layout."""
+        regs = ' '.join(f"R{i:X}={v:04X}" for i, v in enumerate(self.r))
+        return (f"{regs}  D={self.d:02X} DF={self.df} P={self.p:X} X={self.x:X} "
+                f"T={self.t:02X} Q={self.q} IE={self.ie}")
+
+    def seconds(self):
+        """Elapsed machine time at the nominal clock."""
+        return self.cycles * CLOCKS_PER_CYCLE / self.clock_hz
+
+
+def snapshot_header(data):
+    """Header dict of a snapshot blob (raises ValueError if it is not one)."""
+    if data[:len(SNAP_MAGIC)] != SNAP_MAGIC:
+        raise ValueError("not an ELPH simulator snapshot")
+    n = int.from_bytes(data[8:12], 'little')
+    return json.loads(data[12:12 + n])
+
+
+def strip_echo(lines, sent):
+    """Drop BIOS echoes of `sent` lines from `lines` (elph-bridge.py's rule:
+    exact case-insensitive match consumes one pending echo)."""
+    pending = [s.lower() for s in sent]
+    out = []
+    for ln in lines:
+        low = ln.lower()
+        if low in pending:
+            pending.remove(low)
+            continue
+        out.append(ln)
+    return out
+
+
+# ------------------------------------------------------------------------------
+# Serial stand-ins: in-process (SimSerial) and pseudo-terminal (serve_pty)
+# ------------------------------------------------------------------------------
+
+SIM_SLICE = 200_000             # machine cycles between output flushes (~0.13 s
+                                # of board time) while the engine is busy
+
+
+class SimSerial:
+    """pyserial-compatible port backed by an in-process simulator.
+
+    The engine runs in a daemon thread; write() queues bytes for it and
+    read()/in_waiting see its output (BIOS echo included, as on the wire),
+    so elph-bridge.py and replay-match.py work through it unmodified. Open it
+    with open_port('sim:<image>') or ELPH_PORT=sim:<image>.
+
+    Engine output travels through a pipe, so fileno() is selectable the way a
+    pyserial port's is and an event loop can wait on it instead of polling."""
+
+    def __init__(self, image, baudrate=19200, timeout=0.1, translate=True, **kw):
+        import threading
+        self.name = f"sim:{image}"
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.sim = ElphSim.from_file(image, translate=translate, **kw)
+        self.sim.boot()
+        self.sim.run_until_input()      # the board is up before the port opens
+        self.sim.uart.drain()
+        self._inbox = bytearray()
+        self._rfd, self._wfd = os.pipe()
+        os.set_blocking(self._rfd, False)
+        self._cv = threading.Condition()
+        self._closed = False
+        self._idle = False
+        self._thread = threading.Thread(target=self._engine, name=self.name, daemon=True)
+        self._thread.start()
+
+    def _engine(self):
+        try:
+            self._pump()
+        finally:
+            os.close(self._wfd)
+
+    def _pump(self):
+        sim = self.sim
+        while True:
+            with self._cv:
+                if sim.stop_reason == STOP_INPUT:
+                    while not self._inbox and not self._closed:
+                        self._idle = True
+                        self._cv.notify_all()
+                        self._cv.wait()
+                self._idle = False
+                if self._closed:
+                    return
+                sim.uart.feed(self._inbox)
+                self._inbox.clear()
+            reason = sim.run(SIM_SLICE)
+            out = sim.uart.drain()
+            if reason not in (STOP_CYCLES, STOP_INPUT):
+                out += f"\r\ninfo string SIM STOP {reason}: {sim.registers()}\r\n".encode('latin-1')
+            try:
+                while out:
+                    out = out[os.write(self._wfd, out):]
+            except OSError:             # reader closed the port
+                return
+            if reason not in (STOP_CYCLES, STOP_INPUT):
+                return
+
+    def fileno(self):
+        return self._rfd
+
+    def _wait_idle(self):
+        # caller holds self._cv
+        while not self._idle and not self._closed:
+            self._cv.wait()
+
+    def snapshot(self, tag=None):
+        """ElphSim.snapshot() of the engine once it is back waiting for input
+        (call after reading the reply of interest)."""
+        with self._cv:
+            self._wait_idle()
+            return self.sim.snapshot(tag)
+
+    def restore(self, data):
+        """Put the engine in a snapshot's state; output not yet read is
+        discarded. Returns the snapshot header."""
+        with self._cv:
+            self._wait_idle()
+            hdr = self.sim.restore(data)
+            self.reset_input_buffer()
+            return hdr
+
+    @property
+    def in_waiting(self):
+        import fcntl, struct, termios
+        n = fcntl.ioctl(self._rfd, termios.FIONREAD, b'\0\0\0\0')
+        return struct.unpack('i', n)[0]
+
+    def read(self, size=1):
+        import select
+        deadline = time.time() + (self.timeout or 0)
+        data = bytearray()
+        while len(data) < size and not self._closed:
+            try:
+                chunk = os.read(self._rfd, size - len(data))
+            except BlockingIOError:
+                chunk = None
+            if chunk:
+                data.extend(chunk)
+                continue
+            left = deadline - time.time()
+            if left <= 0:
+                break
+            select.select([self._rfd], [], [], left)
+        return bytes(data)
+
+    def write(self, data):
+        with self._cv:
+            self._inbox.extend(data)
+            self._idle = False
+            self._cv.notify_all()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        try:
+            while os.read(self._rfd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        with self._cv:
+            if self._closed:
+                return
+            self._closed = True
+            self._cv.notify_all()
+        os.close(self._rfd)
+
+
+def open_port(port, baudrate=19200, **kw):
+    """Serial port by name: 'sim:<image>' is an in-process SimSerial, anything
+    else (a /dev/ttyUSB*, or the pty elph_sim.py --pty prints) goes to pyserial."""
+    if port.startswith('sim:'):
+        return SimSerial(port[4:], baudrate=baudrate, timeout=kw.get('timeout', 0.1))
+    import serial
+    return serial.Serial(port=port, baudrate=baudrate, **kw)
+
+
+def open_serial(port, baudrate=19200, timeout=0.1):
+    """The engine link elph-bridge.py and replay-match.py open (ELPH_PORT):
+    open_port() at 8N1 with no flow control. sim:<image> needs no pyserial."""
+    return open_port(port, baudrate, bytesize=8, parity='N', stopbits=1, timeout=timeout,
+                     xonxoff=False, rtscts=False, dsrdtr=False)
+
+
+def serve_pty(sim, link=None):
+    """Expose the simulated UART on a pseudo-terminal until interrupted.
+    Prints the slave path (and symlinks it to `link` if given), so
+    `ELPH_PORT=/tmp/elph0 python3 elph-bridge.py` — or socat, minicom, a
+    replay — talks to the simulator exactly as to the board. The slave end
+    stays open here, so clients can come and go like on a real port."""
+    import select
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+    if link:
+        if os.path.islink(link):
+            os.unlink(link)
+        os.symlink(path, link)
+    print(f"ELPH simulator on {path}" + (f" ({link})" if link else ''), flush=True)
+    try:
+        while True:
+            busy = sim.stop_reason != STOP_INPUT
+            r, _, _ = select.select([master], [], [], 0 if busy else None)
+            if r:
+                try:
+                    data = os.read(master, 4096)
+                except OSError:
+                    data = b''
+                if data:
+                    sim.uart.feed(data)
+            reason = sim.run(SIM_SLICE)
+            out = sim.uart.drain()
+            if out:
+                os.write(master, out)
+            if reason not in (STOP_CYCLES, STOP_INPUT):
+                os.write(master, f"\r\ninfo string SIM STOP {reason}: "
+                                 f"{sim.registers()}\r\n".encode('latin-1'))
+                print(f"engine stopped ({reason}): {sim.registers()}", file=sys.stderr)
+                return 2
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        if link and os.path.islink(link):
+            os.unlink(link)
+        os.close(master)
+        os.close(slave)
+
+
+BENCH_SCRIPTS = ['probe_loss19_castle.uci', 'test_turn29_queensac.uci',
+                 'test_queencap_2q_0715.uci', 'test_kingmarch_0626.uci',
+                 'test_turn53_horizon.uci']
+
+
+def bench(image, depth=3, scripts=BENCH_SCRIPTS):
+    """Interpreter vs translated blocks on fixed tools/*.uci positions (each
+    script's go replaced by `go depth N`). Cycle counts and output must match
+    exactly; returns False if any position differs."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    ok = True
+    tot = [0.0, 0.0]
+    print(f"{'position':32s} {'cycles':>12} {'interp':>8} {'blocks':>8} {'speedup':>7}")
+    for name in scripts:
+        cmds = [c for c in load_uci_script(os.path.join(here, name)) if not c.startswith('go')]
+        res = []
+        for translate in (False, True):
+            sim = ElphSim.from_file(image, translate=translate)
+            sim.boot()
+            sim.run_until_input()
+            sim.output_lines()
+            for c in cmds:
+                sim.command(c)
+            c0, w0 = sim.cycles, time.time()
+            out = sim.command(f'go depth {depth}')
+            res.append((sim.cycles - c0, sim.instructions, out, time.time() - w0))
+        (ca, ia, oa, ta), (cb, ib, ob, tb) = res
+        same = (ca, ia, oa) == (cb, ib, ob)
+        ok &= same
+        tot[0] += ta
+        tot[1] += tb
+        print(f"{name:32s} {ca:12,} {ta:7.2f}s {tb:7.2f}s {ta / tb:6.2f}x"
+              + ('' if same else f"  MISMATCH: {cb:,} cycles, {ob[-1:]}"))
+    print(f"{'total':32s} {'':12} {tot[0]:7.2f}s {tot[1]:7.2f}s {tot[0] / tot[1]:6.2f}x")
+    return ok
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="CDP1806 simulator: UCI engine on stdin/stdout")
+    ap.add_argument('image', nargs='?', default='chess-engine.bin',
+                    help="chess-engine.bin, .hex, or an a18 .lst (default: chess-engine.bin)")
+    ap.add_argument('--baud', type=int, default=None,
+                    help="pace UART output at this baud rate (default: unpaced)")
+    ap.add_argument('--rtc', choices=('virtual', 'wall'), default='virtual',
+                    help="RTC time source: machine cycles (default) or host clock")
+    ap.add_argument('--clock-hz', type=int, default=CLOCK_HZ,
+                    help=f"nominal CPU clock for virtual time (default {CLOCK_HZ})")
+    ap.add_argument('--stats', action='store_true',
+                    help="report cycles / host speed on stderr after each go")
+    ap.add_argument('--translate', action='store_true',
+                    help="run translated basic blocks instead of the interpreter "
+                         "(same cycle counts, ~2.5x faster)")
+    ap.add_argument('--pty', nargs='?', const='', metavar='LINK',
+                    help="serve the UART on a pseudo-terminal (optionally symlinked "
+                         "to LINK) instead of stdin/stdout")
+    ap.add_argument('--bench', type=int, nargs='?', const=3, metavar='DEPTH',
+                    help="benchmark interpreter vs --translate on fixed tools/*.uci "
+                         "positions at DEPTH (default 3) and exit")
+    ap.add_argument('--script', metavar='UCI',
+                    help="play a tools/*.uci command script instead of reading stdin")
+    ap.add_argument('--snapshot', metavar='FILE',
+                    help="resume from a snapshot instead of booting the image; with "
+                         "--script, the commands the snapshot already ran are skipped")
+    ap.add_argument('--save-snapshots', metavar='DIR',
+                    help="save DIR/cmdNNNN.snap before every go (NNNN = UCI command index)")
+    args = ap.parse_args()
+    if args.bench:
+        return 0 if bench(args.image, args.bench) else 1
+
+    uart, rtc = Uart(args.baud, args.clock_hz), Rtc(args.rtc, args.clock_hz)
+    if args.snapshot:
+        sim = ElphSim.from_snapshot(args.snapshot, uart=uart, rtc=rtc, clock_hz=args.clock_hz,
+                                    translate=args.translate)
+        sim.uart.drain()
+    else:
+        sim = ElphSim.from_file(args.image, uart=uart, rtc=rtc, clock_hz=args.clock_hz,
+                                translate=args.translate)
+        sim.boot()
+        reason = sim.run_until_input()
+        sim.output_lines()              # startup banner
+        if reason != STOP_INPUT:
+            print(f"engine stopped during boot ({reason}): {sim.registers()}", file=sys.stderr)
+            return 2
+
+    if args.pty is not None:
+        return serve_pty(sim, args.pty or None)
+
+    if args.script:
+        lines = load_uci_script(args.script)
+        done = len(sim.history)
+        if done:
+            if lines[:done] != sim.history:
+                print(f"warning: snapshot history does not match the first {done} "
+                      f"commands of {args.script}", file=sys.stderr)
+            lines = lines[done:]
+    else:
+        lines = sys.stdin
+    if args.save_snapshots:
+        os.makedirs(args.save_snapshots, exist_ok=True)
+
+    for raw in lines:
+        line = raw.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.lower() == 'quit':
+            break
+        if args.save_snapshots and line.startswith('go'):
+            sim.save_snapshot(os.path.join(args.save_snapshots, f"cmd{len(sim.history):04d}.snap"),
+                              tag=line)
+        c0, w0 = sim.cycles, time.time()
+        out = sim.command(line)
+        for ln in out:
+            print(ln, flush=True)
+        if sim.stop_reason != STOP_INPUT:
+            print(f"info string SIM STOP {sim.stop_reason}: {sim.registers()}", flush=True)
+            return 2
+        if args.stats and line.startswith('go'):
+            dc, dw = sim.cycles - c0, time.time() - w0
+            hw = dc * CLOCKS_PER_CYCLE / args.clock_hz
+            print(f"[sim] {dc} cycles = {hw:.2f}s @{args.clock_hz / 1e6:g}MHz in {dw:.2f}s host "
+                  f"({hw / dw if dw else 0:.1f}x)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+SPRT self-play: is build B stronger than build A?
+
+Plays A against B on simulated engines (tools/elph_sim.py, translated-block
+mode, virtual-time RTC) in a process pool, one game pair per job: the same
+opening twice with colours swapped. Openings are the distinct N-ply lines
+(--opening-plies, default 10) of the master-game books in
+openingbooks/*.asm, shuffled with --seed — popular lines, so roughly
+balanced, and both builds' own books take over from there as in a match.
+
+After every pair the sequential probability ratio test is updated on
+pentanomial pair scores (normal approximation of the GSPRT, as fishtest
+does): H0 "B - A <= elo0" against H1 "B - A >= elo1" (logistic Elo), with
+error rates alpha/beta. The run stops as soon as the LLR leaves
+[ln(beta/(1-alpha)), ln((1-beta)/alpha)] — H1 accepted means take the change.
+The engine is deterministic under the virtual clock, so an opening pair is
+never worth replaying as it was: the books hold only ~100 distinct 10-ply
+lines, and a --max-pairs beyond that reuses them with two random legal plies
+appended (drawn from --seed, colours swapped as ever) — with a warning, as
+those positions are less balanced. Running out of openings is an
+inconclusive result.
+
+Games end as in tools/elph_farm.py (rules via python-chess, forfeits,
+CuteChess-style resign/draw adjudication, --maxplies). Per game the report
+gives the result, plies, and board seconds per engine (cycle-exact) plus the
+host seconds the pair took; per pair the LLR, so the trajectory is the
+column of LLR values.
+
+Usage:
+    python3 tools/elph_sprt.py A.lst B.lst                  # elo0=0 elo1=10
+    python3 tools/elph_sprt.py listings/chess-engine-702cdaf.lst new.bin \\
+        --elo0 0 --elo1 15 --go 'go depth 3' -j 8
+    options: --alpha/--beta (0.05)  --opening-plies N  --seed N
+             --max-pairs N  --maxplies N  --csv PATH (one row per game)
+
+Exit code 0 if H1 was accepted, 1 if H0 was, 2 if inconclusive.
+"""
+import glob
+import math
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import chess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from elph_sim import ElphSim, CLOCK_HZ, CLOCKS_PER_CYCLE
+from elph_farm import Adjudicator, search_result
+
+BOOK_DIR = os.path.join(os.path.dirname(HERE), 'openingbooks')
+BESTMOVE_BUDGET_S = 200         # board seconds per search before calling it a hang
+
+
+def book_lines(path):
+    """Every full line (entry moves + response) of a compiled book .asm, as
+    UCI move lists, walking the DB stream the way BL_ENTRY_LOOP does."""
+    text = open(path).read()
+    m = re.search(r'^OPENING_BOOK:', text, re.M)
+    if m:
+        text = text[m.end():]
+    data = []
+    for line in text.splitlines():
+        code = line.split(';', 1)[0]
+        if 'DB' in code:
+            data.extend(int(hx, 16) for hx in re.findall(r'\$([0-9A-Fa-f]{2})', code))
+    sq = lambda b: 'abcdefgh'[b & 7] + '12345678'[b >> 4]
+    lines = []
+    i = 0
+    while i < len(data) and data[i] != 0xFF:
+        ply = data[i]
+        entry = data[i + 1:i + 3 + 2 * ply]
+        i += 3 + 2 * ply
+        if len(entry) < 2 * ply + 2:
+            break
+        lines.append([sq(a) + sq(b) for a, b in zip(entry[0::2], entry[1::2])])
+    return lines
+
+
+def load_openings(plies, seed, count=None, book_dir=BOOK_DIR):
+    """Distinct legal `plies`-ply openings from book_dir/*.asm, shuffled.
+    With `count` above their number, the list is topped up by reusing them
+    in order, each with two random legal plies appended; returns (openings,
+    number of distinct book openings)."""
+    found = set()
+    for path in sorted(glob.glob(os.path.join(book_dir, '*.asm'))):
+        for line in book_lines(path):
+            if len(line) < plies:
+                continue
+            board = chess.Board()
+            try:
+                for mv in line[:plies]:
+                    board.push_uci(mv)      # raises on an illegal move
+            except ValueError:
+                continue
+            found.add(tuple(line[:plies]))
+    openings = sorted(found)
+    rng = random.Random(seed)
+    rng.shuffle(openings)
+    distinct = len(openings)
+    seen = set(openings)
+    tries = 0
+    while count and distinct and len(openings) < count and tries < 20 * count:
+        base = openings[tries % distinct]
+        tries += 1
+        board = chess.Board()
+        for mv in base:
+            board.push_uci(mv)
+        line = list(base)
+        for _ in range(2):
+            legal = sorted(m.uci() for m in board.legal_moves)
+            if not legal:
+                break
+            line.append(rng.choice(legal))
+            board.push_uci(line[-1])
+        if len(line) == len(base) + 2 and not board.is_game_over() and tuple(line) not in seen:
+            seen.add(tuple(line))
+            openings.append(tuple(line))
+    return openings, distinct
+
+
+def new_engine(image):
+    sim = ElphSim.from_file(image, translate=True)
+    sim.boot()
+    sim.run_until_input()
+    sim.output_lines()
+    sim.command('ucinewgame')
+    return sim
+
+
+def play_game(images, opening, args):
+    """One game, images = (white, black). Returns (result, reason, plies,
+    [white board seconds, black board seconds])."""
+    sims = [new_engine(images[0]), new_engine(images[1])]
+    budget = BESTMOVE_BUDGET_S * CLOCK_HZ // CLOCKS_PER_CYCLE
+    board = chess.Board()
+    moves = list(opening)
+    for mv in moves:
+        board.push_uci(mv)
+    adj = Adjudicator(args)
+    cycles = [0, 0]
+    while True:
+        mover = board.turn
+        side = 0 if mover == chess.WHITE else 1
+        sim = sims[side]
+        sim.command('position startpos moves ' + ' '.join(moves))
+        c0 = sim.cycles
+        best, score = search_result(sim.command(args.go, max_cycles=budget))
+        cycles[side] += sim.cycles - c0
+        loser = '0-1' if mover == chess.WHITE else '1-0'
+        if best is None:
+            result, reason = loser, f"no bestmove ({sim.stop_reason})"
+            break
+        try:
+            move = chess.Move.from_uci(best)
+        except ValueError:
+            move = None
+        if move is None or move not in board.legal_moves:
+            result, reason = loser, f"illegal move {best}"
+            break
+        board.push(move)
+        moves.append(best)
+        outcome = board.outcome(claim_draw=True)
+        if outcome is not None:
+            result, reason = outcome.result(), outcome.termination.name.lower().replace('_', ' ')
+            break
+        adjudged = adj.update(board, mover, score)
+        if adjudged:
+            result, reason = adjudged
+            break
+        if args.maxplies and len(moves) >= args.maxplies:
+            result, reason = '1/2-1/2', f"adjudication: {args.maxplies} plies"
+            break
+    secs = [c * CLOCKS_PER_CYCLE / CLOCK_HZ for c in cycles]
+    return result, reason, len(moves), secs
+
+
+def play_pair(n, opening, args):
+    """Opening `n` twice, B white then B black. Returns (n, opening,
+    [game dicts], host seconds); each game's 'score' is B's."""
+    t0 = time.time()
+    games = []
+    for b_white in (True, False):
+        images = (args.b, args.a) if b_white else (args.a, args.b)
+        result, reason, plies, secs = play_game(images, opening, args)
+        white_score = {'1-0': 1.0, '0-1': 0.0}.get(result, 0.5)
+        games.append({'b_white': b_white, 'result': result, 'reason': reason, 'plies': plies,
+                      'score': white_score if b_white else 1.0 - white_score,
+                      'b_secs': secs[0] if b_white else secs[1],
+                      'a_secs': secs[1] if b_white else secs[0]})
+    return n, opening, games, time.time() - t0
+
+
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def score_elo(s):
+    s = min(max(s, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / s - 1)
+
+
+def llr(penta, elo0, elo1):
+    """Log-likelihood ratio of H1 vs H0 from pentanomial counts (pairs
+    scoring 0, 0.5, 1, 1.5, 2 for B), normal approximation."""
+    n = sum(penta)
+    if not n:
+        return 0.0
+    xs = [k / 4 for k in range(5)]         # pair score as a fraction
+    mu = sum(c * x for c, x in zip(penta, xs)) / n
+    var = sum(c * (x - mu) ** 2 for c, x in zip(penta, xs)) / n
+    if var <= 0:
+        return 0.0
+    s0, s1 = expected_score(elo0), expected_score(elo1)
+    return n * (s1 - s0) * (2 * mu - s0 - s1) / (2 * var)
+
+
+def elo_interval(penta):
+    """(elo, low, high) 95% from pentanomial counts."""
+    n = sum(penta)
+    xs = [k / 4 for k in range(5)]
+    mu = sum(c * x for c, x in zip(penta, xs)) / n
+    var = sum(c * (x - mu) ** 2 for c, x in zip(penta, xs)) / n
+    se = math.sqrt(var / n)
+    return score_elo(mu), score_elo(mu - 1.96 * se), score_elo(mu + 1.96 * se)
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="SPRT: build B vs build A on simulated engines")
+    ap.add_argument('a', help="baseline image/listing")
+    ap.add_argument('b', help="candidate image/listing")
+    ap.add_argument('--elo0', type=float, default=0.0)
+    ap.add_argument('--elo1', type=float, default=10.0)
+    ap.add_argument('--alpha', type=float, default=0.05)
+    ap.add_argument('--beta', type=float, default=0.05)
+    ap.add_argument('--go', default='go depth 3', help="go command for both builds")
+    ap.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                    help="game pairs in parallel (default: one per core)")
+    ap.add_argument('--opening-plies', type=int, default=10)
+    ap.add_argument('--seed', type=int, default=1, help="opening order and random extra plies")
+    ap.add_argument('--max-pairs', type=int,
+                    help="stop after this many pairs (default: all distinct openings; more "
+                         "reuses them with 2 random plies)")
+    ap.add_argument('--maxplies', type=int, default=300,
+                    help="draw after this many plies (a full position line must fit UCI_BUFFER)")
+    ap.add_argument('--resign-score', type=int, default=1500)
+    ap.add_argument('--resign-moves', type=int, default=10, help="0 = no resign adjudication")
+    ap.add_argument('--draw-score', type=int, default=10)
+    ap.add_argument('--draw-moves', type=int, default=8, help="0 = no draw adjudication")
+    ap.add_argument('--draw-movenumber', type=int, default=40)
+    ap.add_argument('--csv', help="write one row per game here")
+    args = ap.parse_args()
+
+    openings, distinct = load_openings(args.opening_plies, args.seed, args.max_pairs)
+    if args.max_pairs:
+        openings = openings[:args.max_pairs]
+        if args.max_pairs > distinct:
+            print(f"warning: --max-pairs {args.max_pairs} ({2 * args.max_pairs} games) exceeds "
+                  f"2 x {distinct} distinct {args.opening_plies}-ply openings; pairs past "
+                  f"{distinct} start from a reused opening plus 2 random plies", file=sys.stderr)
+    lower = math.log(args.beta / (1 - args.alpha))
+    upper = math.log((1 - args.beta) / args.alpha)
+    print(f"A = {args.a}\nB = {args.b}\n"
+          f"H0: B-A <= {args.elo0:g}  H1: B-A >= {args.elo1:g}  alpha {args.alpha:g} beta {args.beta:g}  "
+          f"LLR bounds [{lower:.2f}, {upper:.2f}]\n"
+          f"{len(openings)} openings ({args.opening_plies} plies), '{args.go}', {args.jobs} pairs at a time\n")
+
+    csv = open(args.csv, 'w') if args.csv else None
+    if csv:
+        csv.write("pair,opening,b_color,result,b_score,reason,plies,b_board_s,a_board_s\n")
+    penta = [0] * 5
+    wdl = [0, 0, 0]
+    trajectory = []
+    verdict = None
+    t0 = time.time()
+    pool = ProcessPoolExecutor(max_workers=args.jobs)
+    futs = [pool.submit(play_pair, n, op, args) for n, op in enumerate(openings, 1)]
+    try:
+        for fut in as_completed(futs):
+            n, opening, games, host = fut.result()
+            pair = 0.0
+            for g in games:
+                pair += g['score']
+                wdl[0 if g['score'] == 1 else 1 if g['score'] == 0.5 else 2] += 1
+                print(f"  pair {n:3d} B {'white' if g['b_white'] else 'black'}: {g['result']:7s} "
+                      f"{g['plies']:3d} plies ({g['reason']}), board B {g['b_secs']:6.1f}s "
+                      f"A {g['a_secs']:6.1f}s")
+                if csv:
+                    csv.write(f"{n},{' '.join(opening)},{'white' if g['b_white'] else 'black'},"
+                              f"{g['result']},{g['score']},{g['reason']},{g['plies']},"
+                              f"{g['b_secs']:.2f},{g['a_secs']:.2f}\n")
+            penta[int(pair * 2)] += 1
+            value = llr(penta, args.elo0, args.elo1)
+            trajectory.append(value)
+            games_done = 2 * len(trajectory)
+            print(f"[{(time.time() - t0) / 60:6.1f}min] {games_done:4d} games  B +{wdl[0]} ={wdl[1]} "
+                  f"-{wdl[2]}  pair {n} {pair:g}/2 in {host:.0f}s host  LLR {value:+.2f}", flush=True)
+            if value >= upper or value <= lower:
+                verdict = 'H1' if value >= upper else 'H0'
+                break
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        if csv:
+            csv.close()
+
+    games_done = 2 * len(trajectory)
+    print(f"\n{games_done} games ({len(trajectory)} pairs) in {(time.time() - t0) / 60:.1f} min; "
+          f"B +{wdl[0]} ={wdl[1]} -{wdl[2]}, pairs 0/0.5/1/1.5/2: {' '.join(map(str, penta))}")
+    if trajectory:
+        elo, lo, hi = elo_interval(penta)
+        print(f"Elo B-A {elo:+.1f} [{lo:+.1f}, {hi:+.1f}]  LLR {trajectory[-1]:+.2f} "
+              f"[{lower:.2f}, {upper:.2f}]")
+        print("LLR trajectory: " + ' '.join(f"{v:+.2f}" for v in trajectory))
+    if verdict == 'H1':
+        print(f"H1 accepted: B is stronger (>= {args.elo1:g} Elo)")
+        return 0
+    if verdict == 'H0':
+        print(f"H0 accepted: B is not {args.elo1:g} Elo stronger")
+        return 1
+    print("inconclusive: openings exhausted before the LLR reached a bound")
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
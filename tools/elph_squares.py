@@ -0,0 +1,19 @@
+"""
+0x88 square names as the engine encodes them (rank * 16 + file, a1 = $00,
+h8 = $77), shared by the bridge's host book, the corpus archive and the hash
+model so each reads MOVE_HIST / book bytes the same way.
+"""
+
+NO_EP = 0xFF            # GAME_STATE's "no EP square", and ALGEBRAIC_TO_SQUARE's error
+
+
+def square_x88(name):
+    """'e4' -> $34, NO_EP ($FF) if invalid (ALGEBRAIC_TO_SQUARE)."""
+    if len(name) < 2 or not 'a' <= name[0] <= 'h' or not '1' <= name[1] <= '8':
+        return NO_EP
+    return (ord(name[1]) - ord('1')) * 16 + ord(name[0]) - ord('a')
+
+
+def x88_name(sq):
+    """$34 -> 'e4' (off-board bits ignored)."""
+    return 'abcdefgh'[sq & 7] + '12345678'[(sq >> 4) & 7]
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+Transposition-table simulator: capture NEGAMAX's TT traffic in the simulator,
+replay it under alternative table designs.
+
+The engine's TT (transposition.asm) is 256 x 8-byte entries at TT_TABLE,
+indexed by (HASH_HI ^ HASH_LO) & $FF, replace-always. A hash match hands
+TT_MOVE to move ordering; a match at sufficient depth whose flag bit 3 (the
+storing side) equals the side to move is a hit (TT_HIT = 1); NEGAMAX returns
+the stored score only for EXACT entries and never for mate scores (the
+mate-rejection guard: score high byte $7F or $80 means re-search).
+
+Capture (--capture) runs tools/elph_sim.py with pc hooks on TT_CLEAR,
+TT_PROBE and TT_STORE (addresses from the listing's symbol table) and records
+one event per call: probe = hash, side, ply, required depth and the engine's
+own TT_HIT answer; store = hash, side, ply, depth, flag, score and best move.
+Every probe and store also carries a fingerprint of BOARD + side (see
+elph_hash.fingerprint), so a replay knows whether a matching entry was
+really the same position. Searches come from the corpus (each game: a
+ucinewgame, then `position startpos moves ...` / `go depth D` for its non-book
+searches in order, so the table carries over between moves as in a match) or
+from tools/*.uci scripts, with every go rewritten to `go depth D`. Games are
+captured in parallel (ELPH_JOBS / -j), one simulator per worker.
+
+Replay feeds the same probe/store sequence to each scheme. It is a trace
+replay: the search tree is the one the engine's own table produced, so a
+scheme's extra hits are counted where the search would have cut but the
+nodes below are not removed. The engine's scheme is replayed first. As a
+check of the model, the trace is also replayed the way the captured image's
+own TT works (the header records whether its TT_PROBE has the side check and
+what its TT_CLEAR left in the table - older listings differ from the current
+source); that replay must reproduce every recorded TT_HIT, and the report
+says if it does not.
+
+Scheme parameters (--scheme 'entries=512,buckets=2,replace=twotier'):
+    entries    table entries (power of 2); RAM = entries x 8 bytes
+    index      xor  (hash ^ hash >> 8) & mask - the engine's XOR fold
+               lo   hash & mask
+               hi   byte-swapped hash & mask
+               mul  Fibonacci: (hash * 40503 mod 2^16) >> (16 - bits)
+    buckets    entries per index (1, 2 or 4); a probe checks each
+    replace    always   same-hash slot, else the oldest slot
+               depth    keep the deeper entry unless it is from an older search
+               twotier  (2 buckets) slot 0 depth-preferred, slot 1 always
+    side       1/0: reject hits stored by the other side (flag bit 3)
+    mateguard  1/0: never cut on a stored mate score
+
+Per scheme: RAM, hash matches (TT_MOVE available), hits, cutoffs, and
+collisions - matches on a different position - with how many of them became
+hits and cutoffs, and what the side bit and mate guard rejected.
+
+Usage:
+    python3 tools/elph_tt.py --capture OUT.ttrace --image LISTING [inputs...]
+        [--depth 3] [--games N] [--searches M] [-j JOBS]
+        inputs: elph-debug logs (default ./elph-debug*.log), .elpharc archives,
+                tools/*.uci scripts
+    python3 tools/elph_tt.py TRACE... [--scheme SPEC ...] [--grid] [--csv FILE] [-j JOBS]
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from elph_hash import fingerprint
+
+TRACE_MAGIC = b'ELPHTTR1'           # then u32 header length, JSON header, records
+EVENT = struct.Struct('<BBHBBBxhHQ')  # kind, side, hash, ply, depth, flag|hit, score, move, fingerprint
+CLEAR, SEARCH, PROBE, STORE = range(4)
+
+TT_ENTRY_SIZE = 8
+TT_FLAG_EXACT = 1
+MATE_HI = (0x7F, 0x80)              # score high bytes the mate guard rejects
+ENGINE = dict(entries=256, index='xor', buckets=1, replace='always', side=1, mateguard=1)
+INDEX_FUNCS = ('xor', 'lo', 'hi', 'mul')
+REPLACE = ('always', 'depth', 'twotier')
+
+
+# ------------------------------------------------------------------------------
+# Capture
+# ------------------------------------------------------------------------------
+
+class TraceRecorder:
+    """pc hooks that append TT events to `self.events` (packed records)."""
+
+    def __init__(self, sim, symbols):
+        self.sim = sim
+        self.sym = symbols
+        self.events = bytearray()
+        self.pending = None         # offset of the last probe, awaiting TT_HIT
+        self.cleared = False        # TT_CLEAR ran since the last event
+        self.clear_table = None     # TT_TABLE as the first TT_CLEAR left it
+        sim.pc_hooks = {symbols['TT_CLEAR']: self._clear, symbols['TT_PROBE']: self._probe,
+                        symbols['TT_STORE']: self._store}
+
+    def _settle(self):
+        """Patch the engine's answer (TT_HIT) into the previous probe."""
+        if self.pending is not None:
+            self.events[self.pending + 6] = self.sim.mem[self.sym['TT_HIT']]
+            self.pending = None
+        if self.cleared and self.clear_table is None:
+            base = self.sym['TT_TABLE']
+            self.clear_table = bytes(self.sim.mem[base:base + self.sym['TT_ENTRIES'] * TT_ENTRY_SIZE])
+        self.cleared = False
+
+    def _position(self, side):
+        sim, sym = self.sim, self.sym
+        mem = sim.mem
+        h = mem[sym['HASH_HI']] << 8 | mem[sym['HASH_LO']]
+        board = mem[sym['BOARD']:sym['BOARD'] + 128]
+        return h, mem[sym['CURRENT_PLY']], fingerprint(board, side)
+
+    def _clear(self, sim):
+        self._settle()
+        self.cleared = True
+        self.events += EVENT.pack(CLEAR, 0, 0, 0, 0, 0, 0, 0, 0)
+
+    def _probe(self, sim):
+        self._settle()
+        side = sim.r[12] & 8
+        h, ply, fp = self._position(side)
+        self.pending = len(self.events)
+        self.events += EVENT.pack(PROBE, side, h, ply, sim.d, 0, 0, 0, fp)
+
+    def _store(self, sim):
+        self._settle()
+        mem, sym = sim.mem, self.sym
+        side = sim.r[12] & 8
+        h, ply, fp = self._position(side)
+        score = mem[sym['SCORE_HI']] << 8 | mem[sym['SCORE_LO']]
+        best = sym['NODE_BEST_MOVE'] + 2 * ply
+        move = mem[best] << 8 | mem[best + 1]
+        self.events += EVENT.pack(STORE, side, h, ply, sim.d, sim.r[8] & 0xFF,
+                                  score - 0x10000 if score & 0x8000 else score, move, fp)
+
+    def search(self):
+        self._settle()
+        self.events += EVENT.pack(SEARCH, 0, 0, 0, 0, 0, 0, 0, 0)
+
+    def finish(self):
+        self._settle()
+        events, self.events = bytes(self.events), bytearray()
+        return events
+
+
+def game_commands(paths, depth, max_games=None, max_searches=None):
+    """Per game, the UCI commands to replay: corpus games as ucinewgame plus
+    position/go per non-book search; .uci scripts verbatim, go -> depth."""
+    from elph_corpus import log_games
+    from elph_sim import load_uci_script
+    games = 0
+    for path in paths:
+        if path.lower().endswith('.uci'):
+            cmds = ['ucinewgame'] + [f'go depth {depth}' if c.startswith('go') else c
+                                     for c in load_uci_script(path) if c != 'quit']
+            source = [cmds]
+        else:
+            if path.lower().endswith('.elpharc'):
+                from elph_archive import Archive
+                source_games = Archive(path).games()
+            else:
+                source_games = log_games(path)
+            source = []
+            for game in source_games:
+                cmds = ['ucinewgame']
+                searches = [s for s in game.searches if not s.book][:max_searches]
+                for s in searches:
+                    cmds.append('position startpos' + (' moves ' + ' '.join(s.moves) if s.moves else ''))
+                    cmds.append(f'go depth {depth}')
+                if searches:
+                    source.append(cmds)
+        for cmds in source:
+            if max_games is not None and games >= max_games:
+                return
+            games += 1
+            yield cmds
+
+
+_worker_sim = {}
+
+
+def image_side_check(listing):
+    """Does this image's TT_PROBE reject entries stored by the other side?
+    (The side bit arrived after some of the archived listings were built;
+    the check reads R12 inside TT_PROBE.)"""
+    body = None
+    for line in open(listing, errors='replace'):
+        code = line[24:].split(';')[0].strip()
+        if code.startswith('TT_PROBE:'):
+            body = []
+        elif body is not None:
+            if code.startswith('TT_PROBE_MISS:'):
+                break
+            body.append(code.split())
+    return any(tok[:2] == ['GLO', '12'] for tok in body or [])
+
+
+def _capture_game(image, cmds):
+    """Worker: run one game's commands with the recorder installed; returns
+    (events, searches, seconds of board time, table after TT_CLEAR)."""
+    from elph_sim import ElphSim, load_symbols
+    if image not in _worker_sim:
+        sim = ElphSim.from_file(image, translate=True)
+        sim.boot()
+        sim.command('uci')
+        _worker_sim[image] = (sim, TraceRecorder(sim, load_symbols(image)))
+    sim, rec = _worker_sim[image]
+    searches = 0
+    start = sim.seconds()
+    for cmd in cmds:
+        if cmd.startswith('go'):
+            rec.search()
+            searches += 1
+        sim.command(cmd)
+    return rec.finish(), searches, sim.seconds() - start, rec.clear_table
+
+
+def capture(image, games, out, depth, jobs=None):
+    """Capture every game's TT traffic into trace file `out`."""
+    jobs = jobs or int(os.environ.get('ELPH_JOBS', 0)) or os.cpu_count() or 1
+    games = list(games)
+    t0 = time.time()
+    if jobs == 1:
+        results = [_capture_game(image, cmds) for cmds in games]
+    else:
+        with ProcessPoolExecutor(jobs) as pool:
+            results = list(pool.map(_capture_game, [image] * len(games), games))
+    # What the image's own TT does, for checking the replay against TT_HIT:
+    # listings before the TT_CLEAR fix leave loop-counter bytes, not zeros
+    clear = next((r[3] for r in results if r[3] is not None), None)
+    header = json.dumps({'image': os.path.basename(image), 'depth': depth, 'games': len(games),
+                         'searches': sum(r[1] for r in results),
+                         'side_check': int(image_side_check(image)),
+                         'clear_table': clear.hex() if clear and any(clear) else None}).encode()
+    with open(out, 'wb') as f:
+        f.write(TRACE_MAGIC + struct.pack('<I', len(header)) + header)
+        for events, _, _, _ in results:
+            f.write(events)
+    n = sum(len(r[0]) for r in results) // EVENT.size
+    print(f"{len(games)} games, {sum(r[1] for r in results)} searches at depth {depth}: "
+          f"{n} TT events ({sum(r[2] for r in results):.0f}s board time, "
+          f"{time.time() - t0:.1f}s host) -> {out}")
+
+
+def read_trace(path):
+    """(header dict, list of event tuples) of a trace file."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(TRACE_MAGIC)] != TRACE_MAGIC:
+        raise ValueError(f"{path}: not a TT trace")
+    n = struct.unpack_from('<I', data, len(TRACE_MAGIC))[0]
+    start = len(TRACE_MAGIC) + 4
+    header = json.loads(data[start:start + n])
+    return header, list(EVENT.iter_unpack(data[start + n:]))
+
+
+# ------------------------------------------------------------------------------
+# Replay
+# ------------------------------------------------------------------------------
+
+def parse_scheme(spec):
+    """'entries=512,buckets=2' -> full parameter dict (engine defaults)."""
+    scheme = dict(ENGINE)
+    for item in filter(None, spec.split(',')):
+        key, _, value = item.partition('=')
+        key = key.strip()
+        if key not in scheme:
+            raise ValueError(f"unknown scheme parameter {key!r}")
+        scheme[key] = value.strip() if key in ('index', 'replace') else int(value, 0)
+    n, b = scheme['entries'], scheme['buckets']
+    if n & (n - 1) or b not in (1, 2, 4) or n < b:
+        raise ValueError(f"{spec}: entries must be a power of 2, buckets 1, 2 or 4")
+    if scheme['index'] not in INDEX_FUNCS or scheme['replace'] not in REPLACE:
+        raise ValueError(f"{spec}: index is one of {INDEX_FUNCS}, replace one of {REPLACE}")
+    if scheme['replace'] == 'twotier' and b != 2:
+        raise ValueError(f"{spec}: twotier needs buckets=2")
+    return scheme
+
+
+def scheme_name(scheme):
+    diff = [f"{k}={v}" for k, v in scheme.items() if v != ENGINE[k] and k != 'entries']
+    return f"{scheme['entries']}" + (' ' + ','.join(diff) if diff else '')
+
+
+def index_function(scheme):
+    nb = scheme['entries'] // scheme['buckets']
+    mask = nb - 1
+    bits = mask.bit_length()
+    kind = scheme['index']
+    if kind == 'xor':
+        return lambda h: (h ^ h >> 8) & mask
+    if kind == 'lo':
+        return lambda h: h & mask
+    if kind == 'hi':
+        return lambda h: (h >> 8 | h << 8) & mask
+    return lambda h: ((h * 40503) & 0xFFFF) >> (16 - bits) if bits else 0
+
+
+STAT_KEYS = ('probes', 'matches', 'hits', 'cutoffs', 'false_matches', 'false_hits',
+             'false_cutoffs', 'side_rejects', 'side_rejects_false', 'mate_rejects',
+             'mate_rejects_false', 'stores', 'stores_skipped', 'engine_disagree')
+
+
+def replay(events, scheme, check_engine=False, clear_table=None):
+    """Run the probe/store sequence through `scheme`. Returns the stat dict.
+    Entries are (hash, depth, flag|side, score, move, fingerprint, search,
+    stamp); TT_CLEAR leaves all-zero entries, which a probe of hash $0000
+    matches exactly as in the engine, or the entries of `clear_table` (the
+    raw TT_TABLE bytes an image's TT_CLEAR left, one-bucket schemes only)."""
+    buckets = scheme['buckets']
+    nb = scheme['entries'] // buckets
+    index = index_function(scheme)
+    replace = scheme['replace']
+    side_bit, mate_guard = scheme['side'], scheme['mateguard']
+    zero = (0, 0, 0, 0, 0, None, -1, 0)
+
+    def cleared():
+        if clear_table is None:
+            return [[zero] * buckets for _ in range(nb)]
+        t = clear_table
+        return [[(t[i] << 8 | t[i + 1], t[i + 4], t[i + 5], t[i + 2] << 8 | t[i + 3],
+                  t[i + 6] << 8 | t[i + 7], None, -1, 0)] for i in range(0, len(t), TT_ENTRY_SIZE)]
+
+    table = cleared()
+    st = dict.fromkeys(STAT_KEYS, 0)
+    age = stamp = 0
+
+    def preferred(slot, depth):
+        """depth-preferred: may a new entry of `depth` take this slot?"""
+        return slot[6] != age or depth >= slot[1]
+
+    for kind, side, h, ply, depth, flag, score, move, fp in events:
+        if kind == PROBE:
+            st['probes'] += 1
+            entry = None
+            for e in table[index(h)]:
+                if e[0] == h:
+                    entry = e
+                    break
+            hit = False
+            if entry is not None:
+                st['matches'] += 1
+                false = entry[5] != fp
+                st['false_matches'] += false
+                if entry[1] >= depth:
+                    if side_bit and (entry[2] ^ side) & 8:
+                        st['side_rejects'] += 1
+                        st['side_rejects_false'] += false
+                    else:
+                        hit = True
+                        st['hits'] += 1
+                        st['false_hits'] += false
+                        if entry[2] & 7 == TT_FLAG_EXACT:
+                            if mate_guard and (entry[3] >> 8) & 0xFF in MATE_HI:
+                                st['mate_rejects'] += 1
+                                st['mate_rejects_false'] += false
+                            else:
+                                st['cutoffs'] += 1
+                                st['false_cutoffs'] += false
+            if check_engine and hit != bool(flag):
+                st['engine_disagree'] += 1
+        elif kind == STORE:
+            st['stores'] += 1
+            stamp += 1
+            new = (h, depth, flag | side, score & 0xFFFF, move, fp, age, stamp)
+            slots = table[index(h)]
+            same = next((i for i, e in enumerate(slots) if e[0] == h), None)
+            if replace == 'always':
+                i = same if same is not None else min(range(buckets), key=lambda k: slots[k][7])
+            elif replace == 'depth':
+                i = same if same is not None else min(
+                    range(buckets), key=lambda k: (slots[k][6] == age, slots[k][1], slots[k][7]))
+                if not preferred(slots[i], depth):
+                    st['stores_skipped'] += 1
+                    continue
+            else:
+                i = 0 if preferred(slots[0], depth) else 1
+            slots[i] = new
+        elif kind == SEARCH:
+            age += 1
+        else:
+            table = cleared()
+    return st
+
+
+def _replay_traces(paths, scheme, check_engine=False):
+    """Sum of replay() over the traces. check_engine: replay instead what
+    each trace's image does (its side check and TT_CLEAR contents, from the
+    header) and count probes where that disagrees with the recorded TT_HIT."""
+    total = dict.fromkeys(STAT_KEYS, 0)
+    for path in paths:
+        header, events = read_trace(path)
+        clear = None
+        if check_engine:
+            scheme = dict(ENGINE, side=header.get('side_check', 1))
+            clear = header.get('clear_table')
+            clear = bytes.fromhex(clear) if clear else None
+        for k, v in replay(events, scheme, check_engine, clear).items():
+            total[k] += v
+    return total
+
+
+def default_schemes():
+    specs = ['', 'side=0', 'mateguard=0', 'index=lo', 'index=mul', 'replace=depth',
+             'buckets=2', 'buckets=2,replace=depth', 'buckets=2,replace=twotier',
+             'entries=512', 'entries=512,buckets=2,replace=twotier', 'entries=1024',
+             'entries=1024,buckets=2,replace=twotier', 'entries=2048', 'entries=4096']
+    return [parse_scheme(s) for s in specs]
+
+
+def grid_schemes():
+    out = []
+    for entries, index, (buckets, replace) in itertools.product(
+            (256, 512, 1024, 2048), INDEX_FUNCS,
+            ((1, 'always'), (1, 'depth'), (2, 'always'), (2, 'depth'), (2, 'twotier'))):
+        out.append(parse_scheme(f"entries={entries},index={index},buckets={buckets},replace={replace}"))
+    return out
+
+
+def pct(n, d):
+    return f"{100.0 * n / d:6.2f}%" if d else "    - "
+
+
+def report(rows, probes):
+    print(f"{'scheme':40s} {'RAM':>6s} {'match':>7s} {'hit':>7s} {'cutoff':>7s} "
+          f"{'collis':>7s} {'f.hits':>6s} {'f.cuts':>6s} {'side-rej':>11s} {'mate-rej':>11s}")
+    for scheme, st in rows:
+        print(f"{scheme_name(scheme):40s} {scheme['entries'] * TT_ENTRY_SIZE:6d} "
+              f"{pct(st['matches'], probes)} {pct(st['hits'], probes)} {pct(st['cutoffs'], probes)} "
+              f"{pct(st['false_matches'], probes)} {st['false_hits']:6d} {st['false_cutoffs']:6d} "
+              f"{st['side_rejects']:5d} ({st['side_rejects_false']:3d}f) "
+              f"{st['mate_rejects']:5d} ({st['mate_rejects_false']:3d}f)")
+
+
+def write_csv(path, rows):
+    import csv
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(list(ENGINE) + ['ram'] + list(STAT_KEYS))
+        for scheme, st in rows:
+            w.writerow([scheme[k] for k in ENGINE] + [scheme['entries'] * TT_ENTRY_SIZE]
+                       + [st[k] for k in STAT_KEYS])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    ap.add_argument('paths', nargs='*', help="traces to replay, or capture inputs")
+    ap.add_argument('--capture', metavar='OUT', help="record a trace instead of replaying")
+    ap.add_argument('--image', help="with --capture: engine listing (symbols needed)")
+    ap.add_argument('--depth', type=int, default=3)
+    ap.add_argument('--games', type=int)
+    ap.add_argument('--searches', type=int, help="non-book searches per corpus game")
+    ap.add_argument('--scheme', action='append', default=[], help="replay this scheme (repeatable)")
+    ap.add_argument('--grid', action='store_true', help="replay sizes x index x replacement")
+    ap.add_argument('--csv', help="also write one row per scheme here")
+    ap.add_argument('-j', '--jobs', type=int)
+    args = ap.parse_args()
+
+    if args.capture:
+        if not args.image or not args.image.lower().endswith('.lst'):
+            ap.error("--capture needs --image LISTING (.lst, for the TT symbols)")
+        paths = args.paths or sorted(glob.glob('elph-debug*.log'))
+        capture(args.image, game_commands(paths, args.depth, args.games, args.searches),
+                args.capture, args.depth, args.jobs)
+        return 0
+
+    if not args.paths:
+        ap.error("no trace files")
+    headers = [read_trace(p)[0] for p in args.paths]
+    schemes = [parse_scheme(s) for s in args.scheme] or (grid_schemes() if args.grid
+                                                        else default_schemes())
+    engine = parse_scheme('')
+    if engine in schemes:
+        schemes.remove(engine)
+    schemes.insert(0, engine)
+    jobs = args.jobs or int(os.environ.get('ELPH_JOBS', 0)) or os.cpu_count() or 1
+    t0 = time.time()
+    checks = [False] * len(schemes) + [True]
+    if jobs == 1:
+        stats = [_replay_traces(args.paths, s, c) for s, c in zip(schemes + [engine], checks)]
+    else:
+        with ProcessPoolExecutor(jobs) as pool:
+            stats = list(pool.map(_replay_traces, [args.paths] * len(checks),
+                                  schemes + [engine], checks))
+    check = stats.pop()
+    probes = stats[0]['probes']
+    print(f"{len(args.paths)} trace(s): {sum(h['games'] for h in headers)} games, "
+          f"{sum(h['searches'] for h in headers)} searches, {probes} probes, "
+          f"{stats[0]['stores']} stores; {len(schemes)} schemes in {time.time() - t0:.1f}s")
+    bad = check['engine_disagree']
+    old = [h['image'] for h in headers if not h.get('side_check', 1) or h.get('clear_table')]
+    print(f"replay of the captured image reproduces TT_HIT on {probes - bad}/{probes} probes"
+          + ("" if not bad else "  *** replay model and engine disagree ***"))
+    if old:
+        print(f"note: {', '.join(sorted(set(old)))} predate(s) the side check or the TT_CLEAR "
+              "fix; the engine row below is the current transposition.asm")
+    print("rates per probe; collisions = hash matches on a different position "
+          "(f.hits / f.cuts: of those, hits / cutoffs); rejects: total (f = on a different position)")
+    rows = list(zip(schemes, stats))
+    report(rows, probes)
+    if args.csv:
+        write_csv(args.csv, rows)
+        print(f"wrote {args.csv}")
+    return 1 if bad else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
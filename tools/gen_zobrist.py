@@ -11,94 +11,129 @@ Generates 16-bit pseudo-random keys for:
 Total: 781 keys x 2 bytes = 1,562 bytes
 
 Output: Assembly file with .DW directives
+
+ODD = True makes every key odd-weight (bit 15 flipped where the draw has an
+even number of set bits) and redraws repeats: no one, two or three keys can
+then XOR to zero. See
+tools/zobrist_search.py for choosing SEED / ODD against the match corpus.
+
+Usage:
+    python3 tools/gen_zobrist.py > zobrist-keys.asm
 """
 
+import functools
 import random
 import sys
 
 # Seed for reproducibility - change to get different keys
 SEED = 0x1802_CAFE
+ODD = False
+
+def odd_weight(key):
+    """`key` with bit 15 flipped if it has an even number of set bits."""
+    return key ^ 0x8000 if bin(key).count('1') % 2 == 0 else key
+
+def zobrist_keys(seed=SEED, odd=ODD):
+    """The key tables in generation order: (piece_sq, side, castle, ep) with
+    piece_sq[piece_index][square], castle[0..3] = K, Q, k, q and ep[file].
+    This is the same random sequence generate_zobrist_asm() writes out."""
+    rng = random.Random(seed)
+    used = set()
+
+    def draw():
+        key = rng.randint(0, 0xFFFF)
+        if odd:
+            while odd_weight(key) in used:
+                key = rng.randint(0, 0xFFFF)
+            key = odd_weight(key)
+            used.add(key)
+        return key
+
+    piece_sq = [[draw() for sq in range(64)] for piece in range(12)]
+    side = draw()
+    castle = [draw() for i in range(4)]
+    ep = [draw() for file in range(8)]
+    return piece_sq, side, castle, ep
+
+def generate_zobrist_asm(seed=SEED, odd=ODD, file=None):
+    piece_sq, side_key, castle_keys, ep_keys = zobrist_keys(seed, odd)
+
+    out = functools.partial(print, file=file or sys.stdout)
 
-def generate_zobrist_asm():
-    random.seed(SEED)
-
-    print("; Zobrist hash keys for transposition table")
-    print("; Generated by gen_zobrist.py")
-    print("; Seed: 0x{:08X}".format(SEED))
-    print(";")
-    print("; Piece indices:")
-    print(";   0-5:  White P, N, B, R, Q, K")
-    print(";   6-11: Black P, N, B, R, Q, K")
-    print(";")
-    print("; Square indices: 0-63 (rank*8 + file)")
-    print(";")
-    print()
+    out("; Zobrist hash keys for transposition table")
+    out("; Generated by gen_zobrist.py")
+    out("; Seed: 0x{:08X}".format(seed) + (" (odd-weight keys)" if odd else ""))
+    out(";")
+    out("; Piece indices:")
+    out(";   0-5:  White P, N, B, R, Q, K")
+    out(";   6-11: Black P, N, B, R, Q, K")
+    out(";")
+    out("; Square indices: 0-63 (rank*8 + file)")
+    out(";")
+    out()
 
     # Piece-square keys: 12 pieces x 64 squares
-    print("; ===========================================")
-    print("; Piece-Square Keys (768 x 2 bytes = 1536 bytes)")
-    print("; Access: ZOBRIST_PIECE_SQ + (piece_index * 128) + (square * 2)")
-    print("; ===========================================")
-    print("ZOBRIST_PIECE_SQ:")
+    out("; ===========================================")
+    out("; Piece-Square Keys (768 x 2 bytes = 1536 bytes)")
+    out("; Access: ZOBRIST_PIECE_SQ + (piece_index * 128) + (square * 2)")
+    out("; ===========================================")
+    out("ZOBRIST_PIECE_SQ:")
 
     piece_names = ['WhiteP', 'WhiteN', 'WhiteB', 'WhiteR', 'WhiteQ', 'WhiteK',
                    'BlackP', 'BlackN', 'BlackB', 'BlackR', 'BlackQ', 'BlackK']
 
     for piece_idx, piece_name in enumerate(piece_names):
-        print(f"; Piece {piece_idx}: {piece_name}")
+        out(f"; Piece {piece_idx}: {piece_name}")
         for sq in range(64):
             rank = sq // 8
             file = sq % 8
-            key = random.randint(0, 0xFFFF)
+            key = piece_sq[piece_idx][sq]
             file_char = chr(ord('a') + file)
             rank_char = str(rank + 1)
             if sq % 4 == 0:
-                print("    DW ", end="")
-            print(f"${key:04X}", end="")
+                out("    DW ", end="")
+            out(f"${key:04X}", end="")
             if sq % 4 == 3:
-                print(f"  ; {file_char}{rank_char}")
+                out(f"  ; {file_char}{rank_char}")
             else:
-                print(", ", end="")
-        print()
+                out(", ", end="")
+        out()
 
     # Side to move key
-    print("; ===========================================")
-    print("; Side to Move Key (1 x 2 bytes)")
-    print("; XOR when black to move")
-    print("; ===========================================")
-    print("ZOBRIST_SIDE:")
-    key = random.randint(0, 0xFFFF)
-    print(f"    DW ${key:04X}")
-    print()
+    out("; ===========================================")
+    out("; Side to Move Key (1 x 2 bytes)")
+    out("; XOR when black to move")
+    out("; ===========================================")
+    out("ZOBRIST_SIDE:")
+    out(f"    DW ${side_key:04X}")
+    out()
 
     # Castling keys (4 separate keys for K, Q, k, q)
-    print("; ===========================================")
-    print("; Castling Rights Keys (4 x 2 bytes)")
-    print("; Index: 0=K, 1=Q, 2=k, 3=q")
-    print("; ===========================================")
-    print("ZOBRIST_CASTLE:")
+    out("; ===========================================")
+    out("; Castling Rights Keys (4 x 2 bytes)")
+    out("; Index: 0=K, 1=Q, 2=k, 3=q")
+    out("; ===========================================")
+    out("ZOBRIST_CASTLE:")
     castle_names = ['WhiteKingside', 'WhiteQueenside', 'BlackKingside', 'BlackQueenside']
     for i, name in enumerate(castle_names):
-        key = random.randint(0, 0xFFFF)
-        print(f"    DW ${key:04X}  ; {name}")
-    print()
+        out(f"    DW ${castle_keys[i]:04X}  ; {name}")
+    out()
 
     # En passant file keys (8 files)
-    print("; ===========================================")
-    print("; En Passant File Keys (8 x 2 bytes)")
-    print("; Index: 0=a-file, 7=h-file")
-    print("; ===========================================")
-    print("ZOBRIST_EP:")
+    out("; ===========================================")
+    out("; En Passant File Keys (8 x 2 bytes)")
+    out("; Index: 0=a-file, 7=h-file")
+    out("; ===========================================")
+    out("ZOBRIST_EP:")
     for file in range(8):
-        key = random.randint(0, 0xFFFF)
         file_char = chr(ord('a') + file)
-        print(f"    DW ${key:04X}  ; {file_char}-file")
-    print()
+        out(f"    DW ${ep_keys[file]:04X}  ; {file_char}-file")
+    out()
 
     # Summary
     total_keys = 768 + 1 + 4 + 8
     total_bytes = total_keys * 2
-    print(f"; Total: {total_keys} keys, {total_bytes} bytes")
+    out(f"; Total: {total_keys} keys, {total_bytes} bytes")
 
 if __name__ == "__main__":
     generate_zobrist_asm()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""Corpus measurement: per-depth search timing, and a fitted iteration-time
+predictor for the iterative-deepening gate in negamax.asm.
+
+The gate (ITER_NO_SOVF, rule 3) starts depth d+1 only if
+    BF * last_iter_seconds < 180 - SEARCH_ELAPSED        (BF = 3, d >= 3)
+and an iteration still running at 180 s is aborted and thrown away. This
+tool rebuilds every ELPH search's timeline from the log's info lines (one
+per completed depth, timestamped by replay-match.py / the bridge) and
+reports:
+
+  1. Per depth: completion time from the position line, iteration time,
+     iteration nodes, and the time / node branching factor to the next depth.
+     The info line prints the low 16 bits of a cumulative node counter, so
+     counts are unwrapped with the search's own node rate (counted in the
+     report, flagged per row in --csv).
+  2. How the current gate ended each search: depth cap reached, gate stop
+     (with the budget left idle, and how often the fitted model says the
+     next depth would have fitted), or OVERSHOOT — the next iteration was
+     started and aborted at the budget, its time wasted.
+  3. The iteration-time ratio T(d+1)/T(d) fitted by phase and by material,
+     material being EG_PIECE_COUNT (non-king pieces incl. pawns, the count
+     evaluate.asm keeps; endgame < 12). Aborted iterations only bound their
+     ratio from below, so quantiles are Kaplan-Meier estimates over right-
+     censored ratios — dropping them would hide exactly the heavy tail.
+  4. Recommended gate constants: per phase, the smallest BF in half steps
+     (cheap on the 1802: shifts and adds) whose estimated overshoot rate is
+     at most --miss, with the current and recommended gates replayed over
+     every decision whose outcome the logs show.
+
+Engine times are whole RTC seconds; the gate is replayed on floor()ed log
+times, so a decision within a second of the boundary can differ from the
+engine's. A search whose depth stopped short of --cap although the replayed
+gate would have continued is counted as capped by its go depth.
+
+Usage: /tmp/chess_venv/bin/python tools/measure_depth_timing.py [logs or .elpharc...]
+       options: --budget 180  --bf 3  --cap 5  --miss 0.10
+                --csv FILE (one row per completed depth)
+Reads elph-bridge and replay-match logs alike: tools/fixtures/timing-bridge.log
+and timing-replay.log hold the same three searches in each format, and must
+give identical reports.
+Needs timestamped info lines: --no-infos archives have nothing to time.
+"""
+import argparse, csv, glob, math, os, re, statistics, sys
+
+sys.path.insert(0, "/tmp/chess_venv/lib/python3.12/site-packages")
+import chess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from elph_corpus import Metric, measure_corpus
+
+NODE_WRAP = 1 << 16     # SEND_UCI_INFO prints NODES_SEARCHED's low 16 bits
+GATE_MIN_DEPTH = 3      # rule 3 applies from depth 3
+ABORT_SLACK = 1.0       # s: a search ending this close to the budget, with
+                        # this long since its last info line, was aborted
+MIN_ITER = 0.5          # s: shorter iterations are serial latency, not search
+PHASES = (("opening", 26), ("middlegame", 12), ("endgame", 0))
+BF_STEPS = [x / 2 for x in range(3, 21)]        # 1.5 .. 10 in halves
+
+
+def phase_of(pieces):
+    for name, floor in PHASES:
+        if pieces >= floor:
+            return name
+
+
+def piece_count(board):
+    """EG_PIECE_COUNT: non-king pieces of both sides, pawns included."""
+    return chess.popcount(board.occupied) - 2
+
+
+def unwrap_nodes(raw, times):
+    """Cumulative node counts from 16-bit readings: each step adds the wraps
+    that bring it closest to the search's node rate so far. Returns
+    (counts, wrapped?)."""
+    out, wrapped, cum = [], False, 0
+    for r, t in zip(raw, times):
+        diff = (r - cum) % NODE_WRAP
+        if out and t > 1.0 and t_prev > 0 and cum:
+            expect = cum / t_prev * (t - t_prev)
+            k = max(0, round((expect - diff) / NODE_WRAP))
+            if k:
+                diff += k * NODE_WRAP
+                wrapped = True
+        cum += diff
+        t_prev = t
+        out.append(cum)
+    return out, wrapped
+
+
+class DepthTiming(Metric):
+    """Per ELPH search (book moves skipped): ply, piece count, completed
+    depths [(depth, t_done, t_iter, nodes, iter_nodes)], total time, the
+    time since the last info line, and whether node counts were unwrapped."""
+    name = "timing"
+
+    def begin(self, game):
+        super().begin(game)
+        self.rows = []
+
+    def position(self, step):
+        s = step.search
+        if s is None or s.book or s.t_position is None or s.t_bestmove is None:
+            return
+        t0 = s.t_position
+        depths, last = [], 0
+        for d, _cp, _mate, nodes, t in s.infos or ():
+            if d is None or t is None or d <= last:
+                continue
+            depths.append((d, t - t0, nodes or 0))
+            last = d
+        if not depths:
+            return
+        counts, wrapped = unwrap_nodes([n for _, _, n in depths], [t for _, t, _ in depths])
+        done, prev_t, prev_n = [], 0.0, 0
+        for (d, t, _), n in zip(depths, counts):
+            done.append((d, t, t - prev_t, n, n - prev_n))
+            prev_t, prev_n = t, n
+        total = s.t_bestmove - t0
+        self.rows.append({"ply": step.ply, "pieces": piece_count(step.board),
+                          "depths": done, "total": total, "gap": total - done[-1][1],
+                          "wrapped": wrapped})
+
+    def end(self, ok):
+        return self.rows
+
+
+def gate_continues(bf, elapsed, last_iter, budget):
+    """negamax.asm rule 3 on whole seconds: start the next depth?"""
+    remaining = budget - elapsed
+    return remaining > 0 and bf * last_iter < remaining
+
+
+def stop_reason(r, args):
+    """'cap', 'gate' or 'overshoot' for the current gate (args.bf)."""
+    d, t, t_iter = r["depths"][-1][:3]
+    if d >= args.cap:
+        return "cap"
+    if d >= GATE_MIN_DEPTH - 1 and r["total"] >= args.budget - ABORT_SLACK and r["gap"] > ABORT_SLACK:
+        return "overshoot"
+    if d < GATE_MIN_DEPTH:
+        return "cap"
+    prev = r["depths"][-2][1] if len(r["depths"]) > 1 else 0.0
+    if gate_continues(args.bf, math.floor(t), math.floor(t) - math.floor(prev), args.budget):
+        return "cap"            # the gate would have gone on: go depth was d
+    return "gate"
+
+
+def transitions(rows, args):
+    """Iteration-time ratios T(d+1)/T(d) for d >= 2: (row, d, ratio, observed).
+    An overshoot gives the censored lower bound gap / T(d)."""
+    out = []
+    for r in rows:
+        ds = r["depths"]
+        for a, b in zip(ds, ds[1:]):
+            if a[0] >= 2 and b[0] == a[0] + 1 and a[2] >= MIN_ITER:
+                out.append((r, a[0], b[2] / a[2], True))
+        last = ds[-1]
+        if r["stop"] == "overshoot" and last[0] >= 2 and last[2] >= MIN_ITER:
+            out.append((r, last[0], r["gap"] / last[2], False))
+    return out
+
+
+def km_survival(obs):
+    """Kaplan-Meier survival steps [(value, S after value)] of right-censored
+    (value, observed) pairs."""
+    steps, s = [], 1.0
+    at_risk = len(obs)
+    for v, seen in sorted(obs, key=lambda o: (o[0], not o[1])):
+        if seen:
+            s *= 1 - 1 / at_risk
+            steps.append((v, s))
+        at_risk -= 1
+    return steps
+
+
+def km_exceed(steps, x):
+    """P(ratio > x) from km_survival steps."""
+    s = 1.0
+    for v, sv in steps:
+        if v > x:
+            break
+        s = sv
+    return s
+
+
+def km_quantile(steps, q):
+    """Smallest ratio with P(ratio <= it) >= q, or None if the censoring
+    leaves the tail unknown."""
+    for v, sv in steps:
+        if 1 - sv >= q - 1e-12:
+            return v
+    return None
+
+
+def fmt_q(v):
+    return f"{v:6.2f}" if v is not None else "     >"
+
+
+def recommend(obs, miss):
+    """Smallest half-step BF whose estimated overshoot rate <= miss."""
+    steps = km_survival(obs)
+    for bf in BF_STEPS:
+        if km_exceed(steps, bf) <= miss:
+            return bf
+    return None
+
+
+def replay_gate(rows, bf_for, args):
+    """Replay a gate (bf_for(row) -> BF) over every decision point whose
+    outcome the log shows. Counts: go-fit (started, finished in budget),
+    go-overshoot, stop-idle (stopped though the next depth was logged to fit
+    — only where the engine went on), stop-ok, unknown (engine stopped
+    there, so the next depth's time was never seen)."""
+    c = dict.fromkeys(("go-fit", "go-overshoot", "stop-idle", "stop-ok", "unknown"), 0)
+    waste = idle = 0.0
+    for r in rows:
+        ds = r["depths"]
+        for i, (d, t, t_iter, _, _) in enumerate(ds):
+            if d < GATE_MIN_DEPTH or d >= args.cap:
+                continue
+            prev = ds[i - 1][1] if i else 0.0
+            go = gate_continues(bf_for(r), math.floor(t), math.floor(t) - math.floor(prev),
+                                args.budget)
+            if i + 1 < len(ds):
+                fits = True
+            elif r["stop"] == "overshoot":
+                fits = False
+            else:
+                c["unknown"] += 1
+                continue
+            if go and fits:
+                c["go-fit"] += 1
+            elif go:
+                c["go-overshoot"] += 1
+                waste += args.budget - t
+            elif fits:
+                c["stop-idle"] += 1
+                idle += args.budget - t
+            else:
+                c["stop-ok"] += 1
+    return c, waste, idle
+
+
+def pct(a, b):
+    return f"{100 * a / b:5.1f}%" if b else "    -"
+
+
+def med(xs):
+    return statistics.median(xs) if xs else None
+
+
+def p90(xs):
+    return sorted(xs)[int(0.9 * (len(xs) - 1))] if xs else None
+
+
+def num(v, f="8.1f"):
+    """format(v, f), or "-" right-aligned to f's width (none: just "-")."""
+    if v is not None:
+        return format(v, f)
+    return "-".rjust(int(re.match(r"\d*", f).group() or 0))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    ap.add_argument("logs", nargs="*", help="logs or .elpharc (default ./elph-debug*.log)")
+    ap.add_argument("--budget", type=int, default=180, help="search budget, s (180)")
+    ap.add_argument("--bf", type=float, default=3, help="current gate BF (3)")
+    ap.add_argument("--cap", type=int, default=5, help="hard depth cap (5)")
+    ap.add_argument("--miss", type=float, default=0.10,
+                    help="overshoot rate the recommended BF may allow (0.10)")
+    ap.add_argument("--csv", metavar="FILE", help="write one row per completed depth")
+    args = ap.parse_args()
+    logs = args.logs or sorted(glob.glob("elph-debug*.log"))
+
+    rows = []
+    for path, res in measure_corpus(logs, [DepthTiming]):
+        for r in res["timing"]:
+            r["path"] = path
+            r["phase"] = phase_of(r["pieces"])
+            r["stop"] = stop_reason(r, args)
+            rows.append(r)
+    if not rows:
+        sys.exit("no timed searches found")
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["file", "ply", "pieces", "phase", "depth", "t_done", "t_iter",
+                        "nodes", "iter_nodes", "nodes_unwrapped", "stop", "total"])
+            for r in rows:
+                for d, t, ti, n, ni in r["depths"]:
+                    w.writerow([os.path.basename(r["path"]), r["ply"], r["pieces"], r["phase"],
+                                d, f"{t:.3f}", f"{ti:.3f}", n, ni, int(r["wrapped"]),
+                                r["stop"], f"{r['total']:.3f}"])
+
+    n = len(rows)
+    print(f"searches: {n} timed (book moves skipped), "
+          f"{sum(r['wrapped'] for r in rows)} with unwrapped node counts")
+
+    # ---- 1. per depth ----
+    print(f"\n{'depth':>5} {'n':>6} {'done med':>9} {'done p90':>9} {'iter med':>9} "
+          f"{'nodes med':>10} {'knps':>6} {'BF time':>8} {'BF nodes':>9}")
+    by_depth = {}
+    for r in rows:
+        for i, x in enumerate(r["depths"]):
+            by_depth.setdefault(x[0], []).append((x, r["depths"][i + 1] if i + 1 < len(r["depths"]) else None))
+    for d in sorted(by_depth):
+        xs = by_depth[d]
+        bft = [b[2] / a[2] for a, b in xs if b and a[2] >= MIN_ITER]
+        bfn = [b[4] / a[4] for a, b in xs if b and a[4] > 0]
+        rate = [a[4] / a[2] / 1000 for a, _ in xs if a[2] >= MIN_ITER]
+        print(f"{d:5d} {len(xs):6d} {num(med([a[1] for a, _ in xs]), '9.1f')} "
+              f"{num(p90([a[1] for a, _ in xs]), '9.1f')} {num(med([a[2] for a, _ in xs]), '9.1f')} "
+              f"{num(med([a[4] for a, _ in xs]), '10.0f')} {num(med(rate), '6.2f')} "
+              f"{num(med(bft), '8.2f')} {num(med(bfn), '9.2f')}")
+
+    # ---- 3. fit (before 2: the idle check uses it) ----
+    trans = transitions(rows, args)
+    fit = {}
+    print(f"\n== ITERATION-TIME RATIO T(d+1)/T(d) (Kaplan-Meier; '>' = tail censored) ==")
+    print(f"{'group':24s} {'n':>5} {'cens':>5} {'median':>6} {'p75':>6} {'p90':>6} {'p95':>6}")
+    groups = [(f"{ph} d{d}->{d + 1}", [(x, ok) for r, dd, x, ok in trans
+                                         if r["phase"] == ph and dd == d])
+              for ph, _ in PHASES for d in range(2, args.cap)]
+    groups += [(f"{ph} (all d>={GATE_MIN_DEPTH})", [(x, ok) for r, dd, x, ok in trans
+                                                    if r["phase"] == ph and dd >= GATE_MIN_DEPTH])
+               for ph, _ in PHASES]
+    groups.append((f"all (d>={GATE_MIN_DEPTH})", [(x, ok) for _, dd, x, ok in trans
+                                                   if dd >= GATE_MIN_DEPTH]))
+    for name, obs in groups:
+        if not obs:
+            continue
+        steps = km_survival(obs)
+        fit[name] = obs
+        print(f"{name:24s} {len(obs):5d} {sum(not ok for _, ok in obs):5d} "
+              + " ".join(fmt_q(km_quantile(steps, q)) for q in (0.5, 0.75, 0.9, 0.95)))
+
+    print(f"\nby material (EG_PIECE_COUNT, d>={GATE_MIN_DEPTH}):")
+    print(f"{'pieces':>8} {'n':>5} {'cens':>5} {'median':>6} {'p90':>6}")
+    for lo in range(28, -1, -4):
+        obs = [(x, ok) for r, dd, x, ok in trans
+               if dd >= GATE_MIN_DEPTH and lo <= r["pieces"] < lo + 4]
+        if obs:
+            steps = km_survival(obs)
+            print(f"{lo:>4}-{lo + 3:<3} {len(obs):5d} {sum(not ok for _, ok in obs):5d} "
+                  f"{fmt_q(km_quantile(steps, 0.5))} {fmt_q(km_quantile(steps, 0.9))}")
+    pts = [(r["pieces"], math.log(x)) for r, dd, x, ok in trans if ok and dd >= GATE_MIN_DEPTH and x > 0]
+    if len(pts) >= 3 and len({p for p, _ in pts}) > 1:
+        mx, my = statistics.mean(p for p, _ in pts), statistics.mean(y for _, y in pts)
+        b = sum((p - mx) * (y - my) for p, y in pts) / sum((p - mx) ** 2 for p, _ in pts)
+        a = my - b * mx
+        print(f"log-linear (completed only): ratio ~= {math.exp(a):.2f} * {math.exp(b):.4f}^pieces"
+              f"  (x{math.exp(b * 10):.2f} per 10 pieces)")
+
+    # ---- 2. how the current gate ended each search ----
+    typical = {ph: km_quantile(km_survival(fit[k]), 0.5) if (k := f"{ph} (all d>={GATE_MIN_DEPTH})") in fit
+               else None for ph, _ in PHASES}
+    print(f"\n== CURRENT GATE (BF {args.bf:g}, budget {args.budget} s, cap {args.cap}) ==")
+    for reason in ("cap", "gate", "overshoot"):
+        rs = [r for r in rows if r["stop"] == reason]
+        line = f"{reason:10s} {len(rs):6d} {pct(len(rs), n)}"
+        if reason == "gate" and rs:
+            idle = [args.budget - r["total"] for r in rs]
+            likely = 0
+            for r in rs:
+                m, (_, t, t_iter, _, _) = typical[r["phase"]], r["depths"][-1]
+                likely += m is not None and t + m * t_iter < args.budget
+            line += (f"   idle budget med {med(idle):.0f} s, total {sum(idle) / 3600:.1f} h;"
+                     f" next depth would likely have fitted (median ratio): {likely}"
+                     f" ({pct(likely, len(rs)).strip()})")
+        if reason == "overshoot" and rs:
+            wasted = [r["gap"] for r in rs]
+            line += (f"   wasted (aborted iteration) med {med(wasted):.0f} s,"
+                     f" total {sum(wasted) / 3600:.1f} h")
+        print(line)
+
+    # ---- 4. recommendation ----
+    print(f"\n== RECOMMENDED GATE BF (overshoot rate <= {args.miss:.0%}, half steps) ==")
+    rec = {}
+    for ph, floor in PHASES:
+        obs = fit.get(f"{ph} (all d>={GATE_MIN_DEPTH})")
+        rec[ph] = recommend(obs, args.miss) if obs else None
+        per_d = "  ".join(f"d{d}->{d + 1}: {num(recommend(fit[k], args.miss), '.1f')}"
+                          for d in range(GATE_MIN_DEPTH, args.cap)
+                          if (k := f"{ph} d{d}->{d + 1}") in fit)
+        print(f"{ph:11s} (pieces >= {floor:2d})  BF {num(rec[ph], '.1f'):>4}   {per_d}")
+    obs = fit.get(f"all (d>={GATE_MIN_DEPTH})")
+    single = recommend(obs, args.miss) if obs else None
+    print(f"single constant            BF {num(single, '.1f'):>4}")
+
+    print(f"\ngate replayed over logged decisions (d>={GATE_MIN_DEPTH}):")
+    print(f"{'gate':24s} {'go-fit':>7} {'go-over':>8} {'stop-idle':>10} {'stop-ok':>8} "
+          f"{'unknown':>8} {'wasted h':>9} {'idle h':>7}")
+    gates = [(f"current BF {args.bf:g}", lambda r: args.bf)]
+    if single is not None:
+        gates.append((f"single BF {single:g}", lambda r: single))
+    if all(v is not None for v in rec.values()):
+        gates.append(("per phase " + "/".join(f"{rec[ph]:g}" for ph, _ in PHASES),
+                      lambda r: rec[r["phase"]]))
+    for name, bf_for in gates:
+        c, waste, idle = replay_gate(rows, bf_for, args)
+        print(f"{name:24s} {c['go-fit']:7d} {c['go-overshoot']:8d} {c['stop-idle']:10d} "
+              f"{c['stop-ok']:8d} {c['unknown']:8d} {waste / 3600:9.2f} {idle / 3600:7.2f}")
+    print("(unknown: the engine stopped there, so whether the next depth fits is unseen)")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,70 +16,75 @@ Also reports whether the enemy actually promoted and how far the eval fell
 within 6 plies after promotion (the "cliff").
 
 Usage: /tmp/chess_venv/bin/python tools/measure_enemy_runner_blindness.py <logs...>
+Uses each search's last cp score (--no-infos archives work); ELPH's colour
+is the side to move at its first search with a score.
 """
-import re, sys
+import os, re, sys
 
 sys.path.insert(0, "/tmp/chess_venv/lib/python3.12/site-packages")
 import chess
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from elph_corpus import Metric, measure_corpus, run_metrics
 
-def parse(txt):
+PROMO_SUFFIX = re.compile(r"^[a-h][1-8][a-h][1-8][qrbn]$")
+
+
+def parse(game):
     """return (evals_by_prefix_len, final_moves). evals use the deepest info line."""
-    evals, pos, ev, final = {}, None, None, []
-    for line in txt.splitlines():
-        if "TX: 'position startpos" in line:
-            m = re.search(r"position startpos(?: moves ([a-h1-8qrbnk ]+))?'", line)
-            if m:
-                pos = m.group(1).split() if m.group(1) else []
-                ev = None
-            continue
-        if "RX: 'info" in line:
-            m = re.search(r"score cp (-?\d+)", line)
-            if m:
-                ev = int(m.group(1))
-            continue
-        if "RX: 'bestmove" in line and pos is not None:
-            m = re.search(r"bestmove (\S+?)'", line)
-            if m:
-                if ev is not None:
-                    evals[len(pos)] = ev
-                final = pos + [m.group(1)]
-            pos = None
-    return evals, final
-
-
-def analyze(path):
-    evals, moves = parse(open(path, errors="replace").read())
-    if not moves or not evals:
-        return None
-    elph_white = min(evals) % 2 == 0 if evals else True
-    enemy_is_white = not elph_white
-    penult_rank = 6 if enemy_is_white else 1          # rank index 0-7
-    promo_suffix = re.compile(r"^[a-h][1-8][a-h][1-8][qrbn]$")
-
-    board = chess.Board()
-    first_deep = None       # ply where an enemy pawn first reaches penultimate rank
-    promo_ply = None        # ply of the enemy promotion move (if any)
-    for i, mv in enumerate(moves):
-        enemy_move = (i % 2 == 1) if elph_white else (i % 2 == 0)
-        if enemy_move and promo_ply is None and promo_suffix.match(mv):
-            promo_ply = i + 1
-        try:
-            board.push_uci(mv)
-        except Exception:
-            return None
-        if first_deep is None:
-            for sq in board.pieces(chess.PAWN, enemy_is_white):
-                if chess.square_rank(sq) == penult_rank:
-                    first_deep = i + 1
+    evals = {s.ply: s.eval for s in game.searches if s.eval is not None}
+    return evals, game.final_moves() if game.searches else []
+
+
+class RunnerBlindness(Metric):
+    """Enemy runner window vs ELPH's evals, over the final movelist."""
+    name = "runner"
+
+    def begin(self, game):
+        super().begin(game)
+        self.evals, moves = parse(game)
+        self.final_plies = len(moves)
+        self.elph_white = min(self.evals) % 2 == 0 if self.evals else True
+        self.enemy_is_white = not self.elph_white
+        self.penult_rank = 6 if self.enemy_is_white else 1     # rank index 0-7
+        self.first_deep = None  # ply where an enemy pawn first reaches penultimate rank
+        self.promo_ply = None   # ply of the enemy promotion move (if any)
+        self.dead = False       # illegal move before both were found
+
+    def position(self, step):
+        i = step.ply
+        if self.dead or i > self.final_plies:
+            return
+        if i >= 1 and self.first_deep is None:
+            for sq in step.board.pieces(chess.PAWN, self.enemy_is_white):
+                if chess.square_rank(sq) == self.penult_rank:
+                    self.first_deep = i
                     break
-        if first_deep is not None and promo_ply is not None:
-            break
+        if i == self.final_plies:
+            return
+        if step.move is None:
+            self.dead = self.first_deep is None or self.promo_ply is None
+            return
+        enemy_move = (i % 2 == 1) if self.elph_white else (i % 2 == 0)
+        if enemy_move and self.promo_ply is None and PROMO_SUFFIX.match(step.move.uci()):
+            self.promo_ply = i + 1
+
+    def end(self, ok):
+        if self.dead or not self.final_plies or not self.evals:
+            return None
+        return runner_row(self.game.path, self.evals, self.final_plies,
+                          self.first_deep, self.promo_ply)
+
+
+def analyze(game):
+    return run_metrics(game, [RunnerBlindness()])["runner"]
 
+
+def runner_row(path, evals, n_moves, first_deep, promo_ply):
     if first_deep is None:
         return {"path": path, "event": False}
 
-    window_end = promo_ply if promo_ply is not None else len(moves)
+    window_end = promo_ply if promo_ply is not None else n_moves
     window = [e for p, e in evals.items() if first_deep <= p <= window_end]
     after = [e for p, e in evals.items() if promo_ply and promo_ply <= p <= promo_ply + 6]
     if not window:
@@ -96,12 +101,8 @@ def analyze(path):
 
 def main(paths):
     rows, dead = [], 0
-    for p in paths:
-        try:
-            r = analyze(p)
-        except Exception as e:
-            print(f"{p}: ERR {e}", file=sys.stderr)
-            continue
+    for _, res in measure_corpus(paths, [RunnerBlindness], infos=False):
+        r = res["runner"]
         if r is None:
             dead += 1
             continue
@@ -7,50 +7,69 @@ died on d4 as a forced mate-block). Key finding at birth (173 games):
   - CHECKS are the discriminator: W 0.73/game median 0 (58% of games the
     white queen never checks) vs B 2.40/game — 3.3x asymmetry.
 Run with the project venv python: venv/bin/python (needs python-chess).
+Counts over the longest position line each log sent (ELPH's last move
+excluded); games under 20 plies are skipped.
 See memory: weak_queen_must_revisit.
 """
-import re, glob, chess, statistics, sys
-
-logs = sys.argv[1:] or sorted(glob.glob('elph-debug*.log'))
-rows = []
-for path in logs:
-    try: text = open(path, errors='replace').read()
-    except OSError: continue
-    best = ""
-    for m in re.finditer(r"TX: 'position startpos moves ([a-h1-8qrbn ]+)'", text):
-        if len(m.group(1)) > len(best): best = m.group(1)
-    moves = best.split()
-    if len(moves) < 20: continue
-    b = chess.Board(); wc = bc = wch = bch = wm = bm = 0; ok = True
-    for mv in moves:
-        m = chess.Move.from_uci(mv)
-        if m not in b.legal_moves: ok = False; break
+import glob, chess, os, statistics, sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from elph_corpus import Metric, measure_corpus
+
+
+class QueenActivity(Metric):
+    """(plies, W queen moves/captures/checks, B moves/captures/checks) over
+    the longest position line sent, or None if it has an illegal move."""
+    name = "queen"
+
+    def begin(self, game):
+        super().begin(game)
+        self.n = len(game.moves)        # the longest position line sent
+        self.c = [0] * 6                # wm wc wch bm bc bch
+        self.pending = None             # colour whose queen just moved
+        self.ok = True
+
+    def position(self, step):
+        b = step.board
+        if self.pending is not None and b.is_check():
+            self.c[2 if self.pending else 5] += 1
+        self.pending = None
+        if step.ply >= self.n:
+            return
+        m = step.move
+        if m is None:
+            self.ok = False; return
         p = b.piece_at(m.from_square)
-        isq = p and p.piece_type == chess.QUEEN
-        white = b.turn
-        if isq:
-            if white: wm += 1
-            else: bm += 1
+        if p and p.piece_type == chess.QUEEN:
+            white = b.turn
+            self.c[0 if white else 3] += 1
             if b.is_capture(m):
-                if white: wc += 1
-                else: bc += 1
-        b.push(m)
-        if isq and b.is_check():
-            if white: wch += 1
-            else: bch += 1
-    if not ok: continue
-    rows.append((path, len(moves), wm, wc, wch, bm, bc, bch))
-
-if not rows:
-    sys.exit("no usable games found")
-n = len(rows)
-def col(i): return [r[i] for r in rows]
-print(f"games: {n}")
-print(f"{'':14}{'moves':>8}{'captures':>10}{'checks':>8}{'zero-cap':>10}{'zero-chk':>10}")
-for side, mi, ci, chi in (("WHITE (ELPH)",2,3,4), ("BLACK (SF)",5,6,7)):
-    print(f"{side:<14}{statistics.mean(col(mi)):8.2f}{statistics.mean(col(ci)):10.2f}"
-          f"{statistics.mean(col(chi)):8.2f}{sum(1 for c in col(ci) if c==0):>7}/{n}"
-          f"{sum(1 for c in col(chi) if c==0):>7}/{n}")
-print("\nBusiest zero-capture white queens (moves desc):")
-for r in sorted((r for r in rows if r[3]==0), key=lambda r:-r[2])[:5]:
-    print(f"  {r[0][:60]:<60} Qmoves {r[2]}, checks {r[4]}")
+                self.c[1 if white else 4] += 1
+            self.pending = white
+
+    def end(self, ok):
+        if not self.ok or self.n < 20: return None
+        return (self.n,) + tuple(self.c)
+
+
+def main():
+    logs = sys.argv[1:] or sorted(glob.glob('elph-debug*.log'))
+    rows = [(path,) + r["queen"] for path, r in measure_corpus(logs, [QueenActivity], infos=False)
+            if r["queen"] is not None]
+
+    if not rows:
+        sys.exit("no usable games found")
+    n = len(rows)
+    def col(i): return [r[i] for r in rows]
+    print(f"games: {n}")
+    print(f"{'':14}{'moves':>8}{'captures':>10}{'checks':>8}{'zero-cap':>10}{'zero-chk':>10}")
+    for side, mi, ci, chi in (("WHITE (ELPH)",2,3,4), ("BLACK (SF)",5,6,7)):
+        print(f"{side:<14}{statistics.mean(col(mi)):8.2f}{statistics.mean(col(ci)):10.2f}"
+              f"{statistics.mean(col(chi)):8.2f}{sum(1 for c in col(ci) if c==0):>7}/{n}"
+              f"{sum(1 for c in col(chi) if c==0):>7}/{n}")
+    print("\nBusiest zero-capture white queens (moves desc):")
+    for r in sorted((r for r in rows if r[3]==0), key=lambda r:-r[2])[:5]:
+        print(f"  {r[0][:60]:<60} Qmoves {r[2]}, checks {r[4]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,20 @@
 
 Reads DB entries from each file, sorts all entries by ply (for early-exit
 efficiency in the linear scan lookup), deduplicates, and writes a combined
-opening-book.asm.
+opening-book.asm. With --trie the merged book is written in the prefix-trie
+format instead (shared move prefixes stored once; read by
+opening-book-trie-lookup.asm), and the byte savings are reported.
 
-Usage: merge_books.py output.asm input1.asm input2.asm ...
+Usage: merge_books.py [--trie] output.asm input1.asm input2.asm ...
 """
 
+import os
 import sys
 import re
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from pgn_to_book import TRIE_MARKER, build_trie, read_book, trie_asm_lines, trie_report
+
 def parse_book_file(filename):
     """Parse DB entries from a generated book .asm file.
     Returns list of (ply, comment, db_line) tuples."""
@@ -40,19 +46,39 @@ def parse_book_file(filename):
 
     return entries
 
+def db_entry(db_line, comment):
+    """(position, response, count) of one DB line and its '; Ply' comment."""
+    data = [int(b.strip().replace('$', '0x'), 16) for b in db_line[3:].split(',')]
+    moves, resp = data[1:-2], data[-2:]
+    m = re.search(r'\((\d+)x\)', comment)
+    return list(zip(moves[::2], moves[1::2])), tuple(resp), int(m.group(1)) if m else 0
+
 def main():
-    if len(sys.argv) < 3:
-        print(f"Usage: {sys.argv[0]} output.asm input1.asm input2.asm ...")
+    args = sys.argv[1:]
+    trie = '--trie' in args
+    if trie:
+        args.remove('--trie')
+    if len(args) < 2:
+        print(f"Usage: {sys.argv[0]} [--trie] output.asm input1.asm input2.asm ...")
         sys.exit(1)
 
-    output_file = sys.argv[1]
-    input_files = sys.argv[2:]
+    output_file = args[0]
+    input_files = args[1:]
 
     # Collect all entries from all files
     all_entries = []
     sources = []
     for filename in input_files:
         entries = parse_book_file(filename)
+        if trie:
+            # Every entry byte-exact (also uncommented ones, and trie inputs)
+            entries = []
+            for position, resp, count in read_book(filename):
+                pos_str = ' '.join(f"{f:02X}-{t:02X}" for f, t in position)
+                data = [f"${len(position):02X}"] + [f"${b:02X}" for m in position for b in m] + \
+                       [f"${resp[0]:02X}", f"${resp[1]:02X}"]
+                entries.append((len(position), f"; Ply {len(position)}: {pos_str} -> "
+                                f"{resp[0]:02X}-{resp[1]:02X} ({count}x)", f"DB {', '.join(data)}"))
         # Extract opening name from filename
         name = filename.rsplit('/', 1)[-1].replace('.asm', '')
         sources.append(f"{name}: {len(entries)} entries")
@@ -81,6 +107,12 @@ def main():
         total_bytes += byte_count
     total_bytes += 1  # $FF terminator
 
+    if trie:
+        book = [db_entry(db_line, comment) for _, comment, db_line in unique_entries]
+        root, shadowed = build_trie(book)
+        report = trie_report(book, root, shadowed)
+        trie_lines, total_bytes = trie_asm_lines(root)
+
     # Write merged output
     with open(output_file, 'w') as f:
         f.write('; ==============================================================================\n')
@@ -92,28 +124,41 @@ def main():
             f.write(f';   {s}\n')
         f.write('; ==============================================================================\n')
         f.write('\n')
-        f.write('; Book format:\n')
-        f.write(';   Each entry: [ply] [move1_from] [move1_to] ... [response_from] [response_to] [$FF terminator]\n')
-        f.write(';   Entries sorted by ply for efficient early-exit\n')
-        f.write('\n')
-        f.write('OPENING_BOOK:\n')
-
-        current_ply = -1
-        for ply, comment, db_line in unique_entries:
-            if ply != current_ply:
-                f.write(f'\n    ; === Ply {ply} ===\n')
-                current_ply = ply
-            f.write(f'    {comment}\n')
-            f.write(f'    {db_line}\n')
-
-        f.write('\n; End of book marker\n')
-        f.write('    DB $FF\n')
+        if trie:
+            f.write(f'{TRIE_MARKER} (opening-book-trie-lookup.asm)\n')
+            f.write(';   node: [response_from] [response_to] [n_children]\n')
+            f.write(';         n_children x ([move_from] [move_to] DW child), $FF = no response\n')
+            for r in report:
+                f.write(f';   {r.strip()}\n')
+            f.write('\n')
+            for line in trie_lines:
+                f.write(f'{line}\n')
+        else:
+            f.write('; Book format:\n')
+            f.write(';   Each entry: [ply] [move1_from] [move1_to] ... [response_from] [response_to] [$FF terminator]\n')
+            f.write(';   Entries sorted by ply for efficient early-exit\n')
+            f.write('\n')
+            f.write('OPENING_BOOK:\n')
+
+            current_ply = -1
+            for ply, comment, db_line in unique_entries:
+                if ply != current_ply:
+                    f.write(f'\n    ; === Ply {ply} ===\n')
+                    current_ply = ply
+                f.write(f'    {comment}\n')
+                f.write(f'    {db_line}\n')
+
+            f.write('\n; End of book marker\n')
+            f.write('    DB $FF\n')
         f.write(f'\n; Total size: {total_bytes} bytes\n')
 
     print(f"Merged {len(all_entries)} entries from {len(input_files)} files")
     print(f"Duplicates removed: {dupes}")
     print(f"Final entries: {len(unique_entries)}")
     print(f"Total size: {total_bytes} bytes")
+    if trie:
+        for r in report:
+            print(r)
     print(f"Wrote {output_file}")
 
 if __name__ == '__main__':
@@ -7,12 +7,15 @@ USAGE:
     python3 tools/oob_exit.py [path/to/elph-debug.log]
 
 If no path given, defaults to /home/phiber/proj-chess/elph-debug.log.
+The log is read through the corpus store (tools/elph_corpus.py).
 
 A move is "OOB" (out of book) if the engine emitted any `info depth` line
 between the position TX and the bestmove RX — i.e., it actually searched
 rather than instant-playing from the book.
 """
-import re, sys, os
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from elph_corpus import open_corpus
 
 LOG = sys.argv[1] if len(sys.argv) > 1 else "/home/phiber/proj-chess/elph-debug.log"
 
@@ -29,41 +32,17 @@ def main():
         print(f"ERROR: {LOG} not found", file=sys.stderr)
         return 1
 
-    pos_re = re.compile(r"TX: 'position startpos(?: moves (.+?))?'")
-    bm_re  = re.compile(r"RX: 'bestmove (\S+)'")
-    info_re = re.compile(r"RX: 'info depth")
-
-    last_position = ""
-    pending_search = False
     first_oob_position = None
     first_oob_move = None
+    first_oob_search_d = None
     first_oob_search_seconds = None
-    last_info_d = 0
-
-    with open(LOG, errors='ignore') as f:
-        for line in f:
-            mp = pos_re.search(line)
-            if mp:
-                last_position = mp.group(1) or ""
-                pending_search = False
-                last_info_d = 0
-                continue
-            mi = info_re.search(line)
-            if mi:
-                pending_search = True
-                m_d = re.search(r"info depth (\d+)", line)
-                if m_d:
-                    last_info_d = max(last_info_d, int(m_d.group(1)))
-                continue
-            mb = bm_re.search(line)
-            if mb and pending_search and first_oob_position is None:
-                first_oob_position = last_position
-                first_oob_move = mb.group(1)
-                first_oob_search_d = last_info_d
-                # Get timestamp from log line for context
-                m_ts = re.match(r"^\[(\d+):(\d+\.\d+)\]", line)
-                if m_ts:
-                    first_oob_search_seconds = int(m_ts.group(1)) * 60 + float(m_ts.group(2))
+    for game in open_corpus([LOG]).games([LOG], infos=False):
+        for s in game.searches:
+            if s.n_info and first_oob_position is None:
+                first_oob_position = ' '.join(s.moves)
+                first_oob_move = s.bestmove
+                first_oob_search_d = s.depth or 0
+                first_oob_search_seconds = s.t_bestmove
 
     if first_oob_position is None:
         print("No OOB exit yet — match is still in book or hasn't searched.")
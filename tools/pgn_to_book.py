@@ -3,11 +3,31 @@
 PGN to Opening Book Converter for RCA 1802 Chess Engine
 
 Parses PGN files and generates compact opening book in assembly format.
+
+Large databases are streamed: games are read one at a time (plain .pgn, or
+every .pgn member of a .zip, decompressed on the fly), SAN is resolved with
+precomputed 0x88 attack tables and per-piece square lists, and batches of
+games are counted in a process pool. Position counts are spilled to hashed
+shard files once the in-memory tree passes --spill positions; a shard that
+received more than --spill entries is re-split by a second hash until none
+does, and each is then merged on its own, so neither phase ever holds more
+than --spill positions whatever the input size.
+
+Usage: pgn_to_book.py <pgn_or_zip>... [max_ply] [min_frequency] [output.asm]
+       options: -j JOBS (default one per core), --shards 16, --spill 500000,
+                --trie (prefix-trie book for opening-book-trie-lookup.asm)
 """
 
+import argparse
+import io
+import os
+import pickle
 import re
 import sys
-from collections import defaultdict
+import tempfile
+import zipfile
+import zlib
+from collections import defaultdict, deque
 
 # Square name to 0x88 index
 def square_to_0x88(sq_name):
@@ -16,6 +36,28 @@ def square_to_0x88(sq_name):
     rank = int(sq_name[1]) - 1          # 0-7
     return rank * 16 + file
 
+# 0x88 attack tables, indexed by to_sq - from_sq + 119. In 0x88 a square
+# difference identifies its direction uniquely, so ATTACK says which piece
+# types can make that step on an empty board and STEP is the unit step a
+# slider takes along it.
+PIECE_BIT = {'P': 1, 'N': 2, 'B': 4, 'R': 8, 'Q': 16, 'K': 32}
+ATTACK = [0] * 239
+STEP = [0] * 239
+
+def init_attack_tables():
+    for d in (33, 31, 18, 14, -14, -18, -31, -33):
+        ATTACK[d + 119] |= PIECE_BIT['N']
+    for d in (1, -1, 16, -16, 15, 17, -15, -17):
+        ATTACK[d + 119] |= PIECE_BIT['K']
+    for dirs, bits in (((1, -1, 16, -16), PIECE_BIT['R'] | PIECE_BIT['Q']),
+                       ((15, 17, -15, -17), PIECE_BIT['B'] | PIECE_BIT['Q'])):
+        for d in dirs:
+            for n in range(1, 8):
+                ATTACK[d * n + 119] |= bits
+                STEP[d * n + 119] = d
+
+init_attack_tables()
+
 def parse_moves(movetext):
     """Extract moves from PGN movetext, stripping annotations."""
     movetext = re.sub(r'\{[^}]*\}', '', movetext)
@@ -27,22 +69,43 @@ def parse_moves(movetext):
     moves = movetext.split()
     return [m.strip() for m in moves if m.strip()]
 
+def open_pgn_streams(filename):
+    """Yield text streams for a .pgn file, or for every .pgn in a .zip."""
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(filename) as z:
+            for name in z.namelist():
+                if name.lower().endswith('.pgn'):
+                    with z.open(name) as raw:
+                        yield io.TextIOWrapper(raw, encoding='latin-1')
+    else:
+        with open(filename, 'r', encoding='latin-1') as f:
+            yield f
+
+def iter_movetexts(filename):
+    """Stream the movetext of each game, one game in memory at a time.
+    Games set up from a FEN are skipped (the book starts from startpos)."""
+    for f in open_pgn_streams(filename):
+        text, fen = [], False
+        for line in f:
+            line = line.strip()
+            if line.startswith('['):
+                if text:
+                    if not fen:
+                        yield ' '.join(text)
+                    text, fen = [], False
+                if line.startswith('[FEN '):
+                    fen = True
+            elif line:
+                text.append(line)
+        if text and not fen:
+            yield ' '.join(text)
+
 def parse_pgn(filename):
     """Parse PGN file and yield lists of moves for each game."""
-    with open(filename, 'r', encoding='latin-1') as f:
-        content = f.read()
-
-    games = re.split(r'\n(?=\[Event )', content)
-
-    for game in games:
-        if not game.strip():
-            continue
-        match = re.search(r'\]\s*\n\s*\n?(1\..*)', game, re.DOTALL)
-        if match:
-            movetext = match.group(1)
-            moves = parse_moves(movetext)
-            if moves:
-                yield moves
+    for movetext in iter_movetexts(filename):
+        moves = parse_moves(movetext)
+        if moves:
+            yield moves
 
 def move_to_squares(move, board_state):
     """
@@ -62,7 +125,7 @@ def move_to_squares(move, board_state):
             return (0x74, 0x72)  # e8-c8
 
     # Pawn moves
-    if re.match(r'^[a-h][1-8]$', move):
+    if re.match(r'^[a-h][1-8](=?[QRBN])?$', move):
         to_file = ord(move[0]) - ord('a')
         to_rank = int(move[1]) - 1
         to_sq = to_rank * 16 + to_file
@@ -107,90 +170,75 @@ def move_to_squares(move, board_state):
         to_sq_name = piece_match.group(5)
         to_sq = square_to_0x88(to_sq_name)
 
-        # Find the piece on the board
+        # Find the piece on the board (its square list, not a board scan)
         search_piece = piece if board_state['white_to_move'] else piece.lower()
         candidates = []
 
-        for sq, p in board_state['board'].items():
-            if p == search_piece:
-                # Check disambiguation
-                sq_file = sq % 16
-                sq_rank = sq // 16
-                if disambig_file and sq_file != ord(disambig_file) - ord('a'):
-                    continue
-                if disambig_rank and sq_rank != int(disambig_rank) - 1:
-                    continue
-                # Basic move validation
-                if can_piece_reach(piece, sq, to_sq, board_state['board']):
-                    candidates.append(sq)
-
-        if len(candidates) == 1:
-            return (candidates[0], to_sq)
-        elif len(candidates) > 1:
-            # Multiple candidates that can reach - ambiguous, take first
+        for sq in board_state['pieces'][search_piece]:
+            # Check disambiguation
+            sq_file = sq % 16
+            sq_rank = sq // 16
+            if disambig_file and sq_file != ord(disambig_file) - ord('a'):
+                continue
+            if disambig_rank and sq_rank != int(disambig_rank) - 1:
+                continue
+            # Basic move validation
+            if can_piece_reach(piece, sq, to_sq, board_state['board']):
+                candidates.append(sq)
+
+        if len(candidates) > 1:
+            # SAN leaves a pinned piece undisambiguated: drop pinned candidates
+            unpinned = [sq for sq in candidates if not is_pinned(board_state, sq, to_sq)]
+            if unpinned:
+                candidates = unpinned
+        if candidates:
+            # Still several (malformed SAN) - ambiguous, take first
             return (candidates[0], to_sq)
 
     return None
 
 def can_piece_reach(piece, from_sq, to_sq, board):
-    """Check if piece can reach target square (basic validation)."""
-    from_file = from_sq % 16
-    from_rank = from_sq // 16
-    to_file = to_sq % 16
-    to_rank = to_sq // 16
-
-    df = to_file - from_file
-    dr = to_rank - from_rank
-
-    if piece == 'N':
-        # Knight: L-shape
-        return (abs(df), abs(dr)) in [(1, 2), (2, 1)]
-
-    elif piece == 'B':
-        # Bishop: diagonal
-        if abs(df) != abs(dr) or df == 0:
-            return False
-        # Check path is clear
-        step_f = 1 if df > 0 else -1
-        step_r = 1 if dr > 0 else -1
-        f, r = from_file + step_f, from_rank + step_r
-        while (f, r) != (to_file, to_rank):
-            sq = r * 16 + f
+    """Check if piece can reach target square (0x88 tables, path clear)."""
+    index = to_sq - from_sq + 119
+    if not ATTACK[index] & PIECE_BIT[piece]:
+        return False
+    if piece in 'BRQ':
+        step = STEP[index]
+        sq = from_sq + step
+        while sq != to_sq:
             if sq in board:
                 return False
-            f += step_f
-            r += step_r
-        return True
-
-    elif piece == 'R':
-        # Rook: straight lines
-        if df != 0 and dr != 0:
-            return False
-        # Check path is clear
-        if df != 0:
-            step = 1 if df > 0 else -1
-            for f in range(from_file + step, to_file, step):
-                if from_rank * 16 + f in board:
-                    return False
-        else:
-            step = 1 if dr > 0 else -1
-            for r in range(from_rank + step, to_rank, step):
-                if r * 16 + from_file in board:
-                    return False
-        return True
-
-    elif piece == 'Q':
-        # Queen: diagonal or straight
-        if df == 0 or dr == 0:
-            return can_piece_reach('R', from_sq, to_sq, board)
-        elif abs(df) == abs(dr):
-            return can_piece_reach('B', from_sq, to_sq, board)
+            sq += step
+    return True
+
+def is_pinned(state, from_sq, to_sq):
+    """Would moving the piece on from_sq to to_sq expose its own king to a
+    slider on the line through from_sq?"""
+    board = state['board']
+    white = state['white_to_move']
+    king = next(iter(state['pieces']['K' if white else 'k']), None)
+    if king is None:
         return False
-
-    elif piece == 'K':
-        # King: one square any direction
-        return abs(df) <= 1 and abs(dr) <= 1 and (df != 0 or dr != 0)
-
+    index = from_sq - king + 119
+    if not ATTACK[index] & PIECE_BIT['Q']:
+        return False
+    step = STEP[index]
+    sq = king + step
+    while sq != from_sq:                    # something already shields the king
+        if sq in board:
+            return False
+        sq += step
+    sq = from_sq + step
+    while not sq & 0x88:
+        if sq == to_sq:                     # moving along the pin line
+            return False
+        p = board.get(sq)
+        if p:
+            if p.isupper() == white:
+                return False
+            sliders = 'RQ' if step in (1, -1, 16, -16) else 'BQ'
+            return p.upper() in sliders
+        sq += step
     return False
 
 def init_board():
@@ -207,67 +255,440 @@ def init_board():
     for f in range(8):
         board[0x60 + f] = 'p'
 
-    return {'board': board, 'white_to_move': True}
+    pieces = defaultdict(set)
+    for sq, p in board.items():
+        pieces[p].add(sq)
 
-def apply_move(state, from_sq, to_sq):
-    """Apply move to board state."""
-    piece = state['board'].get(from_sq)
+    return {'board': board, 'pieces': pieces, 'white_to_move': True}
+
+def apply_move(state, from_sq, to_sq, promotion=None):
+    """Apply move to board state (board and piece lists)."""
+    board, pieces = state['board'], state['pieces']
+    piece = board.get(from_sq)
     if piece:
-        del state['board'][from_sq]
-        state['board'][to_sq] = piece
+        captured = board.get(to_sq)
+        if captured:
+            pieces[captured].discard(to_sq)
+        elif piece in ['P', 'p'] and (to_sq - from_sq) % 16:
+            # En passant: the captured pawn is beside the mover
+            ep_sq = (from_sq & 0x70) | (to_sq & 0x07)
+            victim = board.pop(ep_sq, None)
+            if victim:
+                pieces[victim].discard(ep_sq)
+        del board[from_sq]
+        pieces[piece].discard(from_sq)
+        if promotion:
+            piece = promotion if piece == 'P' else promotion.lower()
+        board[to_sq] = piece
+        pieces[piece].add(to_sq)
 
         # Handle castling rook
         if piece in ['K', 'k']:
             if to_sq - from_sq == 2:  # Kingside
                 rook_from = from_sq + 3
                 rook_to = from_sq + 1
-                rook = state['board'].get(rook_from)
-                if rook:
-                    del state['board'][rook_from]
-                    state['board'][rook_to] = rook
             elif from_sq - to_sq == 2:  # Queenside
                 rook_from = from_sq - 4
                 rook_to = from_sq - 1
-                rook = state['board'].get(rook_from)
-                if rook:
-                    del state['board'][rook_from]
-                    state['board'][rook_to] = rook
+            else:
+                rook_from = None
+            rook = board.get(rook_from) if rook_from is not None else None
+            if rook:
+                del board[rook_from]
+                board[rook_to] = rook
+                pieces[rook].discard(rook_from)
+                pieces[rook].add(rook_to)
 
     state['white_to_move'] = not state['white_to_move']
 
-def build_book_tree(pgn_file, max_ply=10):
-    """Build a tree of positions with converted square notation."""
-    tree = defaultdict(lambda: defaultdict(int))
-
-    game_count = 0
-    error_count = 0
-
-    for moves in parse_pgn(pgn_file):
-        game_count += 1
+def promotion_of(move):
+    """'e8=Q' / 'exd8Q' -> 'Q', else None."""
+    m = re.search(r'=?([QRBN])$', move)
+    return m.group(1) if m and move[0] in 'abcdefgh' else None
+
+def count_games(movetexts, max_ply, first_game=0):
+    """Position counts for a batch of games: ({position bytes: {response:
+    [count, first game]}}, games, parse errors). A position is its move
+    sequence, two 0x88 bytes a move; `first game` (numbered from first_game
+    in input order) breaks ties the way the single-pass build always did:
+    the response seen first wins."""
+    counts = defaultdict(dict)
+    games = errors = 0
+
+    for game_no, movetext in enumerate(movetexts, first_game):
+        moves = parse_moves(movetext)
+        if not moves:
+            continue
+        games += 1
         state = init_board()
-        move_sequence = []
+        position = bytearray()
 
         for i, alg_move in enumerate(moves[:max_ply + 1]):
             squares = move_to_squares(alg_move, state)
             if squares is None:
-                error_count += 1
+                errors += 1
                 break
 
             from_sq, to_sq = squares
 
             if i < max_ply:
                 # Record position -> next move
-                position = tuple(move_sequence)
-                tree[position][(from_sq, to_sq)] += 1
-
-            move_sequence.append((from_sq, to_sq))
-            apply_move(state, from_sq, to_sq)
-
-    print(f"Parsed {game_count} games ({error_count} parse errors)", file=sys.stderr)
-    return tree
-
-def generate_asm_book(tree, min_frequency=10, output_file=None):
-    """Generate assembly code for the opening book."""
+                node = counts[bytes(position)]
+                if squares in node:
+                    node[squares][0] += 1
+                else:
+                    node[squares] = [1, game_no]
+
+            position += bytes(squares)
+            apply_move(state, from_sq, to_sq, promotion_of(alg_move))
+
+    return dict(counts), games, errors
+
+def merge_counts(tree, counts):
+    for position, responses in counts.items():
+        node = tree.setdefault(position, {})
+        for move, (n, first) in responses.items():
+            if move in node:
+                node[move][0] += n
+                node[move][1] = min(node[move][1], first)
+            else:
+                node[move] = [n, first]
+
+def shard_of(position, shards, level=0):
+    return zlib.crc32(position, level) % shards
+
+def spill(tree, shard_files, shards, sizes, level=0):
+    """Append the in-memory tree (or any iterable of (position, responses))
+    to the shard files by hash and empty it; sizes[shard] counts the entries
+    each file received. level seeds the hash, so a re-split spreads one
+    shard's positions differently from the split that filled it."""
+    parts = defaultdict(list)
+    items = tree.items() if isinstance(tree, dict) else tree
+    for position, responses in items:
+        parts[shard_of(position, shards, level)].append((position, responses))
+    for shard, items in parts.items():
+        with open(shard_files[shard], 'ab') as f:
+            pickle.dump(items, f, pickle.HIGHEST_PROTOCOL)
+        sizes[shard] += len(items)
+    if isinstance(tree, dict):
+        tree.clear()
+
+def read_shard(path):
+    """Yield the (position, responses) lists spilled to one shard file."""
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    break
+
+def bounded_shards(shard_files, sizes, spill_at, level=1):
+    """Shard files to merge, each holding at most spill_at entries (so at
+    most spill_at positions): larger ones are re-split, one spilled list at
+    a time, into enough sub-shards by a hash seeded with `level`. A shard
+    that re-splitting cannot shrink (every entry one position) is kept."""
+    out = []
+    for path, size in zip(shard_files, sizes):
+        if size <= spill_at or level > 8:
+            out.append(path)
+            continue
+        n = -(-size // spill_at) + 1
+        subs = [f"{path}.{i}" for i in range(n)]
+        sub_sizes = [0] * n
+        for items in read_shard(path):
+            spill(items, subs, n, sub_sizes, level)
+        os.remove(path)
+        if max(sub_sizes) == size:
+            out += [p for p, k in zip(subs, sub_sizes) if k]
+        else:
+            out += bounded_shards(subs, sub_sizes, spill_at, level + 1)
+    return out
+
+def best_responses(tree, min_frequency, all_moves=False):
+    """{position tuple: {move: count}} holding each position's most played
+    response (ties: the one seen first) if played at least min_frequency
+    times. all_moves=True keeps every response with its count instead."""
+    out = {}
+    for position, responses in tree.items():
+        if all_moves:
+            out[tuple(zip(position[::2], position[1::2]))] = {
+                move: count for move, (count, _) in responses.items()}
+            continue
+        move, (count, _) = max(responses.items(), key=lambda x: (x[1][0], -x[1][1]))
+        if count >= min_frequency:
+            out[tuple(zip(position[::2], position[1::2]))] = {move: count}
+    return out
+
+def reduce_shard(path, min_frequency, all_moves=False):
+    """Merge one shard file's spilled counts; keep only book-worthy positions."""
+    tree = {}
+    for items in read_shard(path):
+        merge_counts(tree, dict(items))
+    return best_responses(tree, min_frequency, all_moves)
+
+def iter_batches(pgn_files, batch):
+    """Yield (first game number, [movetext, ...]) batches."""
+    games, first = [], 0
+    for pgn_file in pgn_files:
+        for movetext in iter_movetexts(pgn_file):
+            games.append(movetext)
+            if len(games) >= batch:
+                yield first, games
+                first += len(games)
+                games = []
+    if games:
+        yield first, games
+
+def build_book_tree(pgn_files, max_ply=10, min_frequency=1, jobs=None, shards=16,
+                    spill_at=500000, batch=2000, all_moves=False):
+    """Count every position -> next move over the games of pgn_files (.pgn
+    or .zip) and return {position: {best response: count}} for positions
+    whose best response was played at least min_frequency times (with
+    all_moves=True: every position, every response played from it).
+
+    Batches of games are counted in a pool of `jobs` processes (at most two
+    batches per worker in flight, so reading never runs ahead). Once the
+    merged tree holds more than spill_at positions it is spilled to shard
+    files by position hash; shards that received more than spill_at entries
+    are re-split (bounded_shards), then each is merged on its own."""
+    from concurrent.futures import ProcessPoolExecutor
+    if isinstance(pgn_files, str):
+        pgn_files = [pgn_files]
+    jobs = jobs or os.cpu_count() or 1
+    tree = {}
+    game_count = error_count = 0
+    tmp = tempfile.TemporaryDirectory(prefix='pgn_to_book-')
+    shard_files = [os.path.join(tmp.name, f'shard{i:03d}.pkl') for i in range(shards)]
+    sizes = [0] * shards
+    spilled = False
+
+    def take(result):
+        nonlocal game_count, error_count, spilled
+        counts, games, errors = result
+        game_count += games
+        error_count += errors
+        merge_counts(tree, counts)
+        if len(tree) > spill_at:
+            spill(tree, shard_files, shards, sizes)
+            spilled = True
+
+    pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        if pool is None:
+            for first, games in iter_batches(pgn_files, batch):
+                take(count_games(games, max_ply, first))
+        else:
+            inflight = deque()
+            for first, games in iter_batches(pgn_files, batch):
+                inflight.append(pool.submit(count_games, games, max_ply, first))
+                if len(inflight) >= 2 * jobs:
+                    take(inflight.popleft().result())
+            while inflight:
+                take(inflight.popleft().result())
+
+        print(f"Parsed {game_count} games ({error_count} parse errors)", file=sys.stderr)
+        if not spilled:
+            return best_responses(tree, min_frequency, all_moves)
+        spill(tree, shard_files, shards, sizes)
+        shard_files = bounded_shards(shard_files, sizes, spill_at)
+        book = {}
+        if pool is None:
+            parts = (reduce_shard(path, min_frequency, all_moves) for path in shard_files)
+        else:
+            n = len(shard_files)
+            parts = pool.map(reduce_shard, shard_files, [min_frequency] * n, [all_moves] * n)
+        for part in parts:
+            book.update(part)
+        print(f"Merged {len(shard_files)} shards", file=sys.stderr)
+        return book
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        tmp.cleanup()
+
+# ------------------------------------------------------------------------------
+# Trie book format (opening-book-trie-lookup.asm)
+#
+# Each position is a node; a move sequence shared by many lines is stored
+# once, as the path of edges leading to it:
+#   node:  [response_from] [response_to] [n_children]
+#          n_children x ( [move_from] [move_to] DW child_node )
+# response_from = $FF: no book move at this node (it only leads deeper).
+# DW is big-endian (high byte first). OPENING_BOOK is the root (ply 0).
+# ------------------------------------------------------------------------------
+TRIE_MARKER = "; Book format: trie"
+NO_RESPONSE = 0xFF
+# Hash-keyed book written by zobrist_book.py (opening-book-hash-lookup.asm)
+ZOBRIST_MARKER = "; Book format: zobrist"
+
+def new_trie_node(path):
+    return {'path': path, 'response': None, 'count': 0, 'weight': 0, 'children': {}}
+
+def build_trie(entries):
+    """Trie of (position, response, count) entries, in book order. A
+    position listed twice keeps its first response, as the linear scan
+    did. Returns (root, shadowed entries)."""
+    root = new_trie_node(())
+    shadowed = 0
+    for position, response, count in entries:
+        node = root
+        node['weight'] += count
+        for move in position:
+            if move not in node['children']:
+                node['children'][move] = new_trie_node(node['path'] + (move,))
+            node = node['children'][move]
+            node['weight'] += count
+        if node['response'] is None:
+            node['response'], node['count'] = response, count
+        else:
+            shadowed += 1
+    return root, shadowed
+
+def trie_nodes(root):
+    """Nodes in emit order (preorder, most played child first)."""
+    order, stack = [], [root]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        kids = sorted(node['children'].values(), key=lambda c: -c['weight'])
+        node['kids'] = kids
+        stack.extend(reversed(kids))
+    return order
+
+def trie_size(root):
+    return sum(3 + 4 * len(n['children']) for n in trie_nodes(root))
+
+def flat_size(entries):
+    return sum(3 + 2 * len(position) for position, _, _ in entries) + 1
+
+def trie_lookup(root, moves):
+    """The response the trie lookup returns after `moves`, or None."""
+    node = root
+    for move in moves:
+        node = node['children'].get(move)
+        if node is None:
+            return None
+    return node['response']
+
+def flat_index(entries):
+    """{position: response} as BL_ENTRY_LOOP answers it (first entry wins)."""
+    index = {}
+    for position, response, _ in entries:
+        index.setdefault(tuple(position), response)
+    return index
+
+def check_trie(root, entries):
+    """Positions (every entry and every prefix) where the trie answers
+    differently from the linear book; [] when they agree."""
+    index = flat_index(entries)
+    positions = {tuple(p[:i]) for p, _, _ in entries for i in range(len(p) + 1)}
+    return [pos for pos in sorted(positions)
+            if trie_lookup(root, pos) != index.get(pos)]
+
+def trie_asm_lines(root):
+    """OPENING_BOOK in trie format: (asm lines, bytes)."""
+    nodes = trie_nodes(root)
+    label = {id(n): f"BOOK_T{i}" for i, n in enumerate(nodes)}
+    lines = ["OPENING_BOOK:"]
+    total = 0
+    for node in nodes:
+        path = ' '.join(f"{f:02X}-{t:02X}" for f, t in node['path']) or '(start)'
+        if node['response'] is not None:
+            rf, rt = node['response']
+            note = f"-> {rf:02X}-{rt:02X} ({node['count']}x)"
+        else:
+            rf = rt = NO_RESPONSE
+            note = "-> (no book move)"
+        lines.append(f"{label[id(node)]}:    ; Ply {len(node['path'])}: {path} {note}")
+        lines.append(f"    DB ${rf:02X}, ${rt:02X}, ${len(node['kids']):02X}")
+        for kid in node['kids']:
+            f, t = kid['path'][-1]
+            lines.append(f"    DB ${f:02X}, ${t:02X}")
+            lines.append(f"    DW {label[id(kid)]}")
+        total += 3 + 4 * len(node['kids'])
+    return lines, total
+
+def trie_report(entries, root, shadowed):
+    """Size comparison printed by the generators."""
+    flat, trie = flat_size(entries), trie_size(root)
+    nodes = trie_nodes(root)
+    widest = max(len(n['children']) for n in nodes)
+    lines = [f"Trie book: {len(nodes)} nodes, {sum(len(n['children']) for n in nodes)} edges",
+             f"  flat format: {flat} bytes, trie: {trie} bytes "
+             f"(saves {flat - trie} bytes, {100 * (flat - trie) / flat:.1f}%)",
+             f"  lookup: at most {max(len(e[0]) for e in entries)} levels, "
+             f"widest node {widest} children"]
+    if shadowed:
+        lines.append(f"  {shadowed} shadowed entries dropped (position already listed earlier)")
+    wrong = check_trie(root, entries)
+    if wrong:
+        lines.append(f"  WARNING: trie and linear lookup disagree on {len(wrong)} positions")
+    return lines
+
+def read_book(path):
+    """Entries [(position, response, count)] of a book .asm in any format,
+    in book order (a trie book comes back in preorder, a Zobrist book in
+    hash order with each entry's shortest recorded move order)."""
+    text = open(path).read()
+    m = re.search(r'^OPENING_BOOK:', text, re.M)
+    body = text[m.start():] if m else text
+    if ZOBRIST_MARKER in text:
+        entries, line = [], None
+        for row in body.splitlines():
+            lm = re.match(r'\s*; \$[0-9A-Fa-f]{4} Ply \d+: (.*?) -> \S+ \((\d+)x', row)
+            if lm:
+                moves = re.findall(r'([0-9A-Fa-f]{2})-([0-9A-Fa-f]{2})', lm.group(1))
+                line = ([(int(f, 16), int(t, 16)) for f, t in moves], int(lm.group(2)))
+            elif row.strip().startswith('DB') and line:
+                data = [int(hx, 16) for hx in re.findall(r'\$([0-9A-Fa-f]{2})', row)]
+                entries.append((line[0], (data[0], data[2]), line[1]))
+                line = None
+        return entries
+    tokens, labels, counts, pending = [], {}, {}, 0
+    for line in body.splitlines():
+        code, _, comment = line.partition(';')
+        cm = re.search(r'\((\d+)x\)', comment)
+        if cm:
+            pending = int(cm.group(1))          # the '; Ply' comment's game count
+        lm = re.match(r'^(\w+):', code)
+        if lm:
+            labels[lm.group(1)] = len(tokens)
+            code = code[lm.end():]
+        code = code.strip()
+        if code.startswith('DB'):
+            counts[len(tokens)] = pending
+            pending = 0
+            tokens += [int(hx, 16) for hx in re.findall(r'\$([0-9A-Fa-f]{2})', code)]
+        elif code.startswith('DW'):
+            tokens.append(code[2:].strip())
+    entries = []
+    if TRIE_MARKER not in text:
+        i = 0
+        while i < len(tokens) and tokens[i] != 0xFF:
+            ply = tokens[i]
+            moves = tokens[i + 1:i + 1 + 2 * ply]
+            resp = tokens[i + 1 + 2 * ply:i + 3 + 2 * ply]
+            entries.append((list(zip(moves[::2], moves[1::2])), tuple(resp), counts.get(i, 0)))
+            i += 3 + 2 * ply
+        return entries
+    stack = [('OPENING_BOOK', [])]
+    while stack:
+        name, position = stack.pop()
+        i = labels[name]
+        rf, rt, n = tokens[i:i + 3]
+        if rf != NO_RESPONSE:
+            entries.append((position, (rf, rt), counts.get(i, 0)))
+        kids = []
+        for k in range(n):
+            f, t, child = tokens[i + 3 + 3 * k:i + 6 + 3 * k]
+            kids.append((child, position + [(f, t)]))
+        stack.extend(reversed(kids))
+    return entries
+
+def generate_asm_book(tree, min_frequency=10, output_file=None, trie=False):
+    """Generate assembly code for the opening book (linear entries, or a
+    trie with trie=True)."""
 
     entries = []
 
@@ -292,6 +713,31 @@ def generate_asm_book(tree, min_frequency=10, output_file=None):
     lines.append(f"; Entries: {len(entries)}, Min frequency: {min_frequency}")
     lines.append("; ==============================================================================")
     lines.append("")
+
+    if trie:
+        book = [(e['position'], e['response'], e['count']) for e in entries]
+        root, shadowed = build_trie(book)
+        report = trie_report(book, root, shadowed)
+        lines.append(TRIE_MARKER + " (opening-book-trie-lookup.asm)")
+        lines.append(";   node: [response_from] [response_to] [n_children]")
+        lines.append(";         n_children x ([move_from] [move_to] DW child), $FF = no response")
+        lines += [f";   {r.strip()}" for r in report]
+        lines.append("")
+        trie_lines, total_bytes = trie_asm_lines(root)
+        lines += trie_lines
+        lines.append("")
+        lines.append(f"; Total size: {total_bytes} bytes")
+        for r in report:
+            print(r, file=sys.stderr)
+        output = '\n'.join(lines)
+        if output_file:
+            with open(output_file, 'w') as f:
+                f.write(output)
+            print(f"Wrote {output_file} ({total_bytes} bytes)", file=sys.stderr)
+        else:
+            print(output)
+        return entries, total_bytes
+
     lines.append("; Book format:")
     lines.append(";   Each entry: [ply] [move1_from] [move1_to] ... [response_from] [response_to] [$FF terminator]")
     lines.append(";   Entries sorted by ply for efficient early-exit")
@@ -340,19 +786,37 @@ def generate_asm_book(tree, min_frequency=10, output_file=None):
     return entries, total_bytes
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: pgn_to_book.py <pgn_file> [max_ply] [min_frequency] [output.asm]")
-        sys.exit(1)
-
-    pgn_file = sys.argv[1]
-    max_ply = int(sys.argv[2]) if len(sys.argv) > 2 else 10
-    min_freq = int(sys.argv[3]) if len(sys.argv) > 3 else 10
-    output_file = sys.argv[4] if len(sys.argv) > 4 else None
+    parser = argparse.ArgumentParser(
+        description="Convert PGN files (or .zip archives of them) to an opening book",
+        usage="%(prog)s <pgn_or_zip>... [max_ply] [min_frequency] [output.asm] [options]")
+    parser.add_argument('args', nargs='+', help=argparse.SUPPRESS)
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument('--shards', type=int, default=16, help="initial spill shard files (16); oversized ones are re-split")
+    parser.add_argument('--spill', type=int, default=500000,
+                        help="positions held in memory before spilling to shards (500000)")
+    parser.add_argument('--trie', action='store_true',
+                        help="emit the prefix-trie book format (opening-book-trie-lookup.asm)")
+    opts = parser.parse_args()
+
+    # Inputs first, then the original positional max_ply / min_frequency / output
+    pgn_files, numbers, output_file = [], [], None
+    for arg in opts.args:
+        if arg.isdigit():
+            numbers.append(int(arg))
+        elif arg.lower().endswith('.asm'):
+            output_file = arg
+        else:
+            pgn_files.append(arg)
+    if not pgn_files:
+        parser.error("no PGN input")
+    max_ply = numbers[0] if len(numbers) > 0 else 10
+    min_freq = numbers[1] if len(numbers) > 1 else 10
 
-    print(f"Processing {pgn_file} (max_ply={max_ply}, min_freq={min_freq})", file=sys.stderr)
+    print(f"Processing {', '.join(pgn_files)} (max_ply={max_ply}, min_freq={min_freq})", file=sys.stderr)
 
-    tree = build_book_tree(pgn_file, max_ply)
-    entries, size = generate_asm_book(tree, min_freq, output_file)
+    tree = build_book_tree(pgn_files, max_ply, min_freq, opts.jobs, opts.shards, opts.spill)
+    entries, size = generate_asm_book(tree, min_freq, output_file, opts.trie)
 
     print(f"\nBook Statistics:", file=sys.stderr)
     print(f"  Total entries: {len(entries)}", file=sys.stderr)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Parallel regression runner for the tools/*.uci probe scripts.
+
+Plays every script on its own simulated engine (tools/elph_sim.py,
+translated-block mode, virtual-time RTC) in a process pool — one engine per
+core — and records, per search, the bestmove, the last `info depth` line
+(depth, score, node count) and the machine cycles it took. The engine is
+deterministic under the simulator's virtual clock, so results are compared
+EXACTLY against the checked-in golden file (tools/uci_golden.json); any
+difference in bestmove, score or nodes is a regression.
+
+A search with no bestmove inside the cycle budget (BESTMOVE_BUDGET_S of board
+time, as replay-match.py's 200 s timeout) or a simulator stop (IDL trap =
+BIOS breakpoint / crash catcher, illegal opcode) is reported as HANG/STOP and
+the rest of that script is skipped, like replay-match.py leaves the board.
+
+Usage:
+    python3 tools/uci_regress.py                       # all tools/*.uci vs golden
+    python3 tools/uci_regress.py tools/test_hang_caro.uci tools/stress_qs_0717.uci
+    python3 tools/uci_regress.py --update              # re-record the golden file
+    options: --image LST  -j N  --golden PATH
+
+Exit code 1 if any script regressed, hung or is missing from the golden file.
+Re-record the golden file (and commit it) whenever an engine change is MEANT
+to alter search results, and say which build it was recorded with.
+"""
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from elph_sim import (ElphSim, CLOCK_HZ, CLOCKS_PER_CYCLE, STOP_CYCLES, STOP_INPUT,
+                      load_uci_script)
+
+DEFAULT_IMAGE = os.path.join(os.path.dirname(HERE), 'listings', 'chess-engine-94a1d59.lst')
+GOLDEN = os.path.join(HERE, 'uci_golden.json')
+BESTMOVE_BUDGET_S = 200         # board seconds per search before calling it a hang
+
+
+def run_script(image, path):
+    """Play one .uci script; returns (name, [search result dicts], host seconds)."""
+    t0 = time.time()
+    sim = ElphSim.from_file(image, translate=True)
+    sim.boot()
+    sim.run_until_input()
+    sim.output_lines()
+    budget = BESTMOVE_BUDGET_S * CLOCK_HZ // CLOCKS_PER_CYCLE
+    results = []
+    for i, cmd in enumerate(load_uci_script(path)):
+        if cmd == 'quit':
+            break
+        c0 = sim.cycles
+        out = sim.command(cmd, max_cycles=budget if cmd.startswith('go') else None)
+        if not cmd.startswith('go'):
+            if sim.stop_reason != STOP_INPUT:
+                results.append({'cmd': cmd, 'index': i, 'bestmove': None,
+                                'info': f"STOP {sim.stop_reason} {sim.registers()}",
+                                'cycles': sim.cycles - c0})
+                break
+            continue
+        best = next((ln.split()[1] for ln in out if ln.startswith('bestmove ')), None)
+        infos = [ln for ln in out if ln.startswith('info depth')]
+        res = {'cmd': cmd, 'index': i, 'bestmove': best,
+               'info': infos[-1] if infos else '', 'cycles': sim.cycles - c0}
+        if best is None:
+            res['info'] = (f"HANG no bestmove in {BESTMOVE_BUDGET_S}s"
+                           if sim.stop_reason == STOP_CYCLES else
+                           f"STOP {sim.stop_reason} {sim.registers()}")
+        results.append(res)
+        if best is None:
+            break
+    return os.path.basename(path), results, time.time() - t0
+
+
+def compare(got, want):
+    """Differences between a script's results and its golden entry."""
+    if want is None:
+        return ['not in golden file']
+    diffs = []
+    for i in range(max(len(got), len(want))):
+        g = got[i] if i < len(got) else None
+        w = want[i] if i < len(want) else None
+        if g is None:
+            diffs.append(f"search {i + 1} ({w['cmd']}): missing, want {w['bestmove']} | {w['info']}")
+        elif w is None:
+            diffs.append(f"search {i + 1} ({g['cmd']}): extra, got {g['bestmove']} | {g['info']}")
+        elif (g['cmd'], g['bestmove'], g['info']) != (w['cmd'], w['bestmove'], w['info']):
+            diffs.append(f"search {i + 1} ({g['cmd']}):\n"
+                         f"        want {w['bestmove']} | {w['info']}\n"
+                         f"        got  {g['bestmove']} | {g['info']}")
+    return diffs
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Run tools/*.uci on simulated engines vs golden results")
+    ap.add_argument('scripts', nargs='*', help="scripts to run (default: tools/*.uci)")
+    ap.add_argument('--image', default=DEFAULT_IMAGE, help="engine image/listing")
+    ap.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                    help="engines in parallel (default: one per core)")
+    ap.add_argument('--golden', default=GOLDEN, help="golden file (default tools/uci_golden.json)")
+    ap.add_argument('--update', action='store_true',
+                    help="write the results as the new golden file instead of comparing")
+    args = ap.parse_args()
+
+    scripts = args.scripts or sorted(glob.glob(os.path.join(HERE, '*.uci')))
+    golden = {}
+    if os.path.exists(args.golden):
+        with open(args.golden) as f:
+            golden = json.load(f)
+    # longest scripts first so the pool drains evenly
+    order = sorted(scripts, key=lambda p: -sum(1 for c in load_uci_script(p) if c.startswith('go')))
+
+    print(f"{len(scripts)} scripts, {args.jobs} engines, image {os.path.basename(args.image)}")
+    t0 = time.time()
+    results = {}
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futs = [pool.submit(run_script, args.image, p) for p in order]
+        for fut in as_completed(futs):
+            name, res, secs = fut.result()
+            results[name] = (res, secs)
+            print(f"  [{len(results):3d}/{len(scripts)}] {name} ({secs:.0f}s)",
+                  file=sys.stderr, flush=True)
+    wall = time.time() - t0
+
+    failed = 0
+    board = host = 0.0
+    for name in sorted(results):
+        res, secs = results[name]
+        bsecs = sum(r['cycles'] for r in res) * CLOCKS_PER_CYCLE / CLOCK_HZ
+        board += bsecs
+        host += secs
+        hung = any(r['bestmove'] is None for r in res)
+        diffs = [] if args.update else compare(res, golden.get('scripts', {}).get(name))
+        status = 'HANG' if hung else ('FAIL' if diffs else ('REC' if args.update else 'ok'))
+        failed += status in ('HANG', 'FAIL')
+        last = res[-1] if res else {'bestmove': '-', 'info': ''}
+        print(f"{status:4s} {name:38s} {len(res):3d} searches {bsecs:7.1f}s board {secs:6.1f}s host"
+              f"  {last['bestmove']} | {last['info']}")
+        for d in diffs:
+            print(f"       {d}")
+    print(f"\n{len(results) - failed}/{len(results)} clean; {board:.0f}s of board time "
+          f"in {wall:.0f}s wall ({host:.0f}s host CPU, {board / wall if wall else 0:.1f}x the board)")
+
+    if args.update:
+        if args.scripts:
+            golden.setdefault('scripts', {})
+        else:
+            golden['scripts'] = {}
+        for name, (res, _) in results.items():
+            golden['scripts'][name] = [{k: r[k] for k in ('cmd', 'bestmove', 'info')} for r in res]
+        golden = {'image': os.path.basename(args.image),
+                  'scripts': dict(sorted(golden['scripts'].items()))}
+        with open(args.golden, 'w') as f:
+            json.dump(golden, f, indent=1)
+            f.write('\n')
+        print(f"golden file written: {args.golden}")
+        return 0
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
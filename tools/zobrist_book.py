@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Transposition-aware opening book keyed by the engine's Zobrist hash.
+
+The move-sequence books (pgn_to_book.py, merge_books.py) only match the
+exact move order in MOVE_HIST, so 1.d4 Nf6 2.c4 e6 and 1.c4 e6 2.d4 Nf6 are
+two unrelated entries and any order the book did not record is out of book.
+This generator keys every entry by the 16-bit hash the engine already holds
+in HASH_HI/HASH_LO instead:
+
+  - Every move order is replayed from the start position and hashed the way
+    the engine does: HASH_INIT at "position startpos" (all four castling
+    keys, white to move), then MAKE_MOVE's incremental piece-square and side
+    XORs. MAKE_MOVE never touches the castling or en-passant keys, so the
+    game hash is piece-square keys ^ side key ^ all four castle keys. The
+    keys are the ZOBRIST_* tables of gen_zobrist.py (checked against
+    zobrist-keys.asm).
+  - Transpositions (same placement, side, castling rights and en-passant
+    square) are merged: their response counts are added up before the best
+    response is chosen and min_frequency is applied.
+  - Collisions (one hash, different positions - including positions that
+    differ only in castling or en-passant rights, which the game hash cannot
+    tell apart) are found at build time against every position known to the
+    build, book entry or not. An entry is kept for a hash only if, in every
+    other position with that hash, its move was played there, is legal
+    there, or is rejected by the entry's board check below; otherwise the
+    next most played position on the hash is tried, and failing all, the
+    hash is dropped. A book move is never illegal in a known position.
+
+Table layout (opening-book-hash-lookup.asm binary-searches it):
+    OPENING_BOOK:     DW n
+    BOOK_HASH_KEYS:   n x DW hash, ascending
+    BOOK_HASH_MOVES:  n x [from] [piece on from] [to] [piece on to]
+The two piece bytes are BOARD contents the lookup checks before answering
+(the piece on `from` must also belong to the side to move), so a position
+outside the book that shares a book hash (1 in 65536 per entry) plays no
+move from the book unless the pieces fit it.
+
+Usage:
+    python3 tools/zobrist_book.py [inputs...] -o opening-book.asm
+        inputs: .pgn / .zip databases, and/or book .asm files in any format
+    options: --max-ply 10 --min-freq 10 -j JOBS --keys zobrist-keys.asm
+"""
+
+import argparse
+import os
+import re
+import sys
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from gen_zobrist import zobrist_keys
+from pgn_to_book import (ZOBRIST_MARKER, apply_move, build_book_tree, can_piece_reach,
+                         flat_size, init_board, read_book)
+
+PIECE_INDEX = {p: i for i, p in enumerate('PNBRQKpnbrqk')}
+ENGINE_PIECE = {p: i + 1 for i, p in enumerate('PNBRQK')}
+ENGINE_PIECE.update({p.lower(): c | 8 for p, c in ENGINE_PIECE.items()})
+CORNER_RIGHT = {0x00: 'Q', 0x07: 'K', 0x70: 'q', 0x77: 'k'}
+
+PIECE_SQ, SIDE_KEY, CASTLE_KEYS, EP_KEYS = zobrist_keys()
+CASTLE_ALL = CASTLE_KEYS[0] ^ CASTLE_KEYS[1] ^ CASTLE_KEYS[2] ^ CASTLE_KEYS[3]
+
+
+def check_keys(path):
+    """Errors if zobrist-keys.asm (what the engine assembles) does not hold
+    the gen_zobrist.py tables; [] when they match or the file is absent."""
+    if not os.path.exists(path):
+        return []
+    values = [int(hx, 16) for line in open(path)
+              for hx in re.findall(r'\$([0-9A-Fa-f]{4})', line.split(';', 1)[0])]
+    expected = [k for row in PIECE_SQ for k in row] + [SIDE_KEY] + CASTLE_KEYS + EP_KEYS
+    if values != expected:
+        return [f"{path} does not match gen_zobrist.py (regenerate it or pass --keys)"]
+    return []
+
+
+def sq64(sq):
+    return (sq >> 4) * 8 + (sq & 7)
+
+
+def game_hash(board, white_to_move):
+    """HASH_HI:HASH_LO after `position startpos moves ...` reaches this
+    placement (see the module docstring for why castling is constant)."""
+    h = CASTLE_ALL
+    for sq, piece in board.items():
+        h ^= PIECE_SQ[PIECE_INDEX[piece]][sq64(sq)]
+    if not white_to_move:
+        h ^= SIDE_KEY
+    return h
+
+
+def replay(moves):
+    """Play 0x88 (from, to) moves from the start position. Returns (state,
+    full position key) or None if a move has no piece to move. The key is
+    placement, side, castling rights and the en-passant square (only when
+    an enemy pawn could take there)."""
+    state = init_board()
+    rights = set('KQkq')
+    ep = None
+    for frm, to in moves:
+        board = state['board']
+        piece = board.get(frm)
+        if piece is None:
+            return None
+        if piece in 'Kk':
+            rights -= {'K', 'Q'} if piece == 'K' else {'k', 'q'}
+        rights -= {CORNER_RIGHT.get(frm), CORNER_RIGHT.get(to)}
+        ep = None
+        if piece in 'Pp' and abs(to - frm) == 32:
+            enemy = 'p' if piece == 'P' else 'P'
+            if any(not (to + d) & 0x88 and board.get(to + d) == enemy for d in (-1, 1)):
+                ep = (frm + to) // 2
+        promotion = 'Q' if piece in 'Pp' and to >> 4 in (0, 7) else None
+        apply_move(state, frm, to, promotion)
+    key = (frozenset(state['board'].items()), state['white_to_move'],
+           ''.join(sorted(rights)), ep)
+    return state, key
+
+
+def board_check(board, move):
+    """(from, piece on from, to, piece on to) as BOOK_HASH_MOVES stores it."""
+    frm, to = move
+    return (frm, ENGINE_PIECE[board[frm]], to, ENGINE_PIECE.get(board.get(to), 0))
+
+
+def check_passes(board, white_to_move, check):
+    """The lookup's board check: both squares hold the stored pieces and
+    the piece to move belongs to the side to move."""
+    frm, piece_from, to, piece_to = check
+    return (ENGINE_PIECE.get(board.get(frm), 0) == piece_from and
+            ENGINE_PIECE.get(board.get(to), 0) == piece_to and
+            (piece_from & 8 == 0) == white_to_move)
+
+
+def attacked(board, sq, by_white):
+    """Is sq attacked by a piece of that colour?"""
+    for frm, piece in board.items():
+        if piece.isupper() != by_white:
+            continue
+        if piece in 'Pp':
+            if sq - frm in ((15, 17) if by_white else (-15, -17)):
+                return True
+        elif can_piece_reach(piece.upper(), frm, sq, board):
+            return True
+    return False
+
+
+def is_legal(board, white_to_move, move):
+    """Legality of a plain (from, to) move. Castling and en passant come
+    back False: never needed to clear a collision, so never trusted."""
+    frm, to = move
+    piece, target = board.get(frm), board.get(to)
+    if piece is None or piece.isupper() != white_to_move:
+        return False
+    if target is not None and target.isupper() == white_to_move:
+        return False
+    if piece in 'Pp':
+        ahead = 16 if white_to_move else -16
+        if to - frm == ahead:
+            ok = target is None
+        elif to - frm == 2 * ahead:
+            ok = (frm >> 4) == (1 if white_to_move else 6) and target is None \
+                and frm + ahead not in board
+        else:
+            ok = to - frm in (ahead - 1, ahead + 1) and target is not None
+    elif piece in 'Kk' and abs(to - frm) == 2:
+        ok = False
+    else:
+        ok = can_piece_reach(piece.upper(), frm, to, board)
+    if not ok:
+        return False
+    after = dict(board)
+    del after[frm]
+    after[to] = piece
+    king = next(sq for sq, p in after.items() if p == ('K' if white_to_move else 'k'))
+    return not attacked(after, king, not white_to_move)
+
+
+def merge_transpositions(lines):
+    """Group move orders by position. `lines` is [(moves, {response:
+    count}, booked)], first occurrence of a move order winning; booked
+    lines come from a finished book and are kept whatever their count.
+    Returns (positions {key: {'hash', 'board', 'lines', 'responses',
+    'booked'}}, unplayable lines)."""
+    positions, seen, bad = {}, set(), 0
+    for moves, responses, booked in lines:
+        moves = tuple(moves)
+        if moves in seen:
+            continue
+        seen.add(moves)
+        played = replay(moves)
+        if played is None:
+            bad += 1
+            continue
+        state, key = played
+        pos = positions.get(key)
+        if pos is None:
+            pos = positions[key] = {'hash': game_hash(state['board'], state['white_to_move']),
+                                    'board': state['board'], 'white': state['white_to_move'],
+                                    'lines': [],
+                                    'responses': defaultdict(int), 'booked': False}
+        pos['lines'].append(moves)
+        pos['booked'] |= booked
+        for move, count in responses.items():
+            pos['responses'][move] += count
+    return positions, bad
+
+
+def best_move(pos):
+    """(response, count): most played, ties to the first recorded."""
+    return max(pos['responses'].items(), key=lambda x: x[1])
+
+
+def build_hash_book(positions, min_frequency):
+    """Resolve collisions and pick one entry per hash. Returns (entries
+    sorted by hash [(hash, check, count, pos)], stats)."""
+    by_hash = defaultdict(list)
+    for pos in positions.values():
+        if pos['responses']:
+            by_hash[pos['hash']].append(pos)
+    entries = []
+    stats = defaultdict(int)
+    for h, group in by_hash.items():
+        candidates = [p for p in group if p['booked'] or best_move(p)[1] >= min_frequency]
+        if not candidates:
+            continue
+        if len(group) > 1:
+            stats['collisions'] += 1
+        candidates.sort(key=lambda p: -best_move(p)[1])
+        for pos in candidates:
+            move, count = best_move(pos)
+            check = board_check(pos['board'], move)
+            if all(other is pos or move in other['responses'] or
+                   not check_passes(other['board'], other['white'], check) or
+                   is_legal(other['board'], other['white'], move) for other in group):
+                entries.append((h, check, count, pos))
+                if len(group) > 1:
+                    stats['resolved'] += 1
+                stats['shadowed'] += len(candidates) - 1
+                break
+        else:
+            stats['dropped'] += len(candidates)
+    entries.sort(key=lambda e: e[0])
+    return entries, stats
+
+
+def hash_lookup(entries, h, board, white_to_move):
+    """What BOOK_LOOKUP answers: binary search on the hash, then the board
+    check. Returns (from, to) or None."""
+    lo, hi = 0, len(entries)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if entries[mid][0] == h:
+            check = entries[mid][1]
+            return (check[0], check[2]) if check_passes(board, white_to_move, check) else None
+        if h > entries[mid][0]:
+            lo = mid + 1
+        else:
+            hi = mid
+    return None
+
+
+class HashBook:
+    """A compiled Zobrist book (.asm) answering startpos move sequences the
+    way BOOK_LOOKUP does; `get` takes ((from, to), ...) like a dict of a
+    move-sequence book."""
+
+    def __init__(self, path):
+        text = open(path).read()
+        text = text[re.search(r'^OPENING_BOOK:', text, re.M).end():]
+        data = []
+        for line in text.splitlines():
+            code = line.split(';', 1)[0]
+            if 'DW' in code:
+                for hx in re.findall(r'\$([0-9A-Fa-f]{4})', code):
+                    data += [int(hx, 16) >> 8, int(hx, 16) & 0xFF]
+            elif 'DB' in code:
+                data += [int(hx, 16) for hx in re.findall(r'\$([0-9A-Fa-f]{2})', code)]
+        n = data[0] << 8 | data[1]
+        keys, moves = data[2:2 + 2 * n], data[2 + 2 * n:2 + 6 * n]
+        self.entries = [(keys[2 * i] << 8 | keys[2 * i + 1], tuple(moves[4 * i:4 * i + 4]))
+                        for i in range(n)]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, moves, default=None):
+        played = replay(moves)
+        if played is None:
+            return default
+        state = played[0]
+        reply = hash_lookup(self.entries, game_hash(state['board'], state['white_to_move']),
+                            state['board'], state['white_to_move'])
+        return default if reply is None else reply
+
+
+def verify(entries, positions):
+    """Positions whose lookup disagrees with the book built for them: a
+    kept entry answering wrong, or a position hitting someone else's entry
+    with a move that is illegal there. [] when the table is sound."""
+    kept = {id(e[3]): (e[1][0], e[1][2]) for e in entries}
+    wrong = []
+    for pos in positions.values():
+        got = hash_lookup(entries, pos['hash'], pos['board'], pos['white'])
+        want = kept.get(id(pos))
+        if got != want and not (want is None and got is not None and
+                                (got in pos['responses'] or
+                                 is_legal(pos['board'], pos['white'], got))):
+            wrong.append(pos)
+    return wrong
+
+
+def hash_asm_lines(entries):
+    """The book in zobrist format: (asm lines, bytes)."""
+    lines = ["OPENING_BOOK:", f"    DW ${len(entries):04X}", "BOOK_HASH_KEYS:"]
+    for i in range(0, len(entries), 8):
+        lines.append("    DW " + ', '.join(f"${e[0]:04X}" for e in entries[i:i + 8]))
+    lines.append("BOOK_HASH_MOVES:")
+    for h, (frm, piece_from, to, piece_to), count, pos in entries:
+        line = min(pos['lines'], key=lambda m: (len(m), m))
+        path = ' '.join(f"{f:02X}-{t:02X}" for f, t in line) or '(start)'
+        orders = f", {len(pos['lines'])} move orders" if len(pos['lines']) > 1 else ""
+        lines.append(f"    ; ${h:04X} Ply {len(line)}: {path} -> {frm:02X}-{to:02X} ({count}x{orders})")
+        lines.append(f"    DB ${frm:02X}, ${piece_from:02X}, ${to:02X}, ${piece_to:02X}")
+    return lines, 2 + 6 * len(entries)
+
+
+def hash_report(lines, positions, entries, stats, bad):
+    """Statistics printed by the generator and written to the book header."""
+    merged = sum(1 for p in positions.values() if len(p['lines']) > 1)
+    flat = flat_size([(m, None, None) for _, _, _, p in entries for m in p['lines']])
+    out = [f"Zobrist book: {len(lines)} move orders -> {len(positions)} positions "
+           f"({merged} reached by more than one order)",
+           f"  entries: {len(entries)}, {2 + 6 * len(entries)} bytes "
+           f"(move-sequence book for the same lines: {flat} bytes)",
+           f"  hash collisions: {stats['collisions']} "
+           f"({stats['resolved']} resolved, {stats['dropped']} entries dropped)"]
+    if stats['shadowed']:
+        out.append(f"  shadowed by a more played position on the same hash: {stats['shadowed']}")
+    if bad:
+        out.append(f"  WARNING: {bad} move orders do not replay (skipped)")
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build a Zobrist-keyed opening book")
+    ap.add_argument('inputs', nargs='+', help=".pgn / .zip databases or book .asm files")
+    ap.add_argument('-o', '--output', help="output .asm (default: stdout)")
+    ap.add_argument('--max-ply', type=int, default=10, help="deepest position from PGN input (10)")
+    ap.add_argument('--min-freq', type=int, default=10,
+                    help="games a PGN response needs, summed over move orders (10); "
+                         "entries of .asm books are always kept")
+    ap.add_argument('-j', '--jobs', type=int, default=None, help="PGN worker processes")
+    ap.add_argument('--keys', default=os.path.join(HERE, '..', 'zobrist-keys.asm'),
+                    help="zobrist-keys.asm to check the tables against")
+    args = ap.parse_args()
+
+    errors = check_keys(args.keys)
+    if errors:
+        for e in errors:
+            print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+
+    books = [p for p in args.inputs if p.lower().endswith('.asm')]
+    pgns = [p for p in args.inputs if not p.lower().endswith('.asm')]
+    lines = []
+    for path in books:
+        lines += [(moves, {resp: count}, True) for moves, resp, count in read_book(path)]
+    if pgns:
+        tree = build_book_tree(pgns, args.max_ply, 1, args.jobs, all_moves=True)
+        lines += [(moves, responses, False)
+                  for moves, responses in sorted(tree.items(), key=lambda x: (len(x[0]), x[0]))]
+
+    positions, bad = merge_transpositions(lines)
+    entries, stats = build_hash_book(positions, args.min_freq)
+    report = hash_report(lines, positions, entries, stats, bad)
+    wrong = verify(entries, positions)
+    if wrong:
+        report.append(f"  WARNING: lookup disagrees with the book on {len(wrong)} positions")
+
+    asm, total = hash_asm_lines(entries)
+    out = ["; ==============================================================================",
+           "; Opening Book Data - Zobrist-keyed (transposition-aware)",
+           f"; Entries: {len(entries)}, Min frequency: {args.min_freq}",
+           "; ==============================================================================",
+           "",
+           f"{ZOBRIST_MARKER} (opening-book-hash-lookup.asm)",
+           ";   OPENING_BOOK: DW n; BOOK_HASH_KEYS: n x DW hash (ascending)",
+           ";   BOOK_HASH_MOVES: n x [from] [piece on from] [to] [piece on to]"]
+    out += [f";   {r.strip()}" for r in report]
+    out += [""] + asm + ["", f"; Total size: {total} bytes"]
+    text = '\n'.join(out) + '\n'
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+        print(f"Wrote {args.output} ({total} bytes)", file=sys.stderr)
+    else:
+        sys.stdout.write(text)
+    for r in report:
+        print(r, file=sys.stderr)
+    return 1 if wrong else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Zobrist key search: score candidate 16-bit key sets against the match corpus
+and write the best one in zobrist-keys.asm layout.
+
+Candidates are gen_zobrist.py key sets - zobrist_keys(seed, odd) for a range
+of seeds, plain draws and/or odd-weight keys (ODD) - so the winner is
+reproduced by setting SEED / ODD in gen_zobrist.py, which tools/zobrist_book.py
+keys the opening book from. The current zobrist-keys.asm is always scored as
+the baseline.
+
+Linear structure over GF(2): 781 keys of 16 bits are never independent (the
+rank is at most 16), so "independence" is checked where it matters - the key
+set and each piece's 64 keys must span all 16 bits, and no short subset may
+XOR to zero. A dependency among k keys is a pair of positions, k key changes
+apart, with one hash:
+    1 key      a zero key                         - candidate rejected
+    2 keys     two equal keys (random draws of 781 have ~5 pairs)
+    3 keys     a ^ b ^ c = 0: a quiet move and the side key, i.e. a
+               position and its child (random sets have ~1200)
+    4 keys     a ^ b = c ^ d: two quiet moves, i.e. a position and its
+               grandchild (~236k for a random set)
+Odd-weight sets (gen_zobrist ODD: distinct odd-weight keys) have no 2- or
+3-key dependencies, but since every pair XOR is even-weight they have about
+twice the 4-key ones; the corpus decides which matters more.
+
+Corpus (elph_hash.py batch mode, replayed once, rehashed per candidate): the
+collisions a TT can see are between positions of one game, so per candidate:
+    near     pairs of different positions of one game at most --window plies
+             apart (default 16) with one hash
+    game     the same, any distance apart
+    global   pairs of different positions anywhere in the corpus (reported;
+             with millions of positions every 16-bit set is at the ideal)
+Candidates are ranked by near, then game, on the even-numbered games only;
+the odd-numbered games are held out, so the report shows whether the winner's
+advantage is real or just fitted to the games it was chosen on. Candidates are
+scored in parallel (ELPH_JOBS / -j).
+
+Adopting a winner: set SEED (and ODD) in gen_zobrist.py, regenerate
+zobrist-keys.asm, and rebuild opening-book.asm with tools/zobrist_book.py -
+book entries are keyed by the hash.
+
+Usage:
+    python3 tools/zobrist_search.py [inputs...] [--candidates 32] [--family random|odd|both]
+        [--window 16] [--out zobrist-keys.asm] [--csv FILE] [-j JOBS]
+        inputs: elph-debug logs (default ./elph-debug*.log), .elpharc
+                archives, .pgn / .zip databases, tools/*.uci scripts
+    options: --keys zobrist-keys.asm (the baseline) --seed-base N
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from elph_hash import (DEFAULT_KEYS, EMIT, RESET, build_stream, collision_stats,
+                       first_occurrences, load_keys, stream_hashes)
+from gen_zobrist import SEED, generate_zobrist_asm, zobrist_keys
+
+FAMILIES = {'random': (False,), 'odd': (True,), 'both': (False, True)}
+
+
+def key_words(seed, odd):
+    """gen_zobrist's key set as the 781 words in assembly order."""
+    piece_sq, side, castle, ep = zobrist_keys(seed, odd)
+    return [k for table in piece_sq for k in table] + [side] + castle + ep
+
+
+# ------------------------------------------------------------------------------
+# GF(2) structure
+# ------------------------------------------------------------------------------
+
+def gf2_rank(words):
+    """Rank of the keys as vectors over GF(2)."""
+    basis = [0] * 16
+    rank = 0
+    for w in words:
+        for bit in range(15, -1, -1):
+            if not w >> bit & 1:
+                continue
+            if not basis[bit]:
+                basis[bit] = w
+                rank += 1
+                break
+            w ^= basis[bit]
+    return rank
+
+
+def dependencies(words):
+    """(zero keys, equal pairs, 3-key and 4-key dependencies): subsets of the
+    keys that XOR to zero."""
+    where = {}
+    for i, w in enumerate(words):
+        where.setdefault(w, []).append(i)
+    zeros = len(where.get(0, ()))
+    equal = sum(len(v) * (len(v) - 1) // 2 for v in where.values())
+    triples = 0
+    pair_xor = Counter()
+    n = len(words)
+    for i in range(n):
+        a = words[i]
+        for j in range(i + 1, n):
+            x = a ^ words[j]
+            pair_xor[x] += 1
+            for k in where.get(x, ()):
+                triples += k > j
+    quads = sum(c * (c - 1) // 2 for x, c in pair_xor.items() if x) // 3
+    return zeros, equal, triples, quads
+
+
+def structure(words):
+    """GF(2) figures for the report; 'ok' is False for a set the engine
+    must not use (a zero key, or less than full rank)."""
+    ranks = [gf2_rank(words[p * 64:p * 64 + 64]) for p in range(12)]
+    zeros, equal, triples, quads = dependencies(words)
+    return {'rank': gf2_rank(words), 'piece_rank': min(ranks), 'zeros': zeros,
+            'equal': equal, 'triples': triples, 'quads': quads,
+            'ok': not zeros and gf2_rank(words) == 16 and min(ranks) == 16}
+
+
+# ------------------------------------------------------------------------------
+# Corpus
+# ------------------------------------------------------------------------------
+
+_corpus = None
+
+
+def _set_corpus(deltas, fingerprints, window):
+    """Pool initializer (and the serial path): the stream, game bounds and
+    each distinct position's first occurrence, computed once per process."""
+    global _corpus
+    games = []
+    n = 0
+    for i in deltas:
+        if i == RESET:
+            games.append(n)
+        elif i == EMIT:
+            n += 1
+    games.append(n)
+    _corpus = (deltas, fingerprints, list(zip(games, games[1:])), window,
+               first_occurrences(fingerprints))
+
+
+def window_pairs(bounds, window):
+    """Position pairs one game and at most `window` plies apart, and pairs one
+    game apart at any distance, in the even and odd games: the ideal-key
+    expectation is these / 65536 (repetitions make it a slight overestimate)."""
+    out = [0, 0, 0, 0]
+    for g, (a, b) in enumerate(bounds):
+        n = b - a
+        out[g & 1] += sum(n - d for d in range(1, min(window, n - 1) + 1))
+        out[2 + (g & 1)] += n * (n - 1) // 2
+    return out
+
+
+def game_collisions(hashes, fingerprints, bounds, window):
+    """[near even, near odd, game even, game odd]: pairs of different
+    positions of one game with one hash, within `window` plies / any."""
+    out = [0, 0, 0, 0]
+    for g, (a, b) in enumerate(bounds):
+        seen = {}
+        near = far = 0
+        for j in range(a, b):
+            fp = fingerprints[j]
+            same = seen.get(hashes[j])
+            if same is None:
+                seen[hashes[j]] = [(j, fp)]
+                continue
+            for k, other in same:
+                if other != fp:
+                    far += 1
+                    near += j - k <= window
+            same.append((j, fp))
+        out[g & 1] += near
+        out[2 + (g & 1)] += far
+    return out
+
+
+def score(name, words):
+    """Worker: every figure for one key set."""
+    deltas, fingerprints, bounds, window, first = _corpus
+    hashes = stream_hashes(deltas, words)
+    near_even, near_odd, game_even, game_odd = game_collisions(hashes, fingerprints, bounds, window)
+    _, distinct, pairs, _ = collision_stats(hashes, first)
+    st = structure(words)
+    st.update(name=name, words=words, near=(near_even, near_odd), game=(game_even, game_odd),
+              global_pairs=pairs, distinct=distinct)
+    return st
+
+
+def _score_candidate(seed, odd):
+    return score((seed, odd), key_words(seed, odd))
+
+
+# ------------------------------------------------------------------------------
+# Report
+# ------------------------------------------------------------------------------
+
+def candidate_name(name):
+    if name == 'current':
+        return 'current'
+    seed, odd = name
+    return f"0x{seed:08X}" + (" odd" if odd else "")
+
+
+def rank_key(st):
+    """Selection order: usable sets first, then near and game collisions on
+    the even games."""
+    return (not st['ok'], st['near'][0], st['game'][0], st['equal'] + st['triples'])
+
+
+def report(rows, expect, positions):
+    print(f"expected with ideal keys: near {expect[0] / 65536:.0f} / {expect[1] / 65536:.0f}, "
+          f"game {expect[2] / 65536:.0f} / {expect[3] / 65536:.0f} (selection / held-out games), "
+          f"global {positions * (positions - 1) / 2 / 65536:.0f}")
+    print(f"{'keys':18s} {'rank':>6s} {'2-dep':>5s} {'3-dep':>6s} {'4-dep':>7s} "
+          f"{'near sel':>8s} {'held':>6s} {'game sel':>8s} {'held':>6s} {'global':>10s}")
+    for st in rows:
+        flag = '' if st['ok'] else '  rejected'
+        print(f"{candidate_name(st['name']):18s} {st['rank']:3d}/{st['piece_rank']:<2d} "
+              f"{st['equal']:5d} {st['triples']:6d} {st['quads']:7d} {st['near'][0]:8d} {st['near'][1]:6d} "
+              f"{st['game'][0]:8d} {st['game'][1]:6d} {st['global_pairs']:10d}{flag}")
+
+
+def write_csv(path, rows):
+    import csv
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(['keys', 'ok', 'rank', 'piece_rank', 'zeros', 'equal', 'triples', 'quads',
+                    'near_sel', 'near_held', 'game_sel', 'game_held', 'global_pairs', 'distinct'])
+        for st in rows:
+            w.writerow([candidate_name(st['name']), int(st['ok']), st['rank'], st['piece_rank'],
+                        st['zeros'], st['equal'], st['triples'], st['quads'], *st['near'],
+                        *st['game'], st['global_pairs'], st['distinct']])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    ap.add_argument('inputs', nargs='*')
+    ap.add_argument('--candidates', type=int, default=32, help="seeds per family")
+    ap.add_argument('--seed-base', type=lambda s: int(s, 0), default=SEED + 1,
+                    help="first candidate seed (default gen_zobrist SEED + 1)")
+    ap.add_argument('--family', choices=sorted(FAMILIES), default='both')
+    ap.add_argument('--window', type=int, default=16, help="plies apart for near collisions")
+    ap.add_argument('--keys', default=DEFAULT_KEYS, help="baseline key set")
+    ap.add_argument('--out', help="write the best key set here (zobrist-keys.asm layout)")
+    ap.add_argument('--csv', help="also write one row per key set here")
+    ap.add_argument('--top', type=int, default=10, help="candidates shown in the report")
+    ap.add_argument('-j', '--jobs', type=int)
+    args = ap.parse_args()
+
+    paths = args.inputs or sorted(glob.glob('elph-debug*.log'))
+    if not paths:
+        ap.error("no inputs (elph-debug logs, .elpharc, .pgn/.zip or tools/*.uci)")
+    jobs = args.jobs or int(os.environ.get('ELPH_JOBS', 0)) or os.cpu_count() or 1
+    t0 = time.time()
+    deltas, fingerprints, games, bad = build_stream(paths, args.keys, jobs)
+    print(f"{games} games ({bad} unreadable), {len(fingerprints)} positions "
+          f"replayed in {time.time() - t0:.1f}s")
+    if not games:
+        return 1
+
+    t0 = time.time()
+    cands = [(args.seed_base + i, odd) for odd in FAMILIES[args.family]
+             for i in range(args.candidates)]
+    if jobs == 1:
+        _set_corpus(deltas, fingerprints, args.window)
+        current = score('current', load_keys(args.keys))
+        rows = [_score_candidate(seed, odd) for seed, odd in cands]
+    else:
+        with ProcessPoolExecutor(jobs, initializer=_set_corpus,
+                                 initargs=(deltas, fingerprints, args.window)) as pool:
+            cur = pool.submit(score, 'current', load_keys(args.keys))
+            rows = list(pool.map(_score_candidate, *zip(*cands)))
+            current = cur.result()
+        _set_corpus(deltas, fingerprints, args.window)
+    _, _, bounds, _, first = _corpus
+    print(f"{len(cands)} candidates scored in {time.time() - t0:.1f}s; "
+          f"{len(first)} distinct positions, near = within {args.window} plies")
+
+    rows.sort(key=rank_key)
+    best = rows[0]
+    report([current] + rows[:args.top], window_pairs(bounds, args.window), len(first))
+    if args.csv:
+        write_csv(args.csv, [current] + rows)
+        print(f"wrote {args.csv}")
+
+    if not best['ok']:
+        print("no usable candidate")
+        return 1
+    print(f"best {candidate_name(best['name'])} vs current: near collisions "
+          f"{best['near'][0]} vs {current['near'][0]} on the selection games, "
+          f"{best['near'][1]} vs {current['near'][1]} held out; 2/3-key dependencies "
+          f"{best['equal']}/{best['triples']} vs {current['equal']}/{current['triples']}")
+    if args.out:
+        seed, odd = best['name']
+        with open(args.out, 'w') as f:
+            generate_zobrist_asm(seed, odd, f)
+        print(f"wrote {args.out}; to adopt: SEED = 0x{seed:08X}, ODD = {odd} in "
+              f"tools/gen_zobrist.py, then rebuild opening-book.asm (tools/zobrist_book.py)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -230,19 +230,29 @@ UCI_CMD_ISREADY:
 UCI_CMD_POSITION:
     ; Parse position command
     ; Format: "position startpos" or "position startpos moves e2e4 ..."
+    ;     or: "position fen <fen> [moves e2e4 ...]" (see UCI_POS_FEN)
+    ;     or: "position moves e2e4 ..." - bridge extension: apply just these
+    ;         moves to the current game (the previous position command plus
+    ;         any moves since), so only new moves cross the serial link.
+    ;         Board, GAME_PLY/MOVE_HIST and HASH_HIST are left by "go" as
+    ;         "position" set them, so appending here matches a full resend.
 
-    ; Check if "startpos"
     RLDI 10, UCI_BUFFER + 9
 
-    ; Check for "startpos"
+    ; Check for "moves" (incremental form), "fen" or "startpos"
     LDN 10
-    XRI 's'
-    LBNZ UCI_POS_DONE   ; Not startpos (FEN not supported yet)
+    XRI 'm'
+    LBZ UCI_POS_MOVES_KW    ; R10 at "moves", keep the current game
+    XRI $0B             ; 'm'^'f' = $6D^$66 = $0B
+    LBZ UCI_POS_FEN
+    XRI $15             ; 'f'^'s' = $66^$73 = $15
+    LBNZ UCI_POS_DONE   ; Neither startpos nor fen
 
     ; Initialize to starting position
     CALL INIT_BOARD
     CALL INIT_MOVE_HISTORY
 
+UCI_POS_SET_HASH:
     ; --- Compute and store starting position hash for repetition detection ---
     CALL HASH_INIT          ; Compute hash for starting position
     RLDI 10, HASH_HIST      ; R10 → first hash history entry
@@ -256,19 +266,16 @@ UCI_CMD_POSITION:
     LDI 1
     STR 10                  ; count = 1 (starting position stored)
 
-    ; Skip past "startpos" (8 chars) to check for " moves"
-    ; Buffer now at "startpos..." - need to find " moves "
-    RLDI 10, UCI_BUFFER + 17
-
-    ; Check if there's more (should be space or null)
-    LDN 10
+    ; Find "moves": neither "startpos" nor a FEN contains an 'm'
+    RLDI 10, UCI_BUFFER + 9
+UCI_POS_FIND_MOVES:
+    LDA 10
     LBZ UCI_POS_DONE    ; End of string, no moves
-    XRI ' '
-    LBNZ UCI_POS_DONE   ; Not a space, unexpected
-
-    ; Skip the space
-    INC 10
+    XRI 'm'
+    LBNZ UCI_POS_FIND_MOVES
+    DEC 10              ; Back onto the 'm'
 
+UCI_POS_MOVES_KW:
     ; Check for "moves" (5 chars)
     LDN 10
     XRI 'm'
@@ -440,6 +447,140 @@ UCI_HIST_DONE:
 UCI_POS_DONE:
     RETN
 
+; ------------------------------------------------------------------------------
+; UCI_POS_FEN - "position fen <placement> <side> <castling> <ep> [<half> <full>]"
+; ------------------------------------------------------------------------------
+; Sets BOARD and GAME_STATE straight from the FEN fields, then joins the
+; startpos path at UCI_POS_SET_HASH (HASH_INIT, HASH_HIST, trailing moves).
+; The placement writes all 64 squares (digit runs store EMPTY), so the board
+; needs no separate clear. Missing trailing fields keep INIT_BOARD's values;
+; the fullmove number is not read by the engine and is skipped. GAME_PLY is
+; set to BOOK_PLY_LIMIT so the opening book (keyed by moves from the start
+; position) never matches a FEN game and MOVE_HIST recording is skipped.
+; Input:  R10 = UCI_BUFFER + 9 (at "fen")
+; Uses:   R7-R10, R13.0
+; ------------------------------------------------------------------------------
+UCI_POS_FEN:
+    CALL INIT_BOARD
+    CALL INIT_MOVE_HISTORY
+
+    RLDI 10, GAME_PLY
+    LDI BOOK_PLY_LIMIT
+    STR 10              ; GAME_PLY = BOOK_PLY_LIMIT (no book, no MOVE_HIST)
+
+    ; ---- Piece placement, rank 8 first ----
+    RLDI 10, UCI_BUFFER + 13    ; past "fen "
+    RLDI 8, BOARD + $70         ; R8 = a8 (R8.0 = 0x88 square)
+
+UCI_FEN_PLACE:
+    LDA 10              ; D = char, R10++
+    PLO 13              ; R13.0 = char
+    SMI '!'
+    LBNF UCI_FEN_SIDE   ; Space or end of string: placement done
+    SMI '/'-'!'
+    LBNZ UCI_FEN_NOT_SLASH
+    ; Next rank down, file a: (square | $0F) - $1F
+    GLO 8
+    ORI $0F
+    SMI $1F
+    PLO 8
+    LBR UCI_FEN_PLACE
+
+UCI_FEN_NOT_SLASH:
+    SMI '9'-'/'
+    LBDF UCI_FEN_PIECE  ; Not a digit
+UCI_FEN_EMPTY:
+    LDI EMPTY           ; Digit: that many empty squares
+    STR 8
+    INC 8
+    DEC 13
+    GLO 13
+    XRI '0'
+    LBNZ UCI_FEN_EMPTY  ; Count the char in R13.0 down to '0'
+    LBR UCI_FEN_PLACE
+
+UCI_FEN_PIECE:
+    CALL UCI_FEN_PIECE_CODE
+    LBZ UCI_FEN_PLACE   ; Unknown letter: ignore it
+    STR 8               ; BOARD[square] = piece
+    ; Kings: record their squares in GAME_STATE
+    ANI PIECE_MASK
+    XRI KING_TYPE
+    LBNZ UCI_FEN_NEXT_SQ
+    RLDI 9, GAME_STATE + STATE_W_KING_SQ
+    LDN 8
+    ANI COLOR_MASK
+    LBZ UCI_FEN_KING_SQ
+    INC 9               ; STATE_B_KING_SQ
+UCI_FEN_KING_SQ:
+    GLO 8
+    STR 9
+UCI_FEN_NEXT_SQ:
+    INC 8
+    LBR UCI_FEN_PLACE
+
+    ; ---- Side to move, castling, ep, halfmove: R9 walks GAME_STATE ----
+    ; (STATE_SIDE_TO_MOVE..STATE_HALFMOVE are consecutive, in FEN order)
+UCI_FEN_SIDE:
+    DEC 10              ; Back onto the separator
+    RLDI 9, GAME_STATE + STATE_SIDE_TO_MOVE
+    CALL UCI_FEN_FIELD
+    XRI 'b'
+    LBNZ UCI_FEN_CASTLING   ; White (default) unless 'b'
+    LDI BLACK
+    STR 9
+
+    ; ---- Castling rights: any of KQkq, or '-' ----
+UCI_FEN_CASTLING:
+    INC 9               ; STATE_CASTLING
+    CALL UCI_FEN_FIELD
+    LDI 0
+    STR 9
+UCI_FEN_CASTLE_LOOP:
+    LDN 10
+    PLO 13
+    SMI '!'
+    LBNF UCI_FEN_EP     ; Space or end of string
+    INC 10
+    CALL UCI_FEN_CASTLE_BIT ; D = CASTLE_* bit, 0 for '-'
+    STR 2
+    LDN 9
+    OR
+    STR 9
+    LBR UCI_FEN_CASTLE_LOOP
+
+    ; ---- En passant target: square or '-' ($FF = NO_EP either way) ----
+UCI_FEN_EP:
+    INC 9               ; STATE_EP_SQUARE
+    CALL UCI_FEN_FIELD
+    LBZ UCI_POS_SET_HASH
+    CALL ALGEBRAIC_TO_SQUARE
+    STR 9
+    DEC 10              ; Inside the field (or on its separator for '-')
+
+    ; ---- Halfmove clock (optional; INIT_BOARD left it 0) ----
+    INC 9               ; STATE_HALFMOVE
+    CALL UCI_FEN_FIELD
+UCI_FEN_DIGIT:
+    LDA 10
+    SMI '0'
+    LBNF UCI_POS_SET_HASH
+    SMI 10
+    LBDF UCI_POS_SET_HASH
+    ADI 10
+    PLO 13              ; R13.0 = digit
+    LDN 9
+    STR 2
+    SHL
+    SHL
+    ADD
+    SHL                 ; D = clock * 10
+    STR 2
+    GLO 13
+    ADD
+    STR 9               ; clock = clock * 10 + digit
+    LBR UCI_FEN_DIGIT
+
 ; ------------------------------------------------------------------------------
 ; ALGEBRAIC_TO_SQUARE - Convert algebraic notation to 0x88 square
 ; ------------------------------------------------------------------------------
@@ -598,6 +739,12 @@ UCI_GO_SEND_MOVE:
     GLO 8
     STXD
 
+    ; GENERATE_MOVES takes the side from R12.0. SEARCH_POSITION loads it,
+    ; but a book hit skips the search: without this, black book moves were
+    ; checked against WHITE's moves and replaced by a white move.
+    CALL GET_SIDE_TO_MOVE
+    PLO 12              ; R12.0 = side to move
+
     ; Regenerate legal moves into MOVE_LIST
     RLDI 9, MOVE_LIST
     CALL GENERATE_MOVES